@@ -45,6 +45,9 @@ class AccountAuditor(Daemon):
             float(conf.get('accounts_per_second', 200))
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.DB_JOURNAL_MODE = \
+            swift.common.db.parse_db_journal_mode(
+                conf.get('db_journal_mode'))
         self.recon_cache_path = conf.get('recon_cache_path',
                                          '/var/cache/swift')
         self.rcache = os.path.join(self.recon_cache_path, "account.recon")
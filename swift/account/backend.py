@@ -16,13 +16,14 @@
 Pluggable Back-end for Account Server
 """
 
+import os
 from uuid import uuid4
-import six.moves.cPickle as pickle
 
 import sqlite3
 
 from swift.common.utils import Timestamp
-from swift.common.db import DatabaseBroker, utf8encode, zero_like
+from swift.common.db import DatabaseBroker, utf8encode, zero_like, \
+    DELIMITER_SKIP_ROWS
 
 DATADIR = 'accounts'
 
@@ -56,6 +57,11 @@ class AccountBroker(DatabaseBroker):
     db_type = 'account'
     db_contains_type = 'container'
     db_reclaim_timestamp = 'delete_timestamp'
+    db_merkle_columns = ('name', 'put_timestamp', 'delete_timestamp',
+                         'object_count', 'bytes_used', 'deleted',
+                         'storage_policy_index')
+    # (change stamp, snapshot) of the last stats snapshot
+    _stats_snapshot = None
 
     def _initialize(self, conn, put_timestamp, **kwargs):
         """
@@ -202,9 +208,10 @@ class AccountBroker(DatabaseBroker):
                 status_changed_at = ?
             WHERE delete_timestamp < ? """, (timestamp, timestamp, timestamp))
 
-    def _commit_puts_load(self, item_list, entry):
-        """See :func:`swift.common.db.DatabaseBroker._commit_puts_load`"""
-        loaded = pickle.loads(entry.decode('base64'))
+    def _commit_puts_load_tuple(self, item_list, loaded):
+        """
+        See :func:`swift.common.db.DatabaseBroker._commit_puts_load_tuple`
+        """
         # check to see if the update includes policy_index or not
         (name, put_timestamp, delete_timestamp, object_count, bytes_used,
          deleted) = loaded[:6]
@@ -363,6 +370,37 @@ class AccountBroker(DatabaseBroker):
                 FROM account_stat
             ''').fetchone())
 
+    def get_stats_snapshot(self):
+        """
+        Get whether the account is deleted, its info, policy stats and
+        metadata. The snapshot is kept and returned again for as long as the
+        db and its pending file are unchanged, so a broker that is reused,
+        e.g. by a :class:`~swift.common.db.BrokerCache`, answers repeated
+        HEADs and GETs of a busy account without querying the db.
+
+        :returns: a dict with keys 'deleted', 'info', 'policy_stats' and
+            'metadata'; the values for a deleted account may be None. The
+            dict and its values must not be modified.
+        """
+        if self.db_file != ':memory:' and not os.path.exists(self.db_file):
+            return {'deleted': True, 'info': None, 'policy_stats': None,
+                    'metadata': None}
+        # stamp the db before reading it, so that any change made while
+        # reading it invalidates the snapshot
+        stamp = self.get_change_stamp()
+        if stamp is not None and self._stats_snapshot and \
+                self._stats_snapshot[0] == stamp:
+            return self._stats_snapshot[1]
+        snapshot = {'deleted': self.is_deleted()}
+        if snapshot['deleted']:
+            snapshot.update(info=None, policy_stats=None, metadata=None)
+        else:
+            snapshot.update(info=self.get_info(),
+                            policy_stats=self.get_policy_stats(),
+                            metadata=self.metadata)
+        self._stats_snapshot = None if stamp is None else (stamp, snapshot)
+        return snapshot
+
     def list_containers_iter(self, limit, marker, end_marker, prefix,
                              delimiter, reverse=False):
         """
@@ -392,6 +430,9 @@ class AccountBroker(DatabaseBroker):
         if prefix:
             end_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1)
         orig_marker = marker
+        # the number of rows to skip by reading on adapts to the sizes of
+        # the pseudo-directories found
+        skip_rows = DELIMITER_SKIP_ROWS
         with self.get() as conn:
             results = []
             while len(results) < limit:
@@ -435,11 +476,29 @@ class AccountBroker(DatabaseBroker):
                     return [r for r in curs]
 
                 # We have a delimiter and a prefix (possibly empty string) to
-                # handle
+                # handle. As for object listings, the rows under a
+                # pseudo-directory are skipped by reading on for a while,
+                # then by querying again from the marker past it.
                 rowcount = 0
+                skipping = None
                 for row in curs:
                     rowcount += 1
                     name = row[0]
+                    if skipping is not None:
+                        if reverse:
+                            skipped = name >= end_marker
+                        else:
+                            skipped = name < marker
+                        if skipped:
+                            skipping += 1
+                            if skipping > skip_rows:
+                                skip_rows = max(1, skip_rows // 2)
+                                curs.close()
+                                break
+                            continue
+                        skip_rows = min(DELIMITER_SKIP_ROWS, skip_rows * 2)
+                        skipping = None
+                        delim_force_gte = False
                     if reverse:
                         end_marker = name
                     else:
@@ -459,8 +518,11 @@ class AccountBroker(DatabaseBroker):
                         dir_name = name[:end + 1]
                         if dir_name != orig_marker:
                             results.append([dir_name, 0, 0, '0', 1])
-                        curs.close()
-                        break
+                            if len(results) >= limit:
+                                curs.close()
+                                return results
+                        skipping = 0
+                        continue
                     results.append(row)
                 if not rowcount:
                     break
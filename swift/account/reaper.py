@@ -81,6 +81,9 @@ class AccountReaper(Daemon):
         self.container_pool = GreenPool(size=self.container_concurrency)
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.DB_JOURNAL_MODE = \
+            swift.common.db.parse_db_journal_mode(
+                conf.get('db_journal_mode'))
         self.delay_reaping = int(conf.get('delay_reaping') or 0)
         reap_warn_after = float(conf.get('reap_warn_after') or 86400 * 30)
         self.reap_not_done_after = reap_warn_after + self.delay_reaping
@@ -23,7 +23,8 @@ from eventlet import Timeout
 import swift.common.db
 from swift.account.backend import AccountBroker, DATADIR
 from swift.account.utils import account_listing_response, get_response_headers
-from swift.common.db import DatabaseConnectionError, DatabaseAlreadyExists
+from swift.common.db import BrokerCache, DatabaseConnectionError, \
+    DatabaseAlreadyExists
 from swift.common.request_helpers import get_param, \
     split_and_validate_path
 from swift.common.utils import get_logger, hash_path, public, \
@@ -60,6 +61,13 @@ class AccountController(BaseStorageServer):
             conf.get('auto_create_account_prefix') or '.'
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.DB_JOURNAL_MODE = \
+            swift.common.db.parse_db_journal_mode(
+                conf.get('db_journal_mode'))
+        #: Per-worker cache of idle brokers, reused across requests.
+        self.broker_cache = BrokerCache(
+            self.logger, size=int(conf.get('broker_cache_size', 0)),
+            idle_time=float(conf.get('broker_cache_idle_time', 300)))
 
     def _get_account_broker(self, drive, part, account, **kwargs):
         hsh = hash_path(account)
@@ -67,7 +75,7 @@ class AccountController(BaseStorageServer):
         db_path = os.path.join(self.root, drive, db_dir, hsh + '.db')
         kwargs.setdefault('account', account)
         kwargs.setdefault('logger', self.logger)
-        return AccountBroker(db_path, **kwargs)
+        return self.broker_cache.get_broker(AccountBroker, db_path, **kwargs)
 
     def _deleted_response(self, broker, req, resp, body=''):
         # We are here since either the account does not exist or
@@ -174,9 +182,10 @@ class AccountController(BaseStorageServer):
         broker = self._get_account_broker(drive, part, account,
                                           pending_timeout=0.1,
                                           stale_reads_ok=True)
-        if broker.is_deleted():
+        snapshot = broker.get_stats_snapshot()
+        if snapshot['deleted']:
             return self._deleted_response(broker, req, HTTPNotFound)
-        headers = get_response_headers(broker)
+        headers = get_response_headers(broker, snapshot)
         headers['Content-Type'] = out_content_type
         return HTTPNoContent(request=req, headers=headers, charset='utf-8')
 
@@ -209,11 +218,12 @@ class AccountController(BaseStorageServer):
         broker = self._get_account_broker(drive, part, account,
                                           pending_timeout=0.1,
                                           stale_reads_ok=True)
-        if broker.is_deleted():
+        snapshot = broker.get_stats_snapshot()
+        if snapshot['deleted']:
             return self._deleted_response(broker, req, HTTPNotFound)
         return account_listing_response(account, req, out_content_type, broker,
                                         limit, marker, end_marker, prefix,
-                                        delimiter, reverse)
+                                        delimiter, reverse, snapshot)
 
     @public
     @replication
@@ -274,6 +284,8 @@ class AccountController(BaseStorageServer):
                                         ' %(path)s '),
                                       {'method': req.method, 'path': req.path})
                 res = HTTPInternalServerError(body=traceback.format_exc())
+            finally:
+                self.broker_cache.release()
         if self.log_requests:
             trans_time = time.time() - start_time
             additional_info = ''
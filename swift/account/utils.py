@@ -44,16 +44,32 @@ class FakeAccountBroker(object):
     def get_policy_stats(self):
         return {}
 
+    def get_stats_snapshot(self):
+        return {'deleted': False, 'info': self.get_info(),
+                'policy_stats': self.get_policy_stats(),
+                'metadata': self.metadata}
 
-def get_response_headers(broker):
-    info = broker.get_info()
+
+def get_response_headers(broker, snapshot=None):
+    """
+    Get the headers of a response to a HEAD or GET of an account.
+
+    :param broker: the account's broker
+    :param snapshot: the account's stats snapshot from
+        :meth:`~swift.account.backend.AccountBroker.get_stats_snapshot`, if
+        the caller already has it
+    :returns: a dict of headers
+    """
+    if snapshot is None:
+        snapshot = broker.get_stats_snapshot()
+    info = snapshot['info']
     resp_headers = {
         'X-Account-Container-Count': info['container_count'],
         'X-Account-Object-Count': info['object_count'],
         'X-Account-Bytes-Used': info['bytes_used'],
         'X-Timestamp': Timestamp(info['created_at']).normal,
         'X-PUT-Timestamp': Timestamp(info['put_timestamp']).normal}
-    policy_stats = broker.get_policy_stats()
+    policy_stats = snapshot['policy_stats']
     for policy_idx, stats in policy_stats.items():
         policy = POLICIES.get_by_index(policy_idx)
         if not policy:
@@ -64,17 +80,17 @@ def get_response_headers(broker):
             resp_headers[header_name] = value
     resp_headers.update((key, value)
                         for key, (value, timestamp) in
-                        broker.metadata.items() if value != '')
+                        snapshot['metadata'].items() if value != '')
     return resp_headers
 
 
 def account_listing_response(account, req, response_content_type, broker=None,
                              limit='', marker='', end_marker='', prefix='',
-                             delimiter='', reverse=False):
+                             delimiter='', reverse=False, snapshot=None):
     if broker is None:
         broker = FakeAccountBroker()
 
-    resp_headers = get_response_headers(broker)
+    resp_headers = get_response_headers(broker, snapshot)
 
     account_list = broker.list_containers_iter(limit, marker, end_marker,
                                                prefix, delimiter, reverse)
@@ -75,11 +75,18 @@ addition::
             ]]
     }
 
+The time spent rebalancing is printed at the end of the run. When NumPy is
+installed the builder uses it for its rebalance; pass ``--engine python`` to
+time the pure Python code instead, or ``--compare`` to run the scenario with
+both and check that they build the same ring.
+
 """
 
 import argparse
+import copy
 import json
 import sys
+import time
 
 from swift.common.ring import builder
 from swift.common.ring.utils import parse_add_value
@@ -90,6 +97,13 @@ ARG_PARSER = argparse.ArgumentParser(
 ARG_PARSER.add_argument(
     '--check', '-c', action='store_true',
     help="Just check the scenario, don't execute it.")
+ARG_PARSER.add_argument(
+    '--engine', choices=('python', 'numpy'),
+    help="Rebalance with the pure Python or the NumPy code. Defaults to "
+    "numpy if it is installed.")
+ARG_PARSER.add_argument(
+    '--compare', action='store_true',
+    help="Run the scenario with both engines and compare them.")
 ARG_PARSER.add_argument(
     'scenario_path',
     help="Path to the scenario file")
@@ -277,14 +291,21 @@ def parse_scenario(scenario_data):
     return parsed_scenario
 
 
-def run_scenario(scenario):
+def run_scenario(scenario, use_numpy=None):
     """
     Takes a parsed scenario (like from parse_scenario()) and runs it.
+
+    :param use_numpy: whether the builder should rebalance with NumPy,
+                      defaults to the builder's own default
+    :returns: a tuple of (builder, seconds spent rebalancing)
     """
     seed = scenario['random_seed']
 
     rb = builder.RingBuilder(scenario['part_power'], scenario['replicas'], 1)
     rb.set_overload(scenario['overload'])
+    if use_numpy is not None:
+        rb.use_numpy = use_numpy
+    rebalance_time = 0.0
 
     command_map = {
         'add': rb.add_dev,
@@ -305,14 +326,18 @@ def run_scenario(scenario):
             command_f(*command)
 
         rebalance_number = 1
+        start = time.time()
         parts_moved, old_balance, removed_devs = rb.rebalance(seed=seed)
+        rebalance_time += time.time() - start
         rb.pretend_min_part_hours_passed()
         print("\tRebalance 1: moved %d parts, balance is %.6f, %d removed "
               "devs" % (parts_moved, old_balance, removed_devs))
 
         while True:
             rebalance_number += 1
+            start = time.time()
             parts_moved, new_balance, removed_devs = rb.rebalance(seed=seed)
+            rebalance_time += time.time() - start
             rb.pretend_min_part_hours_passed()
             print("\tRebalance %d: moved %d parts, balance is %.6f, "
                   "%d removed devs" % (rebalance_number, parts_moved,
@@ -325,6 +350,32 @@ def run_scenario(scenario):
                 break
             old_balance = new_balance
 
+    print("Rebalancing took %.3fs" % rebalance_time)
+    return rb, rebalance_time
+
+
+def compare_engines(scenario):
+    """
+    Runs a parsed scenario with both the pure Python and the NumPy rebalance
+    and reports how long each took.
+
+    :returns: True if both built the same ring, False otherwise
+    """
+    results = {}
+    for engine in ('python', 'numpy'):
+        print("Engine %s" % engine)
+        # running the scenario consumes its commands
+        results[engine] = run_scenario(copy.deepcopy(scenario),
+                                       use_numpy=(engine == 'numpy'))
+    python_rb, python_time = results['python']
+    numpy_rb, numpy_time = results['numpy']
+    print("python: %.3fs, numpy: %.3fs (%.1fx)" % (
+        python_time, numpy_time, python_time / max(numpy_time, 1e-6)))
+    if python_rb._replica2part2dev != numpy_rb._replica2part2dev:
+        print("The engines built different rings!")
+        return False
+    return True
+
 
 def main(argv=None):
     args = ARG_PARSER.parse_args(argv)
@@ -344,6 +395,13 @@ def main(argv=None):
                          (args.scenario_path, err))
         return 1
 
-    if not args.check:
-        run_scenario(scenario)
+    if args.check:
+        return 0
+    if (args.engine == 'numpy' or args.compare) and not builder.numpy:
+        sys.stderr.write("NumPy is not installed\n")
+        return 1
+    if args.compare:
+        return 0 if compare_engines(scenario) else 1
+    use_numpy = None if args.engine is None else args.engine == 'numpy'
+    run_scenario(scenario, use_numpy=use_numpy)
     return 0
@@ -16,6 +16,7 @@
 from __future__ import print_function
 import logging
 
+from array import array
 from collections import defaultdict
 from errno import EEXIST
 from itertools import islice
@@ -1111,12 +1112,24 @@ swift-ring-builder <builder_file> validate
     @staticmethod
     def write_ring():
         """
-swift-ring-builder <builder_file> write_ring
+swift-ring-builder <builder_file> write_ring [--format <v1|v2>]
     Just rewrites the distributable ring file. This is done automatically after
     a successful rebalance, so really this is only useful after one or more
     'set_info' calls when no rebalance is needed but you want to send out the
     new device information.
+
+    With '--format v2' the ring file is written uncompressed, in a layout
+    whose partition tables servers can mmap and share between processes
+    instead of each loading its own copy. The file name is unchanged. Only
+    Swift versions that understand v2 ring files can load it.
         """
+        usage = Commands.write_ring.__doc__.strip()
+        parser = optparse.OptionParser(usage)
+        parser.add_option('--format', choices=('v1', 'v2'), default='v1',
+                          help="ring file format to write (default v1)")
+        options, args = parser.parse_args(argv)
+        format_version = int(options.format[1:])
+
         if not builder.devs:
             print('Unable to write empty ring.')
             exit(EXIT_ERROR)
@@ -1128,8 +1141,9 @@ swift-ring-builder <builder_file> write_ring
                       'assignments but with devices; did you forget to run '
                       '"rebalance"?')
         ring_data.save(
-            pathjoin(backup_dir, '%d.' % time() + basename(ring_file)))
-        ring_data.save(ring_file)
+            pathjoin(backup_dir, '%d.' % time() + basename(ring_file)),
+            format_version=format_version)
+        ring_data.save(ring_file, format_version=format_version)
         exit(EXIT_SUCCESS)
 
     @staticmethod
@@ -1167,7 +1181,8 @@ swift-ring-builder <ring_file> write_builder [min_part_hours]
             'devs': ring.devs,
             'devs_changed': False,
             'version': 0,
-            '_replica2part2dev': ring._replica2part2dev_id,
+            '_replica2part2dev': [array('H', part2dev_id) for part2dev_id
+                                  in ring._replica2part2dev_id],
             '_last_part_moves_epoch': None,
             '_last_part_moves': None,
             '_last_part_gather_start': 0,
@@ -27,6 +27,7 @@ BufferedHTTPResponse.
 """
 
 from swift.common import constraints
+from collections import defaultdict, deque
 import logging
 import time
 import socket
@@ -42,6 +43,11 @@ if six.PY2:
 else:
     httplib = eventlet.import_patched('http.client')
 httplib._MAXHEADERS = constraints.MAX_HEADER_COUNT
+_select = eventlet.patcher.original('select')
+
+# the per-process pool of idle backend connections; see
+# set_connection_pool()
+_connection_pool = None
 
 
 class BufferedHTTPResponse(HTTPResponse):
@@ -154,6 +160,10 @@ class BufferedHTTPResponse(HTTPResponse):
 class BufferedHTTPConnection(HTTPConnection):
     """HTTPConnection class that uses BufferedHTTPResponse"""
     response_class = BufferedHTTPResponse
+    # set when the connection was checked out of a BufferedHTTPConnectionPool
+    pool = None
+    pool_key = None
+    idle_since = None
 
     def connect(self):
         self._connected_time = time.time()
@@ -183,6 +193,195 @@ class BufferedHTTPConnection(HTTPConnection):
         return response
 
 
+def _socket_is_idle(sock):
+    """
+    Check that a socket that has been sitting in a pool is still fit for
+    sending a new request: there must be nothing to read from it. A
+    readable idle socket has either been closed by the remote end or has
+    unexpected data on it; both mean it must not be reused.
+    """
+    try:
+        readable = _select.select([sock], [], [], 0)[0]
+    except (_select.error, socket.error, TypeError, ValueError):
+        return False
+    return not readable
+
+
+def _response_is_complete(response):
+    """
+    Check whether a backend response has been consumed far enough that the
+    connection it arrived on can carry another request.
+    """
+    if response.will_close:
+        return False
+    if not response.isclosed():
+        # responses without a body (HEAD, 204, 304, Content-Length: 0) are
+        # complete as soon as the headers have been read
+        if response.length != 0 or response.chunked:
+            return False
+        response.close()
+    return True
+
+
+class BufferedHTTPConnectionPool(object):
+    """
+    A pool of idle, keep-alive :class:`BufferedHTTPConnection` objects keyed
+    by (ip, port). Each proxy worker process has its own pool (see
+    :func:`set_connection_pool`); it is not shared across processes.
+
+    Connections are checked out by :func:`http_connect_raw` and must be
+    handed back with :func:`release_connection` once their response has been
+    completely read; connections that cannot be safely reused are closed
+    rather than pooled.
+
+    :param max_idle_per_host: maximum number of idle connections kept for any
+                              one (ip, port); surplus connections are closed.
+    :param idle_timeout: seconds after which an idle connection is evicted.
+    :param logger: optional logger used to emit ``backend_pool.*`` metrics.
+    """
+
+    def __init__(self, max_idle_per_host=8, idle_timeout=30, logger=None):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.logger = logger
+        self._idle = defaultdict(deque)
+
+    def _increment(self, metric):
+        if self.logger:
+            self.logger.increment('backend_pool.%s' % metric)
+
+    def _evict_expired(self, idle, now):
+        while idle and now - idle[0].idle_since > self.idle_timeout:
+            conn = idle.popleft()
+            conn.idle_since = None
+            conn.close()
+            self._increment('evictions')
+
+    def get(self, ipaddr, port):
+        """
+        Check out an idle connection to ``ipaddr:port``.
+
+        :returns: a :class:`BufferedHTTPConnection` ready for a new request,
+                  or None if the pool has no usable connection for the host.
+        """
+        key = (ipaddr, port)
+        idle = self._idle.get(key)
+        if idle:
+            self._evict_expired(idle, time.time())
+        while idle:
+            # most recently used first; it's the one most likely to be alive
+            conn = idle.pop()
+            conn.idle_since = None
+            if _socket_is_idle(conn.sock):
+                self._increment('hits')
+                return conn
+            conn.close()
+            self._increment('evictions')
+        if key in self._idle and not self._idle[key]:
+            del self._idle[key]
+        self._increment('misses')
+        return None
+
+    def put(self, conn, response=None):
+        """
+        Return a connection to the pool.
+
+        The socket is handed over to a fresh connection object, so that
+        whoever still holds a reference to ``conn`` (or to ``response``) can
+        go on to close it, or release it again, without disturbing the
+        pooled connection.
+
+        :param conn: a connection checked out of this pool
+        :param response: the response that was last read from ``conn``
+        :returns: True if the connection was pooled, False otherwise
+        """
+        if conn.sock is None:
+            # closed, or already released
+            return False
+        try:
+            response = response or conn._HTTPConnection__response
+            reusable = (
+                conn._HTTPConnection__state == httplib._CS_IDLE and
+                (response is None or _response_is_complete(response)))
+        except AttributeError:
+            reusable = False
+        if not reusable:
+            conn.close()
+            self._increment('discards')
+            return False
+        now = time.time()
+        idle = self._idle[conn.pool_key]
+        self._evict_expired(idle, now)
+        if len(idle) >= self.max_idle_per_host:
+            conn.close()
+            self._increment('overflows')
+            return False
+        pooled = BufferedHTTPConnection(conn.host, conn.port)
+        pooled.sock, conn.sock = conn.sock, None
+        pooled._connected_time = getattr(conn, '_connected_time', now)
+        pooled.pool = self
+        pooled.pool_key = conn.pool_key
+        pooled.idle_since = now
+        conn.close()
+        idle.append(pooled)
+        return True
+
+    def idle_count(self):
+        """
+        :returns: the total number of idle connections held by the pool
+        """
+        return sum(len(idle) for idle in self._idle.values())
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        idle_conns = [conn for idle in self._idle.values() for conn in idle]
+        self._idle.clear()
+        for conn in idle_conns:
+            conn.idle_since = None
+            conn.close()
+
+
+def set_connection_pool(pool):
+    """
+    Install a :class:`BufferedHTTPConnectionPool` that :func:`http_connect`
+    and :func:`http_connect_raw` will take non-SSL connections from, or
+    uninstall it if ``pool`` is None. Any previously installed pool has its
+    idle connections closed.
+
+    :param pool: a :class:`BufferedHTTPConnectionPool` or None
+    """
+    global _connection_pool
+    if _connection_pool is not None and _connection_pool is not pool:
+        _connection_pool.close()
+    _connection_pool = pool
+
+
+def get_connection_pool():
+    """
+    :returns: the currently installed :class:`BufferedHTTPConnectionPool`, or
+              None if connection pooling is disabled.
+    """
+    return _connection_pool
+
+
+def release_connection(conn, response=None):
+    """
+    Hand a connection back to the pool it was checked out of so it can be
+    reused. Connections that did not come from a pool, or that are not in a
+    state fit for reuse, are left alone for the caller to close.
+
+    :param conn: the connection returned by :func:`http_connect`
+    :param response: the response read from ``conn``, if any
+    :returns: True if the connection was returned to a pool
+    """
+    pool = getattr(conn, 'pool', None)
+    if pool is None:
+        return False
+    return pool.put(conn, response)
+
+
 def http_connect(ipaddr, port, device, partition, method, path,
                  headers=None, query_string=None, ssl=False):
     """
@@ -228,16 +427,40 @@ def http_connect_raw(ipaddr, port, method, path, headers=None,
     """
     if not port:
         port = 443 if ssl else 80
+    if query_string:
+        path += '?' + query_string
+    pool = None if ssl else _connection_pool
+    if pool is not None:
+        # callers ask the backend to close the connection after responding;
+        # when pooling we want to keep it open instead
+        headers = dict((header, value)
+                       for header, value in (headers or {}).items()
+                       if header.lower() != 'connection')
+        headers['Connection'] = 'keep-alive'
+        conn = pool.get(ipaddr, port)
+        if conn is not None:
+            try:
+                _send_request(conn, method, path, headers)
+                return conn
+            except (socket.error, httplib.HTTPException):
+                # the backend hung up on us since we last checked; fall back
+                # to a new connection
+                conn.close()
     if ssl:
         conn = HTTPSConnection('%s:%s' % (ipaddr, port))
     else:
         conn = BufferedHTTPConnection('%s:%s' % (ipaddr, port))
-    if query_string:
-        path += '?' + query_string
+        if pool is not None:
+            conn.pool = pool
+            conn.pool_key = (ipaddr, port)
+    _send_request(conn, method, path, headers)
+    return conn
+
+
+def _send_request(conn, method, path, headers):
     conn.path = path
     conn.putrequest(method, path, skip_host=(headers and 'Host' in headers))
     if headers:
         for header, value in headers.items():
             conn.putheader(header, str(value))
     conn.endheaders()
-    return conn
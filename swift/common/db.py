@@ -15,7 +15,9 @@
 
 """ Database code for Swift """
 
+from collections import OrderedDict
 from contextlib import contextmanager, closing
+import fcntl
 import hashlib
 import json
 import logging
@@ -24,12 +26,13 @@ from uuid import uuid4
 import sys
 import time
 import errno
+import struct
 import six
 import six.moves.cPickle as pickle
 from swift import gettext_ as _
 from tempfile import mkstemp
 
-from eventlet import sleep, Timeout
+from eventlet import greenthread, sleep, Timeout
 import sqlite3
 
 from swift.common.constraints import MAX_META_COUNT, MAX_META_OVERALL_SIZE, \
@@ -42,6 +45,9 @@ from swift.common.swob import HTTPBadRequest
 
 #: Whether calls will be made to preallocate disk space for database files.
 DB_PREALLOCATION = False
+#: The journal mode for database connections: 'delete' or 'wal'.
+DB_JOURNAL_MODE = 'delete'
+DB_JOURNAL_MODES = ('delete', 'wal')
 #: Timeout for trying to connect to a DB
 BROKER_TIMEOUT = 25
 #: Pickle protocol to use
@@ -49,6 +55,19 @@ PICKLE_PROTOCOL = 2
 #: Max size of .pending file in bytes. When this is exceeded, the pending
 # records will be merged.
 PENDING_CAP = 131072
+#: Max number of pending records merged in one call to merge_items().
+PENDING_COMMIT_BATCH = 1000
+#: Marks the start of a record in a pending file; it is followed by the
+# length of the record's pickle, then the pickle itself. Neither the marker
+# nor ':' occur in base64 encoding, so the original format of pending
+# records, a ':' followed by a base64 encoded pickle, can still be read.
+PENDING_RECORD_MARKER = b'\x00'
+PENDING_RECORD_LENGTH = struct.Struct('!I')
+#: Max number of rows of a pseudo-directory that a delimited listing skips
+# by reading on, before it skips the rest with a query from the next name
+# after the pseudo-directory; stepping over a few rows is cheaper than a new
+# query, but stepping over many is not.
+DELIMITER_SKIP_ROWS = 16
 
 
 def utf8encode(*args):
@@ -180,6 +199,21 @@ def chexor(old, name, timestamp):
     return '%032x' % (int(old, 16) ^ int(new, 16))
 
 
+def parse_db_journal_mode(value):
+    """
+    Parse a configured journal mode for database connections.
+
+    :param value: 'delete' or 'wal', in any case, or None for the default
+    :returns: the journal mode, in lower case
+    :raises ValueError: if the journal mode is not supported
+    """
+    mode = (value or 'delete').strip().lower()
+    if mode not in DB_JOURNAL_MODES:
+        raise ValueError('db_journal_mode must be one of %s, not %r' % (
+            ', '.join(DB_JOURNAL_MODES), value))
+    return mode
+
+
 def get_db_connection(path, timeout=30, okay_to_create=False):
     """
     Returns a properly configured SQLite database connection.
@@ -190,6 +224,8 @@ def get_db_connection(path, timeout=30, okay_to_create=False):
     :returns: DB connection object
     """
     try:
+        # connecting to a db in WAL journal mode creates its write-ahead log
+        in_use_wal = os.path.exists(path + '-wal')
         connect_time = time.time()
         conn = sqlite3.connect(path, check_same_thread=False,
                                factory=GreenDBConnection, timeout=timeout)
@@ -206,7 +242,13 @@ def get_db_connection(path, timeout=30, okay_to_create=False):
             cur.execute('PRAGMA synchronous = NORMAL')
             cur.execute('PRAGMA count_changes = OFF')
             cur.execute('PRAGMA temp_store = MEMORY')
-            cur.execute('PRAGMA journal_mode = DELETE')
+            if DB_JOURNAL_MODE == 'wal':
+                cur.execute('PRAGMA journal_mode = WAL')
+            elif not in_use_wal:
+                # no other connection to a db in WAL mode is open unless it
+                # has a write-ahead log, so it can be switched back here;
+                # otherwise it is left to checkpoint()
+                cur.execute('PRAGMA journal_mode = DELETE')
         conn.create_function('chexor', 3, chexor)
     except sqlite3.DatabaseError:
         import traceback
@@ -217,6 +259,9 @@ def get_db_connection(path, timeout=30, okay_to_create=False):
 
 class DatabaseBroker(object):
     """Encapsulates working with a database."""
+    # the columns of an item hashed by merkle syncs; ROWID differs between
+    # replicas, so it is never one of them
+    db_merkle_columns = ('name', 'created_at', 'deleted')
 
     def __init__(self, db_file, timeout=BROKER_TIMEOUT, logger=None,
                  account=None, container=None, pending_timeout=None,
@@ -368,6 +413,54 @@ class DatabaseBroker(object):
         dbs_path = os.path.dirname(partition_path)
         return os.path.dirname(dbs_path)
 
+    def get_db_identity(self):
+        """
+        Get the identity of the db file on disk, which changes if the db file
+        is replaced, removed or quarantined.
+
+        :returns: a tuple of (st_dev, st_ino) pairs, or None if the db file
+            does not exist
+        """
+        try:
+            stat = os.stat(self.db_file)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return None
+        return ((stat.st_dev, stat.st_ino),)
+
+    def get_change_stamp(self):
+        """
+        Get a stamp of the state of the db that changes whenever the db is
+        modified, whether by this broker or by any other connection, or
+        records are added to its pending file. A stamp can only be compared
+        with others from the same broker.
+
+        :returns: a stamp, or None if changes to the db can't be detected
+        """
+        with self.get() as conn:
+            # data_version changes when other connections commit changes,
+            # total_changes when this connection does
+            row = conn.execute('PRAGMA data_version').fetchone()
+            if not row:
+                return None
+            stamp = (conn, row[0], conn.total_changes)
+        try:
+            pending_size = os.path.getsize(self.pending_file)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            pending_size = 0
+        return stamp + (pending_size,)
+
+    def _reset_instance_cache(self):
+        """
+        Forget any instance attributes loaded from the db that other
+        processes may change in place, before the broker is reused for
+        another request.
+        """
+        pass
+
     def quarantine(self, reason):
         """
         The database will be quarantined and a
@@ -488,6 +581,55 @@ class DatabaseBroker(object):
                 _('Broker error trying to rollback locked connection'))
             conn.close()
 
+    def close(self):
+        """
+        Close the broker's connection to the db, if it has one. Closing the
+        last connection to a db in WAL journal mode checkpoints the
+        write-ahead log into the db file and removes the log, leaving the
+        whole db in its one file.
+        """
+        if self.conn:
+            conn, self.conn = self.conn, None
+            conn.close()
+
+    def get_journal_mode(self):
+        """
+        Get the journal mode of the db.
+
+        :returns: the journal mode, e.g. 'delete' or 'wal'
+        """
+        with self.get() as conn:
+            return conn.execute('PRAGMA journal_mode').fetchone()[0].lower()
+
+    def checkpoint(self):
+        """
+        If the db is in WAL journal mode, copy the transactions in its
+        write-ahead log into the db file and truncate the log. If the
+        configured journal mode is no longer WAL then also switch the db back
+        to DELETE journal mode, which only succeeds if no other connection
+        to the db is open.
+
+        :returns: True if the db file holds every committed transaction,
+            False if some are still only in the write-ahead log, e.g.
+            because they are newer than the snapshot of an active reader
+        """
+        with self.get() as conn:
+            mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            if mode.lower() != 'wal':
+                return True
+            busy, log, checkpointed = conn.execute(
+                'PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+            if DB_JOURNAL_MODE != 'wal':
+                orig_timeout, conn.timeout = conn.timeout, 0.1
+                try:
+                    conn.execute('PRAGMA journal_mode = DELETE')
+                except (sqlite3.OperationalError, LockTimeout):
+                    # still in use; try again at the next checkpoint
+                    pass
+                finally:
+                    conn.timeout = orig_timeout
+            return not busy or log == checkpointed
+
     def newid(self, remote_id):
         """
         Re-id the database.  This should be called after an rsync.
@@ -589,6 +731,147 @@ class DatabaseBroker(object):
             curs.row_factory = dict_factory
             return [r for r in curs]
 
+    def get_item_count_since(self, start):
+        """
+        Get the number of objects in the database after a ROWID.
+
+        :param start: start ROWID
+        :returns: the number of objects after start
+        """
+        self._commit_puts_stale_ok()
+        with self.get() as conn:
+            return conn.execute('''
+                SELECT COUNT(*) FROM %s WHERE ROWID > ?
+            ''' % self.db_contains_type, (start,)).fetchone()[0]
+
+    def _name_range_query(self, select, lower, upper):
+        # the condition on deleted lets the (deleted, name) index be used
+        query = 'SELECT %s FROM %s' % (select, self.db_contains_type)
+        conditions = ['deleted IN (0, 1)']
+        args = []
+        if lower:
+            conditions.append('name > ?')
+            args.append(lower)
+        if upper:
+            conditions.append('name <= ?')
+            args.append(upper)
+        query += ' WHERE ' + ' AND '.join(conditions)
+        return query, args
+
+    def _iter_name_range_hashes(self, conn, lower, upper):
+        """
+        Yield the name and hash of each row in a name range, in name order.
+        A row is hashed over its db_merkle_columns, each value encoded with
+        its length so that the hash is the same on every replica.
+        """
+        columns = list(self.db_merkle_columns)
+        name_index = columns.index('name')
+        query, args = self._name_range_query(
+            ', '.join(columns), lower, upper)
+        try:
+            curs = conn.execute(query + ' ORDER BY name', args)
+        except sqlite3.OperationalError as err:
+            if ('no such column: storage_policy_index' not in str(err) or
+                    'storage_policy_index' not in columns):
+                raise
+            columns[columns.index('storage_policy_index')] = \
+                '0 AS storage_policy_index'
+            query, args = self._name_range_query(
+                ', '.join(columns), lower, upper)
+            curs = conn.execute(query + ' ORDER BY name', args)
+        curs.row_factory = None
+        for row in curs:
+            row_hash = hashlib.md5()
+            for value in row:
+                if value is None:
+                    row_hash.update(b'-')
+                    continue
+                if not isinstance(value, (six.binary_type, six.text_type)):
+                    value = str(value)
+                if isinstance(value, six.text_type):
+                    value = value.encode('utf8')
+                row_hash.update(('%d:' % len(value)).encode('ascii'))
+                row_hash.update(value)
+            yield row[name_index], int(row_hash.hexdigest(), 16)
+
+    def get_merkle_ranges(self, lower, upper, parts):
+        """
+        Split the objects in a name range into ranges of about the same
+        number of objects each, and hash the objects in each of them. An
+        object is in a range if lower < name <= upper; an empty lower or upper
+        leaves that end of the range open. Objects with the same name are
+        never split between ranges.
+
+        The hash of a range is an XOR of the hashes of its objects, so it
+        doesn't depend on the order of objects with the same name.
+
+        :param lower: lower bound of the name range to split
+        :param upper: upper bound of the name range to split
+        :param parts: the most ranges to split the name range into
+        :returns: a list of [lower, upper, hash, count] lists, one per range,
+                  which together cover the given name range
+        """
+        self._commit_puts_stale_ok()
+        with self.get() as conn:
+            query, args = self._name_range_query('COUNT(*)', lower, upper)
+            count = conn.execute(query, args).fetchone()[0]
+            part_size = max(1, -(-count // parts))
+            ranges = []
+            range_lower = lower
+            last_name = None
+            range_hash = range_count = 0
+            for name, row_hash in self._iter_name_range_hashes(
+                    conn, lower, upper):
+                if (range_count >= part_size and name != last_name and
+                        len(ranges) < parts - 1):
+                    ranges.append([range_lower, last_name,
+                                   '%032x' % range_hash, range_count])
+                    range_lower = last_name
+                    range_hash = range_count = 0
+                range_hash ^= row_hash
+                range_count += 1
+                last_name = name
+            ranges.append([range_lower, upper, '%032x' % range_hash,
+                           range_count])
+            return ranges
+
+    def get_merkle_hashes(self, ranges):
+        """
+        Hash the objects in each of some name ranges, the same way as
+        :meth:`get_merkle_ranges`.
+
+        :param ranges: a list of (lower, upper) name ranges
+        :returns: a list of [hash, count] lists, one per range
+        """
+        self._commit_puts_stale_ok()
+        hashes = []
+        with self.get() as conn:
+            for lower, upper in ranges:
+                range_hash = range_count = 0
+                for name, row_hash in self._iter_name_range_hashes(
+                        conn, lower, upper):
+                    range_hash ^= row_hash
+                    range_count += 1
+                hashes.append(['%032x' % range_hash, range_count])
+        return hashes
+
+    def get_items_in_name_range(self, lower, upper):
+        """
+        Get a list of objects in the database in a name range; an object is
+        in the range if lower < name <= upper, and an empty lower or upper
+        leaves that end of the range open.
+
+        :param lower: lower bound of the name range
+        :param upper: upper bound of the name range
+        :returns: list of objects in the name range, in name order
+        """
+        self._commit_puts_stale_ok()
+        with self.get() as conn:
+            query, args = self._name_range_query('*', lower, upper)
+            curs = conn.execute(query + ' ORDER BY name', args)
+            curs.row_factory = dict_factory
+            return [r for r in curs]
+
     def get_sync(self, id, incoming=True):
         """
         Gets the most recent sync point for a server from the sync table.
@@ -679,24 +962,85 @@ class DatabaseBroker(object):
         if self.skip_commits:
             raise DatabaseConnectionError(self.db_file,
                                           'commits not accepted')
+        data = pickle.dumps(self.make_tuple_for_pickle(record),
+                            protocol=PICKLE_PROTOCOL)
+        if self._append_pending(PENDING_RECORD_MARKER +
+                                PENDING_RECORD_LENGTH.pack(len(data)) + data):
+            return
+        # the pending file is full
         with lock_parent_directory(self.pending_file, self.pending_timeout):
-            pending_size = 0
-            try:
-                pending_size = os.path.getsize(self.pending_file)
-            except OSError as err:
-                if err.errno != errno.ENOENT:
-                    raise
-            if pending_size > PENDING_CAP:
-                self._commit_puts([record])
+            self._commit_puts([record])
+
+    def _lock_pending(self, fd, operation):
+        """
+        Lock the open pending file.
+
+        :param fd: file descriptor of the pending file
+        :param operation: fcntl.LOCK_SH or fcntl.LOCK_EX
+        :raises LockTimeout: if the lock can't be taken in ``pending_timeout``
+        """
+        with LockTimeout(self.pending_timeout, self.pending_file):
+            while True:
+                try:
+                    fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                    return
+                except IOError as err:
+                    if err.errno != errno.EAGAIN:
+                        raise
+                sleep(0.01)
+
+    def _append_pending(self, entry):
+        """
+        Append an entry to the pending file, unless the file is full. The
+        entry is written with a single write in append mode while holding a
+        shared lock on the file, so any number of entries may be appended
+        concurrently; _commit_puts() takes an exclusive lock on the file so
+        that it never sees a partly written entry nor discards one.
+
+        :param entry: the entry to append
+        :returns: True if the entry was appended, False if the file is full
+        :raises LockTimeout: if a timeout occurs while waiting to take a lock
+            on the pending file.
+        """
+        fd = os.open(self.pending_file,
+                     os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            self._lock_pending(fd, fcntl.LOCK_SH)
+            if os.fstat(fd).st_size > PENDING_CAP:
+                return False
+            os.write(fd, entry)
+            return True
+        finally:
+            # closing the file releases the lock
+            os.close(fd)
+
+    def put_records(self, records):
+        """
+        Put a batch of records into the DB. The records are committed
+        immediately, together with anything waiting in the pending file. When
+        the pending file has records the commit may be split into several
+        calls to merge_items(), each taking about ``PENDING_COMMIT_BATCH``
+        records.
+
+        :param records: a list of records to be added to the DB.
+        :raises DatabaseConnectionError: if the DB file does not exist or if
+            ``skip_commits`` is True.
+        :raises LockTimeout: if a timeout occurs while waiting to take a lock
+            to commit the pending file.
+        """
+        if self._db_file == ':memory:':
+            self.merge_items(list(records))
+            return
+        if not os.path.exists(self.db_file):
+            raise DatabaseConnectionError(self.db_file, "DB doesn't exist")
+        if self.skip_commits:
+            raise DatabaseConnectionError(self.db_file,
+                                          'commits not accepted')
+        with lock_parent_directory(self.pending_file, self.pending_timeout):
+            if os.path.exists(self.pending_file):
+                self._commit_puts(list(records))
             else:
-                with open(self.pending_file, 'a+b') as fp:
-                    # Colons aren't used in base64 encoding; so they are our
-                    # delimiter
-                    fp.write(':')
-                    fp.write(pickle.dumps(
-                        self.make_tuple_for_pickle(record),
-                        protocol=PICKLE_PROTOCOL).encode('base64'))
-                    fp.flush()
+                self.merge_items(list(records))
 
     def _skip_commit_puts(self):
         return (self._db_file == ':memory:' or self.skip_commits or not
@@ -726,22 +1070,63 @@ class DatabaseBroker(object):
                 self.merge_items(item_list)
             return
         with open(self.pending_file, 'r+b') as fp:
-            for entry in fp.read().split(':'):
-                if entry:
-                    try:
-                        self._commit_puts_load(item_list, entry)
-                    except Exception:
-                        self.logger.exception(
-                            _('Invalid pending entry %(file)s: %(entry)s'),
-                            {'file': self.pending_file, 'entry': entry})
-            if item_list:
-                self.merge_items(item_list)
+            # wait for any records being appended
+            self._lock_pending(fp.fileno(), fcntl.LOCK_EX)
+            for batch in self._load_pending(fp.read(), item_list):
+                self.merge_items(batch)
             try:
                 os.ftruncate(fp.fileno(), 0)
             except OSError as err:
                 if err.errno != errno.ENOENT:
                     raise
 
+    def _load_pending(self, pending, item_list):
+        """
+        Unmarshall the records in the contents of a pending file, in batches
+        of up to ``PENDING_COMMIT_BATCH`` records. Records in both the binary
+        format and the original base64 format are loaded; invalid entries are
+        logged and skipped.
+
+        :param pending: the contents of a pending file
+        :param item_list: a list of records to start the first batch with
+        :returns: an iterator of non-empty lists of records
+        """
+        pos = 0
+        while pos < len(pending):
+            if pending[pos:pos + 1] == PENDING_RECORD_MARKER:
+                start = pos + 1 + PENDING_RECORD_LENGTH.size
+                if start > len(pending):
+                    entry, pos = pending[pos:], len(pending)
+                else:
+                    (length,) = PENDING_RECORD_LENGTH.unpack_from(
+                        pending, pos + 1)
+                    entry, pos = pending[pos:start + length], start + length
+                loader = self._commit_puts_load_binary
+            else:
+                if pending[pos:pos + 1] == ':':
+                    pos += 1
+                end = pending.find(':', pos)
+                if end < 0:
+                    end = len(pending)
+                marker = pending.find(PENDING_RECORD_MARKER, pos, end)
+                if marker >= 0:
+                    end = marker
+                entry, pos = pending[pos:end], end
+                loader = self._commit_puts_load
+            if not entry:
+                continue
+            try:
+                loader(item_list, entry)
+            except Exception:
+                self.logger.exception(
+                    _('Invalid pending entry %(file)s: %(entry)s'),
+                    {'file': self.pending_file, 'entry': entry})
+            if len(item_list) >= PENDING_COMMIT_BATCH:
+                yield item_list
+                item_list = []
+        if item_list:
+            yield item_list
+
     def _commit_puts_stale_ok(self):
         """
         Catch failures of _commit_puts() if broker is intended for
@@ -759,9 +1144,29 @@ class DatabaseBroker(object):
 
     def _commit_puts_load(self, item_list, entry):
         """
-        Unmarshall the :param:entry and append it to :param:item_list.
-        This is implemented by a particular broker to be compatible
-        with its :func:`merge_items`.
+        Unmarshall the :param:entry, a base64 encoded pickle from a pending
+        file in the original format, and append it to :param:item_list.
+        """
+        self._commit_puts_load_tuple(
+            item_list, pickle.loads(entry.decode('base64')))
+
+    def _commit_puts_load_binary(self, item_list, entry):
+        """
+        Unmarshall the :param:entry, a length-prefixed pickle from a pending
+        file, and append it to :param:item_list.
+        """
+        start = len(PENDING_RECORD_MARKER) + PENDING_RECORD_LENGTH.size
+        (length,) = PENDING_RECORD_LENGTH.unpack_from(
+            entry, len(PENDING_RECORD_MARKER))
+        if len(entry) != start + length:
+            raise ValueError('Truncated pending record')
+        self._commit_puts_load_tuple(item_list, pickle.loads(entry[start:]))
+
+    def _commit_puts_load_tuple(self, item_list, data):
+        """
+        Turn :param:data, a tuple made by :meth:`make_tuple_for_pickle`, back
+        into a record and append it to :param:item_list. This is implemented
+        by a particular broker to be compatible with its :func:`merge_items`.
         """
         raise NotImplementedError
 
@@ -1045,3 +1450,123 @@ class DatabaseBroker(object):
             'UPDATE %s_stat SET status_changed_at = ?'
             ' WHERE status_changed_at < ?' % self.db_type,
             (timestamp, timestamp))
+
+
+class BrokerCache(object):
+    """
+    A bounded cache of idle brokers, keyed by db file, that lets a server
+    worker reuse brokers, and their open database connections, across
+    requests.
+
+    A broker is checked out of the cache by :meth:`get_broker` for the
+    duration of a request, so that no two requests share a broker, and is
+    returned to the cache by :meth:`release` once the request is done. A
+    cached broker is only reused if the identity of its db files is
+    unchanged, so brokers of dbs that have since been replaced (e.g. by
+    rsync_then_merge), removed, quarantined or, for containers, have gained
+    or lost a db file while sharding are discarded. Brokers of dbs still in
+    WAL journal mode when that is no longer the configured mode are not
+    cached, so that the dbs can be switched back to DELETE mode.
+
+    :param logger: a logger instance
+    :param size: the max number of idle brokers kept; 0 disables the cache
+    :param idle_time: the max time in seconds an idle broker is kept
+    """
+
+    def __init__(self, logger, size=0, idle_time=300):
+        self.logger = logger
+        self.size = size
+        self.idle_time = idle_time
+        # key -> (cached_at, identity, broker), least recently used first
+        self._brokers = OrderedDict()
+        # greenthread -> list of (key, identity, broker) checked out by it
+        self._checked_out = {}
+
+    def _pop(self, key):
+        entry = self._brokers.pop(key, None)
+        if entry and entry[2].conn:
+            self.logger.decrement('broker_cache.open')
+        return entry
+
+    def _discard(self, broker):
+        if broker.conn:
+            try:
+                broker.conn.close()
+            except Exception:
+                pass
+            broker.conn = None
+
+    def _keep_open(self, broker):
+        # switching a db in WAL journal mode back to DELETE mode needs every
+        # connection to it closed, so don't keep one open for it
+        return DB_JOURNAL_MODE == 'wal' or \
+            not os.path.exists(broker.db_file + '-wal')
+
+    def get_broker(self, broker_class, db_file, **kwargs):
+        """
+        Get a broker for a db file, reusing a cached one if possible. The
+        broker is checked out by the current greenthread until it calls
+        :meth:`release`.
+
+        :param broker_class: the class of broker to make on a cache miss
+        :param db_file: path to the db file
+        :param kwargs: keyword args for the broker; brokers made with
+            different args are cached separately
+        :returns: an instance of ``broker_class``
+        """
+        if not self.size:
+            return broker_class(db_file, **kwargs)
+        key = (broker_class, db_file, tuple(sorted(kwargs.items())))
+        entry = self._pop(key)
+        broker = identity = None
+        if entry:
+            cached_at, cached_identity, broker = entry
+            identity = broker.get_db_identity()
+            if identity == cached_identity and \
+                    cached_at + self.idle_time >= time.time():
+                self.logger.increment('broker_cache.hit')
+                broker._reset_instance_cache()
+            else:
+                self.logger.increment('broker_cache.stale')
+                self._discard(broker)
+                broker = None
+        if broker is None:
+            self.logger.increment('broker_cache.miss')
+            broker = broker_class(db_file, **kwargs)
+            identity = broker.get_db_identity()
+        self._checked_out.setdefault(greenthread.getcurrent(), []).append(
+            (key, identity, broker))
+        return broker
+
+    def release(self):
+        """
+        Return the brokers checked out by the current greenthread to the
+        cache, evicting the least recently used brokers beyond the cache's
+        size or idle time.
+        """
+        checked_out = self._checked_out.pop(greenthread.getcurrent(), None)
+        if not checked_out:
+            return
+        now = time.time()
+        for key, identity, broker in checked_out:
+            if identity is None or not self._keep_open(broker):
+                # the db did not exist when the broker was checked out, or
+                # is to be switched back from WAL journal mode
+                self._discard(broker)
+                continue
+            entry = self._pop(key)
+            if entry:
+                # the same db was checked out concurrently
+                self._discard(entry[2])
+            if broker.conn:
+                self.logger.increment('broker_cache.open')
+            self._brokers[key] = (now, identity, broker)
+        while self._brokers:
+            key, (cached_at, identity, broker) = next(
+                iter(self._brokers.items()))
+            if len(self._brokers) <= self.size and \
+                    cached_at + self.idle_time >= now:
+                break
+            self._pop(key)
+            self.logger.increment('broker_cache.evicted')
+            self._discard(broker)
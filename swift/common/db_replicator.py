@@ -47,6 +47,8 @@ from swift.common.swob import Response, HTTPNotFound, HTTPNoContent, \
 
 
 DEBUG_TIMINGS_THRESHOLD = 10
+#: Number of ranges each differing name range is split into by merkle syncs.
+MERKLE_FANOUT = 16
 
 
 def quarantine_db(object_file, server_type):
@@ -71,6 +73,23 @@ def quarantine_db(object_file, server_type):
         renamer(object_dir, quarantine_dir, fsync=False)
 
 
+def wal_stamp(db_file):
+    """
+    Stamp the write-ahead log of a db in WAL journal mode; the stamp changes
+    when transactions are committed to the log.
+
+    :param db_file: path to the db file
+    :returns: a tuple of the log's size and mtime, or None if there is no log
+    """
+    try:
+        stat = os.stat(db_file + '-wal')
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+        return None
+    return stat.st_size, stat.st_mtime
+
+
 def looks_like_partition(dir_name):
     """
     True if the directory name is a valid partition number, False otherwise.
@@ -196,6 +215,8 @@ class Replicator(Daemon):
         self._local_device_ids = set()
         self.per_diff = int(conf.get('per_diff', 1000))
         self.max_diffs = int(conf.get('max_diffs') or 100)
+        self.merkle_sync = config_true_value(conf.get('merkle_sync', 'no'))
+        self.merkle_leaf_rows = int(conf.get('merkle_leaf_rows', 64))
         self.interval = int(conf.get('interval') or
                             conf.get('run_pause') or 30)
         self.node_timeout = float(conf.get('node_timeout', 10))
@@ -208,6 +229,9 @@ class Replicator(Daemon):
         self.reclaim_age = float(conf.get('reclaim_age', 86400 * 7))
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.DB_JOURNAL_MODE = \
+            swift.common.db.parse_db_journal_mode(
+                conf.get('db_journal_mode'))
         self._zero_stats()
         self.recon_cache_path = conf.get('recon_cache_path',
                                          '/var/cache/swift')
@@ -224,7 +248,8 @@ class Replicator(Daemon):
                       'no_change': 0, 'hashmatch': 0, 'rsync': 0, 'diff': 0,
                       'remove': 0, 'empty': 0, 'remote_merge': 0,
                       'start': time.time(), 'diff_capped': 0, 'deferred': 0,
-                      'failure_nodes': {}}
+                      'merkle': 0, 'merkle_rows': 0, 'merkle_rows_saved': 0,
+                      'merkle_bytes_saved': 0, 'failure_nodes': {}}
 
     def _report_stats(self):
         """Report the current stats to the logs."""
@@ -248,6 +273,11 @@ class Replicator(Daemon):
                          sorted(self.stats.items()) if item[0] in
                          ('no_change', 'hashmatch', 'rsync', 'diff', 'ts_repl',
                           'empty', 'diff_capped', 'remote_merge')]))
+        if self.merkle_sync:
+            self.logger.info(' '.join(['%s:%s' % item for item in
+                             sorted(self.stats.items()) if item[0] in
+                             ('merkle', 'merkle_rows', 'merkle_rows_saved',
+                              'merkle_bytes_saved')]))
 
     def _add_failure_stats(self, failure_devs_info):
         for node, dev in failure_devs_info:
@@ -306,15 +336,27 @@ class Replicator(Daemon):
         rsync_module = rsync_module_interpolation(self.rsync_module, device)
         rsync_path = '%s/tmp/%s' % (device['device'], local_id)
         remote_file = '%s/%s' % (rsync_module, rsync_path)
+        # in WAL journal mode, committed transactions may still be only in
+        # the write-ahead log, which is not synced; copy them to the db file
+        complete = broker.checkpoint()
         mtime = os.path.getmtime(broker.db_file)
+        wal = wal_stamp(broker.db_file)
         if not self._rsync_file(broker.db_file, remote_file,
                                 different_region=different_region):
             return False
         # perform block-level sync if the db was modified during the first sync
-        if os.path.exists(broker.db_file + '-journal') or \
-                os.path.getmtime(broker.db_file) > mtime:
+        if not complete or os.path.exists(broker.db_file + '-journal') or \
+                os.path.getmtime(broker.db_file) > mtime or \
+                wal_stamp(broker.db_file) != wal:
+            complete = broker.checkpoint()
+            wal = wal_stamp(broker.db_file)
             # grab a lock so nobody else can modify it
             with broker.lock():
+                if not complete or wal_stamp(broker.db_file) != wal:
+                    self.logger.warning(
+                        'Unable to sync %s: committed transactions remain '
+                        'in its write-ahead log', broker.db_file)
+                    return False
                 if not self._rsync_file(broker.db_file, remote_file,
                                         whole_file=False,
                                         different_region=different_region):
@@ -388,6 +430,123 @@ class Replicator(Daemon):
                 return True
         return False
 
+    def _merkle_sync_db(self, point, broker, http, remote_id, info):
+        """
+        Sync a db by comparing hashes of name ranges of records with the
+        remote replica, and sending only the records in ranges that differ.
+
+        The ranges form a tree: all records are split into MERKLE_FANOUT
+        ranges with about the same number of local records each, and each
+        range whose hash differs from the remote one is split again, until
+        it holds at most merkle_leaf_rows local records or the remote replica
+        has none; the records in those ranges are then sent in batches of
+        per_diff records.
+
+        :param point: synchronization high water mark between the replicas
+        :param broker: database broker object
+        :param http: ReplConnection object for the remote server
+        :param remote_id: database id for the remote replica
+        :param info: local replication info
+
+        :returns: boolean indicating completion and success, or None if the
+                  remote server failed to hash the first ranges
+        """
+        self.logger.debug('%s merkle syncing to %s, starting at row %s',
+                          broker.db_file,
+                          '%(ip)s:%(port)s/%(device)s' % http.node,
+                          point)
+        start = time.time()
+        sync_table = broker.get_syncs()
+        ranges = broker.get_merkle_ranges('', '', MERKLE_FANOUT)
+        bytes_sent = 0
+        leaf_ranges = []
+        while ranges:
+            remote_hashes = []
+            for i in range(0, len(ranges), self.per_diff):
+                args = [r[:2] for r in ranges[i:i + self.per_diff]]
+                with Timeout(self.node_timeout):
+                    response = http.replicate('merkle_hashes', args)
+                if not response or not is_success(response.status):
+                    if response:
+                        self.logger.error('ERROR Bad response %s from %s',
+                                          response.status, http.host)
+                    # a remote server that doesn't know merkle syncs fails
+                    # at once; let the caller fall back to other modes
+                    return None if bytes_sent == 0 else False
+                remote_hashes.extend(json.loads(response.data))
+                bytes_sent += len(json.dumps(args)) + len(response.data)
+            split_ranges = []
+            for (lower, upper, local_hash, local_count), remote in zip(
+                    ranges, remote_hashes):
+                if [local_hash, local_count] == remote or not local_count:
+                    continue
+                if local_count <= self.merkle_leaf_rows or not remote[1]:
+                    leaf_ranges.append((lower, upper))
+                    continue
+                sub_ranges = broker.get_merkle_ranges(
+                    lower, upper, MERKLE_FANOUT)
+                if len(sub_ranges) > 1:
+                    split_ranges.extend(sub_ranges)
+                else:
+                    # all of its records have the same name
+                    leaf_ranges.append((lower, upper))
+            ranges = split_ranges
+
+        self.stats['merkle'] += 1
+        self.logger.increment('merkles')
+        rows_sent = diffs = 0
+        objects = []
+        for i, (lower, upper) in enumerate(leaf_ranges):
+            objects.extend(broker.get_items_in_name_range(lower, upper))
+            while objects and (len(objects) >= self.per_diff or
+                               i == len(leaf_ranges) - 1):
+                if diffs >= self.max_diffs:
+                    self.logger.debug(
+                        'Synchronization for %s has more than %s rows in '
+                        'differing ranges; moving on and will try again '
+                        'next pass.', broker, self.max_diffs * self.per_diff)
+                    self.stats['diff_capped'] += 1
+                    self.logger.increment('diff_caps')
+                    return False
+                diffs += 1
+                batch = objects[:self.per_diff]
+                del objects[:self.per_diff]
+                if not self._send_replicate_request(
+                        http, 'merge_items', batch, None):
+                    return False
+                rows_sent += len(batch)
+                bytes_sent += len(json.dumps(batch))
+
+        # every record up to info['max_row'] is either in a range that matches
+        # the remote replica or was just sent
+        with Timeout(self.node_timeout):
+            response = http.replicate('merge_syncs', sync_table)
+        if not response or not is_success(response.status):
+            return False
+        broker.merge_syncs([{'remote_id': remote_id,
+                             'sync_point': info['max_row']}],
+                           incoming=False)
+
+        # a usync sends every row since point; estimate the size of its
+        # merge_items requests from the first rows it would send
+        usync_rows = broker.get_item_count_since(point)
+        usync_sample = broker.get_items_since(point, self.per_diff)
+        usync_bytes = (usync_rows * len(json.dumps(usync_sample)) //
+                       max(1, len(usync_sample)))
+        rows_saved = usync_rows - rows_sent
+        bytes_saved = usync_bytes - bytes_sent
+        self.stats['merkle_rows'] += rows_sent
+        self.stats['merkle_rows_saved'] += rows_saved
+        self.stats['merkle_bytes_saved'] += bytes_saved
+        self.logger.update_stats('merkle_rows', rows_sent)
+        self.logger.update_stats('merkle_rows_saved', rows_saved)
+        self.logger.update_stats('merkle_bytes_saved', bytes_saved)
+        self.logger.debug('%s merkle synced %s rows in %s ranges to %s (%gs)',
+                          broker.db_file, rows_sent, len(leaf_ranges),
+                          '%(ip)s:%(port)s/%(device)s' % http.node,
+                          time.time() - start)
+        return True
+
     def _in_sync(self, rinfo, info, broker, local_sync):
         """
         Determine whether or not two replicas of a databases are considered
@@ -485,13 +644,27 @@ class Replicator(Daemon):
                               '%(ip)s:%(port)s/%(device)s' % node)
             return True
 
+        point = max(rinfo['point'], local_sync)
         # if the difference in rowids between the two differs by
         # more than 50% and the difference is greater than per_diff,
         # rsync then do a remote merge.
         # NOTE: difference > per_diff stops us from dropping to rsync
         # on smaller containers, who have only a few rows to sync.
-        if (rinfo['max_row'] / float(info['max_row']) < 0.5 and
-                info['max_row'] - rinfo['max_row'] > self.per_diff):
+        remote_merge = (
+            rinfo['max_row'] / float(info['max_row']) < 0.5 and
+            info['max_row'] - rinfo['max_row'] > self.per_diff)
+        # rather than rsync the db or send more rows than a usync can in one
+        # pass, find the rows that differ from the remote replica with a
+        # merkle sync
+        if self.merkle_sync and (
+                remote_merge or
+                info['max_row'] - point > self.max_diffs * self.per_diff):
+            success = self._merkle_sync_db(point, broker, http, rinfo['id'],
+                                           info)
+            if success is not None:
+                return success
+
+        if remote_merge:
             self.stats['remote_merge'] += 1
             self.logger.increment('remote_merges')
             return self._rsync_db(broker, node, http, info['id'],
@@ -499,8 +672,7 @@ class Replicator(Daemon):
                                   replicate_timeout=(info['count'] / 2000),
                                   different_region=different_region)
         # else send diffs over to the remote server
-        return self._usync_db(max(rinfo['point'], local_sync),
-                              broker, http, rinfo['id'], info['id'])
+        return self._usync_db(point, broker, http, rinfo['id'], info['id'])
 
     def _post_replicate_hook(self, broker, info, responses):
         """
@@ -573,6 +745,7 @@ class Replicator(Daemon):
             broker = self.brokerclass(object_file, pending_timeout=30)
             broker.reclaim(now - self.reclaim_age,
                            now - (self.reclaim_age * 2))
+            broker.checkpoint()
             info = broker.get_replication_info()
             bpart = self.ring.get_part(
                 info['account'], info.get('container'))
@@ -938,6 +1111,9 @@ class ReplicatorRpc(object):
         broker.merge_items(args[0], args[1])
         return HTTPAccepted()
 
+    def merkle_hashes(self, broker, args):
+        return Response(json.dumps(broker.get_merkle_hashes(args[0])))
+
     def complete_rsync(self, drive, db_file, args):
         old_filename = os.path.join(self.root, drive, 'tmp', args[0])
         if args[1:]:
@@ -948,6 +1124,8 @@ class ReplicatorRpc(object):
             return HTTPNotFound()
         broker = self.broker_class(old_filename)
         broker.newid(args[0])
+        # leave no transaction behind in a write-ahead log
+        broker.close()
         renamer(old_filename, db_file)
         return HTTPNoContent()
 
@@ -966,6 +1144,9 @@ class ReplicatorRpc(object):
         new_broker = self.broker_class(tmp_filename)
         existing_broker = self.broker_class(db_file)
         db_file = existing_broker.db_file
+        if existing_broker.get_journal_mode() == 'wal':
+            return self._merge_rsynced_db(existing_broker, new_broker,
+                                          args[0])
         point = -1
         objects = existing_broker.get_items_since(point, 1000)
         while len(objects):
@@ -979,9 +1160,37 @@ class ReplicatorRpc(object):
         new_broker.update_metadata(existing_broker.metadata)
         if self._abort_rsync_then_merge(db_file, tmp_filename):
             return HTTPNotFound()
+        # leave no transaction behind in a write-ahead log
+        new_broker.close()
         renamer(tmp_filename, db_file)
         return HTTPNoContent()
 
+    def _merge_rsynced_db(self, existing_broker, new_broker, remote_id):
+        """
+        Merge an rsynced db into an existing db in WAL journal mode, in
+        place. A db in WAL mode can't be replaced by renaming another db over
+        it, because processes that still have it open would go on using its
+        write-ahead log with the new db.
+
+        :param existing_broker: broker of the existing db
+        :param new_broker: broker of the rsynced db
+        :param remote_id: the ID of the remote db that was rsynced
+        """
+        point = -1
+        objects = new_broker.get_items_since(point, 1000)
+        while len(objects):
+            existing_broker.merge_items(objects, remote_id)
+            point = objects[-1]['ROWID']
+            objects = new_broker.get_items_since(point, 1000)
+            sleep()
+        existing_broker.merge_syncs(new_broker.get_syncs())
+        # the existing broker is the one kept, so the roles are swapped
+        self._post_rsync_then_merge_hook(new_broker, existing_broker)
+        existing_broker.update_metadata(new_broker.metadata)
+        new_broker.close()
+        os.unlink(new_broker.db_file)
+        return HTTPNoContent()
+
 # Footnote [1]:
 #   This orders the nodes so that, given nodes a b c, a will contact b then c,
 # b will contact c then a, and c will contact a then b -- in other words, each
@@ -27,7 +27,7 @@ import six
 import six.moves.cPickle as pickle
 from six.moves.http_client import HTTPException
 
-from swift.common.bufferedhttp import http_connect
+from swift.common.bufferedhttp import http_connect, release_connection
 from swift.common.exceptions import ClientException
 from swift.common.utils import Timestamp, FileLikeIter
 from swift.common.http import HTTP_NO_CONTENT, HTTP_INSUFFICIENT_STORAGE, \
@@ -123,6 +123,7 @@ def _make_req(node, part, method, path, headers, stype,
     with Timeout(response_timeout):
         resp = conn.getresponse()
         resp.read()
+    release_connection(conn, resp)
     if not is_success(resp.status):
         raise DirectClientException(stype, method, node, part, path, resp)
     return resp
@@ -167,8 +168,11 @@ def _get_direct_account_container(path, stype, node, part,
         resp_headers[header] = value
     if resp.status == HTTP_NO_CONTENT:
         resp.read()
+        release_connection(conn, resp)
         return resp_headers, []
-    return resp_headers, json.loads(resp.read())
+    body = resp.read()
+    release_connection(conn, resp)
+    return resp_headers, json.loads(body)
 
 
 def gen_headers(hdrs_in=None, add_ts=False, add_user_agent=True):
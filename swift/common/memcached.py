@@ -53,7 +53,7 @@ from hashlib import md5
 
 from eventlet.green import socket
 from eventlet.pools import Pool
-from eventlet import Timeout
+from eventlet import GreenPool, Timeout
 from six.moves import range
 from swift.common import utils
 
@@ -93,18 +93,21 @@ def sanitize_timeout(timeout):
     return int(timeout)
 
 
-def set_msg(key, flags, timeout, value):
+def set_msg(key, flags, timeout, value, noreply=False):
     if not isinstance(key, bytes):
         raise TypeError('key must be bytes')
     if not isinstance(value, bytes):
         raise TypeError('value must be bytes')
-    return b' '.join([
+    parts = [
         b'set',
         key,
         str(flags).encode('ascii'),
         str(timeout).encode('ascii'),
         str(len(value)).encode('ascii'),
-    ]) + (b'\r\n' + value + b'\r\n')
+    ]
+    if noreply:
+        parts.append(b'noreply')
+    return b' '.join(parts) + (b'\r\n' + value + b'\r\n')
 
 
 class MemcacheConnectionError(Exception):
@@ -156,7 +159,7 @@ class MemcacheRing(object):
     def __init__(self, servers, connect_timeout=CONN_TIMEOUT,
                  io_timeout=IO_TIMEOUT, pool_timeout=POOL_TIMEOUT,
                  tries=TRY_COUNT, allow_pickle=False, allow_unpickle=False,
-                 max_conns=2):
+                 max_conns=2, noreply_sets=False):
         self._ring = {}
         self._errors = dict(((serv, []) for serv in servers))
         self._error_limited = dict(((serv, 0) for serv in servers))
@@ -174,6 +177,7 @@ class MemcacheRing(object):
         self._pool_timeout = pool_timeout
         self._allow_pickle = allow_pickle
         self._allow_unpickle = allow_unpickle or allow_pickle
+        self._noreply_sets = noreply_sets
 
     def _exception_occurred(self, server, e, action='talking',
                             sock=None, fp=None, got_connection=True):
@@ -211,10 +215,10 @@ class MemcacheRing(object):
                 self._error_limited[server] = now + ERROR_LIMIT_DURATION
                 logging.error('Error limiting server %s', server)
 
-    def _get_conns(self, key):
+    def _iter_servers(self, key):
         """
-        Retrieves a server conn from the pool, or connects a new one.
-        Chooses the server based on a consistent hash of "key".
+        Yields the servers to try for "key", in the order of the consistent
+        hash ring.
         """
         pos = bisect(self._sorted, key)
         served = []
@@ -224,6 +228,14 @@ class MemcacheRing(object):
             if server in served:
                 continue
             served.append(server)
+            yield server
+
+    def _get_conns(self, key):
+        """
+        Retrieves a server conn from the pool, or connects a new one.
+        Chooses the server based on a consistent hash of "key".
+        """
+        for server in self._iter_servers(key):
             if self._error_limited[server] > time.time():
                 continue
             sock = None
@@ -277,9 +289,11 @@ class MemcacheRing(object):
         for (server, fp, sock) in self._get_conns(key):
             try:
                 with Timeout(self._io_timeout):
-                    sock.sendall(set_msg(key, flags, timeout, value))
-                    # Wait for the set to complete
-                    fp.readline()
+                    sock.sendall(set_msg(key, flags, timeout, value,
+                                         noreply=self._noreply_sets))
+                    if not self._noreply_sets:
+                        # Wait for the set to complete
+                        fp.readline()
                     self._return_conn(server, fp, sock)
                     return
             except (Exception, Timeout) as e:
@@ -440,14 +454,16 @@ class MemcacheRing(object):
             elif serialize:
                 value = json.dumps(value).encode('ascii')
                 flags |= JSON_FLAG
-            msg.append(set_msg(key, flags, timeout, value))
+            msg.append(set_msg(key, flags, timeout, value,
+                               noreply=self._noreply_sets))
         for (server, fp, sock) in self._get_conns(server_key):
             try:
                 with Timeout(self._io_timeout):
                     sock.sendall(b''.join(msg))
-                    # Wait for the set to complete
-                    for line in range(len(mapping)):
-                        fp.readline()
+                    if not self._noreply_sets:
+                        # Wait for the set to complete
+                        for line in range(len(mapping)):
+                            fp.readline()
                     self._return_conn(server, fp, sock)
                     return
             except (Exception, Timeout) as e:
@@ -498,3 +514,39 @@ class MemcacheRing(object):
                     return values
             except (Exception, Timeout) as e:
                 self._exception_occurred(server, e, sock=sock, fp=fp)
+
+    def get_many(self, keys):
+        """
+        Gets multiple values from memcache for the given keys. Unlike
+        :meth:`get_multi`, each key is fetched from its own server; the keys
+        for each server are fetched with a single request, and the servers are
+        asked in parallel.
+
+        :param keys: keys for values to be retrieved from memcache
+        :returns: list of values, in the same order as the keys, with None for
+                  any key that was not found
+        """
+        now = time.time()
+        server_keys = {}
+        for key in keys:
+            for server in self._iter_servers(md5hash(key)):
+                if self._error_limited[server] <= now:
+                    server_keys.setdefault(server, []).append(key)
+                    break
+        found = {}
+
+        def fetch(keys_for_server):
+            # the first key's consistent hash will choose the same server
+            values = self.get_multi(keys_for_server, keys_for_server[0])
+            if values:
+                found.update(zip(keys_for_server, values))
+
+        if len(server_keys) > 1:
+            pool = GreenPool(len(server_keys))
+            for keys_for_server in server_keys.values():
+                pool.spawn_n(fetch, keys_for_server)
+            pool.waitall()
+        else:
+            for keys_for_server in server_keys.values():
+                fetch(keys_for_server)
+        return [found.get(key) for key in keys]
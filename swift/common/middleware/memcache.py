@@ -17,6 +17,7 @@ import os
 
 from six.moves.configparser import ConfigParser, NoSectionError, NoOptionError
 
+from swift.common.utils import config_true_value
 from swift.common.memcached import (MemcacheRing, CONN_TIMEOUT, POOL_TIMEOUT,
                                     IO_TIMEOUT, TRY_COUNT)
 
@@ -84,6 +85,8 @@ class MemcacheMiddleware(object):
             'pool_timeout', POOL_TIMEOUT))
         tries = int(memcache_options.get('tries', TRY_COUNT))
         io_timeout = float(memcache_options.get('io_timeout', IO_TIMEOUT))
+        noreply_sets = config_true_value(memcache_options.get(
+            'noreply_sets', False))
 
         if not self.memcache_servers:
             self.memcache_servers = '127.0.0.1:11211'
@@ -102,7 +105,8 @@ class MemcacheMiddleware(object):
             io_timeout=io_timeout,
             allow_pickle=(serialization_format == 0),
             allow_unpickle=(serialization_format <= 1),
-            max_conns=max_conns)
+            max_conns=max_conns,
+            noreply_sets=noreply_sets)
 
     def __call__(self, env, start_response):
         env['swift.cache'] = self.memcache
@@ -18,7 +18,8 @@ from swift import gettext_ as _
 import eventlet
 
 from swift.common.utils import cache_from_env, get_logger, register_swift_info
-from swift.proxy.controllers.base import get_account_info, get_container_info
+from swift.proxy.controllers.base import get_account_info, \
+    get_container_info, prefetch_info
 from swift.common.memcached import MemcacheConnectionError
 from swift.common.swob import Request, Response
 
@@ -241,6 +242,17 @@ class RateLimitMiddleware(object):
         if not self.memcache_client:
             return None
 
+        if container_name and (
+                (obj_name and
+                 req.method in ('PUT', 'DELETE', 'POST', 'COPY')) or
+                (not obj_name and req.method == 'GET')):
+            # we will need the container info as well as the account info,
+            # so get both from memcache in one go
+            try:
+                prefetch_info(req.environ, self.app)
+            except ValueError:
+                pass
+
         try:
             account_info = get_account_info(req.environ, self.app,
                                             swift_source='RL')
@@ -282,6 +282,32 @@ def copy_header_subset(from_r, to_r, condition):
             to_r.headers[k] = v
 
 
+def get_container_update_record(op, obj, headers, policy_index):
+    """
+    Make the object record that a container update would put in the
+    container DB, as sent in the body of a container server UPDATE request.
+
+    :param op: operation performed (ex: 'PUT', or 'DELETE')
+    :param obj: object name
+    :param headers: dictionary of headers of the container update
+    :param policy_index: the storage policy index of the object
+    :returns: a dict, the object record
+    """
+    headers = HeaderKeyDict(headers)
+    if op == 'DELETE':
+        return {'name': obj, 'created_at': headers['x-timestamp'],
+                'size': 0, 'content_type': 'application/deleted',
+                'etag': 'noetag', 'deleted': 1,
+                'storage_policy_index': int(policy_index)}
+    return {'name': obj, 'created_at': headers['x-timestamp'],
+            'size': int(headers['x-size']),
+            'content_type': headers['x-content-type'],
+            'etag': headers['x-etag'], 'deleted': 0,
+            'storage_policy_index': int(policy_index),
+            'ctype_timestamp': headers.get('x-content-type-timestamp'),
+            'meta_timestamp': headers.get('x-meta-timestamp')}
+
+
 def check_path_header(req, name, length, error_msg):
     """
     Validate that the value of path-like header is
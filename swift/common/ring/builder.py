@@ -37,6 +37,12 @@ from swift.common.ring import RingData
 from swift.common.ring.utils import tiers_for_dev, build_tier_tree, \
     validate_and_normalize_address, validate_replicas_by_tier, pretty_dev
 
+try:
+    import numpy
+except ImportError:
+    # the rebalance just falls back to the pure python code paths
+    numpy = None
+
 # we can't store None's in the replica2part2dev array, so we high-jack
 # the max value for magic to represent the part is not currently
 # assigned to any device.
@@ -67,6 +73,42 @@ def _set_random_seed(seed):
             random.setstate(random_state)
 
 
+def _part2dev_array(part2dev):
+    """
+    Returns a numpy array of the dev ids in a part2dev array.
+    """
+    if isinstance(part2dev, array) and part2dev.typecode == 'H':
+        if not part2dev:
+            return numpy.zeros(0, dtype=numpy.uint16)
+        return numpy.frombuffer(part2dev, dtype=numpy.uint16)
+    return numpy.array(part2dev, dtype=numpy.uint16)
+
+
+def _count_replicas_at_tier(tier_ids):
+    """
+    Counts the replicas of each part that share a tier.
+
+    :param tier_ids: a numpy array with a row for each replica and a column
+                     for each part holding the index of the tier that
+                     part-replica is assigned to, or -1 if it is unassigned
+    :returns: a tuple (counts, first) of arrays shaped like tier_ids; counts
+              holds the number of replicas of the part in the tier of each
+              part-replica, and first is True for just one of the
+              part-replicas of each part in each tier
+    """
+    assigned = tier_ids >= 0
+    counts = numpy.zeros(tier_ids.shape, dtype=numpy.int32)
+    first = assigned.copy()
+    for replica, replica_tier_ids in enumerate(tier_ids):
+        for other, other_tier_ids in enumerate(tier_ids):
+            same_tier = replica_tier_ids == other_tier_ids
+            counts[replica] += same_tier
+            if other < replica:
+                first[replica] &= ~same_tier
+    counts[~assigned] = 0
+    return counts, first
+
+
 class RingBuilder(object):
     """
     Used to build swift.common.ring.RingData instances to be written to disk
@@ -134,6 +176,11 @@ class RingBuilder(object):
         self._remove_devs = []
         self._ring = None
 
+        # If NumPy is installed, the loops over every part-replica in the
+        # ring during a rebalance are done with arrays instead; the result is
+        # exactly the same ring, just built (a lot) sooner.
+        self.use_numpy = numpy is not None
+
         self.logger = logging.getLogger("swift.ring.builder")
         if not self.logger.handlers:
             self.logger.disabled = True
@@ -586,6 +633,8 @@ class RingBuilder(object):
         :returns: number of parts with different assignments than
             old_replica2part2dev if provided
         """
+        if self.use_numpy:
+            return self._build_dispersion_graph_numpy(old_replica2part2dev)
 
         # Since we're going to loop over every replica of every part we'll
         # also count up changed_parts if old_replica2part2dev is passed in
@@ -639,6 +688,64 @@ class RingBuilder(object):
         self.version += 1
         return changed_parts
 
+    def _build_dispersion_graph_numpy(self, old_replica2part2dev=None):
+        """
+        The same as _build_dispersion_graph, but counts replicas at tiers for
+        all the parts at once using numpy.
+        """
+        old_replica2part2dev = old_replica2part2dev or []
+        changed_parts = 0
+
+        int_replicas = int(math.ceil(self.replicas))
+        max_allowed_replicas = self._build_max_replicas_by_tier()
+        tiers, dev2tier = self._build_tier_index()
+        max_allowed = numpy.array(
+            [max_allowed_replicas[tier] for tier in tiers] + [0])
+
+        # like zip(*self._replica2part2dev), only go over the parts that have
+        # every replica
+        parts = min([len(part2dev) for part2dev
+                     in self._replica2part2dev or []] or [0])
+        replica2part2dev = self._build_replica2part2dev_array(parts)
+        for replica, part2dev in enumerate(replica2part2dev):
+            try:
+                old_part2dev = _part2dev_array(
+                    old_replica2part2dev[replica])[:parts]
+            except IndexError:
+                changed_parts += parts
+                continue
+            changed_parts += parts - len(old_part2dev)
+            changed_parts += int(numpy.count_nonzero(
+                part2dev[:len(old_part2dev)] != old_part2dev))
+
+        dispersion_graph = {}
+        graph_width = int_replicas + 1
+        # parts_at_risk_by_depth[depth][part] is how many replicas over the
+        # max allowed the part has in the tiers of that depth
+        parts_at_risk_by_depth = numpy.zeros((len(dev2tier) + 1, parts))
+        for depth, depth_dev2tier in enumerate(dev2tier):
+            tier_ids = depth_dev2tier[replica2part2dev]
+            counts, first = _count_replicas_at_tier(tier_ids)
+            tier_ids, counts = tier_ids[first], counts[first]
+            # the number of parts with each replica count at each tier
+            tier_replica_counts = numpy.bincount(
+                tier_ids * graph_width + counts,
+                minlength=len(tiers) * graph_width,
+            ).reshape(len(tiers), graph_width)
+            for tier_id in numpy.unique(tier_ids).tolist():
+                graph = [int(n) for n in tier_replica_counts[tier_id]]
+                graph[0] = self.parts - sum(graph)
+                dispersion_graph[tiers[tier_id]] = graph
+            over_max = numpy.maximum(counts - max_allowed[tier_ids], 0)
+            parts_at_risk_by_depth[depth + 1] = numpy.bincount(
+                numpy.nonzero(first)[1], weights=over_max, minlength=parts)
+        # count each part-replica once at tier where dispersion is worst
+        parts_at_risk = parts_at_risk_by_depth.max(axis=0).sum()
+        self._dispersion_graph = dispersion_graph
+        self.dispersion = 100.0 * parts_at_risk / (self.parts * self.replicas)
+        self.version += 1
+        return changed_parts
+
     def validate(self, stats=False):
         """
         Validate the ring.
@@ -847,6 +954,83 @@ class RingBuilder(object):
             if dev is not None:
                 yield dev
 
+    def _build_tier_index(self):
+        """
+        Numbers the tiers of all the devices for the numpy code paths.
+
+        :returns: a tuple (tiers, dev2tier); tiers is a list of tiers and
+                  dev2tier is a numpy array such that
+                  tiers[dev2tier[depth][dev_id]] is the tier of length
+                  depth + 1 of the device, or -1 if there's no such device
+                  (e.g. NONE_DEV)
+        """
+        tiers = []
+        tier_ids = {}
+        dev2tier = numpy.full((4, NONE_DEV + 1), -1, dtype=numpy.int32)
+        for dev in self._iter_devs():
+            for depth, tier in enumerate(dev.get('tiers') or
+                                         tiers_for_dev(dev)):
+                if tier not in tier_ids:
+                    tier_ids[tier] = len(tiers)
+                    tiers.append(tier)
+                dev2tier[depth][dev['id']] = tier_ids[tier]
+        return tiers, dev2tier
+
+    def _build_replica2part2dev_array(self, parts=None):
+        """
+        Returns _replica2part2dev as a numpy array with a row for each
+        replica; the rows of fractional replicas are padded with NONE_DEV.
+
+        :param parts: the number of parts to include, defaults to all of them
+        """
+        if parts is None:
+            parts = self.parts
+        replica2part2dev = self._replica2part2dev or []
+        replica2part2dev_array = numpy.full(
+            (len(replica2part2dev), parts), NONE_DEV, dtype=numpy.uint16)
+        for replica, part2dev in enumerate(replica2part2dev):
+            part2dev = _part2dev_array(part2dev)[:parts]
+            replica2part2dev_array[replica][:len(part2dev)] = part2dev
+        return replica2part2dev_array
+
+    def _parts_for_dispersion(self, replica_plan):
+        """
+        Returns the parts _gather_parts_for_dispersion should consider, in
+        order. With numpy that is just the parts that have some replica in a
+        tier over its max replicas.
+        """
+        if not self.use_numpy:
+            return range(self.parts)
+        tiers, dev2tier = self._build_tier_index()
+        max_replicas = numpy.array(
+            [replica_plan[tier]['max'] for tier in tiers] + [0])
+        replica2part2dev = self._build_replica2part2dev_array()
+        undispersed = numpy.zeros(self.parts, dtype=bool)
+        for depth_dev2tier in dev2tier:
+            tier_ids = depth_dev2tier[replica2part2dev]
+            counts, _first = _count_replicas_at_tier(tier_ids)
+            undispersed |= (counts > max_replicas[tier_ids]).any(axis=0)
+        return numpy.nonzero(undispersed)[0].tolist()
+
+    def _parts_for_balance(self, start):
+        """
+        Returns the parts the _gather_parts_for_balance methods should
+        consider, in order, beginning at start. With numpy that is just the
+        parts with a replica on an overweight device.
+
+        :param start: offset into self.parts to begin search
+        """
+        if not self.use_numpy:
+            return ((start + offset) % self.parts
+                    for offset in range(self.parts))
+        overweight = numpy.zeros(NONE_DEV + 1, dtype=bool)
+        for dev in self._iter_devs():
+            overweight[dev['id']] = dev['parts_wanted'] < 0
+        replica2part2dev = self._build_replica2part2dev_array()
+        parts = numpy.nonzero(overweight[replica2part2dev].any(axis=0))[0]
+        return numpy.concatenate(
+            (parts[parts >= start], parts[parts < start])).tolist()
+
     def _build_tier2children(self):
         """
         Wrap helper build_tier_tree so exclude zero-weight devices.
@@ -925,6 +1109,15 @@ class RingBuilder(object):
         elapsed_hours = int(time() - self._last_part_moves_epoch) // 3600
         if elapsed_hours <= 0:
             return
+        if self.use_numpy:
+            last_part_moves = numpy.frombuffer(
+                self._last_part_moves, dtype=numpy.uint8).astype(numpy.uint32)
+            last_part_moves = numpy.minimum(
+                last_part_moves + min(elapsed_hours, 0xff), 0xff)
+            self._last_part_moves = array(
+                'B', last_part_moves.astype(numpy.uint8).tobytes())
+            self._last_part_moves_epoch = int(time())
+            return
         for part in range(self.parts):
             # The "min(self._last_part_moves[part] + elapsed_hours, 0xff)"
             # which was here showed up in profiling, so it got inlined.
@@ -948,7 +1141,11 @@ class RingBuilder(object):
         if self._remove_devs:
             dev_ids = [d['id'] for d in self._remove_devs if d['parts']]
             if dev_ids:
-                for part, replica in self._each_part_replica():
+                if self.use_numpy:
+                    part_replicas = self._each_part_replica_on(dev_ids)
+                else:
+                    part_replicas = self._each_part_replica()
+                for part, replica in part_replicas:
                     dev_id = self._replica2part2dev[replica][part]
                     if dev_id in dev_ids:
                         self._replica2part2dev[replica][part] = NONE_DEV
@@ -1039,7 +1236,7 @@ class RingBuilder(object):
         """
         # Now we gather partitions that are "at risk" because they aren't
         # currently sufficient spread out across the cluster.
-        for part in range(self.parts):
+        for part in self._parts_for_dispersion(replica_plan):
             if (not self._can_part_move(part)):
                 continue
             # First, add up the count of replicas at each tier for each
@@ -1105,8 +1302,7 @@ class RingBuilder(object):
                 parts_wanted_in_tier[tier] += wanted
         # Last, we gather partitions from devices that are "overweight" because
         # they have more partitions than their parts_wanted.
-        for offset in range(self.parts):
-            part = (start + offset) % self.parts
+        for part in self._parts_for_balance(start):
             if (not self._can_part_move(part)):
                 continue
             # For each part we'll look at the devices holding those parts and
@@ -1200,8 +1396,7 @@ class RingBuilder(object):
         :param assign_parts: the map of partition => [replica] to update
         :param start: offset into self.parts to begin search
         """
-        for offset in range(self.parts):
-            part = (start + offset) % self.parts
+        for part in self._parts_for_balance(start):
             if (not self._can_part_move(part)):
                 continue
             overweight_dev_replica = []
@@ -1674,6 +1869,16 @@ class RingBuilder(object):
             for part in range(len(part2dev)):
                 yield (part, replica)
 
+    def _each_part_replica_on(self, dev_ids):
+        """
+        Generator yielding every (partition, replica) pair in the ring that is
+        assigned to one of dev_ids, in the same order as _each_part_replica.
+        """
+        for replica, part2dev in enumerate(self._replica2part2dev):
+            on_devs = numpy.in1d(_part2dev_array(part2dev), dev_ids)
+            for part in numpy.nonzero(on_devs)[0].tolist():
+                yield (part, replica)
+
     @classmethod
     def load(cls, builder_file, open=open, **kwargs):
         """
@@ -1710,6 +1915,10 @@ class RingBuilder(object):
         if not hasattr(builder, '_id'):
             builder._id = None
 
+        if not hasattr(builder, 'use_numpy'):
+            # nor did they know about the NumPy rebalance path
+            builder.use_numpy = numpy is not None
+
         for dev in builder.devs:
             # really old rings didn't have meta keys
             if dev and 'meta' not in dev:
@@ -25,6 +25,7 @@ import os
 from io import BufferedReader
 from hashlib import md5
 from itertools import chain
+import mmap
 from tempfile import NamedTemporaryFile
 import sys
 
@@ -35,26 +36,127 @@ from swift.common.utils import hash_path, validate_configuration
 from swift.common.ring.utils import tiers_for_dev
 
 
+# Sections of a v2 ring file start on multiples of this many bytes, so that
+# the partition tables can be mmapped and shared through the page cache.
+V2_ALIGNMENT = 4096
+
+
 def calc_replica_count(replica2part2dev_id):
     base = len(replica2part2dev_id) - 1
     extra = 1.0 * len(replica2part2dev_id[-1]) / len(replica2part2dev_id[0])
     return base + extra
 
 
+def _align(offset):
+    return -(-offset // V2_ALIGNMENT) * V2_ALIGNMENT
+
+
+class MappedPart2DevId(object):
+    """
+    Read-only, array-like view of one replica's partition to device id table
+    in a mmapped v2 ring file. Behaves like the ``array('H')`` that a v1 ring
+    file is loaded into, but the table is never copied into process memory.
+
+    :param buf: the mmapped ring file
+    :param offset: offset of the table within ``buf``
+    :param length: number of partitions in the table
+    :param byteorder: byte order of the table, 'little' or 'big'
+    """
+
+    def __init__(self, buf, offset, length, byteorder):
+        self._buf = buf
+        self._offset = offset
+        self._length = length
+        self._byteswap = byteorder != sys.byteorder
+        self._struct = struct.Struct('<H' if byteorder == 'little' else '>H')
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, part):
+        if isinstance(part, slice):
+            return self.to_array()[part]
+        if part < 0:
+            part += self._length
+        if not 0 <= part < self._length:
+            raise IndexError('partition index out of range')
+        return self._struct.unpack_from(self._buf, self._offset + 2 * part)[0]
+
+    def __iter__(self):
+        chunk = V2_ALIGNMENT * 16
+        end = self._offset + 2 * self._length
+        for start in range(self._offset, end, chunk):
+            part2dev = array.array('H', self._buf[start:min(start + chunk,
+                                                            end)])
+            if self._byteswap:
+                part2dev.byteswap()
+            for dev_id in part2dev:
+                yield dev_id
+
+    def __eq__(self, other):
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def to_array(self):
+        """
+        :returns: a copy of the table as an ``array('H')``
+        """
+        part2dev = array.array(
+            'H', self._buf[self._offset:self._offset + 2 * self._length])
+        if self._byteswap:
+            part2dev.byteswap()
+        return part2dev
+
+    def tostring(self):
+        return self.to_array().tostring()
+
+
 class RingData(object):
     """Partitioned consistent hashing ring data (used for serialization)."""
 
     def __init__(self, replica2part2dev_id, devs, part_shift,
                  next_part_power=None):
+        self._devs_loader = None
         self.devs = devs
         self._replica2part2dev_id = replica2part2dev_id
         self._part_shift = part_shift
         self.next_part_power = next_part_power
+        self._dev_ids_with_parts = None
+
+    def __setstate__(self, state):
+        # old-style pickled rings may hold a RingData with a plain devs
+        # attribute
+        self.__dict__.update(state)
+        self._devs_loader = None
+        self._dev_ids_with_parts = None
+        if 'devs' in state:
+            self.devs = self.__dict__.pop('devs')
 
-        for dev in self.devs:
+    @property
+    def devs(self):
+        if self._devs is None and self._devs_loader is not None:
+            self.devs = self._devs_loader()
+            self._devs_loader = None
+        return self._devs
+
+    @devs.setter
+    def devs(self, devs):
+        self._devs = devs
+        for dev in devs or []:
             if dev is not None:
                 dev.setdefault("region", 1)
 
+    @property
+    def dev_ids_with_parts(self):
+        """The set of ids of devices with at least one partition assigned."""
+        if self._dev_ids_with_parts is None:
+            self._dev_ids_with_parts = set()
+            for part2dev_id in self._replica2part2dev_id:
+                self._dev_ids_with_parts.update(part2dev_id)
+        return self._dev_ids_with_parts
+
     @property
     def replica_count(self):
         """Number of replicas (full or partial) used in the ring."""
@@ -95,6 +197,46 @@ class RingData(object):
 
         return ring_dict
 
+    @classmethod
+    def deserialize_v2(cls, file_obj, metadata_only=False):
+        """
+        Deserialize an (uncompressed) v2 ring file into a RingData instance.
+
+        The partition tables are not read: the file is mmapped read-only and
+        each replica's table is a :class:`MappedPart2DevId` view onto it, so
+        that every process using the ring shares the same pages of the page
+        cache. The device list is only parsed when ``devs`` is first used.
+
+        :param file file_obj: An opened file object which has already consumed
+                              the 6 bytes of magic and version.
+        :param bool metadata_only: If True, don't map the partition tables;
+                                   `replica2part2dev_id` will be `[]`.
+        :returns: A RingData instance
+        """
+        json_len, = struct.unpack('!I', file_obj.read(4))
+        meta = json.loads(file_obj.read(json_len).decode('ascii'))
+        replica2part2dev_id = []
+        devs_offset = meta['data_offset']
+        if metadata_only:
+            for length in meta['replica_lengths']:
+                devs_offset = _align(devs_offset + 2 * length)
+            file_obj.seek(devs_offset)
+            devs_json = file_obj.read(meta['devs_length'])
+        else:
+            buf = mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+            for length in meta['replica_lengths']:
+                replica2part2dev_id.append(MappedPart2DevId(
+                    buf, devs_offset, length, meta['byteorder']))
+                devs_offset = _align(devs_offset + 2 * length)
+            devs_json = buf[devs_offset:devs_offset + meta['devs_length']]
+
+        ring_data = cls(replica2part2dev_id, None, meta['part_shift'],
+                        meta.get('next_part_power'))
+        ring_data._devs_loader = lambda: json.loads(devs_json.decode('ascii'))
+        if not metadata_only:
+            ring_data._dev_ids_with_parts = set(meta['dev_ids_with_parts'])
+        return ring_data
+
     @classmethod
     def load(cls, filename, metadata_only=False):
         """
@@ -104,6 +246,11 @@ class RingData(object):
         :param bool metadata_only: If True, only load `devs` and `part_shift`.
         :returns: A RingData instance containing the loaded data.
         """
+        with open(filename, 'rb') as file_obj:
+            if file_obj.read(6) == struct.pack('!4sH', b'R1NG', 2):
+                return cls.deserialize_v2(
+                    file_obj, metadata_only=metadata_only)
+
         gz_file = BufferedReader(GzipFile(filename, 'rb'))
 
         # See if the file is in the new format
@@ -150,21 +297,78 @@ class RingData(object):
         for part2dev_id in ring['replica2part2dev_id']:
             file_obj.write(part2dev_id.tostring())
 
-    def save(self, filename, mtime=1300507380.0):
+    def serialize_v2(self, file_obj):
+        """
+        Write this ring out in the v2 format: an uncompressed file laid out
+        as a header, the partition tables, then the device list, with each
+        section starting on a ``V2_ALIGNMENT`` boundary. The tables are
+        always written little-endian.
+        """
+        ring = self.to_dict()
+        replica_lengths = [len(part2dev_id)
+                           for part2dev_id in ring['replica2part2dev_id']]
+        devs_json = json.dumps(ring['devs'], sort_keys=True,
+                               ensure_ascii=True).encode('ascii')
+        meta = {'part_shift': ring['part_shift'],
+                'replica_count': len(replica_lengths),
+                'replica_lengths': replica_lengths,
+                'byteorder': 'little',
+                'devs_length': len(devs_json),
+                'dev_ids_with_parts': sorted(self.dev_ids_with_parts),
+                'data_offset': 0}
+        if ring.get('next_part_power') is not None:
+            meta['next_part_power'] = ring['next_part_power']
+
+        # the header holds the offset of the data that follows it, so grow
+        # that offset until the header fits in front of it
+        while True:
+            json_text = json.dumps(meta, sort_keys=True,
+                                   ensure_ascii=True).encode('ascii')
+            header_len = 10 + len(json_text)
+            if header_len <= meta['data_offset']:
+                break
+            meta['data_offset'] = _align(header_len)
+
+        file_obj.write(struct.pack('!4sHI', b'R1NG', 2, len(json_text)))
+        file_obj.write(json_text)
+        offset = header_len
+        for part2dev_id in ring['replica2part2dev_id']:
+            file_obj.write(b'\x00' * (_align(offset) - offset))
+            offset = _align(offset)
+            part2dev_id = array.array('H', part2dev_id)
+            if sys.byteorder != 'little':
+                part2dev_id.byteswap()
+            file_obj.write(part2dev_id.tostring())
+            offset += 2 * len(part2dev_id)
+        file_obj.write(b'\x00' * (_align(offset) - offset))
+        file_obj.write(devs_json)
+
+    def save(self, filename, mtime=1300507380.0, format_version=1):
         """
         Serialize this RingData instance to disk.
 
         :param filename: File into which this instance should be serialized.
         :param mtime: time used to override mtime for gzip, default or None
                       if the caller wants to include time
+        :param format_version: 1 for a gzipped v1 ring file, 2 for an
+                               uncompressed, mmap-able v2 ring file
         """
-        # Override the timestamp so that the same ring data creates
-        # the same bytes on disk. This makes a checksum comparison a
-        # good way to see if two rings are identical.
         tempf = NamedTemporaryFile(dir=".", prefix=filename, delete=False)
-        gz_file = GzipFile(filename, mode='wb', fileobj=tempf, mtime=mtime)
-        self.serialize_v1(gz_file)
-        gz_file.close()
+        if format_version == 2:
+            self.serialize_v2(tempf)
+        elif format_version == 1:
+            # Override the timestamp so that the same ring data creates
+            # the same bytes on disk. This makes a checksum comparison a
+            # good way to see if two rings are identical.
+            gz_file = GzipFile(filename, mode='wb', fileobj=tempf,
+                               mtime=mtime)
+            self.serialize_v1(gz_file)
+            gz_file.close()
+        else:
+            tempf.close()
+            os.unlink(tempf.name)
+            raise ValueError('Unknown ring format version %r' %
+                             (format_version,))
         tempf.flush()
         os.fsync(tempf.fileno())
         tempf.close()
@@ -246,10 +450,7 @@ class Ring(object):
             # way, a region, zone, or server with no partitions assigned
             # does not count toward our totals, thereby keeping the early
             # bailouts in get_more_nodes() working.
-            dev_ids_with_parts = set()
-            for part2dev_id in self._replica2part2dev_id:
-                for dev_id in part2dev_id:
-                    dev_ids_with_parts.add(dev_id)
+            dev_ids_with_parts = ring_data.dev_ids_with_parts
 
             regions = set()
             zones = set()
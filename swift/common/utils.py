@@ -3626,7 +3626,16 @@ class LRUCache(object):
         self.tail = [self.head, None, None, None, None]  # newest
         self.head[self.NEXT] = self.tail
 
+    def _unlink(self, link):
+        link_prev, link_next = link[self.PREV], link[self.NEXT]
+        link_prev[self.NEXT] = link_next
+        link_next[self.PREV] = link_prev
+
     def set_cache(self, value, *key):
+        # replace, rather than duplicate, any link left for a timed out key
+        link = self.mapping.pop(key, None)
+        if link is not None:
+            self._unlink(link)
         while len(self.mapping) >= self.maxsize:
             old_next, old_key = self.head[self.NEXT][self.NEXT:self.NEXT + 2]
             self.head[self.NEXT], old_next[self.PREV] = old_next, self.head
@@ -3648,6 +3657,25 @@ class LRUCache(object):
         link[self.NEXT] = self.tail
         return value
 
+    def get(self, *key):
+        """
+        Return the value cached for ``key``.
+
+        :raises KeyError: if ``key`` is not cached or has timed out
+        """
+        link = self.mapping.get(key, self.head)
+        if link is self.head:
+            raise KeyError('%r is not cached' % (key,))
+        return self.get_cached(link, *key)
+
+    def delete(self, *key):
+        """
+        Remove ``key`` from the cache, if it is cached.
+        """
+        link = self.mapping.pop(key, None)
+        if link is not None:
+            self._unlink(link)
+
     def __call__(self, f):
 
         class LRUCacheWrapped(object):
@@ -4920,6 +4948,40 @@ def find_shard_range(item, ranges):
     return None
 
 
+def filter_shard_ranges(shard_ranges, includes, marker, end_marker):
+    """
+    Filter the given shard ranges to those whose namespace includes the
+    ``includes`` name or any part of the namespace between ``marker`` and
+    ``end_marker``. If none of ``includes``, ``marker`` or ``end_marker`` are
+    specified then all shard ranges will be returned.
+
+    :param shard_ranges: A list of :class:`~swift.common.utils.ShardRange`.
+    :param includes: a string; if not empty then only the shard range, if any,
+        whose namespace includes this string will be returned, and ``marker``
+        and ``end_marker`` will be ignored.
+    :param marker: if specified then only shard ranges whose upper bound is
+        greater than this value will be returned.
+    :param end_marker: if specified then only shard ranges whose lower bound is
+        less than this value will be returned.
+    :return: A filtered list of :class:`~swift.common.utils.ShardRange`.
+    """
+    if includes:
+        shard_range = find_shard_range(includes, shard_ranges)
+        return [shard_range] if shard_range else []
+
+    def shard_range_filter(sr):
+        end = start = True
+        if end_marker:
+            end = end_marker > sr.lower
+        if marker:
+            start = marker < sr.upper
+        return start and end
+
+    if marker or end_marker:
+        return list(filter(shard_range_filter, shard_ranges))
+    return shard_ranges
+
+
 def modify_priority(conf, logger):
     """
     Modify priority by nice and ionice.
@@ -422,6 +422,22 @@ def load_app_config(conf_file):
 class SwiftHttpProtocol(wsgi.HttpProtocol):
     default_request_version = "HTTP/1.0"
 
+    def handle_one_request(self):
+        wsgi.HttpProtocol.handle_one_request(self)
+        # If the client asked for "Expect: 100-continue" and we answered with
+        # a final response without ever sending the 100 Continue, eventlet
+        # leaves the request body unread. We can't know whether the client
+        # will go on to send that body anyway, so the connection must not be
+        # kept alive for another request.
+        request_input = getattr(self, 'environ', {}).get('eventlet.input')
+        if request_input is None or request_input.wfile is None or \
+                getattr(request_input, 'is_hundred_continue_response_sent',
+                        False):
+            return
+        if request_input.chunked_input or \
+                request_input.position < (request_input.content_length or 0):
+            self.close_connection = 1
+
     def log_request(self, *a):
         """
         Turn off logging requests by the underlying WSGI software.
@@ -43,6 +43,9 @@ class ContainerAuditor(Daemon):
             float(conf.get('containers_per_second', 200))
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.DB_JOURNAL_MODE = \
+            swift.common.db.parse_db_journal_mode(
+                conf.get('db_journal_mode'))
         self.recon_cache_path = conf.get('recon_cache_path',
                                          '/var/cache/swift')
         self.rcache = os.path.join(self.recon_cache_path, "container.recon")
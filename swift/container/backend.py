@@ -21,7 +21,6 @@ import os
 from uuid import uuid4
 
 import six
-import six.moves.cPickle as pickle
 from six.moves import range
 import sqlite3
 from eventlet import tpool
@@ -30,10 +29,10 @@ from swift.common.constraints import CONTAINER_LISTING_LIMIT
 from swift.common.exceptions import LockTimeout
 from swift.common.utils import Timestamp, encode_timestamps, \
     decode_timestamps, extract_swift_bytes, storage_directory, hash_path, \
-    ShardRange, renamer, find_shard_range, MD5_OF_EMPTY_STRING, mkdirs, \
+    ShardRange, renamer, filter_shard_ranges, MD5_OF_EMPTY_STRING, mkdirs, \
     get_db_files, parse_db_filename, make_db_file_path, split_path
 from swift.common.db import DatabaseBroker, utf8encode, BROKER_TIMEOUT, \
-    zero_like, DatabaseAlreadyExists
+    zero_like, DatabaseAlreadyExists, DELIMITER_SKIP_ROWS
 
 SQLITE_ARG_LIMIT = 999
 
@@ -320,6 +319,8 @@ class ContainerBroker(DatabaseBroker):
     db_type = 'container'
     db_contains_type = 'object'
     db_reclaim_timestamp = 'created_at'
+    db_merkle_columns = ('name', 'created_at', 'size', 'content_type', 'etag',
+                         'deleted', 'storage_policy_index')
 
     def __init__(self, db_file, timeout=BROKER_TIMEOUT, logger=None,
                  account=None, container=None, pending_timeout=None,
@@ -424,6 +425,35 @@ class ContainerBroker(DatabaseBroker):
         self.conn = None
         self._db_files = get_db_files(self._init_db_file)
 
+    def get_db_identity(self):
+        """
+        Get the identity of the db files on disk, which changes if a db file
+        is replaced, removed or quarantined, or if a db file is added or
+        removed while sharding.
+
+        :returns: a tuple of (st_dev, st_ino) pairs, or None if no db file
+            exists
+        """
+        if self._db_file == ':memory:':
+            return None
+        identity = []
+        for db_file in get_db_files(self._init_db_file):
+            try:
+                stat = os.stat(db_file)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                continue
+            identity.append((stat.st_dev, stat.st_ino))
+        return tuple(identity) or None
+
+    def _reset_instance_cache(self):
+        # the storage policy index and shard root may be updated in place
+        # by other processes
+        if hasattr(self, '_storage_policy_index'):
+            del self._storage_policy_index
+        self._root_account = self._root_container = None
+
     @property
     def db_files(self):
         """
@@ -641,9 +671,10 @@ class ContainerBroker(DatabaseBroker):
                 status_changed_at = ?
             WHERE delete_timestamp < ? """, (timestamp, timestamp, timestamp))
 
-    def _commit_puts_load(self, item_list, entry):
-        """See :func:`swift.common.db.DatabaseBroker._commit_puts_load`"""
-        data = pickle.loads(entry.decode('base64'))
+    def _commit_puts_load_tuple(self, item_list, data):
+        """
+        See :func:`swift.common.db.DatabaseBroker._commit_puts_load_tuple`
+        """
         (name, timestamp, size, content_type, etag, deleted) = data[:6]
         if len(data) > 6:
             storage_policy_index = data[6]
@@ -1099,6 +1130,9 @@ class ContainerBroker(DatabaseBroker):
         if prefix:
             end_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1)
         orig_marker = marker
+        # the number of rows to skip by reading on adapts to the sizes of
+        # the pseudo-directories found
+        skip_rows = DELIMITER_SKIP_ROWS
         with self.get() as conn:
             results = []
             deleted_key = self._get_deleted_key(conn)
@@ -1168,11 +1202,32 @@ class ContainerBroker(DatabaseBroker):
                     return [transform_func(r) for r in curs]
 
                 # We have a delimiter and a prefix (possibly empty string) to
-                # handle
+                # handle. Once a row under a pseudo-directory is found, the
+                # marker is set past the pseudo-directory, and its remaining
+                # rows are skipped: the first few by reading on, the rest by
+                # querying again from the marker.
                 rowcount = 0
+                skipping = None
                 for row in curs:
                     rowcount += 1
                     name = row[0]
+                    if skipping is not None:
+                        if reverse:
+                            skipped = name >= end_marker
+                        elif delim_force_gte:
+                            skipped = name < marker
+                        else:
+                            skipped = name <= marker
+                        if skipped:
+                            skipping += 1
+                            if skipping > skip_rows:
+                                skip_rows = max(1, skip_rows // 2)
+                                curs.close()
+                                break
+                            continue
+                        skip_rows = min(DELIMITER_SKIP_ROWS, skip_rows * 2)
+                        skipping = None
+                        delim_force_gte = False
                     if reverse:
                         end_marker = name
                     else:
@@ -1190,8 +1245,8 @@ class ContainerBroker(DatabaseBroker):
                                 end_marker = name[:end + 1]
                             else:
                                 marker = name[:end] + chr(ord(delimiter) + 1)
-                            curs.close()
-                            break
+                            skipping = 0
+                            continue
                     elif end >= 0:
                         if reverse:
                             end_marker = name[:end + 1]
@@ -1202,8 +1257,11 @@ class ContainerBroker(DatabaseBroker):
                         dir_name = name[:end + 1]
                         if dir_name != orig_marker:
                             results.append([dir_name, '0', 0, None, ''])
-                        curs.close()
-                        break
+                            if len(results) >= limit:
+                                curs.close()
+                                return results
+                        skipping = 0
+                        continue
                     results.append(transform_func(row))
                 if not rowcount:
                     break
@@ -1714,14 +1772,6 @@ class ContainerBroker(DatabaseBroker):
             at the tail of other shard ranges.
         :return: a list of instances of :class:`swift.common.utils.ShardRange`
         """
-        def shard_range_filter(sr):
-            end = start = True
-            if end_marker:
-                end = end_marker > sr.lower
-            if marker:
-                start = marker < sr.upper
-            return start and end
-
         if reverse:
             marker, end_marker = end_marker, marker
         if marker and end_marker and marker >= end_marker:
@@ -1736,14 +1786,13 @@ class ContainerBroker(DatabaseBroker):
         # note if this ever changes to *not* sort by upper first then it breaks
         # a key assumption for bisect, which is used by utils.find_shard_ranges
         shard_ranges.sort(key=lambda sr: (sr.upper, sr.state, sr.lower))
+        shard_ranges = filter_shard_ranges(
+            shard_ranges, includes, marker, end_marker)
         if includes:
-            shard_range = find_shard_range(includes, shard_ranges)
-            return [shard_range] if shard_range else []
+            return shard_ranges
 
         if reverse:
             shard_ranges.reverse()
-        if marker or end_marker:
-            shard_ranges = list(filter(shard_range_filter, shard_ranges))
 
         if fill_gaps:
             if reverse:
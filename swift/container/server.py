@@ -27,7 +27,8 @@ from swift.container.sync_store import ContainerSyncStore
 from swift.container.backend import ContainerBroker, DATADIR, \
     RECORD_TYPE_SHARD, UNSHARDED, SHARDING, SHARDED, SHARD_UPDATE_STATES
 from swift.container.replicator import ContainerReplicatorRpc
-from swift.common.db import DatabaseAlreadyExists
+from swift.common.db import BrokerCache, DatabaseAlreadyExists, \
+    DatabaseConnectionError
 from swift.common.container_sync_realms import ContainerSyncRealms
 from swift.common.request_helpers import get_param, \
     split_and_validate_path, is_sys_or_user_meta
@@ -121,6 +122,13 @@ class ContainerController(BaseStorageServer):
                                 'be ignored in a future release.')
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.DB_JOURNAL_MODE = \
+            swift.common.db.parse_db_journal_mode(
+                conf.get('db_journal_mode'))
+        #: Per-worker cache of idle brokers, reused across requests.
+        self.broker_cache = BrokerCache(
+            self.logger, size=int(conf.get('broker_cache_size', 0)),
+            idle_time=float(conf.get('broker_cache_idle_time', 300)))
         self.sync_store = ContainerSyncStore(self.root,
                                              self.logger,
                                              self.mount_check)
@@ -141,7 +149,7 @@ class ContainerController(BaseStorageServer):
         kwargs.setdefault('account', account)
         kwargs.setdefault('container', container)
         kwargs.setdefault('logger', self.logger)
-        return ContainerBroker(db_path, **kwargs)
+        return self.broker_cache.get_broker(ContainerBroker, db_path, **kwargs)
 
     def get_and_validate_policy_index(self, req):
         """
@@ -495,6 +503,73 @@ class ContainerController(BaseStorageServer):
                                 headers={'x-backend-storage-policy-index':
                                          broker.storage_policy_index})
 
+    def _update_records_from_body(self, req):
+        """
+        Make the object records of an UPDATE request.
+
+        :param req: an instance of :class:`~swift.common.swob.Request`
+        :returns: a list of object records
+        :raises ValueError, KeyError, TypeError: if the body is not a valid
+            list of object updates
+        """
+        updates = json.loads(req.body)
+        if not isinstance(updates, list):
+            raise ValueError('Expected a list of object updates')
+        records = []
+        for update in updates:
+            if not check_utf8(update['name']):
+                raise ValueError('Invalid object name %r' % update['name'])
+            records.append({
+                'name': update['name'],
+                'created_at': Timestamp(update['created_at']).internal,
+                'size': int(update['size']),
+                'content_type': update['content_type'],
+                'etag': update['etag'],
+                'deleted': 1 if update['deleted'] else 0,
+                'storage_policy_index': int(update['storage_policy_index']),
+                'ctype_timestamp': update.get('ctype_timestamp'),
+                'meta_timestamp': update.get('meta_timestamp')})
+        return records
+
+    @public
+    @timing_stats()
+    def UPDATE(self, req):
+        """
+        Handle HTTP UPDATE request (merge a batch of object updates).
+
+        The body is a JSON list of object records in the form they take in the
+        container DB, each of which is handled as if it were an object PUT or
+        DELETE to this container.
+
+        If the request can accept a redirection but the container has shard
+        ranges then the updates are refused with a 412, so that the sender
+        will send them individually and be redirected to the right shards.
+        """
+        drive, part, account, container = split_and_validate_path(req, 4)
+        req_timestamp = valid_timestamp(req)
+        if not check_drive(self.root, drive, self.mount_check):
+            return HTTPInsufficientStorage(drive=drive, request=req)
+        requested_policy_index = self.get_and_validate_policy_index(req)
+        try:
+            records = self._update_records_from_body(req)
+        except (ValueError, KeyError, TypeError) as err:
+            return HTTPBadRequest('Invalid body: %r' % err)
+        broker = self._get_container_broker(drive, part, account, container)
+        self._maybe_autocreate(broker, req_timestamp, account,
+                               requested_policy_index or 0)
+        if config_true_value(
+                req.headers.get('x-backend-accept-redirect', False)) and \
+                broker.get_shard_ranges(states=SHARD_UPDATE_STATES):
+            return HTTPPreconditionFailed(
+                request=req, body='Container has shard ranges')
+        if records:
+            try:
+                broker.put_records(records)
+            except DatabaseConnectionError:
+                # the db was removed since it was found
+                return HTTPNotFound(request=req)
+        return HTTPAccepted(request=req)
+
     @public
     @timing_stats(sample_rate=0.1)
     def HEAD(self, req):
@@ -611,6 +686,13 @@ class ContainerController(BaseStorageServer):
           listing to be returned from a deleted container whose DB file still
           exists.
 
+        * If the ``X-Backend-Override-Shard-Name-Filter`` header has value
+          ``sharded`` and the container state is ``sharded`` then any
+          ``marker``, ``end_marker``, ``includes`` and ``reverse`` parameters
+          are ignored and all shard ranges are listed, so that the complete
+          listing may be cached by the proxy. The response then includes an
+          ``X-Backend-Override-Shard-Name-Filter`` header with value ``true``.
+
         :param req: an instance of :class:`swift.common.swob.Request`
         :returns: an instance of :class:`swift.common.swob.Response`
         """
@@ -665,6 +747,14 @@ class ContainerController(BaseStorageServer):
                     return HTTPBadRequest(request=req, body='Bad state')
             include_deleted = config_true_value(
                 req.headers.get('x-backend-include-deleted', False))
+            override_filter = req.headers.get(
+                'x-backend-override-shard-name-filter', '').lower()
+            if override_filter == info.get('db_state') == SHARDED:
+                # the proxy wants the complete set of shard ranges so that it
+                # can cache them; it will apply the name filters itself
+                resp_headers['X-Backend-Override-Shard-Name-Filter'] = 'true'
+                marker = end_marker = includes = None
+                reverse = False
             container_list = broker.get_shard_ranges(
                 marker, end_marker, includes, reverse, states=states,
                 include_deleted=include_deleted, fill_gaps=fill_gaps)
@@ -765,6 +855,8 @@ class ContainerController(BaseStorageServer):
                     'ERROR __call__ error with %(method)s %(path)s '),
                     {'method': req.method, 'path': req.path})
                 res = HTTPInternalServerError(body=traceback.format_exc())
+            finally:
+                self.broker_cache.release()
         if self.log_requests:
             trans_time = time.time() - start_time
             log_message = get_log_line(req, res, trans_time, '')
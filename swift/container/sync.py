@@ -223,6 +223,9 @@ class ContainerSync(Daemon):
         self._myport = int(conf.get('bind_port', 6201))
         swift.common.db.DB_PREALLOCATION = \
             config_true_value(conf.get('db_preallocation', 'f'))
+        swift.common.db.DB_JOURNAL_MODE = \
+            swift.common.db.parse_db_journal_mode(
+                conf.get('db_journal_mode'))
         self.conn_timeout = float(conf.get('conn_timeout', 5))
         request_tries = int(conf.get('request_tries') or 3)
 
@@ -18,16 +18,19 @@ import os
 import sys
 import time
 import signal
+from collections import defaultdict
 from os.path import basename, dirname, join
 from random import shuffle
 from swift import gettext_ as _
 from contextlib import closing
-from eventlet import Timeout
+from eventlet import GreenPool, Timeout, tpool
+from eventlet.semaphore import Semaphore
 
 from swift.obj import diskfile, replicator
 from swift.common.utils import (
     get_logger, ratelimit_sleep, dump_recon_cache, list_from_csv, listdir,
-    unlink_paths_older_than, readconf, config_auto_int_value, round_robin_iter)
+    unlink_paths_older_than, readconf, config_auto_int_value, round_robin_iter,
+    config_true_value)
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist,\
     DiskFileDeleted, DiskFileExpired
 from swift.common.daemon import Daemon
@@ -44,6 +47,7 @@ class AuditorWorker(object):
         self.max_files_per_second = float(conf.get('files_per_second', 20))
         self.max_bytes_per_second = float(conf.get('bytes_per_second',
                                                    10000000))
+        self.object_concurrency = int(conf.get('object_concurrency', 1))
         try:
             # ideally unless ops overrides the rsync_tempfile_timeout in the
             # auditor section we can base our behavior on whatever they
@@ -79,11 +83,18 @@ class AuditorWorker(object):
         if self.zero_byte_only_at_fps:
             self.max_files_per_second = float(self.zero_byte_only_at_fps)
             self.auditor_type = 'ZBF'
+        # only the full auditor audits recently written objects first
+        self.audit_recent_writes = self.auditor_type == 'ALL' and \
+            config_true_value(conf.get('audit_recent_writes', 'false'))
+        self.recent_writes_interval = int(conf.get('interval', 30))
+        self.recent_writes_audited = 0
         self.log_time = int(conf.get('log_time', 3600))
         self.last_logged = 0
         self.files_running_time = 0
         self.bytes_running_time = 0
+        self._bytes_ratelimit = Semaphore()
         self.bytes_processed = 0
+        self.device_stats = defaultdict(lambda: defaultdict(int))
         self.total_bytes_processed = 0
         self.total_files_processed = 0
         self.passes = 0
@@ -131,10 +142,18 @@ class AuditorWorker(object):
                         auditor_type=self.auditor_type))
 
         all_locs = round_robin_iter(loc_generators)
+        if self.audit_recent_writes:
+            self.recent_writes_audited = 0
+            all_locs = self.recent_writes_first(all_locs, device_dirs)
+        pool = None
+        if self.object_concurrency > 1:
+            pool = GreenPool(self.object_concurrency)
         for location in all_locs:
             loop_time = time.time()
-            self.failsafe_object_audit(location)
-            self.logger.timing_since('timing', loop_time)
+            if pool:
+                pool.spawn_n(self.timed_object_audit, location)
+            else:
+                self.timed_object_audit(location)
             self.files_running_time = ratelimit_sleep(
                 self.files_running_time, self.max_files_per_second)
             self.total_files_processed += 1
@@ -163,6 +182,14 @@ class AuditorWorker(object):
                      'bytes_processed': self.bytes_processed,
                      'start_time': reported, 'audit_time': time_auditing})
                 dump_recon_cache(cache_entry, self.rcache, self.logger)
+                for device, stats in sorted(self.device_stats.items()):
+                    self.logger.info(
+                        'Object audit (%(type)s) of %(device)s: '
+                        'files/sec: %(frate).2f, bytes/sec: %(brate).2f', {
+                            'type': self.auditor_type, 'device': device,
+                            'frate': stats['files'] / (now - reported),
+                            'brate': stats['bytes'] / (now - reported)})
+                self.device_stats.clear()
                 reported = now
                 total_quarantines += self.quarantines
                 total_errors += self.errors
@@ -172,6 +199,8 @@ class AuditorWorker(object):
                 self.bytes_processed = 0
                 self.last_logged = now
             time_auditing += (now - loop_time)
+        if pool:
+            pool.waitall()
         # Avoid divide by zero during very short runs
         elapsed = (time.time() - begin) or 0.000001
         self.logger.info(_(
@@ -187,6 +216,12 @@ class AuditorWorker(object):
                 'frate': self.total_files_processed / elapsed,
                 'brate': self.total_bytes_processed / elapsed,
                 'audit': time_auditing, 'audit_rate': time_auditing / elapsed})
+        if self.audit_recent_writes:
+            self.logger.info(
+                'Object audit (%(type)s%(description)s): %(count)d recently '
+                'written objects audited first', {
+                    'type': self.auditor_type, 'description': description,
+                    'count': self.recent_writes_audited})
         if self.stats_sizes:
             self.logger.info(
                 _('Object audit stats: %s') % json.dumps(self.stats_buckets))
@@ -197,6 +232,42 @@ class AuditorWorker(object):
                 policy,
                 self.auditor_type)
 
+    def recent_write_locations(self, device_dirs=None):
+        """
+        Yields the locations of the objects recently written to the devices
+        being audited, taking them from the devices' journals.
+
+        :param device_dirs: a list of device names, or None for all devices
+        """
+        devices = device_dirs or listdir(self.devices)
+        for policy in POLICIES:
+            diskfile_mgr = self.diskfile_router[policy]
+            for device in devices:
+                for location in diskfile_mgr.consume_recent_writes(
+                        device, policy):
+                    self.recent_writes_audited += 1
+                    yield location
+
+    def recent_writes_first(self, locations, device_dirs=None):
+        """
+        Yields the locations of recently written objects ahead of the given
+        locations of the full sweep. The journals of recent writes are
+        checked every recent_writes_interval seconds, and once more when the
+        full sweep is done.
+
+        :param locations: an iterator of audit locations
+        :param device_dirs: a list of device names, or None for all devices
+        """
+        next_check = 0
+        for location in locations:
+            if time.time() >= next_check:
+                for recent in self.recent_write_locations(device_dirs):
+                    yield recent
+                next_check = time.time() + self.recent_writes_interval
+            yield location
+        for recent in self.recent_write_locations(device_dirs):
+            yield recent
+
     def record_stats(self, obj_size):
         """
         Based on config's object_size_stats will keep track of how many objects
@@ -214,6 +285,35 @@ class AuditorWorker(object):
         else:
             self.stats_buckets["OVER"] += 1
 
+    def timed_object_audit(self, location):
+        """
+        Audits the given object location and records how long it took.
+        """
+        begin = time.time()
+        self.failsafe_object_audit(location)
+        self.logger.timing_since('timing', begin)
+
+    def iter_chunks(self, reader):
+        """
+        Yields the chunks of an object being audited.
+
+        When several objects are audited at once each chunk is read, and
+        checked by the reader, in a worker thread, so that the reads and
+        checksums of different objects overlap.
+
+        :param reader: a DiskFileReader
+        """
+        if self.object_concurrency <= 1:
+            for chunk in reader:
+                yield chunk
+            return
+        chunks = iter(reader)
+        while True:
+            chunk = tpool.execute(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
     def failsafe_object_audit(self, location):
         """
         Entrypoint to object_audit, with a failsafe generic exception handler.
@@ -251,14 +351,19 @@ class AuditorWorker(object):
                     reader = df.reader(_quarantine_hook=raise_dfq)
             if reader:
                 with closing(reader):
-                    for chunk in reader:
+                    for chunk in self.iter_chunks(reader):
                         chunk_len = len(chunk)
-                        self.bytes_running_time = ratelimit_sleep(
-                            self.bytes_running_time,
-                            self.max_bytes_per_second,
-                            incr_by=chunk_len)
+                        # concurrent audits take turns so that they share
+                        # the rate limit
+                        with self._bytes_ratelimit:
+                            self.bytes_running_time = ratelimit_sleep(
+                                self.bytes_running_time,
+                                self.max_bytes_per_second,
+                                incr_by=chunk_len)
                         self.bytes_processed += chunk_len
                         self.total_bytes_processed += chunk_len
+                        self.device_stats[location.device]['bytes'] += \
+                            chunk_len
         except DiskFileQuarantined as err:
             self.quarantines += 1
             self.logger.error(_('ERROR Object %(obj)s failed audit and was'
@@ -277,6 +382,7 @@ class AuditorWorker(object):
             pass
 
         self.passes += 1
+        self.device_stats[location.device]['files'] += 1
         # _ondisk_info attr is initialized to None and filled in by open
         ondisk_info_dict = df._ondisk_info or {}
         if 'unexpected' in ondisk_info_dict:
@@ -31,12 +31,14 @@ are also not considered part of the backend API.
 """
 
 import six.moves.cPickle as pickle
+import binascii
 import copy
 import errno
 import fcntl
 import json
 import os
 import re
+import struct
 import time
 import uuid
 import hashlib
@@ -65,7 +67,7 @@ from swift.common.utils import mkdirs, Timestamp, \
     config_true_value, listdir, split_path, remove_file, \
     get_md5_socket, F_SETPIPE_SZ, decode_timestamps, encode_timestamps, \
     MD5_OF_EMPTY_STRING, link_fd_to_path, o_tmpfile_supported, \
-    O_TMPFILE, makedirs_count, replace_partition_in_path
+    O_TMPFILE, makedirs_count, replace_partition_in_path, LRUCache
 from swift.common.splice import splice, tee
 from swift.common.exceptions import DiskFileQuarantined, DiskFileNotExist, \
     DiskFileCollision, DiskFileNoSpace, DiskFileDeviceUnavailable, \
@@ -83,6 +85,22 @@ PICKLE_PROTOCOL = 2
 DEFAULT_RECLAIM_AGE = timedelta(weeks=1).total_seconds()
 HASH_FILE = 'hashes.pkl'
 HASH_INVALIDATIONS_FILE = 'hashes.invalid'
+BINARY_HASH_FILE = 'hashes.bin'
+# hashes.bin is a header (magic, version, valid, updated, checksum) followed by
+# a bitmap of the suffixes in the partition, a bitmap of the suffixes with a
+# valid hash and a 16 byte md5 slot for every possible suffix. The checksum is
+# an md5 of the rest of the file, hashes.bin is updated in place and readers
+# don't hold the partition lock, so a read that overlaps a write is retried.
+BINARY_HASHES_HEADER = struct.Struct('!4sB?xxd16s')
+BINARY_HASHES_CHECKSUM_OFFSET = BINARY_HASHES_HEADER.size - 16
+BINARY_HASHES_READ_ATTEMPTS = 3
+BINARY_HASHES_MAGIC = b'HASH'
+BINARY_HASHES_VERSION = 1
+BINARY_HASHES_SUFFIXES = 16 ** 3
+BINARY_HASHES_BITMAP_SIZE = BINARY_HASHES_SUFFIXES // 8
+BINARY_HASHES_MD5_OFFSET = (BINARY_HASHES_HEADER.size +
+                            2 * BINARY_HASHES_BITMAP_SIZE)
+BINARY_HASHES_SIZE = BINARY_HASHES_MD5_OFFSET + 16 * BINARY_HASHES_SUFFIXES
 METADATA_KEY = b'user.swift.metadata'
 METADATA_CHECKSUM_KEY = b'user.swift.metadata_checksum'
 DROP_CACHE_WINDOW = 1024 * 1024
@@ -96,6 +114,11 @@ TMP_BASE = 'tmp'
 get_data_dir = partial(get_policy_string, DATADIR_BASE)
 get_async_dir = partial(get_policy_string, ASYNCDIR_BASE)
 get_tmp_dir = partial(get_policy_string, TMP_BASE)
+RECENT_WRITES_BASE = 'recent_writes'
+get_recent_writes_file = partial(get_policy_string, RECENT_WRITES_BASE)
+# The journal of recently written objects of a device stops growing at this
+# size until the auditor consumes it
+RECENT_WRITES_MAX_SIZE = 16 * 1024 * 1024
 MIN_TIME_UPDATE_AUDITOR_STATUS = 60
 # This matches rsync tempfiles, like ".<timestamp>.data.Xy095a"
 RE_RSYNC_TEMPFILE = re.compile(r'^\..*\.([a-zA-Z0-9_]){6}$')
@@ -344,21 +367,218 @@ def write_hashes(partition_dir, hashes):
     write_pickle(hashes, hashes_file, partition_dir, PICKLE_PROTOCOL)
 
 
-def consolidate_hashes(partition_dir):
+def _encode_binary_hashes(hashes):
+    """
+    Pack a hashes dict into the contents of a hashes.bin file.
+
+    Anything that isn't a suffix dir is left out, and a suffix whose hash
+    isn't a hex md5 is marked as needing to be rehashed.
+    """
+    data = bytearray(BINARY_HASHES_SIZE)
+    BINARY_HASHES_HEADER.pack_into(
+        data, 0, BINARY_HASHES_MAGIC, BINARY_HASHES_VERSION,
+        bool(hashes.get('valid')), hashes.get('updated', -1), b'')
+    for suffix, hash_ in hashes.items():
+        if not isinstance(suffix, str) or len(suffix) != 3 or \
+                suffix.strip('0123456789abcdef'):
+            continue
+        slot = int(suffix, 16)
+        byte, bit = divmod(slot, 8)
+        data[BINARY_HASHES_HEADER.size + byte] |= 128 >> bit
+        try:
+            md5 = binascii.unhexlify(hash_)
+        except (TypeError, ValueError, binascii.Error):
+            continue
+        if len(md5) != 16:
+            continue
+        data[BINARY_HASHES_HEADER.size + BINARY_HASHES_BITMAP_SIZE +
+             byte] |= 128 >> bit
+        offset = BINARY_HASHES_MD5_OFFSET + 16 * slot
+        data[offset:offset + 16] = md5
+    data[BINARY_HASHES_CHECKSUM_OFFSET:BINARY_HASHES_HEADER.size] = \
+        _binary_hashes_checksum(data)
+    return data
+
+
+def _binary_hashes_checksum(data):
+    """
+    Get the md5 of the contents of a hashes.bin file but its checksum.
+    """
+    checksum = hashlib.md5(data[:BINARY_HASHES_CHECKSUM_OFFSET])
+    checksum.update(data[BINARY_HASHES_HEADER.size:])
+    return checksum.digest()
+
+
+def _decode_binary_hashes(data):
+    """
+    Unpack the contents of a hashes.bin file into a hashes dict.
+
+    :raises ValueError: if data isn't a hashes.bin file
+    """
+    if len(data) != BINARY_HASHES_SIZE:
+        raise ValueError('hashes.bin is %d bytes' % len(data))
+    magic, version, valid, updated, checksum = \
+        BINARY_HASHES_HEADER.unpack_from(data)
+    if magic != BINARY_HASHES_MAGIC or version != BINARY_HASHES_VERSION:
+        raise ValueError('hashes.bin has an unknown format')
+    if checksum != _binary_hashes_checksum(data):
+        raise ValueError('hashes.bin checksum mismatch')
+    data = bytearray(data)
+    hashes = {'valid': valid, 'updated': updated}
+    present_offset = BINARY_HASHES_HEADER.size
+    hashed_offset = present_offset + BINARY_HASHES_BITMAP_SIZE
+    for byte in range(BINARY_HASHES_BITMAP_SIZE):
+        present = data[present_offset + byte]
+        hashed = data[hashed_offset + byte]
+        # an md5 is only trusted if its suffix is marked present too
+        for bit in range(8):
+            if not (present | hashed) & (128 >> bit):
+                continue
+            slot = byte * 8 + bit
+            hash_ = None
+            if present & hashed & (128 >> bit):
+                offset = BINARY_HASHES_MD5_OFFSET + 16 * slot
+                hash_ = binascii.hexlify(data[offset:offset + 16])
+                if not isinstance(hash_, str):
+                    hash_ = hash_.decode('ascii')
+            hashes['%03x' % slot] = hash_
+    return hashes
+
+
+def read_binary_hashes(partition_dir):
+    """
+    Read the existing hashes.bin with a single read, which is retried if its
+    checksum doesn't match.
+
+    :returns: a dict, the suffix hashes (if any), the key 'valid' will be False
+              if hashes.bin is corrupt, cannot be read or does not exist
+    """
+    hashes_file = join(partition_dir, BINARY_HASH_FILE)
+    hashes = {'valid': False}
+    for _attempt in range(BINARY_HASHES_READ_ATTEMPTS):
+        try:
+            with open(hashes_file, 'rb') as hashes_fp:
+                data = hashes_fp.read()
+        except (IOError, OSError):
+            break
+        try:
+            hashes = _decode_binary_hashes(data)
+        except (ValueError, struct.error):
+            # corrupt, or torn by a concurrent write
+            continue
+        break
+    hashes.setdefault('updated', -1)
+    return hashes
+
+
+def write_binary_hashes(partition_dir, hashes):
+    """
+    Write hashes to hashes.bin
+
+    The updated key is added to hashes before it is written. An existing
+    hashes.bin is updated in place, only the parts of it that have changed are
+    rewritten; readers that overlap the update see its checksum mismatch.
+    """
+    hashes_file = join(partition_dir, BINARY_HASH_FILE)
+    hashes.setdefault('valid', False)
+    hashes['updated'] = time.time()
+    data = bytes(_encode_binary_hashes(hashes))
+    try:
+        fd = os.open(hashes_file, os.O_RDWR)
+    except OSError as err:
+        if err.errno != errno.ENOENT:
+            raise
+    else:
+        try:
+            old_data = os.read(fd, BINARY_HASHES_SIZE + 1)
+            if len(old_data) == BINARY_HASHES_SIZE and \
+                    old_data[:4] == BINARY_HASHES_MAGIC:
+                # rewrite the changed md5s before the header and bitmaps that
+                # mark them valid
+                _write_changed(fd, old_data, data, BINARY_HASHES_MD5_OFFSET,
+                               BINARY_HASHES_SIZE)
+                _write_changed(fd, old_data, data, 0,
+                               BINARY_HASHES_MD5_OFFSET)
+                return
+        finally:
+            os.close(fd)
+    fd, tmppath = mkstemp(dir=partition_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fo:
+        fo.write(data)
+        fo.flush()
+        fsync(fd)
+        renamer(tmppath, hashes_file)
+
+
+def _write_changed(fd, old_data, data, start, end, block_size=16):
+    """
+    Write the blocks of data between start and end that differ from old_data
+    to fd, then sync them to disk.
+    """
+    changed = False
+    offset = start
+    while offset < end:
+        if old_data[offset:offset + block_size] == \
+                data[offset:offset + block_size]:
+            offset += block_size
+            continue
+        run_end = offset + block_size
+        while run_end < end and old_data[run_end:run_end + block_size] != \
+                data[run_end:run_end + block_size]:
+            run_end += block_size
+        os.lseek(fd, offset, os.SEEK_SET)
+        os.write(fd, data[offset:run_end])
+        changed = True
+        offset = run_end
+    if changed:
+        fdatasync(fd)
+
+
+def _migrate_hashes(partition_dir, binary_hashes):
+    """
+    If the partition's hashes are in the other format than the one in use,
+    move them over to the format in use. Must be called with the partition
+    locked.
+
+    :param partition_dir: absolute path to partition dir
+    :param binary_hashes: if True hashes.bin is in use, otherwise hashes.pkl
+    """
+    if binary_hashes:
+        old_file, read_old, write_new = (
+            HASH_FILE, read_hashes, write_binary_hashes)
+    else:
+        old_file, read_old, write_new = (
+            BINARY_HASH_FILE, read_binary_hashes, write_hashes)
+    old_path = join(partition_dir, old_file)
+    if not exists(old_path):
+        return
+    hashes = read_old(partition_dir)
+    write_new(partition_dir, hashes)
+    remove_file(old_path)
+
+
+def consolidate_hashes(partition_dir, binary_hashes=False):
     """
     Take what's in hashes.pkl and hashes.invalid, combine them, write the
     result back to hashes.pkl, and clear out hashes.invalid.
 
     :param partition_dir: absolute path to partition dir containing hashes.pkl
                           and hashes.invalid
+    :param binary_hashes: use hashes.bin rather than hashes.pkl; either is
+                          migrated to the one in use if it is found
 
     :returns: a dict, the suffix hashes (if any), the key 'valid' will be False
               if hashes.pkl is corrupt, cannot be read or does not exist
     """
     invalidations_file = join(partition_dir, HASH_INVALIDATIONS_FILE)
+    if binary_hashes:
+        read, write = read_binary_hashes, write_binary_hashes
+    else:
+        read, write = read_hashes, write_hashes
 
     with lock_path(partition_dir):
-        hashes = read_hashes(partition_dir)
+        _migrate_hashes(partition_dir, binary_hashes)
+        hashes = read(partition_dir)
 
         found_invalidation_entry = False
         try:
@@ -372,7 +592,7 @@ def consolidate_hashes(partition_dir):
                 raise
 
         if found_invalidation_entry:
-            write_hashes(partition_dir, hashes)
+            write(partition_dir, hashes)
             # Now that all the invalidations are reflected in hashes.pkl, it's
             # safe to clear out the invalidations file.
             with open(invalidations_file, 'wb') as inv_fh:
@@ -647,8 +867,11 @@ class BaseDiskFileManager(object):
 
     diskfile_cls = None  # must be set by subclasses
 
+    # set by subclasses whose suffix hashes are a single md5 and so can be
+    # kept in hashes.bin
+    binary_hashes_supported = False
+
     invalidate_hash = strip_self(invalidate_hash)
-    consolidate_hashes = strip_self(consolidate_hashes)
     quarantine_renamer = strip_self(quarantine_renamer)
 
     def __init__(self, conf, logger):
@@ -659,6 +882,8 @@ class BaseDiskFileManager(object):
         self.bytes_per_sync = int(conf.get('mb_per_sync', 512)) * 1024 * 1024
         self.mount_check = config_true_value(conf.get('mount_check', 'true'))
         self.reclaim_age = int(conf.get('reclaim_age', DEFAULT_RECLAIM_AGE))
+        self.binary_hashes = self.binary_hashes_supported and \
+            config_true_value(conf.get('binary_hashes', 'false'))
         replication_concurrency_per_device = conf.get(
             'replication_concurrency_per_device')
         replication_one_per_device = conf.get('replication_one_per_device')
@@ -683,6 +908,12 @@ class BaseDiskFileManager(object):
                 replication_concurrency_per_device)
         self.replication_lock_timeout = int(conf.get(
             'replication_lock_timeout', 15))
+        self.audit_recent_writes = config_true_value(
+            conf.get('audit_recent_writes', 'false'))
+        self.hashes_cache_time = float(conf.get('hashes_cache_time', 0))
+        self._hashes_cache = LRUCache(
+            maxsize=int(conf.get('hashes_cache_size', 1000)),
+            maxtime=self.hashes_cache_time)
 
         self.use_splice = False
         self.pipe_size = None
@@ -1135,6 +1366,20 @@ class BaseDiskFileManager(object):
         """
         raise NotImplementedError
 
+    def consolidate_hashes(self, partition_dir):
+        """
+        Take what's in the partition's hashes file and hashes.invalid, combine
+        them, write the result back to the hashes file, and clear out
+        hashes.invalid.
+
+        :param partition_dir: absolute path to partition dir
+        :returns: a dict, the suffix hashes (if any), the key 'valid' will be
+                  False if the hashes file is corrupt, cannot be read or does
+                  not exist
+        """
+        return consolidate_hashes(partition_dir,
+                                  binary_hashes=self.binary_hashes)
+
     def _get_hashes(self, *args, **kwargs):
         hashed, hashes = self.__get_hashes(*args, **kwargs)
         hashes.pop('updated', None)
@@ -1161,7 +1406,12 @@ class BaseDiskFileManager(object):
         hashed = 0
         dev_path = self.get_dev_path(device)
         partition_path = get_part_path(dev_path, policy, partition)
-        hashes_file = join(partition_path, HASH_FILE)
+        if self.binary_hashes:
+            hashes_file = join(partition_path, BINARY_HASH_FILE)
+            read, write = read_binary_hashes, write_binary_hashes
+        else:
+            hashes_file = join(partition_path, HASH_FILE)
+            read, write = read_hashes, write_hashes
         modified = False
         orig_hashes = {'valid': False}
 
@@ -1190,7 +1440,7 @@ class BaseDiskFileManager(object):
             # conditions - so try not to get overly caught up trying to
             # optimize it out unless you manage to convince yourself there's a
             # bad behavior.
-            orig_hashes = read_hashes(partition_path)
+            orig_hashes = read(partition_path)
         else:
             hashes = copy.deepcopy(orig_hashes)
 
@@ -1214,8 +1464,8 @@ class BaseDiskFileManager(object):
                 modified = True
         if modified:
             with lock_path(partition_path):
-                if read_hashes(partition_path) == orig_hashes:
-                    write_hashes(partition_path, hashes)
+                if read(partition_path) == orig_hashes:
+                    write(partition_path, hashes)
                     return hashed, hashes
             return self.__get_hashes(device, partition, policy,
                                      recalculate=recalculate,
@@ -1404,8 +1654,128 @@ class BaseDiskFileManager(object):
                                  partition, account, container, obj,
                                  policy=policy, **kwargs)
 
+    def record_recent_write(self, device_path, policy, datadir):
+        """
+        Append an object's hash dir to its device's journal of recently
+        written objects, for the auditor to audit them first.
+
+        :param device_path: absolute path to the device
+        :param policy: the StoragePolicy instance
+        :param datadir: absolute path to the object's hash dir
+        """
+        journal = join(device_path, get_recent_writes_file(policy))
+        entry = '/'.join(datadir.rsplit(os.sep, 3)[1:]) + '\n'
+        try:
+            fd = os.open(journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         0o644)
+            try:
+                if os.fstat(fd).st_size < RECENT_WRITES_MAX_SIZE:
+                    os.write(fd, entry.encode('ascii'))
+            finally:
+                os.close(fd)
+        except OSError:
+            self.logger.exception(_('Problem recording write to %s'),
+                                  journal)
+
+    def consume_recent_writes(self, device, policy):
+        """
+        Take the journal of objects recently written to a device.
+
+        :param device: name of target device
+        :param policy: the StoragePolicy instance
+        :returns: a list of AuditLocations, one per object in the journal,
+                  in the order they were first written
+        """
+        dev_path = self.get_dev_path(device)
+        if not dev_path:
+            return []
+        journal = join(dev_path, get_recent_writes_file(policy))
+        taken = journal + '.auditing'
+        try:
+            # writers that still have the journal open append to the taken
+            # file until they close it; an entry written after it is read
+            # below is only picked up by the full sweep
+            os.rename(journal, taken)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return []
+        with open(taken, 'rb') as fp:
+            entries = fp.read().decode('ascii', 'ignore').splitlines()
+        remove_file(taken)
+        datadir_path = join(dev_path, get_data_dir(policy))
+        locations = []
+        seen = set()
+        for entry in entries:
+            if entry in seen or entry.count('/') != 2:
+                continue
+            seen.add(entry)
+            locations.append(AuditLocation(
+                join(datadir_path, entry), device, entry.split('/')[0],
+                policy))
+        return locations
+
+    def _hashes_stamp(self, partition_path):
+        """
+        Stamp the partition's hashes file and hashes.invalid.
+
+        hashes.bin is updated in place, possibly without changing its size or
+        mtime, so it is stamped with its header, which holds the time it was
+        updated and a checksum of its contents. The other files are stamped
+        with their inode, size, mtime and ctime.
+
+        :param partition_path: absolute path to partition dir
+        :returns: a tuple that changes whenever either file is written
+        """
+        stamp = []
+        for name in (BINARY_HASH_FILE if self.binary_hashes else HASH_FILE,
+                     HASH_INVALIDATIONS_FILE):
+            path = join(partition_path, name)
+            try:
+                if name == BINARY_HASH_FILE:
+                    with open(path, 'rb') as fp:
+                        stamp.append(fp.read(BINARY_HASHES_HEADER.size))
+                    continue
+                st = os.stat(path)
+            except (IOError, OSError) as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                stamp.append(None)
+            else:
+                stamp.append((st.st_ino, st.st_size,
+                              getattr(st, 'st_mtime_ns', st.st_mtime),
+                              getattr(st, 'st_ctime_ns', st.st_ctime)))
+        return tuple(stamp)
+
+    def _stamp_current_hashes(self, partition_path, hashes):
+        """
+        Return the stamp of the partition's hashes files if they hold exactly
+        the given hashes and no invalidations.
+
+        :param partition_path: absolute path to partition dir
+        :param hashes: a dict of suffix hashes as returned by _get_hashes
+        :returns: the stamp, or None if the hashes are already out of date
+        """
+        read = read_binary_hashes if self.binary_hashes else read_hashes
+        with lock_path(partition_path):
+            on_disk = read(partition_path)
+            on_disk.pop('updated', None)
+            if not on_disk.pop('valid', False) or on_disk != hashes:
+                return None
+            stamp = self._hashes_stamp(partition_path)
+        if stamp[1] and stamp[1][1]:
+            # there are invalidations that have not been consolidated yet
+            return None
+        return stamp
+
     def get_hashes(self, device, partition, suffixes, policy):
         """
+        Get the hashes of the suffix dirs in a partition.
+
+        If ``hashes_cache_time`` is set, the hashes are kept for that long
+        and, unless suffixes are to be recalculated, returned without
+        locking or rehashing the partition for as long as neither the hashes
+        file nor hashes.invalid has been written since.
 
         :param device: name of target device
         :param partition: partition name
@@ -1419,8 +1789,26 @@ class BaseDiskFileManager(object):
         partition_path = get_part_path(dev_path, policy, partition)
         if not os.path.exists(partition_path):
             mkdirs(partition_path)
+        if self.hashes_cache_time and not suffixes:
+            try:
+                stamp, hashes = self._hashes_cache.get(partition_path)
+            except KeyError:
+                pass
+            else:
+                if stamp == self._hashes_stamp(partition_path):
+                    self.logger.increment('hashes_cache.hit')
+                    return dict(hashes)
+            self.logger.increment('hashes_cache.miss')
         _junk, hashes = tpool.execute(
             self._get_hashes, device, partition, policy, recalculate=suffixes)
+        if self.hashes_cache_time:
+            stamp = tpool.execute(
+                self._stamp_current_hashes, partition_path, hashes)
+            if stamp:
+                self._hashes_cache.set_cache(
+                    (stamp, dict(hashes)), partition_path)
+            else:
+                self._hashes_cache.delete(partition_path)
         return hashes
 
     def _listdir(self, path):
@@ -1626,6 +2014,10 @@ class BaseDiskFileWriter(object):
             # It was an unnamed temp file created by open() with O_TMPFILE
             link_fd_to_path(self._fd, target_path,
                             self._diskfile._dirs_created)
+        if self._extension == '.data' and self.manager.audit_recent_writes:
+            self.manager.record_recent_write(
+                self._diskfile._device_path, self._diskfile.policy,
+                self._datadir)
 
         # Check if the partition power will/has been increased
         new_target_path = None
@@ -2763,6 +3155,7 @@ class DiskFile(BaseDiskFile):
 @DiskFileRouter.register(REPL_POLICY)
 class DiskFileManager(BaseDiskFileManager):
     diskfile_cls = DiskFile
+    binary_hashes_supported = True
 
     def _process_ondisk_files(self, exts, results, **kwargs):
         """
@@ -26,6 +26,7 @@ import six.moves.cPickle as pickle
 import shutil
 
 from eventlet import (GreenPile, GreenPool, Timeout, sleep, tpool, spawn)
+from eventlet.queue import Queue, Empty
 from eventlet.support.greenlets import GreenletExit
 
 from swift import gettext_ as _
@@ -127,6 +128,74 @@ class RebuildingECDiskFileStream(object):
             yield chunk
 
 
+class SharedRebuilds(object):
+    """
+    Holds the fragment archives that were rebuilt for the other sync_to nodes
+    of a SYNC job as a side effect of rebuilding a fragment archive of the
+    same object, until ssync to those nodes asks for them.
+
+    Each shared rebuild is fed through an unbounded queue by the greenthread
+    that rebuilds the original fragment archive, so the total number of bytes
+    reserved for shared rebuilds that have not been claimed yet is limited to
+    ``max_buffer``.
+
+    :param max_buffer: the maximum number of bytes of rebuilt fragment
+                       archives that may be waiting to be claimed
+    """
+
+    def __init__(self, max_buffer):
+        self.max_buffer = max_buffer
+        self.buffered = 0
+        self.finished_nodes = set()
+        self._rebuilds = {}
+
+    def _key(self, node, name, timestamp):
+        return (node['index'], name, Timestamp(timestamp).internal)
+
+    def reserve(self, node, name, timestamp, size):
+        """
+        Reserve room for a fragment archive that will be rebuilt for a node.
+
+        :param node: the node that the fragment archive will be sent to
+        :param name: the name of the object
+        :param timestamp: the timestamp of the object's data file
+        :param size: the size of the fragment archive
+        :returns: a queue to feed with the rebuilt fragments, followed by
+                  None, or None if the fragment archive can not be shared
+        """
+        key = self._key(node, name, timestamp)
+        if node['index'] in self.finished_nodes or key in self._rebuilds:
+            return None
+        if self.buffered + size > self.max_buffer:
+            return None
+        queue = Queue()
+        self._rebuilds[key] = (queue, size)
+        self.buffered += size
+        return queue
+
+    def claim(self, node, name, timestamp):
+        """
+        Claim a fragment archive that was rebuilt for a node.
+
+        :returns: the queue the rebuilt fragments are fed to, or None if no
+                  fragment archive was rebuilt for the node
+        """
+        queue, size = self._rebuilds.pop(
+            self._key(node, name, timestamp), (None, 0))
+        self.buffered -= size
+        return queue
+
+    def finish_node(self, node):
+        """
+        Forget all the fragment archives rebuilt for a node that were not
+        claimed, and stop reserving room for the node.
+        """
+        self.finished_nodes.add(node['index'])
+        for key in [k for k in self._rebuilds if k[0] == node['index']]:
+            _junk, size = self._rebuilds.pop(key)
+            self.buffered -= size
+
+
 class ObjectReconstructor(Daemon):
     """
     Reconstruct objects using erasure code.  And also rebalance EC Fragment
@@ -175,7 +244,16 @@ class ObjectReconstructor(Daemon):
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.ssync_batch_size = int(conf.get('ssync_batch_size', 0))
+        self.ssync_digest_threshold = int(
+            conf.get('ssync_digest_threshold', 0))
         self.disk_chunk_size = int(conf.get('disk_chunk_size', 65536))
+        self.multi_fragment_rebuild = config_true_value(
+            conf.get('multi_fragment_rebuild', 'false'))
+        self.multi_fragment_buffer_size = int(
+            conf.get('multi_fragment_buffer_size', 67108864))
+        self.rebuild_fetched_bytes = 0
+        self.rebuild_rebuilt_bytes = 0
         self.headers = {
             'Content-Length': '0',
             'user-agent': 'obj-reconstructor %s' % os.getpid()}
@@ -371,6 +449,21 @@ class ObjectReconstructor(Daemon):
         # the fragment index we need to reconstruct is the position index
         # of the node we're rebuilding to within the primary part list
         fi_to_rebuild = job['policy'].get_backend_index(node['index'])
+        path = datafile_metadata['name']
+
+        shared_rebuilds = job.get('shared_rebuilds')
+        if shared_rebuilds:
+            queue = shared_rebuilds.claim(
+                node, path, datafile_metadata['X-Timestamp'])
+            if queue:
+                self.logger.debug(
+                    'Using shared rebuild of frag #%s for %s',
+                    fi_to_rebuild, _full_path(
+                        node, job['partition'], path, job['policy']))
+                return RebuildingECDiskFileStream(
+                    datafile_metadata, fi_to_rebuild,
+                    self._iter_shared_rebuild(queue, job, node,
+                                              datafile_metadata))
 
         # KISS send out connection requests to all nodes, see what sticks.
         # Use fragment preferences header to tell other nodes that we want
@@ -383,19 +476,25 @@ class ObjectReconstructor(Daemon):
                        'exclude': []}]
         headers['X-Backend-Fragment-Preferences'] = json.dumps(frag_prefs)
         pile = GreenAsyncPile(len(part_nodes))
-        path = datafile_metadata['name']
+
+        def get_node_response(_node, full_get_path):
+            return _node, self._get_response(
+                _node, job['partition'], path, headers, full_get_path)
+
         for _node in part_nodes:
             full_get_path = _full_path(
                 _node, job['partition'], path, job['policy'])
-            pile.spawn(self._get_response, _node, job['partition'],
-                       path, headers, full_get_path)
+            pile.spawn(get_node_response, _node, full_get_path)
 
         buckets = defaultdict(dict)
         etag_buckets = {}
         error_resp_count = 0
-        for resp in pile:
+        # indexes of nodes that could not give us their fragment archive
+        without_frag = set()
+        for _node, resp in pile:
             if not resp:
                 error_resp_count += 1
+                without_frag.add(_node['index'])
                 continue
             resp.headers = HeaderKeyDict(resp.getheaders())
             frag_index = resp.headers.get('X-Object-Sysmeta-Ec-Frag-Index')
@@ -482,21 +581,114 @@ class ObjectReconstructor(Daemon):
 
             raise DiskFileError('Unable to reconstruct EC archive')
 
+        shared_frag_queues = []
+        if shared_rebuilds:
+            shared_frag_queues = self._reserve_shared_rebuilds(
+                job, node, datafile_metadata, without_frag)
         rebuilt_fragment_iter = self.make_rebuilt_fragment_iter(
             responses[:job['policy'].ec_ndata], path, job['policy'],
-            fi_to_rebuild)
+            fi_to_rebuild, shared_frag_queues)
         return RebuildingECDiskFileStream(datafile_metadata, fi_to_rebuild,
                                           rebuilt_fragment_iter)
 
+    def _reserve_shared_rebuilds(self, job, node, datafile_metadata,
+                                 without_frag):
+        """
+        Reserve shared rebuilds of an object for the other sync_to nodes of
+        a SYNC job that could not give us their fragment archive of the
+        object, so that all of them are rebuilt from a single decode.
+
+        :param job: the SYNC job
+        :param node: the node that we're rebuilding to
+        :param datafile_metadata: the datafile metadata of the object
+        :param without_frag: indexes of the nodes that did not return their
+                             fragment archive
+        :returns: a list of (frag index, queue) tuples
+        """
+        shared_frag_queues = []
+        for other in job['sync_to']:
+            if other['index'] == node['index'] or \
+                    other['index'] not in without_frag:
+                continue
+            queue = job['shared_rebuilds'].reserve(
+                other, datafile_metadata['name'],
+                datafile_metadata['X-Timestamp'],
+                int(datafile_metadata['Content-Length']))
+            if queue:
+                shared_frag_queues.append((
+                    job['policy'].get_backend_index(other['index']), queue))
+        return shared_frag_queues
+
+    def _iter_shared_rebuild(self, queue, job, node, datafile_metadata):
+        """
+        Yield the fragments of a shared rebuild as they are rebuilt.
+
+        If the shared rebuild stalls for longer than node_timeout or ends
+        before the whole fragment archive was rebuilt, the rest of it is
+        rebuilt here instead, so that ssync is never sent a short archive.
+        """
+        policy = job['policy']
+        path = datafile_metadata['name']
+        frag_index = policy.get_backend_index(node['index'])
+        content_length = int(datafile_metadata['Content-Length'])
+        fragments = rebuilt_bytes = 0
+        while True:
+            try:
+                fragment = queue.get(timeout=self.node_timeout)
+            except Empty:
+                self.logger.error(
+                    'Timeout waiting for shared rebuild of %(path)s '
+                    'policy#%(policy)d frag#%(frag_index)s, rebuilding it',
+                    {'path': path, 'policy': policy,
+                     'frag_index': frag_index})
+                break
+            if fragment is None:
+                if rebuilt_bytes >= content_length:
+                    return
+                self.logger.error(
+                    'Shared rebuild of %(path)s policy#%(policy)d '
+                    'frag#%(frag_index)s ended early, rebuilding it',
+                    {'path': path, 'policy': policy,
+                     'frag_index': frag_index})
+                break
+            fragments += 1
+            rebuilt_bytes += len(fragment)
+            yield fragment
+        df = self.reconstruct_fa(dict(job, shared_rebuilds=None), node,
+                                 datafile_metadata)
+        for fragment in itertools.islice(df.reader(), fragments, None):
+            yield fragment
+
     def _reconstruct(self, policy, fragment_payload, frag_index):
         return policy.pyeclib_driver.reconstruct(fragment_payload,
                                                  [frag_index])[0]
 
-    def make_rebuilt_fragment_iter(self, responses, path, policy, frag_index):
+    def _reconstruct_many(self, policy, fragment_payload, frag_indexes):
+        """
+        Rebuild the fragments for several frag indexes with a single decode.
+
+        :returns: a dict mapping frag index to rebuilt fragment
+        """
+        rebuilt = {}
+        for fragment in policy.pyeclib_driver.reconstruct(
+                fragment_payload, sorted(set(frag_indexes))):
+            # don't rely on the order of the rebuilt fragments
+            index = policy.pyeclib_driver.get_metadata(
+                fragment, formatted=True)['index']
+            rebuilt[index] = fragment
+        return rebuilt
+
+    def make_rebuilt_fragment_iter(self, responses, path, policy, frag_index,
+                                   shared_frag_queues=None):
         """
         Turn a set of connections from backend object servers into a generator
         that yields up the rebuilt fragment archive for frag_index.
+
+        The fragments for each (frag index, queue) tuple in
+        shared_frag_queues are rebuilt by the same decode and put to the
+        queue, followed by None once the rebuild ends.
         """
+        shared_frag_queues = shared_frag_queues or []
 
         def _get_one_fragment(resp):
             buff = ''
@@ -513,26 +705,49 @@ class ObjectReconstructor(Daemon):
             # We need a fragment from each connections, so best to
             # use a GreenPile to keep them ordered and in sync
             pile = GreenPile(len(responses))
-            while True:
-                for resp in responses:
-                    pile.spawn(_get_one_fragment, resp)
-                try:
-                    with Timeout(self.node_timeout):
-                        fragment_payload = [fragment for fragment in pile]
-                except (Exception, Timeout):
-                    self.logger.exception(
-                        _("Error trying to rebuild %(path)s "
-                          "policy#%(policy)d frag#%(frag_index)s"),
-                        {'path': path,
-                         'policy': policy,
-                         'frag_index': frag_index,
-                         })
-                    break
-                if not all(fragment_payload):
-                    break
-                rebuilt_fragment = self._reconstruct(
-                    policy, fragment_payload, frag_index)
-                yield rebuilt_fragment
+            fetched_bytes = rebuilt_bytes = 0
+            try:
+                while True:
+                    for resp in responses:
+                        pile.spawn(_get_one_fragment, resp)
+                    try:
+                        with Timeout(self.node_timeout):
+                            fragment_payload = [fragment for fragment in pile]
+                    except (Exception, Timeout):
+                        self.logger.exception(
+                            _("Error trying to rebuild %(path)s "
+                              "policy#%(policy)d frag#%(frag_index)s"),
+                            {'path': path,
+                             'policy': policy,
+                             'frag_index': frag_index,
+                             })
+                        break
+                    if not all(fragment_payload):
+                        break
+                    fetched_bytes += sum(len(f) for f in fragment_payload)
+                    if shared_frag_queues:
+                        rebuilt = self._reconstruct_many(
+                            policy, fragment_payload,
+                            [frag_index] + [fi for fi, _q in
+                                            shared_frag_queues])
+                        for fi, queue in shared_frag_queues:
+                            queue.put(rebuilt[fi])
+                            rebuilt_bytes += len(rebuilt[fi])
+                        rebuilt_fragment = rebuilt[frag_index]
+                    else:
+                        rebuilt_fragment = self._reconstruct(
+                            policy, fragment_payload, frag_index)
+                    rebuilt_bytes += len(rebuilt_fragment)
+                    yield rebuilt_fragment
+            finally:
+                for _fi, queue in shared_frag_queues:
+                    queue.put(None)
+                self.rebuild_fetched_bytes += fetched_bytes
+                self.rebuild_rebuilt_bytes += rebuilt_bytes
+                self.logger.update_stats('rebuild.fetched_bytes',
+                                         fetched_bytes)
+                self.logger.update_stats('rebuild.rebuilt_bytes',
+                                         rebuilt_bytes)
 
         return fragment_payload_iter()
 
@@ -572,6 +787,15 @@ class ObjectReconstructor(Daemon):
                      'min': self.partition_times[0],
                      'med': self.partition_times[
                          len(self.partition_times) // 2]})
+            if self.rebuild_rebuilt_bytes:
+                self.logger.info(
+                    _("%(rebuilt)d bytes rebuilt from %(fetched)d bytes "
+                      "fetched (%(ratio).2f bytes fetched per byte "
+                      "rebuilt)"),
+                    {'rebuilt': self.rebuild_rebuilt_bytes,
+                     'fetched': self.rebuild_fetched_bytes,
+                     'ratio': float(self.rebuild_fetched_bytes) /
+                     self.rebuild_rebuilt_bytes})
         else:
             self.logger.info(
                 _("Nothing reconstructed for %s seconds."),
@@ -647,13 +871,16 @@ class ObjectReconstructor(Daemon):
         return suffixes
 
     def rehash_remote(self, node, job, suffixes):
+        headers = dict(self.headers)
+        # the response is not used, only ask for the rehashed suffixes back
+        headers['X-Backend-Replicate-Suffixes'] = '-'.join(sorted(suffixes))
         try:
             with Timeout(self.http_timeout):
                 conn = http_connect(
                     node['replication_ip'], node['replication_port'],
                     node['device'], job['partition'], 'REPLICATE',
                     '/' + '-'.join(sorted(suffixes)),
-                    headers=self.headers)
+                    headers=headers)
                 conn.getresponse().read()
         except (Exception, Timeout):
             self.logger.exception(
@@ -787,43 +1014,62 @@ class ObjectReconstructor(Daemon):
         # failure we'll continue onto the remaining primary nodes and
         # make sure they're in sync - or potentially rebuild missing
         # fragments we find
-        dest_nodes = itertools.chain(
-            job['sync_to'],
+        other_nodes = [
+            n for n in
+            job['policy'].object_ring.get_part_nodes(job['partition'])
+            if n['id'] != job['local_dev']['id'] and
+            n['id'] not in (m['id'] for m in job['sync_to'])
+        ]
+        syncd_with = 0
+        if self.multi_fragment_rebuild and len(job['sync_to']) > 1:
+            # sync with our partners at the same time so that fragment
+            # archives they are all missing are rebuilt from a single decode
+            job['shared_rebuilds'] = SharedRebuilds(
+                self.multi_fragment_buffer_size)
+            pool = GreenPool(len(job['sync_to']))
+            syncd_with = sum(pool.imap(
+                lambda node: self._sync_with_node(job, node),
+                job['sync_to']))
+            dest_nodes = iter(other_nodes)
+        else:
             # I think we could order these based on our index to better
             # protect against a broken chain
-            [
-                n for n in
-                job['policy'].object_ring.get_part_nodes(job['partition'])
-                if n['id'] != job['local_dev']['id'] and
-                n['id'] not in (m['id'] for m in job['sync_to'])
-            ],
-        )
-        syncd_with = 0
+            dest_nodes = itertools.chain(job['sync_to'], other_nodes)
         for node in dest_nodes:
             if syncd_with >= len(job['sync_to']):
                 # success!
                 break
+            if self._sync_with_node(job, node):
+                syncd_with += 1
+        self.logger.timing_since('partition.update.timing', begin)
 
-            try:
-                suffixes = self._get_suffixes_to_sync(job, node)
-            except SuffixSyncError:
-                continue
+    def _sync_with_node(self, job, node):
+        """
+        Sync the local partition of a SYNC job with a remote node.
 
-            if not suffixes:
-                syncd_with += 1
-                continue
+        :returns: True if the remote node is in sync, False otherwise
+        """
+        try:
+            suffixes = self._get_suffixes_to_sync(job, node)
+        except SuffixSyncError:
+            return False
 
-            # ssync any out-of-sync suffixes with the remote node
+        if not suffixes:
+            return True
+
+        # ssync any out-of-sync suffixes with the remote node
+        try:
             success, _ = ssync_sender(
                 self, node, job, suffixes)()
-            # let remote end know to rehash it's suffixes
-            self.rehash_remote(node, job, suffixes)
-            # update stats for this attempt
-            self.suffix_sync += len(suffixes)
-            self.logger.update_stats('suffix.syncs', len(suffixes))
-            if success:
-                syncd_with += 1
-        self.logger.timing_since('partition.update.timing', begin)
+        finally:
+            if job.get('shared_rebuilds'):
+                job['shared_rebuilds'].finish_node(node)
+        # let remote end know to rehash it's suffixes
+        self.rehash_remote(node, job, suffixes)
+        # update stats for this attempt
+        self.suffix_sync += len(suffixes)
+        self.logger.update_stats('suffix.syncs', len(suffixes))
+        return success
 
     def _revert(self, job, begin):
         """
@@ -1137,6 +1383,8 @@ class ObjectReconstructor(Daemon):
         self.reconstruction_part_count = 0
         self.last_reconstruction_count = -1
         self.handoffs_remaining = 0
+        self.rebuild_fetched_bytes = 0
+        self.rebuild_rebuilt_bytes = 0
 
     def delete_partition(self, path):
         def kill_it(path):
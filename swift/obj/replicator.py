@@ -19,6 +19,7 @@ import errno
 from os.path import isdir, isfile, join, dirname
 import random
 import shutil
+import tempfile
 import time
 import itertools
 from six import viewkeys
@@ -27,6 +28,7 @@ from swift import gettext_ as _
 
 import eventlet
 from eventlet import GreenPool, queue, tpool, Timeout, sleep
+from eventlet.event import Event
 from eventlet.green import subprocess
 
 from swift.common.constraints import check_drive
@@ -46,6 +48,11 @@ from swift.common.storage_policy import POLICIES, REPL_POLICY
 
 DEFAULT_RSYNC_TIMEOUT = 900
 
+# Priorities of replication jobs when priority_replication is enabled, most
+# urgent first: partitions with a primary that was failing or is being
+# drained, handoff partitions, and everything else.
+JOB_PRIORITIES = ('at_risk', 'handoff', 'normal')
+
 
 def _do_listdir(partition, replication_cycle):
     return (((partition + replication_cycle) % 10) == 0)
@@ -155,6 +162,10 @@ class ObjectReplicator(Daemon):
         self.rsync_module = conf.get('rsync_module', '').rstrip('/')
         if not self.rsync_module:
             self.rsync_module = '{replication_ip}::object'
+        self.rsync_batch_size = int(conf.get('rsync_batch_size', 0))
+        self.rsync_batch_wait = float(conf.get('rsync_batch_wait', 1))
+        self._rsync_batches = {}
+        self.rsync_node_stats = defaultdict(lambda: defaultdict(int))
         self.http_timeout = int(conf.get('http_timeout', 60))
         self.recon_cache_path = conf.get('recon_cache_path',
                                          '/var/cache/swift')
@@ -164,6 +175,9 @@ class ObjectReplicator(Daemon):
         self.node_timeout = float(conf.get('node_timeout', 10))
         self.sync_method = getattr(self, conf.get('sync_method') or 'rsync')
         self.network_chunk_size = int(conf.get('network_chunk_size', 65536))
+        self.ssync_batch_size = int(conf.get('ssync_batch_size', 0))
+        self.ssync_digest_threshold = int(
+            conf.get('ssync_digest_threshold', 0))
         self.default_headers = {
             'Content-Length': '0',
             'user-agent': 'object-replicator %s' % os.getpid()}
@@ -173,6 +187,9 @@ class ObjectReplicator(Daemon):
                                                          False))
         self.handoff_delete = config_auto_int_value(
             conf.get('handoff_delete', 'auto'), 0)
+        self.priority_replication = config_true_value(
+            conf.get('priority_replication', 'no'))
+        self.jobs_queued = {}
         if any((self.handoff_delete, self.handoffs_first)):
             self.logger.warning('Handoff only mode is not intended for normal '
                                 'operation, please disable handoffs_first and '
@@ -350,17 +367,22 @@ class ObjectReplicator(Daemon):
 
         return line
 
-    def _rsync(self, args):
+    def _rsync(self, args, output=None, timeout=None):
         """
         Execute the rsync binary to replicate a partition.
 
+        :param args: the rsync command line
+        :param output: an optional list to which the lines rsync printed
+                       are appended
+        :param timeout: max duration of the rsync process, defaults to
+                        rsync_timeout
         :returns: return code of rsync process. 0 is successful
         """
         start_time = time.time()
         proc = None
 
         try:
-            with Timeout(self.rsync_timeout):
+            with Timeout(timeout or self.rsync_timeout):
                 proc = subprocess.Popen(args,
                                         stdout=subprocess.PIPE,
                                         stderr=subprocess.STDOUT)
@@ -394,6 +416,8 @@ class ObjectReplicator(Daemon):
         for result in results.split('\n'):
             if result == '':
                 continue
+            if output is not None:
+                output.append(result)
             if result.startswith('cd+'):
                 continue
             if not ret_val:
@@ -412,10 +436,112 @@ class ObjectReplicator(Daemon):
                 {'src': args[-2], 'dst': args[-1], 'time': total_time})
         return ret_val
 
+    def _rsync_to_node(self, node, args, src_dir, timeout=None):
+        """
+        Run one rsync process to a remote node and account for it in the
+        per-node rsync stats.
+
+        :param node: the "dev" entry for the remote node
+        :param args: the rsync command line
+        :param src_dir: the directory the paths itemized by rsync are
+                        relative to
+        :param timeout: max duration of the rsync process, defaults to
+                        rsync_timeout
+        :returns: return code of rsync process. 0 is successful
+        """
+        output = []
+        begin = time.time()
+        ret_val = self._rsync(args, output=output, timeout=timeout)
+        sent_bytes = 0
+        for line in output:
+            # with --itemize-changes a file pushed to the remote end is
+            # reported as "<f+++++++++ <path>"
+            if not line.startswith('<f'):
+                continue
+            try:
+                sent_bytes += os.path.getsize(
+                    join(src_dir, line.split(' ', 1)[1]))
+            except (IndexError, OSError):
+                pass
+        node_stats = self.rsync_node_stats[
+            '%s/%s' % (node['replication_ip'], node['device'])]
+        node_stats['processes'] += 1
+        node_stats['bytes'] += sent_bytes
+        node_stats['time'] += time.time() - begin
+        self.logger.increment('rsync.processes')
+        self.logger.update_stats('rsync.bytes', sent_bytes)
+        return ret_val
+
+    def _rsync_batched(self, node, args, src_dir, dest, paths):
+        """
+        Add paths to the batch of paths bound for the same rsync destination
+        and wait for the batch to be sent with a single rsync process.
+
+        The batch is sent once it holds paths from ``rsync_batch_size``
+        partitions, or ``rsync_batch_wait`` seconds after it was started.
+        Every partition in the batch shares its outcome: if the rsync times
+        out or exits non-zero (including a partial transfer) the sync fails
+        for all of them.
+
+        :param node: the "dev" entry for the remote node
+        :param args: the rsync command line, without source or destination
+        :param src_dir: the local directory the paths are relative to
+        :param dest: the rsync destination the paths are relative to
+        :param paths: a list of suffix paths relative to src_dir
+        :returns: boolean indicating whether the batch rsync succeeded
+        """
+        key = (tuple(args), src_dir, dest)
+        batch = self._rsync_batches.get(key)
+        if batch is None:
+            batch = self._rsync_batches[key] = {
+                'node': node, 'args': args, 'src_dir': src_dir,
+                'dest': dest, 'paths': [], 'partitions': 0,
+                'done': Event()}
+            batch['timer'] = eventlet.spawn_after(
+                self.rsync_batch_wait, self._send_rsync_batch, key)
+        batch['paths'].extend(paths)
+        batch['partitions'] += 1
+        if batch['partitions'] >= self.rsync_batch_size:
+            batch['timer'].cancel()
+            self._send_rsync_batch(key)
+        return batch['done'].wait()
+
+    def _send_rsync_batch(self, key):
+        """
+        Send a batch of paths with a single rsync process reading the paths
+        from a ``--files-from`` list, and wake up the partitions waiting for
+        it. The rsync may run for ``rsync_timeout`` seconds for each
+        partition in the batch.
+
+        :param key: the key of the batch in self._rsync_batches
+        """
+        batch = self._rsync_batches.pop(key, None)
+        if batch is None:
+            return
+        success = False
+        try:
+            with tempfile.NamedTemporaryFile(prefix='rsync-files-') as fp:
+                fp.write(''.join(path + '\n' for path in batch['paths']))
+                fp.flush()
+                args = batch['args'] + ['--files-from=%s' % fp.name,
+                                        batch['src_dir'], batch['dest']]
+                success = self._rsync_to_node(
+                    batch['node'], args, batch['src_dir'],
+                    timeout=self.rsync_timeout * batch['partitions']) == 0
+        except (Exception, Timeout):
+            self.logger.exception(_("Error syncing batch to %s"),
+                                  batch['dest'])
+        finally:
+            batch['done'].send(success)
+
     def rsync(self, node, job, suffixes):
         """
         Uses rsync to implement the sync method. This was the first
         sync method in Swift.
+
+        If ``rsync_batch_size`` is greater than 1 the suffixes are sent
+        together with those of other partitions bound for the same remote
+        device, see :meth:`_rsync_batched`.
         """
         if not os.path.exists(job['path']):
             return False, {}
@@ -438,18 +564,28 @@ class ObjectReplicator(Daemon):
             # a different region than the local one.
             args.append('--compress')
         rsync_module = rsync_module_interpolation(self.rsync_module, node)
-        had_any = False
+        spaths = []
         for suffix in suffixes:
             spath = join(job['path'], suffix)
             if os.path.exists(spath):
-                args.append(spath)
-                had_any = True
-        if not had_any:
+                spaths.append(spath)
+        if not spaths:
             return False, {}
         data_dir = get_data_dir(job['policy'])
+        if self.rsync_batch_size > 1:
+            # rsync recreates the <partition>/<suffix> paths listed with
+            # --files-from below the destination's data dir
+            src_dir = dirname(job['path'])
+            paths = [join(job['partition'], os.path.basename(path))
+                     for path in spaths]
+            return self._rsync_batched(
+                node, args, src_dir,
+                join(rsync_module, node['device'], data_dir),
+                paths), {}
+        args.extend(spaths)
         args.append(join(rsync_module, node['device'],
                     data_dir, job['partition']))
-        return self._rsync(args) == 0, {}
+        return self._rsync_to_node(node, args, job['path']) == 0, {}
 
     def ssync(self, node, job, suffixes, remote_check_objs=None):
         return ssync_sender.Sender(
@@ -468,6 +604,15 @@ class ObjectReplicator(Daemon):
                 return False
         return True
 
+    def _suffix_headers(self, headers, suffixes):
+        """
+        Return headers for a REPLICATE request that recalculates suffixes
+        and, since the response is not used, only asks for their hashes back.
+        """
+        headers = dict(headers)
+        headers['X-Backend-Replicate-Suffixes'] = '-'.join(suffixes)
+        return headers
+
     def update_deleted(self, job):
         """
         High-level method that replicates a single partition that doesn't
@@ -511,7 +656,9 @@ class ObjectReplicator(Daemon):
                                 node['replication_ip'],
                                 node['replication_port'],
                                 node['device'], job['partition'], 'REPLICATE',
-                                '/' + '-'.join(suffixes), headers=headers)
+                                '/' + '-'.join(suffixes),
+                                headers=self._suffix_headers(
+                                    headers, suffixes))
                             conn.getresponse().read()
                         if node['region'] != job['region']:
                             synced_remote_regions[node['region']] = viewkeys(
@@ -680,7 +827,7 @@ class ObjectReplicator(Daemon):
                             node['replication_ip'], node['replication_port'],
                             node['device'], job['partition'], 'REPLICATE',
                             '/' + '-'.join(suffixes),
-                            headers=headers)
+                            headers=self._suffix_headers(headers, suffixes))
                         conn.getresponse().read()
                     if not success:
                         failure_devs_info.add((node['replication_ip'],
@@ -750,11 +897,39 @@ class ObjectReplicator(Daemon):
                      'min': self.partition_times[0],
                      'med': self.partition_times[
                          len(self.partition_times) // 2]})
+            if self.rsync_node_stats:
+                self.rsync_stats_line()
+            if self.jobs_queued:
+                self.logger.info(self._jobs_queued_line())
         else:
             self.logger.info(
                 _("Nothing replicated for %s seconds."),
                 (time.time() - self.start))
 
+    def rsync_stats_line(self):
+        """
+        Logs the number of rsync processes run and the rate at which they
+        sent data, in total and for each remote device.
+        """
+        def rate(node_stats):
+            return node_stats['bytes'] / (node_stats['time'] or 0.000001)
+
+        total = defaultdict(int)
+        for node_name, node_stats in sorted(self.rsync_node_stats.items()):
+            self.logger.debug(
+                "rsync to %(node)s: %(processes)d processes, %(bytes)d "
+                "bytes, %(rate).2f bytes/sec",
+                {'node': node_name, 'processes': node_stats['processes'],
+                 'bytes': node_stats['bytes'], 'rate': rate(node_stats)})
+            for key, value in node_stats.items():
+                total[key] += value
+        self.logger.info(
+            "%(processes)d rsync processes to %(nodes)d devices sent "
+            "%(bytes)d bytes, %(rate).2f bytes/sec per process",
+            {'processes': total['processes'],
+             'nodes': len(self.rsync_node_stats),
+             'bytes': total['bytes'], 'rate': rate(total)})
+
     def heartbeat(self):
         """
         Loop that runs in the background during replication.  It periodically
@@ -893,12 +1068,77 @@ class ObjectReplicator(Daemon):
                     policy, ips, override_devices=override_devices,
                     override_partitions=override_partitions)
         random.shuffle(jobs)
+        if self.priority_replication:
+            self.prioritize_jobs(jobs)
         if self.handoffs_first:
             # Move the handoff parts to the front of the list
             jobs.sort(key=lambda job: not job['delete'])
         self.job_count = len(jobs)
         return jobs
 
+    def _load_replication_history(self):
+        """
+        Read the outcome of previous replication passes from the recon cache.
+
+        :returns: a tuple of the set of (replication_ip, device) pairs that
+                  failed and a dict mapping each local device to the time
+                  its last replication pass finished
+        """
+        cache = load_recon_cache(self.rcache)
+        all_stats = [cache.get('replication_stats') or {}]
+        last_by_device = {}
+        per_disk = cache.get('object_replication_per_disk') or {}
+        for device, data in per_disk.items():
+            all_stats.append(data.get('replication_stats') or {})
+            if 'object_replication_last' in data:
+                last_by_device[device] = data['object_replication_last']
+        failed_devs = set()
+        for stats in all_stats:
+            for ip, devices in (stats.get('failure_nodes') or {}).items():
+                failed_devs.update((ip, device) for device in devices)
+        return failed_devs, last_by_device
+
+    def prioritize_jobs(self, jobs):
+        """
+        Sort jobs so that partitions whose durability is most at risk are
+        replicated first, and count the jobs queued at each priority.
+
+        A job is at risk if any of its remote primaries failed during the
+        last replication pass or has a weight of zero, and jobs with more
+        such primaries come first. Handoff partitions come next, then
+        everything else. Within a priority, partitions on the local devices
+        that finished a replication pass longest ago come first.
+
+        :param jobs: a list of jobs, sorted in place; each job gets a
+                     ``priority`` from JOB_PRIORITIES
+        """
+        failed_devs, last_by_device = self._load_replication_history()
+
+        def sort_key(job):
+            deficit = len([
+                node for node in job['nodes']
+                if node.get('weight') == 0 or
+                (node['replication_ip'], node['device']) in failed_devs])
+            if deficit:
+                job['priority'] = 'at_risk'
+            elif job['delete']:
+                job['priority'] = 'handoff'
+            else:
+                job['priority'] = 'normal'
+            return (JOB_PRIORITIES.index(job['priority']), -deficit,
+                    last_by_device.get(job['device'], 0))
+
+        jobs.sort(key=sort_key)
+        self.jobs_queued = dict.fromkeys(JOB_PRIORITIES, 0)
+        for job in jobs:
+            self.jobs_queued[job['priority']] += 1
+        self.logger.info(self._jobs_queued_line())
+
+    def _jobs_queued_line(self):
+        return 'Partitions queued by priority: %s' % ', '.join(
+            '%s %d' % (priority, self.jobs_queued[priority])
+            for priority in JOB_PRIORITIES)
+
     def replicate(self, override_devices=None, override_partitions=None,
                   override_policies=None, start_time=None):
         """Run a replication pass"""
@@ -911,6 +1151,8 @@ class ObjectReplicator(Daemon):
         self.my_replication_ips = self._get_my_replication_ips()
         self.all_devs_info = set()
         self.handoffs_remaining = 0
+        self.rsync_node_stats = defaultdict(lambda: defaultdict(int))
+        self.jobs_queued = {}
 
         stats = eventlet.spawn(self.heartbeat)
         eventlet.sleep()  # Give spawns a cycle
@@ -924,6 +1166,8 @@ class ObjectReplicator(Daemon):
                                      override_partitions=override_partitions,
                                      override_policies=override_policies)
             for job in jobs:
+                if 'priority' in job:
+                    self.jobs_queued[job['priority']] -= 1
                 dev_stats = self.stats_for_dev[job['device']]
                 num_jobs += 1
                 current_nodes = job['nodes']
@@ -28,7 +28,8 @@ from swift import gettext_ as _
 from hashlib import md5
 
 from eventlet import sleep, wsgi, Timeout, tpool
-from eventlet.greenthread import spawn
+from eventlet.event import Event
+from eventlet.greenthread import spawn, spawn_after
 
 from swift.common.utils import public, get_logger, \
     config_true_value, timing_stats, replication, \
@@ -44,12 +45,13 @@ from swift.common.exceptions import ConnectionTimeout, DiskFileQuarantined, \
     DiskFileDeviceUnavailable, DiskFileExpired, ChunkReadTimeout, \
     ChunkReadError, DiskFileXattrNotSupported
 from swift.obj import ssync_receiver
-from swift.common.http import is_success, HTTP_MOVED_PERMANENTLY
+from swift.common.http import is_success, HTTP_MOVED_PERMANENTLY, \
+    HTTP_METHOD_NOT_ALLOWED
 from swift.common.base_storage_server import BaseStorageServer
 from swift.common.header_key_dict import HeaderKeyDict
 from swift.common.request_helpers import get_name_and_placement, \
     is_user_meta, is_sys_or_user_meta, is_object_transient_sysmeta, \
-    resolve_etag_is_at_header, is_sys_meta
+    resolve_etag_is_at_header, is_sys_meta, get_container_update_record
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPCreated, \
     HTTPInternalServerError, HTTPNoContent, HTTPNotFound, \
     HTTPPreconditionFailed, HTTPRequestTimeout, HTTPUnprocessableEntity, \
@@ -125,6 +127,11 @@ class ObjectController(BaseStorageServer):
         self.node_timeout = float(conf.get('node_timeout', 3))
         self.container_update_timeout = float(
             conf.get('container_update_timeout', 1))
+        self.container_update_batch_interval = float(
+            conf.get('container_update_batch_interval', 0))
+        self.container_update_batch_size = int(
+            conf.get('container_update_batch_size', 100))
+        self._container_update_batches = {}
         self.conn_timeout = float(conf.get('conn_timeout', 0.5))
         self.client_timeout = int(conf.get('client_timeout', 60))
         self.disk_chunk_size = int(conf.get('disk_chunk_size', 65536))
@@ -205,6 +212,10 @@ class ObjectController(BaseStorageServer):
             conf.get('replication_failure_threshold') or 100)
         self.replication_failure_ratio = float(
             conf.get('replication_failure_ratio') or 1.0)
+        self.replication_update_concurrency = int(
+            conf.get('replication_update_concurrency') or 1)
+        self.replication_update_buffer_size = int(
+            conf.get('replication_update_buffer_size') or 65536)
 
         servers_per_port = int(conf.get('servers_per_port', '0') or 0)
         if servers_per_port:
@@ -313,13 +324,32 @@ class ObjectController(BaseStorageServer):
                     'ERROR container update failed with '
                     '%(ip)s:%(port)s/%(dev)s (saving for async update later)'),
                     {'ip': ip, 'port': port, 'dev': contdevice})
-        data = {'op': op, 'account': account, 'container': container,
-                'obj': obj, 'headers': headers_out}
         if redirect_data:
             self.logger.debug(
                 'Update to %(path)s redirected to %(redirect)s',
                 {'path': full_path, 'redirect': redirect_data[0]})
             container_path = redirect_data[0]
+        self._save_async_update(op, account, container, obj, headers_out,
+                                objdevice, policy, container_path)
+
+    def _save_async_update(self, op, account, container, obj, headers_out,
+                           objdevice, policy, container_path=None):
+        """
+        Saves an async update for the object-updater to send later.
+
+        :param op: operation performed (ex: 'PUT', or 'DELETE')
+        :param account: account name for the object
+        :param container: container name for the object
+        :param obj: object name
+        :param headers_out: dictionary of headers to send in the container
+                            request
+        :param objdevice: device name that the object is in
+        :param policy: the associated BaseStoragePolicy instance
+        :param container_path: optional path in the form `<account/container>`
+            to which the update should be sent.
+        """
+        data = {'op': op, 'account': account, 'container': container,
+                'obj': obj, 'headers': headers_out}
         if container_path:
             data['container_path'] = container_path
         timestamp = headers_out.get('x-meta-timestamp',
@@ -327,6 +357,126 @@ class ObjectController(BaseStorageServer):
         self._diskfile_router[policy].pickle_async_update(
             objdevice, account, container, obj, data, timestamp, policy)
 
+    def batch_async_update(self, op, account, container, obj, host,
+                           partition, contdevice, headers_out, objdevice,
+                           policy, container_path=None):
+        """
+        Queues a container update to be sent in a batch with the other
+        updates for the same container on the same node that arrive within
+        ``container_update_batch_interval``.
+
+        Takes the same arguments as :meth:`async_update`.
+
+        :returns: an Event that is sent once the update has either been sent
+                  or saved as an async update.
+        """
+        path = container_path or '%s/%s' % (account, container)
+        key = (host, partition, contdevice, path, int(policy))
+        headers = HeaderKeyDict(headers_out)
+        headers['user-agent'] = 'object-server %s' % os.getpid()
+        update = {'op': op, 'account': account, 'container': container,
+                  'obj': obj, 'headers': headers,
+                  'objdevice': objdevice, 'policy': policy,
+                  'container_path': container_path, 'done': Event()}
+        if key in self._container_update_batches:
+            updates, timer = self._container_update_batches[key]
+        else:
+            updates = []
+            timer = spawn_after(self.container_update_batch_interval,
+                                self._flush_container_updates, key, updates)
+            self._container_update_batches[key] = (updates, timer)
+        updates.append(update)
+        if len(updates) >= self.container_update_batch_size:
+            timer.cancel()
+            spawn(self._flush_container_updates, key, updates)
+            del self._container_update_batches[key]
+        return update['done']
+
+    def _flush_container_updates(self, key, updates):
+        """
+        Sends a batch of container updates queued by
+        :meth:`batch_async_update` as a single UPDATE request to the container
+        server. If the batch can't be sent every update in it is saved as an
+        async update.
+
+        :param key: the (host, partition, device, path, policy index) of the
+                    batch
+        :param updates: the list of updates in the batch
+        """
+        if self._container_update_batches.get(key, (None, None))[0] is \
+                updates:
+            del self._container_update_batches[key]
+        host, partition, contdevice, path, _policy_index = key
+        policy = updates[0]['policy']
+        status = None
+        try:
+            if all([host, partition, contdevice]):
+                status = self._send_container_updates(
+                    host, partition, contdevice, path, policy, updates)
+            if status == HTTP_METHOD_NOT_ALLOWED:
+                # the container server doesn't support UPDATE (yet), fall back
+                # to sending the updates one at a time
+                for update in updates:
+                    self.async_update(
+                        update['op'], update['account'], update['container'],
+                        update['obj'], host, partition, contdevice,
+                        update['headers'], update['objdevice'], policy,
+                        container_path=update['container_path'])
+            elif status is None or not is_success(status):
+                for update in updates:
+                    self._save_async_update(
+                        update['op'], update['account'], update['container'],
+                        update['obj'], update['headers'],
+                        update['objdevice'], policy, update['container_path'])
+        finally:
+            for update in updates:
+                update['done'].send()
+
+    def _send_container_updates(self, host, partition, contdevice, path,
+                                policy, updates):
+        """
+        Sends a batch of container updates as an UPDATE request.
+
+        :returns: the status of the response or None if the request failed
+        """
+        records = [get_container_update_record(
+            update['op'], update['obj'], update['headers'], policy)
+            for update in updates]
+        body = json.dumps(records)
+        headers_out = {
+            'x-timestamp': min(record['created_at'] for record in records),
+            'X-Backend-Storage-Policy-Index': int(policy),
+            'x-trans-id': updates[0]['headers'].get('x-trans-id', '-'),
+            'referer': updates[0]['headers'].get('referer', '-'),
+            'user-agent': 'object-server %s' % os.getpid(),
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body))}
+        try:
+            with ConnectionTimeout(self.conn_timeout):
+                ip, port = host.rsplit(':', 1)
+                conn = http_connect(ip, port, contdevice, partition, 'UPDATE',
+                                    '/' + path, headers_out)
+            with Timeout(self.node_timeout):
+                conn.send(body)
+                response = conn.getresponse()
+                response.read()
+        except (Exception, Timeout):
+            self.logger.exception(_(
+                'ERROR container update batch of %(count)d failed with '
+                '%(ip)s:%(port)s/%(dev)s (saving for async update later)'),
+                {'count': len(updates), 'ip': ip, 'port': port,
+                 'dev': contdevice})
+            return None
+        if not is_success(response.status) and \
+                response.status != HTTP_METHOD_NOT_ALLOWED:
+            self.logger.error(_(
+                'ERROR Container update batch of %(count)d failed '
+                '(saving for async update later): %(status)d '
+                'response from %(ip)s:%(port)s/%(dev)s'),
+                {'count': len(updates), 'status': response.status,
+                 'ip': ip, 'port': port, 'dev': contdevice})
+        return response.status
+
     def container_update(self, op, account, container, obj, request,
                          headers_out, objdevice, policy):
         """
@@ -386,11 +536,17 @@ class ObjectController(BaseStorageServer):
         headers_out['X-Backend-Storage-Policy-Index'] = int(policy)
         update_greenthreads = []
         for conthost, contdevice in updates:
-            gt = spawn(self.async_update, op, account, container, obj,
-                       conthost, contpartition, contdevice, headers_out,
-                       objdevice, policy,
-                       logger_thread_locals=self.logger.thread_locals,
-                       container_path=contpath)
+            if self.container_update_batch_interval > 0:
+                gt = self.batch_async_update(
+                    op, account, container, obj, conthost, contpartition,
+                    contdevice, headers_out, objdevice, policy,
+                    container_path=contpath)
+            else:
+                gt = spawn(self.async_update, op, account, container, obj,
+                           conthost, contpartition, contdevice, headers_out,
+                           objdevice, policy,
+                           logger_thread_locals=self.logger.thread_locals,
+                           container_path=contpath)
             update_greenthreads.append(gt)
         # Wait a little bit to see if the container updates are successful.
         # If we immediately return after firing off the greenthread above, then
@@ -1169,16 +1325,26 @@ class ObjectController(BaseStorageServer):
         Note that the name REPLICATE is preserved for historical reasons as
         this verb really just returns the hashes information for the specified
         parameters and is used, for example, by both replication and EC.
+
+        The suffixes in the path are recalculated. If the request has an
+        X-Backend-Replicate-Suffixes header, only the hashes of the suffixes
+        it lists (joined with '-' like those in the path) are returned.
         """
         device, partition, suffix_parts, policy = \
             get_name_and_placement(request, 2, 3, True)
         suffixes = suffix_parts.split('-') if suffix_parts else []
+        wanted = request.headers.get('X-Backend-Replicate-Suffixes')
         try:
             hashes = self._diskfile_router[policy].get_hashes(
                 device, partition, suffixes, policy)
         except DiskFileDeviceUnavailable:
             resp = HTTPInsufficientStorage(drive=device, request=request)
         else:
+            if wanted is not None:
+                wanted = set(wanted.split('-'))
+                hashes = dict((suffix, hash_)
+                              for suffix, hash_ in hashes.items()
+                              if suffix in wanted)
             resp = Response(body=pickle.dumps(hashes))
         return resp
 
@@ -1186,7 +1352,8 @@ class ObjectController(BaseStorageServer):
     @replication
     @timing_stats(sample_rate=0.1)
     def SSYNC(self, request):
-        return Response(app_iter=ssync_receiver.Receiver(self, request)())
+        return Response(app_iter=ssync_receiver.Receiver(self, request)(),
+                        headers={'X-Backend-Ssync-Digests': 'true'})
 
     def __call__(self, env, start_response):
         """WSGI Application entry point for the Swift Object Server."""
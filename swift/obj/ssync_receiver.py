@@ -14,7 +14,11 @@
 # limitations under the License.
 
 
+import bisect
+
+import eventlet
 import eventlet.greenio
+import six
 from six.moves import urllib
 
 from swift.common import exceptions
@@ -23,6 +27,7 @@ from swift.common import swob
 from swift.common import utils
 from swift.common import request_helpers
 from swift.common.utils import Timestamp
+from swift.obj.ssync_sender import digest_missing, encode_missing
 
 
 def decode_missing(line):
@@ -303,6 +308,53 @@ class Receiver(object):
         local = self._check_local(remote)
         return encode_wanted(remote, local)
 
+    def _local_missing(self, suffixes):
+        """
+        Returns two lists, of the hashes of the local objects in the given
+        suffixes in sorted order, and of the missing_check lines the sender
+        would send for them.
+        """
+        hashes = []
+        lines = []
+        for object_hash, timestamps in sorted(self.diskfile_mgr.yield_hashes(
+                self.device, self.partition, self.policy, suffixes,
+                frag_index=self.frag_index)):
+            hashes.append(object_hash)
+            lines.append(encode_missing(object_hash, **timestamps))
+        return hashes, lines
+
+    def _check_digests(self, line, local):
+        """
+        Reads the ``<prefix> <digest>`` lines sent by the sender, following
+        the given ``:DIGESTS: START <suffixes>`` line, and compares them to
+        the digests of the local objects in the same ranges of hashes.
+
+        :param line: the ``:DIGESTS: START`` line
+        :param local: a dict to cache the results of :py:meth:`_local_missing`
+                      in between rounds of digests
+        :returns: a list of the prefixes whose digest does not match
+        """
+        if 'hashes' not in local:
+            parts = line.split()
+            suffixes = parts[2].split(',') if len(parts) > 2 else []
+            local['hashes'], local['lines'] = self._local_missing(suffixes)
+        hashes, lines = local['hashes'], local['lines']
+        mismatched = []
+        while True:
+            with exceptions.MessageTimeout(
+                    self.app.client_timeout, 'missing_check digests line'):
+                line = self.fp.readline(self.app.network_chunk_size)
+            if not line:
+                raise Exception('Looking for :DIGESTS: END got %r' % line)
+            if line.strip() == ':DIGESTS: END':
+                break
+            prefix, digest = line.split()
+            start = bisect.bisect_left(hashes, prefix)
+            end = bisect.bisect_left(hashes, prefix + '\xff')
+            if digest != digest_missing(lines[start:end]):
+                mismatched.append(prefix)
+        return mismatched
+
     def missing_check(self):
         """
         Handles the receiver-side of the MISSING_CHECK step of a
@@ -339,6 +391,16 @@ class Receiver(object):
                of hashes desired by the receiver until reading
                `:MISSING_CHECK: END`.
 
+        When the sender's ssync_digest_threshold is set, then at step 1 it
+        may also send any number of `:DIGESTS: START <suffixes>` lines, each
+        followed by `<prefix> <digest>` lines and `:DIGESTS: END`. The
+        receiver responds to each of them with `:DIGESTS: START`, the
+        prefixes of the ranges of hashes whose digest differs from the digest
+        of its own objects (one per line) and `:DIGESTS: END`, so that the
+        sender only has to send `hash timestamp` lines for the objects in the
+        ranges that differ. The receiver advertises that it supports this with
+        the X-Backend-Ssync-Digests response header.
+
         The collection and then response is so the sender doesn't
         have to read while it writes to ensure network buffers don't
         fill up and block everything.
@@ -350,12 +412,21 @@ class Receiver(object):
             raise Exception(
                 'Looking for :MISSING_CHECK: START got %r' % line[:1024])
         object_hashes = []
+        local = {}
         while True:
             with exceptions.MessageTimeout(
                     self.app.client_timeout, 'missing_check line'):
                 line = self.fp.readline(self.app.network_chunk_size)
             if not line or line.strip() == ':MISSING_CHECK: END':
                 break
+            if line.startswith(':DIGESTS: START'):
+                mismatched = self._check_digests(line, local)
+                yield ':DIGESTS: START\r\n'
+                if mismatched:
+                    yield '\r\n'.join(mismatched)
+                    yield '\r\n'
+                yield ':DIGESTS: END\r\n'
+                continue
             want = self._check_missing(line)
             if want:
                 object_hashes.append(want)
@@ -397,6 +468,14 @@ class Receiver(object):
         the receiver will hang up the request early so as to not
         waste any more time.
 
+        When replication_update_concurrency is greater than one, DELETE and
+        POST subrequests, and PUT subrequests whose body is no larger than
+        replication_update_buffer_size, are read off the wire and then
+        committed concurrently while the receiver reads the following
+        subrequests. Larger PUT subrequests are streamed and committed
+        inline. Subrequests for the same object are always committed in the
+        order they were sent.
+
         At step 4, the receiver will send back an error if there were
         any failures (that didn't cause a hangup due to the above
         thresholds) so the sender knows the whole was not entirely a
@@ -408,8 +487,33 @@ class Receiver(object):
             line = self.fp.readline(self.app.network_chunk_size)
         if line.strip() != ':UPDATES: START':
             raise Exception('Looking for :UPDATES: START got %r' % line[:1024])
-        successes = 0
-        failures = 0
+        counts = {'successes': 0, 'failures': 0}
+
+        def check_response(method, subreq, resp):
+            if http.is_success(resp.status_int) or \
+                    resp.status_int == http.HTTP_NOT_FOUND:
+                counts['successes'] += 1
+            else:
+                self.app.logger.warning(
+                    'ssync subrequest failed with %s: %s %s' %
+                    (resp.status_int, method, subreq.path))
+                counts['failures'] += 1
+            if counts['failures'] >= self.app.replication_failure_threshold \
+                    and (not counts['successes'] or
+                         float(counts['failures']) / counts['successes'] >
+                         self.app.replication_failure_ratio):
+                raise Exception(
+                    'Too many %d failures to %d successes' %
+                    (counts['failures'], counts['successes']))
+
+        def commit(method, subreq):
+            return method, subreq, subreq.get_response(self.app)
+
+        pool = None
+        if self.app.replication_update_concurrency > 1:
+            pool = eventlet.GreenPool(self.app.replication_update_concurrency)
+        # subrequests being committed concurrently, by object path
+        pending = {}
         while True:
             with exceptions.MessageTimeout(
                     self.app.client_timeout, 'updates line'):
@@ -480,31 +584,34 @@ class Receiver(object):
             if replication_headers:
                 subreq.headers['X-Backend-Replication-Headers'] = \
                     ' '.join(replication_headers)
+            if pool is not None:
+                # an earlier subrequest for the same object must be committed
+                # first
+                if subreq.path in pending:
+                    check_response(*pending.pop(subreq.path).wait())
+                for path, gt in list(pending.items()):
+                    if gt.dead:
+                        check_response(*pending.pop(path).wait())
+                buffer_size = self.app.replication_update_buffer_size
+                if method != 'PUT' or content_length <= buffer_size:
+                    if method == 'PUT':
+                        body = ''.join(subreq.environ['wsgi.input'])
+                        subreq.environ['wsgi.input'] = six.BytesIO(body)
+                    pending[subreq.path] = pool.spawn(commit, method, subreq)
+                    continue
             # Route subrequest and translate response.
             resp = subreq.get_response(self.app)
-            if http.is_success(resp.status_int) or \
-                    resp.status_int == http.HTTP_NOT_FOUND:
-                successes += 1
-            else:
-                self.app.logger.warning(
-                    'ssync subrequest failed with %s: %s %s' %
-                    (resp.status_int, method, subreq.path))
-                failures += 1
-            if failures >= self.app.replication_failure_threshold and (
-                    not successes or
-                    float(failures) / successes >
-                    self.app.replication_failure_ratio):
-                raise Exception(
-                    'Too many %d failures to %d successes' %
-                    (failures, successes))
+            check_response(method, subreq, resp)
             # The subreq may have failed, but we want to read the rest of the
             # body from the remote side so we can continue on with the next
             # subreq.
             for junk in subreq.environ['wsgi.input']:
                 pass
-        if failures:
+        for path in list(pending):
+            check_response(*pending.pop(path).wait())
+        if counts['failures']:
             raise swob.HTTPInternalServerError(
                 'ERROR: With :UPDATES: %d failures to %d successes' %
-                (failures, successes))
+                (counts['failures'], counts['successes']))
         yield ':UPDATES: START\r\n'
         yield ':UPDATES: END\r\n'
@@ -13,12 +13,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from hashlib import md5
+import itertools
+
 import six
 from six.moves import urllib
 
 from swift.common import bufferedhttp
 from swift.common import exceptions
 from swift.common import http
+from swift.common.utils import config_true_value
 
 
 def encode_missing(object_hash, ts_data, ts_meta=None, ts_ctype=None):
@@ -43,6 +47,15 @@ def encode_missing(object_hash, ts_data, ts_meta=None, ts_ctype=None):
     return msg
 
 
+def digest_missing(lines):
+    """
+    Returns the digest of a range of lines in the form generated by
+    :py:func:`encode_missing`, as compared by the sender and the receiver
+    of a missing_check that uses digests.
+    """
+    return md5(''.join(line + '\n' for line in lines)).hexdigest()
+
+
 def decode_wanted(parts):
     """
     Parse missing_check line parts to determine which parts of local
@@ -99,6 +112,13 @@ class Sender(object):
         # be sync'ed; each entry maps an object hash => dict of wanted parts
         self.send_map = {}
         self.failures = 0
+        # whether the receiver supports comparing digests of hash ranges in
+        # missing_check; set once connected
+        self.use_digests = False
+        # updates waiting to be sent as a single chunk when ssync_batch_size
+        # is set
+        self.batch = []
+        self.batch_len = 0
 
     def __call__(self):
         """
@@ -206,6 +226,9 @@ class Sender(object):
                 raise exceptions.ReplicationException(
                     'Expected status %s; got %s (%s)' %
                     (http.HTTP_OK, self.response.status, err_msg))
+            if self.daemon.ssync_digest_threshold:
+                self.use_digests = config_true_value(
+                    self.response.getheader('X-Backend-Ssync-Digests', ''))
 
     def readline(self):
         """
@@ -274,13 +297,18 @@ class Sender(object):
                 lambda objhash_timestamps:
                 objhash_timestamps[0] in
                 self.remote_check_objs, hash_gen)
-        for object_hash, timestamps in hash_gen:
-            self.available_map[object_hash] = timestamps
-            with exceptions.MessageTimeout(
-                    self.daemon.node_timeout,
-                    'missing_check send line'):
-                msg = '%s\r\n' % encode_missing(object_hash, **timestamps)
-                self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        if self.use_digests and self.remote_check_objs is None:
+            entries = []
+            for object_hash, timestamps in hash_gen:
+                self.available_map[object_hash] = timestamps
+                entries.append(
+                    (object_hash, encode_missing(object_hash, **timestamps)))
+            entries.sort()
+            self.send_digests(entries)
+        else:
+            for object_hash, timestamps in hash_gen:
+                self.available_map[object_hash] = timestamps
+                self.send_missing(encode_missing(object_hash, **timestamps))
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'missing_check end'):
             msg = ':MISSING_CHECK: END\r\n'
@@ -311,6 +339,91 @@ class Sender(object):
             if parts:
                 self.send_map[parts[0]] = decode_wanted(parts[1:])
 
+    def send_missing(self, line):
+        """
+        Sends a missing_check line offering an object to the receiver.
+        """
+        with exceptions.MessageTimeout(
+                self.daemon.node_timeout, 'missing_check send line'):
+            msg = '%s\r\n' % line
+            self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+
+    def _split_range(self, prefix, entries):
+        """
+        Splits sorted (hash, line) entries whose hashes share a prefix into
+        the ranges of entries sharing one more character of their hash.
+        """
+        return [(prefix + char, list(group)) for char, group in
+                itertools.groupby(entries, lambda e: e[0][len(prefix)])]
+
+    def send_digests(self, entries):
+        """
+        Offers objects to the receiver during missing_check using digests.
+
+        Each range of hashes sharing a prefix that holds more than
+        ssync_digest_threshold objects is offered as a single ``<prefix>
+        <digest>`` line between ``:DIGESTS: START <suffixes>`` and
+        ``:DIGESTS: END``; the receiver compares each digest with the digest
+        of its own objects in the range and responds with the prefixes that
+        do not match, which are then split into narrower ranges. Smaller
+        ranges are offered line by line as usual, so only the ranges that
+        differ are ever enumerated.
+
+        :param entries: a list of (hash, missing line) tuples sorted by hash
+        """
+        suffixes = ','.join(sorted(self.suffixes))
+        ranges = self._split_range('', entries)
+        while ranges:
+            digests = []
+            for prefix, range_entries in ranges:
+                if len(range_entries) > self.daemon.ssync_digest_threshold \
+                        and len(prefix) < len(range_entries[0][0]):
+                    digests.append((prefix, range_entries))
+                else:
+                    for _hash, line in range_entries:
+                        self.send_missing(line)
+            if not digests:
+                break
+            with exceptions.MessageTimeout(
+                    self.daemon.node_timeout, 'missing_check send digests'):
+                msg = ':DIGESTS: START %s\r\n' % suffixes
+                msg += ''.join(
+                    '%s %s\r\n' % (prefix, digest_missing(
+                        line for _hash, line in range_entries))
+                    for prefix, range_entries in digests)
+                msg += ':DIGESTS: END\r\n'
+                self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+            mismatched = set()
+            while True:
+                with exceptions.MessageTimeout(
+                        self.daemon.http_timeout,
+                        'missing_check digests start wait'):
+                    line = self.readline()
+                if not line:
+                    raise exceptions.ReplicationException('Early disconnect')
+                line = line.strip()
+                if line == ':DIGESTS: START':
+                    break
+                elif line:
+                    raise exceptions.ReplicationException(
+                        'Unexpected response: %r' % line[:1024])
+            while True:
+                with exceptions.MessageTimeout(
+                        self.daemon.http_timeout,
+                        'missing_check digests line wait'):
+                    line = self.readline()
+                if not line:
+                    raise exceptions.ReplicationException('Early disconnect')
+                line = line.strip()
+                if line == ':DIGESTS: END':
+                    break
+                if line:
+                    mismatched.add(line)
+            ranges = []
+            for prefix, range_entries in digests:
+                if prefix in mismatched:
+                    ranges.extend(self._split_range(prefix, range_entries))
+
     def updates(self):
         """
         Handles the sender-side of the UPDATES step of an SSYNC
@@ -357,6 +470,7 @@ class Sender(object):
                 # continue. The diskfile may however be deleted after a
                 # successful ssync since it remains in the send_map.
                 pass
+        self.send_batch()
         with exceptions.MessageTimeout(
                 self.daemon.node_timeout, 'updates end'):
             msg = ':UPDATES: END\r\n'
@@ -387,15 +501,43 @@ class Sender(object):
                 raise exceptions.ReplicationException(
                     'Unexpected response: %r' % line[:1024])
 
+    def send_update(self, msg, step):
+        """
+        Sends part of a subrequest as a chunk or, if ssync_batch_size is set,
+        adds it to the batch of subrequests that is sent as a single chunk
+        once it holds at least ssync_batch_size bytes. Since the receiver
+        reads the subrequests out of the chunked request body, batching is
+        invisible to it.
+        """
+        if not self.daemon.ssync_batch_size:
+            with exceptions.MessageTimeout(self.daemon.node_timeout, step):
+                self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+            return
+        self.batch.append(msg)
+        self.batch_len += len(msg)
+        if self.batch_len >= self.daemon.ssync_batch_size:
+            self.send_batch()
+
+    def send_batch(self):
+        """
+        Sends the batch of subrequests, if any, as a single chunk.
+        """
+        if not self.batch:
+            return
+        msg = ''.join(self.batch)
+        self.batch = []
+        self.batch_len = 0
+        with exceptions.MessageTimeout(
+                self.daemon.node_timeout, 'send_batch'):
+            self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+
     def send_delete(self, url_path, timestamp):
         """
         Sends a DELETE subrequest with the given information.
         """
         msg = ['DELETE ' + url_path, 'X-Timestamp: ' + timestamp.internal]
         msg = '\r\n'.join(msg) + '\r\n\r\n'
-        with exceptions.MessageTimeout(
-                self.daemon.node_timeout, 'send_delete'):
-            self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        self.send_update(msg, 'send_delete')
 
     def send_put(self, url_path, df):
         """
@@ -408,14 +550,11 @@ class Sender(object):
             if key not in ('name', 'Content-Length'):
                 msg.append('%s: %s' % (key, value))
         msg = '\r\n'.join(msg) + '\r\n\r\n'
-        with exceptions.MessageTimeout(self.daemon.node_timeout, 'send_put'):
-            self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        self.send_update(msg, 'send_put')
         bytes_read = 0
         for chunk in df.reader():
             bytes_read += len(chunk)
-            with exceptions.MessageTimeout(
-                    self.daemon.node_timeout, 'send_put chunk'):
-                self.connection.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.send_update(chunk, 'send_put chunk')
         if bytes_read != df.content_length:
             # Since we may now have partial state on the receiver we have to
             # prevent the receiver finalising what may well be a bad or
@@ -436,8 +575,7 @@ class Sender(object):
         for key, value in sorted(metadata.items()):
             msg.append('%s: %s' % (key, value))
         msg = '\r\n'.join(msg) + '\r\n\r\n'
-        with exceptions.MessageTimeout(self.daemon.node_timeout, 'send_post'):
-            self.connection.send('%x\r\n%s\r\n' % (len(msg), msg))
+        self.send_update(msg, 'send_post')
 
     def disconnect(self):
         """
@@ -14,14 +14,16 @@
 # limitations under the License.
 
 import six.moves.cPickle as pickle
+import json
 import os
 import signal
 import sys
 import time
 from swift import gettext_ as _
+from collections import deque, OrderedDict
 from random import random
 
-from eventlet import spawn, Timeout
+from eventlet import sleep, spawn, GreenPool, Timeout
 
 from swift.common.bufferedhttp import http_connect
 from swift.common.constraints import check_drive
@@ -32,10 +34,16 @@ from swift.common.utils import get_logger, renamer, write_pickle, \
     eventlet_monkey_patch, get_redirect_data
 from swift.common.daemon import Daemon
 from swift.common.header_key_dict import HeaderKeyDict
+from swift.common.request_helpers import get_container_update_record
 from swift.common.storage_policy import split_policy_string, PolicyError
 from swift.obj.diskfile import get_tmp_dir, ASYNCDIR_BASE
 from swift.common.http import is_success, HTTP_INTERNAL_SERVER_ERROR, \
-    HTTP_MOVED_PERMANENTLY
+    HTTP_MOVED_PERMANENTLY, HTTP_METHOD_NOT_ALLOWED, HTTP_PRECONDITION_FAILED
+
+# once a device has more than this many open (not yet full) batches for each
+# of its concurrent updates the oldest batch is sent, full or not, so that
+# loaded updates don't pile up in memory
+OPEN_BATCHES_PER_WORKER = 100
 
 
 class SweepStats(object):
@@ -43,17 +51,20 @@ class SweepStats(object):
     Stats bucket for an update sweep
     """
     def __init__(self, errors=0, failures=0, quarantines=0, successes=0,
-                 unlinks=0, redirects=0):
+                 unlinks=0, redirects=0, deferrals=0, skips=0):
         self.errors = errors
         self.failures = failures
         self.quarantines = quarantines
         self.successes = successes
         self.unlinks = unlinks
         self.redirects = redirects
+        self.deferrals = deferrals
+        self.skips = skips
 
     def copy(self):
         return type(self)(self.errors, self.failures, self.quarantines,
-                          self.successes, self.unlinks)
+                          self.successes, self.unlinks, self.redirects,
+                          self.deferrals, self.skips)
 
     def since(self, other):
         return type(self)(self.errors - other.errors,
@@ -61,7 +72,9 @@ class SweepStats(object):
                           self.quarantines - other.quarantines,
                           self.successes - other.successes,
                           self.unlinks - other.unlinks,
-                          self.redirects - other.redirects)
+                          self.redirects - other.redirects,
+                          self.deferrals - other.deferrals,
+                          self.skips - other.skips)
 
     def reset(self):
         self.errors = 0
@@ -70,6 +83,8 @@ class SweepStats(object):
         self.successes = 0
         self.unlinks = 0
         self.redirects = 0
+        self.deferrals = 0
+        self.skips = 0
 
     def __str__(self):
         keys = (
@@ -79,6 +94,8 @@ class SweepStats(object):
             (self.unlinks, 'unlinks'),
             (self.errors, 'errors'),
             (self.redirects, 'redirects'),
+            (self.deferrals, 'deferrals'),
+            (self.skips, 'skips'),
         )
         return ', '.join('%d %s' % pair for pair in keys)
 
@@ -95,6 +112,13 @@ class ObjectUpdater(Daemon):
         self.interval = int(conf.get('interval', 300))
         self.container_ring = None
         self.concurrency = int(conf.get('concurrency', 1))
+        self.concurrency_per_device = int(
+            conf.get('concurrency_per_device', 1))
+        self.updates_per_batch = int(conf.get('updates_per_batch', 1))
+        self.max_objects_per_container_per_second = float(
+            conf.get('max_objects_per_container_per_second', 0))
+        self.max_deferred_updates = int(
+            conf.get('max_deferred_updates', 10000))
         if 'slowdown' in conf:
             self.logger.warning(
                 'The slowdown option is deprecated in favor of '
@@ -266,18 +290,39 @@ class ObjectUpdater(Daemon):
                          device, my_pid)
 
         last_obj_hash = None
+        found = 0
+        pool = GreenPool(self.concurrency_per_device)
+        if self.concurrency_per_device > 1:
+            run = pool.spawn_n
+        else:
+            def run(func, *args):
+                func(*args)
+        # (policy, [(update_path, update), ...]) batches of loaded updates
+        # keyed by (container path, policy index), oldest first
+        batches = OrderedDict()
+        container_counts = {}
+        # (update, loaded update) held back by the per-container rate limit
+        deferred = deque()
         ap_iter = RateLimitedIterator(
             self._iter_async_pendings(device),
             elements_per_second=self.max_objects_per_second)
+        prefix_dirs = set()
         for update in ap_iter:
+            found += 1
+            prefix_dirs.add(os.path.dirname(update['path']))
             if update['obj_hash'] == last_obj_hash:
                 self.stats.unlinks += 1
                 self.logger.increment('unlinks')
                 os.unlink(update['path'])
+            elif self.updates_per_batch <= 1 and \
+                    not self.max_objects_per_container_per_second:
+                run(self.process_object_update, update['path'],
+                    update['device'], update['policy'])
+                last_obj_hash = update['obj_hash']
             else:
-                self.process_object_update(update['path'], update['device'],
-                                           update['policy'])
                 last_obj_hash = update['obj_hash']
+                self._add_to_batch(run, batches, container_counts,
+                                   start_time, update, deferred)
 
             now = time.time()
             if now - last_status_update >= self.report_interval:
@@ -291,36 +336,160 @@ class ObjectUpdater(Daemon):
                      'stats': this_sweep})
                 last_status_update = now
 
+        self._send_deferred(run, batches, container_counts, start_time,
+                            deferred)
+        for key, (policy, batch) in batches.items():
+            run(self.process_update_batch, key[0], batch, device, policy)
+        pool.waitall()
+        # updates may still have been in flight when _iter_async_pendings
+        # tried to clean up their dirs
+        for prefix_path in prefix_dirs:
+            try:
+                os.rmdir(prefix_path)
+            except OSError:
+                pass
+
         self.logger.timing_since('timing', start_time)
         sweep_totals = self.stats.since(start_stats)
+        elapsed = time.time() - start_time
+        # whatever wasn't unlinked or quarantined is still waiting
+        backlog = max(found - sweep_totals.unlinks -
+                      sweep_totals.quarantines, 0)
+        dump_recon_cache(
+            {'object_updater_stats': {os.path.basename(device): {
+                'backlog': backlog,
+                'drain_rate': sweep_totals.unlinks / max(elapsed, 0.001),
+                'sweep_time': elapsed}}},
+            self.rcache, self.logger)
         self.logger.info(
             ('Object update sweep completed on %(device)s '
              'in %(elapsed).02fs seconds:, '
              '%(successes)d successes, %(failures)d failures, '
              '%(quarantines)d quarantines, '
              '%(unlinks)d unlinks, %(errors)d errors, '
-             '%(redirects)d redirects '
-             '(pid: %(pid)d)'),
+             '%(redirects)d redirects, %(deferrals)d deferrals, '
+             '%(skips)d skips (pid: %(pid)d)'),
             {'device': device,
-             'elapsed': time.time() - start_time,
+             'elapsed': elapsed,
              'pid': my_pid,
              'successes': sweep_totals.successes,
              'failures': sweep_totals.failures,
              'quarantines': sweep_totals.quarantines,
              'unlinks': sweep_totals.unlinks,
              'errors': sweep_totals.errors,
-             'redirects': sweep_totals.redirects})
+             'redirects': sweep_totals.redirects,
+             'deferrals': sweep_totals.deferrals,
+             'skips': sweep_totals.skips})
 
-    def process_object_update(self, update_path, device, policy):
+    def _add_to_batch(self, run, batches, container_counts, start_time,
+                      update, deferred):
         """
-        Process the object information to be updated and update.
+        Load an async pending and add it to the batch of updates for its
+        container, running the batch once it is full.
+
+        If the container has already had its share of updates so far in this
+        sweep the update is deferred until the end of the sweep.
+
+        :param run: the function to run full batches with
+        :param batches: the dict of open batches
+        :param container_counts: a dict of the number of updates taken for
+            each container in this sweep
+        :param start_time: the time the sweep started
+        :param update: an async pending as yielded by _iter_async_pendings
+        :param deferred: the deque of deferred updates
+        """
+        data = self._load_update(update['device'], update['path'])
+        if data is None:
+            return
+        container_path = self._get_update_container_path(data)
+        count = container_counts.get(container_path, 0)
+        if self.max_objects_per_container_per_second and count >= max(
+                1, (time.time() - start_time) *
+                self.max_objects_per_container_per_second):
+            self.stats.deferrals += 1
+            self.logger.increment('deferrals')
+            deferred.append((update, data))
+            if len(deferred) > self.max_deferred_updates:
+                # leave the oldest deferred update for a later sweep
+                deferred.popleft()
+                self.stats.skips += 1
+                self.logger.increment('skips')
+            return
+        container_counts[container_path] = count + 1
+        self._take_update(run, batches, update, data)
+
+    def _send_deferred(self, run, batches, container_counts, start_time,
+                       deferred):
+        """
+        Take the updates that were deferred by the per-container rate limit,
+        sleeping as needed so that no container is sent more than
+        max_objects_per_container_per_second updates.
+
+        :param run: the function to run full batches with
+        :param batches: the dict of open batches
+        :param container_counts: a dict of the number of updates taken for
+            each container in this sweep
+        :param start_time: the time the sweep started
+        :param deferred: the deque of deferred updates
+        """
+        schedule = []
+        for update, data in deferred:
+            container_path = self._get_update_container_path(data)
+            count = container_counts.get(container_path, 0)
+            container_counts[container_path] = count + 1
+            schedule.append((
+                start_time +
+                count / self.max_objects_per_container_per_second,
+                update, data))
+        deferred.clear()
+        # sort is stable so each container's updates keep their order
+        schedule.sort(key=lambda item: item[0])
+        for send_at, update, data in schedule:
+            delay = send_at - time.time()
+            if delay > 0:
+                sleep(delay)
+            self._take_update(run, batches, update, data)
+
+    def _take_update(self, run, batches, update, data):
+        """
+        Send a loaded update, or add it to the open batch for its container
+        and send the batch once it is full.
+
+        :param run: the function to run updates and batches with
+        :param batches: the dict of open batches
+        :param update: an async pending as yielded by _iter_async_pendings
+        :param data: the loaded update
+        """
+        if self.updates_per_batch <= 1:
+            run(self.process_object_update, update['path'], update['device'],
+                update['policy'], data)
+            return
+        key = (self._get_update_container_path(data), int(update['policy']))
+        if key not in batches:
+            batches[key] = (update['policy'], [])
+        policy, batch = batches[key]
+        batch.append((update['path'], data))
+        if len(batch) >= self.updates_per_batch:
+            del batches[key]
+            run(self.process_update_batch, key[0], batch, update['device'],
+                policy)
+        elif len(batches) > \
+                self.concurrency_per_device * OPEN_BATCHES_PER_WORKER:
+            # send the oldest batch even though it isn't full
+            old_key, (old_policy, old_batch) = batches.popitem(last=False)
+            run(self.process_update_batch, old_key[0], old_batch,
+                update['device'], old_policy)
+
+    def _load_update(self, device, update_path):
+        """
+        Load an async pending, quarantining it if it can't be loaded.
 
-        :param update_path: path to pickled object update file
         :param device: path to device
-        :param policy: storage policy of object update
+        :param update_path: path to pickled object update file
+        :returns: the update dict, or None if it was quarantined
         """
         try:
-            update = pickle.load(open(update_path, 'rb'))
+            return pickle.load(open(update_path, 'rb'))
         except Exception:
             self.logger.exception(
                 _('ERROR Pickle problem, quarantining %s'), update_path)
@@ -329,7 +498,90 @@ class ObjectUpdater(Daemon):
             target_path = os.path.join(device, 'quarantined', 'objects',
                                        os.path.basename(update_path))
             renamer(update_path, target_path, fsync=False)
-            return
+            return None
+
+    def _get_update_container_path(self, update):
+        """
+        :returns: the `<account>/<container>` path an update is sent to
+        """
+        return update.get('container_path') or '%s/%s' % (
+            update['account'], update['container'])
+
+    def process_update_batch(self, container_path, batch, device, policy):
+        """
+        Send a batch of updates for the same container in a single UPDATE
+        request to each container node.
+
+        Any update that the container nodes won't take in a batch, for
+        instance because the container has shard ranges, is processed
+        individually with :meth:`process_object_update`.
+
+        :param container_path: the `<account>/<container>` path the updates
+            are sent to
+        :param batch: a list of (update_path, update) tuples
+        :param device: path to device
+        :param policy: storage policy of the object updates
+        """
+        acct, cont = split_path('/' + container_path, minsegs=2)
+        part, nodes = self.get_container_ring().get_nodes(acct, cont)
+        events = []
+        for node in nodes:
+            to_send = [(update_path, update) for update_path, update in batch
+                       if node['id'] not in update.get('successes', [])]
+            if to_send:
+                events.append((node, to_send, spawn(
+                    self.object_batch_update, node, part, container_path,
+                    policy, [update for _path, update in to_send])))
+        send_individually = False
+        new_successes = set()
+        for node, to_send, event in events:
+            status = event.wait()
+            if is_success(status):
+                for update_path, update in to_send:
+                    update.setdefault('successes', []).append(node['id'])
+                    new_successes.add(update_path)
+            elif status in (HTTP_METHOD_NOT_ALLOWED,
+                            HTTP_PRECONDITION_FAILED):
+                send_individually = True
+
+        node_ids = set(node['id'] for node in nodes)
+        for update_path, update in batch:
+            obj = '/%s/%s' % (container_path, update['obj'])
+            if node_ids.issubset(update.get('successes', [])):
+                self.stats.successes += 1
+                self.logger.increment('successes')
+                self.logger.debug('Update sent for %(obj)s %(path)s',
+                                  {'obj': obj, 'path': update_path})
+                self.stats.unlinks += 1
+                self.logger.increment('unlinks')
+                os.unlink(update_path)
+                continue
+            if update_path in new_successes:
+                write_pickle(update, update_path, os.path.join(
+                    device, get_tmp_dir(policy)))
+            if send_individually:
+                self.process_object_update(update_path, device, policy,
+                                           update=update)
+            else:
+                self.stats.failures += 1
+                self.logger.increment('failures')
+                self.logger.debug('Update failed for %(obj)s %(path)s',
+                                  {'obj': obj, 'path': update_path})
+
+    def process_object_update(self, update_path, device, policy,
+                              update=None):
+        """
+        Process the object information to be updated and update.
+
+        :param update_path: path to pickled object update file
+        :param device: path to device
+        :param policy: storage policy of object update
+        :param update: the already loaded object update, if any
+        """
+        if update is None:
+            update = self._load_update(device, update_path)
+            if update is None:
+                return
 
         def do_update():
             successes = update.get('successes', [])
@@ -408,6 +660,51 @@ class ObjectUpdater(Daemon):
             write_pickle(update, update_path, os.path.join(
                 device, get_tmp_dir(policy)))
 
+    def object_batch_update(self, node, part, container_path, policy,
+                            updates):
+        """
+        Send a batch of object updates to the container as an UPDATE request.
+
+        :param node: node dictionary from the container ring
+        :param part: partition that holds the container
+        :param container_path: the `<account>/<container>` path of the
+            container
+        :param policy: storage policy of the object updates
+        :param updates: a list of object update dicts
+        :return: the status of the response
+        """
+        records = [get_container_update_record(
+            update['op'], update['obj'], update['headers'], policy)
+            for update in updates]
+        body = json.dumps(records)
+        headers_out = {
+            'X-Timestamp': min(record['created_at'] for record in records),
+            'X-Backend-Storage-Policy-Index': str(int(policy)),
+            'X-Backend-Accept-Redirect': 'true',
+            'User-Agent': 'object-updater %s' % os.getpid(),
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body))}
+        try:
+            with ConnectionTimeout(self.conn_timeout):
+                conn = http_connect(node['ip'], node['port'], node['device'],
+                                    part, 'UPDATE', '/' + container_path,
+                                    headers_out)
+            with Timeout(self.node_timeout):
+                conn.send(body)
+                resp = conn.getresponse()
+                resp.read()
+            if not is_success(resp.status):
+                self.logger.debug(
+                    _('Error code %(status)d is returned from remote '
+                      'server %(ip)s: %(port)s / %(device)s'),
+                    {'status': resp.status, 'ip': node['ip'],
+                     'port': node['port'], 'device': node['device']})
+            return resp.status
+        except (Exception, Timeout):
+            self.logger.exception(_('ERROR with remote server '
+                                    '%(ip)s:%(port)s/%(device)s'), node)
+        return HTTP_INTERNAL_SERVER_ERROR
+
     def object_update(self, node, part, op, obj, headers_out):
         """
         Perform the object update to the container
@@ -45,8 +45,8 @@ from swift.common.wsgi import make_pre_authed_env, make_pre_authed_request
 from swift.common.utils import Timestamp, config_true_value, \
     public, split_path, list_from_csv, GreenthreadSafeIterator, \
     GreenAsyncPile, quorum_size, parse_content_type, \
-    document_iters_to_http_response_body, ShardRange
-from swift.common.bufferedhttp import http_connect
+    document_iters_to_http_response_body, ShardRange, LRUCache
+from swift.common.bufferedhttp import http_connect, release_connection
 from swift.common import constraints
 from swift.common.exceptions import ChunkReadTimeout, ChunkWriteTimeout, \
     ConnectionTimeout, RangeAlreadyComplete
@@ -61,12 +61,93 @@ from swift.common.swob import Request, Response, Range, \
 from swift.common.request_helpers import strip_sys_meta_prefix, \
     strip_user_meta_prefix, is_user_meta, is_sys_meta, is_sys_or_user_meta, \
     http_response_to_document_iters, is_object_transient_sysmeta, \
-    strip_object_transient_sysmeta_prefix
+    strip_object_transient_sysmeta_prefix, get_sys_meta_prefix, \
+    get_user_meta_prefix
 from swift.common.storage_policy import POLICIES
 
 
 DEFAULT_RECHECK_ACCOUNT_EXISTENCE = 60  # seconds
 DEFAULT_RECHECK_CONTAINER_EXISTENCE = 60  # seconds
+DEFAULT_RECHECK_LISTING_SHARD_RANGES = 600  # seconds
+DEFAULT_RECHECK_UPDATING_SHARD_RANGES = 3600  # seconds
+DEFAULT_LOCAL_INFO_CACHE_TIME = 0  # seconds
+DEFAULT_LOCAL_INFO_CACHE_SIZE = 1000
+
+
+class LocalInfoCache(object):
+    """
+    A bounded, in-process LRU cache of account and container info. It is
+    consulted after the request's swift.infocache and before memcache, so
+    that the info of busy accounts and containers can be had without any
+    network calls.
+
+    As in memcache, the info of accounts and containers that were not found
+    is only cached for a tenth of the time.
+
+    :param maxsize: the maximum number of entries to cache
+    :param maxtime: the number of seconds for which to cache info; 0
+                    disables the cache
+    :param logger: a logger for hit and miss metrics, or None
+    """
+
+    def __init__(self, maxsize=DEFAULT_LOCAL_INFO_CACHE_SIZE,
+                 maxtime=DEFAULT_LOCAL_INFO_CACHE_TIME, logger=None):
+        self.maxsize = maxsize
+        self.maxtime = maxtime
+        self.logger = logger
+        self._lru = LRUCache(maxsize=maxsize, maxtime=maxtime)
+
+    def get(self, cache_key):
+        """
+        :param cache_key: an account or container cache key
+        :returns: a copy of the cached info, or None on a miss
+        """
+        if self.maxtime <= 0:
+            return None
+        try:
+            expires, info = self._lru.get(cache_key)
+        except KeyError:
+            info = None
+        else:
+            if expires < time.time():
+                info = None
+        if self.logger:
+            self.logger.increment('%s_info.local_cache.%s' % (
+                cache_key.split('/', 1)[0], 'hit' if info else 'miss'))
+        return deepcopy(info) if info else None
+
+    def set(self, cache_key, info):
+        """
+        :param cache_key: an account or container cache key
+        :param info: the info to cache; a copy is kept
+        """
+        if self.maxtime <= 0:
+            return
+        cache_time = self.maxtime
+        if info.get('status') in (HTTP_NOT_FOUND, HTTP_GONE):
+            cache_time *= 0.1
+        self._lru.set_cache((time.time() + cache_time, deepcopy(info)),
+                            cache_key)
+
+    def delete(self, cache_key):
+        """
+        :param cache_key: an account or container cache key
+        """
+        self._lru.delete(cache_key)
+
+
+# the account and container info cache shared by everything in this process
+_local_info_cache = LocalInfoCache()
+
+
+def set_local_info_cache(local_info_cache):
+    """
+    Set the in-process account and container info cache.
+
+    :param local_info_cache: a :class:`LocalInfoCache`
+    """
+    global _local_info_cache
+    _local_info_cache = local_info_cache
 
 
 def update_headers(response, headers):
@@ -190,9 +271,46 @@ def headers_to_container_info(headers, status_int=HTTP_OK):
         'meta': meta,
         'sysmeta': sysmeta,
         'sharding_state': headers.get('x-backend-sharding-state', 'unsharded'),
+        'created_at': headers.get('x-backend-timestamp'),
+        'put_timestamp': headers.get('x-backend-put-timestamp'),
     }
 
 
+def headers_from_container_info(info):
+    """
+    Construct response headers from a dict of cached container info; the
+    inverse of :func:`headers_to_container_info`.
+
+    :param info: a dict of container info
+    :returns: a HeaderKeyDict, or None if the info does not include everything
+        needed to build the headers (e.g. if it was cached by an older proxy)
+    """
+    if not info or not is_success(info.get('status') or 0) or \
+            not info.get('created_at') or not info.get('put_timestamp'):
+        return None
+    headers = HeaderKeyDict({
+        'X-Backend-Timestamp': info['created_at'],
+        'X-Backend-PUT-Timestamp': info['put_timestamp'],
+        'X-Timestamp': Timestamp(info['created_at']).normal,
+        'X-PUT-Timestamp': Timestamp(info['put_timestamp']).normal,
+        'X-Backend-Storage-Policy-Index': info['storage_policy'],
+        'X-Container-Object-Count': info['object_count'] or 0,
+        'X-Container-Bytes-Used': info['bytes'] or 0,
+        'X-Backend-Sharding-State': info['sharding_state'],
+    })
+    for header, key in (('X-Container-Read', 'read_acl'),
+                        ('X-Container-Write', 'write_acl'),
+                        ('X-Container-Sync-Key', 'sync_key'),
+                        ('X-Versions-Location', 'versions')):
+        if info.get(key) is not None:
+            headers[header] = info[key]
+    for key, value in info.get('meta', {}).items():
+        headers[get_user_meta_prefix('container') + key] = value
+    for key, value in info.get('sysmeta', {}).items():
+        headers[get_sys_meta_prefix('container') + key] = value
+    return headers
+
+
 def headers_to_object_info(headers, status_int=HTTP_OK):
     """
     Construct a cacheable dict of object info based on response headers.
@@ -440,7 +558,7 @@ def get_account_info(env, app, swift_source=None):
     return info
 
 
-def get_cache_key(account, container=None, obj=None):
+def get_cache_key(account, container=None, obj=None, shard=None):
     """
     Get the keys for both memcache and env['swift.infocache'] (cache_key)
     where info about accounts, containers, and objects is cached
@@ -448,6 +566,9 @@ def get_cache_key(account, container=None, obj=None):
     :param account: The name of the account
     :param container: The name of the container (or None if account)
     :param obj: The name of the object (or None if account or container)
+    :param shard: Sharding state for the container query; typically 'listing'
+        or 'updating' for the keys under which a container's shard ranges are
+        cached (or None for the container info)
     :returns: a string cache_key
     """
 
@@ -458,7 +579,10 @@ def get_cache_key(account, container=None, obj=None):
     elif container:
         if not account:
             raise ValueError('Container cache key requires account')
-        cache_key = 'container/%s/%s' % (account, container)
+        if shard:
+            cache_key = 'shard-%s/%s/%s' % (shard, account, container)
+        else:
+            cache_key = 'container/%s/%s' % (account, container)
     else:
         cache_key = 'account/%s' % account
     # Use a unique environment cache key per account and one container.
@@ -470,7 +594,7 @@ def get_cache_key(account, container=None, obj=None):
 
 def set_info_cache(app, env, account, container, resp):
     """
-    Cache info in both memcache and env.
+    Cache info in memcache, the local info cache and env.
 
     :param  app: the application object
     :param  account: the unquoted account name
@@ -503,6 +627,7 @@ def set_info_cache(app, env, account, container, resp):
     memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
     if cache_time is None:
         infocache.pop(cache_key, None)
+        _local_info_cache.delete(cache_key)
         if memcache:
             memcache.delete(cache_key)
         return
@@ -513,6 +638,7 @@ def set_info_cache(app, env, account, container, resp):
         info = headers_to_account_info(resp.headers, resp.status_int)
     if memcache:
         memcache.set(cache_key, info, time=cache_time)
+    _local_info_cache.set(cache_key, info)
     infocache[cache_key] = info
     return info
 
@@ -547,7 +673,7 @@ def set_object_info_cache(app, env, account, container, obj, resp):
 
 def clear_info_cache(app, env, account, container=None):
     """
-    Clear the cached info in both memcache and env
+    Clear the cached info in memcache, the local info cache and env
 
     :param  app: the application object
     :param  env: the WSGI environment
@@ -555,6 +681,14 @@ def clear_info_cache(app, env, account, container=None):
     :param  container: the containr name or None if setting info for containers
     """
     set_info_cache(app, env, account, container, None)
+    if container:
+        # the container's shard ranges may also have changed
+        memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+        for shard in ('listing', 'updating'):
+            cache_key = get_cache_key(account, container, shard=shard)
+            env.get('swift.infocache', {}).pop(cache_key, None)
+            if memcache:
+                memcache.delete(cache_key)
 
 
 def _get_info_from_infocache(env, account, container=None):
@@ -591,22 +725,86 @@ def _get_info_from_memcache(app, env, account, container=None):
     if memcache:
         info = memcache.get(cache_key)
         if info:
-            for key in info:
-                if isinstance(info[key], six.text_type):
-                    info[key] = info[key].encode("utf-8")
-                elif isinstance(info[key], dict):
-                    for subkey, value in info[key].items():
-                        if isinstance(value, six.text_type):
-                            info[key][subkey] = value.encode("utf-8")
+            _encode_cached_info(info)
+            _local_info_cache.set(cache_key, info)
             env.setdefault('swift.infocache', {})[cache_key] = info
         return info
     return None
 
 
+def _get_info_from_local_cache(env, account, container=None):
+    """
+    Get cached account or container information from the local info cache
+
+    :param  env: the environment used by the current request
+    :param  account: the account name
+    :param  container: the container name
+
+    :returns: a dictionary of cached info on cache hit, None on miss
+    """
+    cache_key = get_cache_key(account, container)
+    info = _local_info_cache.get(cache_key)
+    if info:
+        env.setdefault('swift.infocache', {})[cache_key] = info
+    return info
+
+
+def _encode_cached_info(info):
+    """
+    Encode the unicode strings of info loaded from memcache, in place.
+
+    :param info: a dictionary of account or container info
+    """
+    for key in info:
+        if isinstance(info[key], six.text_type):
+            info[key] = info[key].encode("utf-8")
+        elif isinstance(info[key], dict):
+            for subkey, value in info[key].items():
+                if isinstance(value, six.text_type):
+                    info[key][subkey] = value.encode("utf-8")
+
+
+def prefetch_info(env, app):
+    """
+    Load the account info, and the container info if the path has a
+    container, from memcache into the request-environment cache
+    (swift.infocache) with a single multi-get, so that a following
+    get_account_info and get_container_info are served without any further
+    trips to memcache. This is useful to middlewares that need both.
+
+    Nothing is fetched for info that is already in swift.infocache or the
+    local info cache, and on a memcache miss the info is left to be fetched
+    by the usual calls.
+
+    :param  env: the environment used by the current request
+    :param  app: the application object
+    """
+    (version, account, container, unused) = \
+        split_path(env['PATH_INFO'], 2, 4, True)
+    infocache = env.setdefault('swift.infocache', {})
+    cache_keys = [get_cache_key(account)]
+    if container:
+        cache_keys.append(get_cache_key(account, container))
+    cache_keys = [key for key in cache_keys if key not in infocache]
+    for cache_key in list(cache_keys):
+        info = _local_info_cache.get(cache_key)
+        if info:
+            infocache[cache_key] = info
+            cache_keys.remove(cache_key)
+    memcache = getattr(app, 'memcache', None) or env.get('swift.cache')
+    if not memcache or not cache_keys:
+        return
+    for cache_key, info in zip(cache_keys, memcache.get_many(cache_keys)):
+        if info:
+            _encode_cached_info(info)
+            _local_info_cache.set(cache_key, info)
+            infocache[cache_key] = info
+
+
 def _get_info_from_caches(app, env, account, container=None):
     """
-    Get the cached info from env or memcache (if used) in that order.
-    Used for both account and container info.
+    Get the cached info from env, the local info cache or memcache (if used)
+    in that order. Used for both account and container info.
 
     :param  app: the application object
     :param  env: the environment used by the current request
@@ -614,6 +812,8 @@ def _get_info_from_caches(app, env, account, container=None):
     """
 
     info = _get_info_from_infocache(env, account, container)
+    if info is None:
+        info = _get_info_from_local_cache(env, account, container)
     if info is None:
         info = _get_info_from_memcache(app, env, account, container)
     return info
@@ -713,6 +913,10 @@ def close_swift_conn(src):
 
     :param src: the response from the backend
     """
+    if release_connection(getattr(src, 'swift_conn', None), src):
+        # the response was read to the end and its connection has gone back
+        # to the backend connection pool for reuse
+        return
     try:
         # Since the backends set "Connection: close" in their response
         # headers, the response object (src) is solely responsible for the
@@ -1198,6 +1402,7 @@ class ResumingGetter(object):
             self.reasons.append(possible_source.reason)
             self.bodies.append(possible_source.read())
             self.source_headers.append(possible_source.getheaders())
+            release_connection(conn, possible_source)
 
             # if 404, record the timestamp. If a good source shows up, its
             # timestamp will be compared to the latest 404.
@@ -1625,8 +1830,10 @@ class Controller(object):
                     resp = conn.getresponse()
                     if not is_informational(resp.status) and \
                             not is_server_error(resp.status):
+                        body = resp.read()
+                        release_connection(conn, resp)
                         return resp.status, resp.reason, resp.getheaders(), \
-                            resp.read()
+                            body
                     elif resp.status == HTTP_INSUFFICIENT_STORAGE:
                         self.app.error_limit(node,
                                              _('ERROR Insufficient Storage'))
@@ -15,18 +15,20 @@
 
 from swift import gettext_ as _
 import json
+import math
 
 from six.moves.urllib.parse import unquote
 from swift.common.utils import public, csv_append, Timestamp, \
-    config_true_value, ShardRange
+    config_true_value, ShardRange, filter_shard_ranges
 from swift.common.constraints import check_metadata, CONTAINER_LISTING_LIMIT
 from swift.common.http import HTTP_ACCEPTED, is_success
 from swift.common.request_helpers import get_sys_meta_prefix
 from swift.proxy.controllers.base import Controller, delay_denial, \
-    cors_validation, set_info_cache, clear_info_cache
+    cors_validation, set_info_cache, clear_info_cache, get_cache_key, \
+    headers_from_container_info, _get_info_from_caches
 from swift.common.storage_policy import POLICIES
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
-    HTTPNotFound, HTTPServerError
+    HTTPNotFound, HTTPServerError, Response
 
 
 class ContainerController(Controller):
@@ -84,6 +86,93 @@ class ContainerController(Controller):
                         return HTTPBadRequest(request=req, body=str(err))
         return None
 
+    def _GETorHEAD_from_backend(self, req):
+        part = self.app.container_ring.get_part(
+            self.account_name, self.container_name)
+        concurrency = self.app.container_ring.replica_count \
+            if self.app.concurrent_gets else 1
+        node_iter = self.app.iter_nodes(self.app.container_ring, part)
+        return self.GETorHEAD_base(
+            req, _('Container'), node_iter, part,
+            req.swift_entity_path, concurrency)
+
+    def _filter_shard_ranges(self, req, cached_ranges):
+        # apply the request's name constraints to a complete list of shard
+        # ranges, as the container server would have done
+        marker = req.params.get('marker', '')
+        end_marker = req.params.get('end_marker')
+        includes = req.params.get('includes')
+        reverse = config_true_value(req.params.get('reverse'))
+        if reverse:
+            marker, end_marker = end_marker, marker
+        if marker and end_marker and marker >= end_marker:
+            return json.dumps([])
+        shard_ranges = filter_shard_ranges(
+            [ShardRange.from_dict(data) for data in cached_ranges],
+            includes, marker, end_marker)
+        if reverse and not includes:
+            shard_ranges.reverse()
+        return json.dumps([dict(sr) for sr in shard_ranges])
+
+    def _GET_using_cache(self, req, memcache):
+        # The root of a sharded container is asked for the same list of shard
+        # ranges by every listing; if the container info tells us that the
+        # container is sharded then try to build the response from cached
+        # shard ranges instead.
+        info = _get_info_from_caches(
+            self.app, req.environ, self.account_name, self.container_name)
+        headers = headers_from_container_info(info)
+        infocache = req.environ.setdefault('swift.infocache', {})
+        cache_key = get_cache_key(
+            self.account_name, self.container_name, shard='listing')
+        if headers and info.get('sharding_state') == 'sharded':
+            cached_ranges = infocache.get(cache_key)
+            if cached_ranges is None:
+                cached_ranges = memcache.get(cache_key)
+                self.app.logger.increment('shard_listing.cache.%s' % (
+                    'hit' if cached_ranges else 'miss'))
+            if cached_ranges:
+                infocache[cache_key] = cached_ranges
+                self.app.logger.debug('Found %d shards in cache for %s',
+                                      len(cached_ranges), req.path_qs)
+                headers['X-Backend-Record-Type'] = 'shard'
+                headers['X-Backend-Cached-Results'] = 'true'
+                resp = Response(
+                    request=req, headers=headers,
+                    body=self._filter_shard_ranges(req, cached_ranges))
+                resp.content_type = 'application/json'
+                resp.last_modified = math.ceil(
+                    float(headers['X-PUT-Timestamp']))
+                return resp
+
+        # Ask the backend for all the shard ranges of a sharded container,
+        # regardless of any name constraints, so that they can be cached.
+        req.headers['X-Backend-Override-Shard-Name-Filter'] = 'sharded'
+        resp = self._GETorHEAD_from_backend(req)
+        del req.headers['X-Backend-Override-Shard-Name-Filter']
+        complete_listing = config_true_value(resp.headers.pop(
+            'X-Backend-Override-Shard-Name-Filter', False))
+        if not (complete_listing and
+                resp.headers.get('X-Backend-Record-Type') == 'shard'):
+            return resp
+        try:
+            cached_ranges = json.loads(resp.body)
+            if not isinstance(cached_ranges, list):
+                raise ValueError('not a list')
+            body = self._filter_shard_ranges(req, cached_ranges)
+        except (ValueError, TypeError, KeyError) as err:
+            self.app.logger.error(
+                'Problem with shard ranges from %s: %r', req.path_qs, err)
+            return resp
+        if cached_ranges:
+            self.app.logger.debug('Caching %d shards for %s',
+                                  len(cached_ranges), req.path_qs)
+            memcache.set(cache_key, cached_ranges,
+                         time=self.app.recheck_listing_shard_ranges)
+            infocache[cache_key] = cached_ranges
+        resp.body = body
+        return resp
+
     def GETorHEAD(self, req):
         """Handler for HTTP GET/HEAD requests."""
         ai = self.account_info(self.account_name, req)
@@ -99,11 +188,6 @@ class ContainerController(Controller):
             # Don't cache this. The lack of account will be cached, and that
             # is sufficient.
             return HTTPNotFound(request=req)
-        part = self.app.container_ring.get_part(
-            self.account_name, self.container_name)
-        concurrency = self.app.container_ring.replica_count \
-            if self.app.concurrent_gets else 1
-        node_iter = self.app.iter_nodes(self.app.container_ring, part)
         params = req.params
         params['format'] = 'json'
         record_type = req.headers.get('X-Backend-Record-Type', '').lower()
@@ -112,20 +196,28 @@ class ContainerController(Controller):
             req.headers['X-Backend-Record-Type'] = 'auto'
             params['states'] = 'listing'
         req.params = params
-        resp = self.GETorHEAD_base(
-            req, _('Container'), node_iter, part,
-            req.swift_entity_path, concurrency)
+        memcache = getattr(self.app, 'memcache', None) or \
+            req.environ.get('swift.cache')
+        if all((req.method == 'GET', record_type == 'auto',
+                self.app.recheck_listing_shard_ranges > 0, memcache,
+                not config_true_value(req.headers.get('x-newest', False)))):
+            resp = self._GET_using_cache(req, memcache)
+        else:
+            resp = self._GETorHEAD_from_backend(req)
+        cached_results = config_true_value(
+            resp.headers.get('X-Backend-Cached-Results'))
         resp_record_type = resp.headers.get('X-Backend-Record-Type', '')
         if all((req.method == "GET", record_type == 'auto',
                resp_record_type.lower() == 'shard')):
             resp = self._get_from_shards(req, resp)
 
-        # Cache this. We just made a request to a storage node and got
-        # up-to-date information for the container.
-        resp.headers['X-Backend-Recheck-Container-Existence'] = str(
-            self.app.recheck_container_existence)
-        set_info_cache(self.app, req.environ, self.account_name,
-                       self.container_name, resp)
+        if not cached_results:
+            # Cache this. We just made a request to a storage node and got
+            # up-to-date information for the container.
+            resp.headers['X-Backend-Recheck-Container-Existence'] = str(
+                self.app.recheck_container_existence)
+            set_info_cache(self.app, req.environ, self.account_name,
+                           self.container_name, resp)
         if 'swift.authorize' in req.environ:
             req.acl = resp.headers.get('x-container-read')
             aresp = req.environ['swift.authorize'](req)
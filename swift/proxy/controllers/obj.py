@@ -37,7 +37,7 @@ from hashlib import md5
 from swift import gettext_ as _
 
 from greenlet import GreenletExit
-from eventlet import GreenPile
+from eventlet import GreenPile, tpool
 from eventlet.queue import Queue
 from eventlet.timeout import Timeout
 
@@ -46,8 +46,9 @@ from swift.common.utils import (
     GreenAsyncPile, GreenthreadSafeIterator, Timestamp,
     normalize_delete_at_timestamp, public, get_expirer_container,
     document_iters_to_http_response_body, parse_content_range,
-    quorum_size, reiterate, close_if_possible, safe_json_loads)
-from swift.common.bufferedhttp import http_connect
+    quorum_size, reiterate, close_if_possible, safe_json_loads,
+    ShardRange, find_shard_range)
+from swift.common.bufferedhttp import http_connect, release_connection
 from swift.common.constraints import check_metadata, check_object_creation
 from swift.common import constraints
 from swift.common.exceptions import ChunkReadTimeout, \
@@ -64,7 +65,7 @@ from swift.common.http import (
 from swift.common.storage_policy import (POLICIES, REPL_POLICY, EC_POLICY,
                                          ECDriverError, PolicyError)
 from swift.proxy.controllers.base import Controller, delay_denial, \
-    cors_validation, ResumingGetter, update_headers
+    cors_validation, ResumingGetter, update_headers, get_cache_key
 from swift.common.swob import HTTPAccepted, HTTPBadRequest, HTTPNotFound, \
     HTTPPreconditionFailed, HTTPRequestEntityTooLarge, HTTPRequestTimeout, \
     HTTPServerError, HTTPServiceUnavailable, HTTPClientDisconnect, \
@@ -266,17 +267,62 @@ class BaseObjectController(Controller):
         """Handler for HTTP HEAD requests."""
         return self.GETorHEAD(req)
 
+    def _get_cached_updating_shard_ranges(self, req):
+        """
+        Get the root container's updating shard ranges from the request's
+        infocache or memcache, fetching and caching all of them from the root
+        container on a miss.
+
+        :param req: original Request instance.
+        :return: a list of instances of
+            :class:`swift.common.utils.ShardRange`, or None if there was a
+            problem fetching the shard ranges
+        """
+        cache_key = get_cache_key(
+            self.account_name, self.container_name, shard='updating')
+        infocache = req.environ.setdefault('swift.infocache', {})
+        memcache = getattr(self.app, 'memcache', None) or \
+            req.environ.get('swift.cache')
+        cached_ranges = infocache.get(cache_key)
+        if cached_ranges is None and memcache:
+            cached_ranges = memcache.get(cache_key)
+            self.app.logger.increment('shard_updating.cache.%s' % (
+                'hit' if cached_ranges else 'miss'))
+        if cached_ranges:
+            infocache[cache_key] = cached_ranges
+            return [ShardRange.from_dict(data) for data in cached_ranges]
+
+        shard_ranges = self._get_shard_ranges(
+            req, self.account_name, self.container_name, states='updating')
+        if shard_ranges:
+            cached_ranges = [dict(sr) for sr in shard_ranges]
+            infocache[cache_key] = cached_ranges
+            if memcache:
+                memcache.set(cache_key, cached_ranges,
+                             time=self.app.recheck_updating_shard_ranges)
+        return shard_ranges
+
+    def _get_update_shard(self, req):
+        if self.app.recheck_updating_shard_ranges <= 0:
+            # caching is disabled; ask the root for just the one we need
+            shard_ranges = self._get_shard_ranges(
+                req, self.account_name, self.container_name,
+                includes=self.object_name, states='updating')
+            return shard_ranges[0] if shard_ranges else None
+        shard_ranges = self._get_cached_updating_shard_ranges(req)
+        return find_shard_range(self.object_name, shard_ranges or [])
+
     def _get_update_target(self, req, container_info):
         # find the sharded container to which we'll send the update
         db_state = container_info.get('sharding_state', 'unsharded')
         if db_state in ('sharded', 'sharding'):
-            shard_ranges = self._get_shard_ranges(
-                req, self.account_name, self.container_name,
-                includes=self.object_name, states='updating')
-            if shard_ranges:
+            shard_range = self._get_update_shard(req)
+            self.app.logger.increment('shard_updating.%s' % (
+                'shard' if shard_range else 'root'))
+            if shard_range:
                 partition, nodes = self.app.container_ring.get_nodes(
-                    shard_ranges[0].account, shard_ranges[0].container)
-                return partition, nodes, shard_ranges[0].name
+                    shard_range.account, shard_range.container)
+                return partition, nodes, shard_range.name
 
         return container_info['partition'], container_info['nodes'], None
 
@@ -1037,6 +1083,56 @@ class ReplicatedObjectController(BaseObjectController):
         return resp
 
 
+def _apply_to_each(func, items):
+    return [func(item) for item in items]
+
+
+class ECCoder(object):
+    """
+    Runs a storage policy's erasure coding for the proxy, either on the
+    calling greenthread or, to keep the hub free for other requests while
+    the coding math is done, in eventlet's native thread pool.
+
+    Each call codes a batch of segments, so that the cost of handing work to
+    the thread pool is shared by all of them.
+
+    :param policy: an erasure coded storage policy
+    :param in_threads: if True, code in eventlet's native thread pool
+    :param logger: a logger for coding timing metrics, which are only emitted
+                   when coding in threads
+    """
+    def __init__(self, policy, in_threads=False, logger=None):
+        self.policy = policy
+        self.in_threads = in_threads
+        self.logger = logger
+
+    def _code(self, func, items, metric):
+        if not self.in_threads:
+            return _apply_to_each(func, items)
+        start = time.time()
+        results = tpool.execute(_apply_to_each, func, items)
+        if self.logger:
+            self.logger.timing_since(
+                'policy.%d.%s.timing' % (int(self.policy), metric), start)
+        return results
+
+    def encode(self, segments):
+        """
+        :param segments: a list of segments
+        :returns: a list with each segment's list of fragments
+        """
+        return self._code(
+            self.policy.pyeclib_driver.encode, segments, 'ec_encode')
+
+    def decode(self, fragment_sets):
+        """
+        :param fragment_sets: a list with a list of fragments for each segment
+        :returns: a list of the decoded segments
+        """
+        return self._code(
+            self.policy.pyeclib_driver.decode, fragment_sets, 'ec_decode')
+
+
 class ECAppIter(object):
     """
     WSGI iterable that decodes EC fragment archives (or portions thereof)
@@ -1062,11 +1158,21 @@ class ECAppIter(object):
         headers in the GET response from the object server.
 
     :param logger: a logger
+
+    :param coder: the :class:`ECCoder` with which to decode; defaults to
+        decoding on the calling greenthread.
+
+    :param segments_in_flight: the number of segments' worth of fragments to
+        read ahead from each backend response, and to decode in a batch when
+        that many have already been read.
     """
     def __init__(self, path, policy, internal_parts_iters, range_specs,
-                 fa_length, obj_length, logger):
+                 fa_length, obj_length, logger, coder=None,
+                 segments_in_flight=1):
         self.path = path
         self.policy = policy
+        self.coder = coder or ECCoder(policy)
+        self.segments_in_flight = max(1, segments_in_flight)
         self.internal_parts_iters = internal_parts_iters
         self.range_specs = range_specs
         self.fa_length = fa_length
@@ -1413,7 +1519,8 @@ class ECAppIter(object):
     def _decode_segments_from_fragments(self, fragment_iters):
         # Decodes the fragments from the object servers and yields one
         # segment at a time.
-        queues = [Queue(1) for _junk in range(len(fragment_iters))]
+        queues = [Queue(self.segments_in_flight)
+                  for _junk in range(len(fragment_iters))]
 
         def put_fragments_in_queue(frag_iter, queue):
             try:
@@ -1432,7 +1539,8 @@ class ECAppIter(object):
                 self.logger.exception(_("Exception fetching fragments for"
                                         " %r"), self.path)
             finally:
-                queue.resize(2)  # ensure there's room
+                # ensure there's room
+                queue.resize(self.segments_in_flight + 1)
                 queue.put(None)
                 frag_iter.close()
 
@@ -1440,29 +1548,42 @@ class ECAppIter(object):
             for frag_iter, queue in zip(fragment_iters, queues):
                 pool.spawn(put_fragments_in_queue, frag_iter, queue)
 
-            while True:
-                fragments = []
-                for queue in queues:
-                    fragment = queue.get()
-                    queue.task_done()
-                    fragments.append(fragment)
-
-                # If any object server connection yields out a None; we're
-                # done.  Either they are all None, and we've finished
-                # successfully; or some un-recoverable failure has left us
-                # with an un-reconstructible list of fragments - so we'll
-                # break out of the iter so WSGI can tear down the broken
-                # connection.
-                if not all(fragments):
+            done = False
+            while not done:
+                fragment_sets = []
+                while len(fragment_sets) < self.segments_in_flight:
+                    if fragment_sets and not all(
+                            queue.qsize() for queue in queues):
+                        # decode what we have rather than wait for more
+                        break
+                    fragments = []
+                    for queue in queues:
+                        fragment = queue.get()
+                        queue.task_done()
+                        fragments.append(fragment)
+
+                    # If any object server connection yields out a None;
+                    # we're done.  Either they are all None, and we've
+                    # finished successfully; or some un-recoverable failure
+                    # has left us with an un-reconstructible list of
+                    # fragments - so we'll break out of the iter so WSGI can
+                    # tear down the broken connection.
+                    if not all(fragments):
+                        done = True
+                        break
+                    fragment_sets.append(fragments)
+
+                if not fragment_sets:
                     break
                 try:
-                    segment = self.policy.pyeclib_driver.decode(fragments)
+                    segments = self.coder.decode(fragment_sets)
                 except ECDriverError:
                     self.logger.exception(_("Error decoding fragments for"
                                             " %r"), self.path)
                     raise
 
-                yield segment
+                for segment in segments:
+                    yield segment
 
     def app_iter_range(self, start, end):
         return self
@@ -1716,6 +1837,13 @@ class Putter(object):
             self.queue.task_done()
 
     def close(self):
+        # only a connection that carried the whole request body and has had
+        # its final response read can be reused for another request
+        if (not self.failed and self.state in (DATA_SENT, COMMIT_SENT) and
+                self.resp is not None and
+                release_connection(self.conn, self.resp)):
+            self.resp = self.final_resp = None
+            return
         # release reference to response to ensure connection really does close,
         # see bug https://bugs.launchpad.net/swift/+bug/1594739
         self.resp = self.final_resp = None
@@ -1915,13 +2043,18 @@ class MIMEPutter(Putter):
                    mime_boundary, multiphase=need_multiphase)
 
 
-def chunk_transformer(policy):
+def chunk_transformer(policy, coder=None):
     """
     A generator to transform a source chunk to erasure coded chunks for each
     `send` call. The number of erasure coded chunks is as
     policy.ec_n_unique_fragments.
+
+    :param policy: the erasure coded storage policy
+    :param coder: the :class:`ECCoder` with which to encode; defaults to
+                  encoding on the calling greenthread
     """
     segment_size = policy.ec_segment_size
+    coder = coder or ECCoder(policy)
 
     buf = collections.deque()
     total_buf_len = 0
@@ -1946,10 +2079,7 @@ def chunk_transformer(policy):
                     total_buf_len -= len(piece)
                 chunks_to_encode.append(''.join(pieces))
 
-            frags_by_byte_order = []
-            for chunk_to_encode in chunks_to_encode:
-                frags_by_byte_order.append(
-                    policy.pyeclib_driver.encode(chunk_to_encode))
+            frags_by_byte_order = coder.encode(chunks_to_encode)
             # Sequential calls to encode() have given us a list that
             # looks like this:
             #
@@ -1973,7 +2103,7 @@ def chunk_transformer(policy):
     # Take any leftover bytes and encode them.
     last_bytes = ''.join(buf)
     if last_bytes:
-        last_frags = policy.pyeclib_driver.encode(last_bytes)
+        last_frags = coder.encode([last_bytes])[0]
         yield last_frags
     else:
         yield [''] * policy.ec_n_unique_fragments
@@ -2262,6 +2392,14 @@ class ECGetResponseCollection(object):
 
 @ObjectControllerRouter.register(EC_POLICY)
 class ECObjectController(BaseObjectController):
+    def _ec_coder(self, policy):
+        """
+        Get an :class:`ECCoder` for a policy, as configured for the policy.
+        """
+        policy_options = self.app.get_policy_options(policy)
+        return ECCoder(policy, in_threads=policy_options.ec_coding_in_threads,
+                       logger=self.app.logger)
+
     def _fragment_GET_request(self, req, node_iter, partition, policy,
                               header_provider=None):
         """
@@ -2437,7 +2575,9 @@ class ECObjectController(BaseObjectController):
                 [parts_iter for
                  _getter, parts_iter in best_bucket.get_responses()],
                 range_specs, fa_length, obj_length,
-                self.app.logger)
+                self.app.logger, coder=self._ec_coder(policy),
+                segments_in_flight=self.app.get_policy_options(
+                    policy).ec_segments_in_flight)
             resp = Response(
                 request=req,
                 conditional_response=True,
@@ -2571,7 +2711,8 @@ class ECObjectController(BaseObjectController):
         This method was added in the PUT method extraction change
         """
         bytes_transferred = 0
-        chunk_transform = chunk_transformer(policy)
+        chunk_transform = chunk_transformer(
+            policy, coder=self._ec_coder(policy))
         chunk_transform.send(None)
         frag_hashers = collections.defaultdict(md5)
 
@@ -25,10 +25,12 @@ from time import time
 import functools
 import sys
 
-from eventlet import Timeout
+from eventlet import Timeout, tpool
 
 from swift import __canonical_version__ as swift_version
 from swift.common import constraints
+from swift.common.bufferedhttp import BufferedHTTPConnectionPool, \
+    set_connection_pool
 from swift.common.storage_policy import POLICIES
 from swift.common.ring import Ring
 from swift.common.utils import cache_from_env, get_logger, \
@@ -39,7 +41,10 @@ from swift.common.constraints import check_utf8, valid_api_version
 from swift.proxy.controllers import AccountController, ContainerController, \
     ObjectControllerRouter, InfoController
 from swift.proxy.controllers.base import get_container_info, NodeIter, \
-    DEFAULT_RECHECK_CONTAINER_EXISTENCE, DEFAULT_RECHECK_ACCOUNT_EXISTENCE
+    DEFAULT_RECHECK_CONTAINER_EXISTENCE, DEFAULT_RECHECK_ACCOUNT_EXISTENCE, \
+    DEFAULT_RECHECK_LISTING_SHARD_RANGES, \
+    DEFAULT_RECHECK_UPDATING_SHARD_RANGES, DEFAULT_LOCAL_INFO_CACHE_SIZE, \
+    DEFAULT_LOCAL_INFO_CACHE_TIME, LocalInfoCache, set_local_info_cache
 from swift.common.swob import HTTPBadRequest, HTTPForbidden, \
     HTTPMethodNotAllowed, HTTPNotFound, HTTPPreconditionFailed, \
     HTTPServerError, HTTPException, Request, HTTPServiceUnavailable
@@ -135,6 +140,12 @@ class ProxyOverrideOptions(object):
         self.write_affinity_handoff_delete_count = config_auto_int_value(
             get('write_affinity_handoff_delete_count', 'auto'), None
         )
+        self.ec_coding_in_threads = config_true_value(
+            get('ec_coding_in_threads', False))
+        self.ec_segments_in_flight = int(get('ec_segments_in_flight', 1))
+        if self.ec_segments_in_flight < 1:
+            raise ValueError('Invalid ec_segments_in_flight value: %r' %
+                             self.ec_segments_in_flight)
 
     def __repr__(self):
         return '%s({}, {%s})' % (self.__class__.__name__, ', '.join(
@@ -143,7 +154,9 @@ class ProxyOverrideOptions(object):
                 'read_affinity',
                 'write_affinity',
                 'write_affinity_node_count',
-                'write_affinity_handoff_delete_count')))
+                'write_affinity_handoff_delete_count',
+                'ec_coding_in_threads',
+                'ec_segments_in_flight')))
 
     def __eq__(self, other):
         if not isinstance(other, ProxyOverrideOptions):
@@ -153,7 +166,9 @@ class ProxyOverrideOptions(object):
             'read_affinity',
             'write_affinity',
             'write_affinity_node_count',
-            'write_affinity_handoff_delete_count'))
+            'write_affinity_handoff_delete_count',
+            'ec_coding_in_threads',
+            'ec_segments_in_flight'))
 
 
 class Application(object):
@@ -183,6 +198,15 @@ class Application(object):
         self.put_queue_depth = int(conf.get('put_queue_depth', 10))
         self.object_chunk_size = int(conf.get('object_chunk_size', 65536))
         self.client_chunk_size = int(conf.get('client_chunk_size', 65536))
+        if config_true_value(conf.get('backend_keepalive', 'false')):
+            set_connection_pool(BufferedHTTPConnectionPool(
+                max_idle_per_host=int(conf.get(
+                    'backend_keepalive_max_idle_per_host', 8)),
+                idle_timeout=float(conf.get(
+                    'backend_keepalive_idle_timeout', 30)),
+                logger=self.logger))
+        else:
+            set_connection_pool(None)
         self.trans_id_suffix = conf.get('trans_id_suffix', '')
         self.post_quorum_timeout = float(conf.get('post_quorum_timeout', 0.5))
         self.error_suppression_interval = \
@@ -195,6 +219,23 @@ class Application(object):
         self.recheck_account_existence = \
             int(conf.get('recheck_account_existence',
                          DEFAULT_RECHECK_ACCOUNT_EXISTENCE))
+        self.recheck_listing_shard_ranges = \
+            int(conf.get('recheck_listing_shard_ranges',
+                         DEFAULT_RECHECK_LISTING_SHARD_RANGES))
+        self.recheck_updating_shard_ranges = \
+            int(conf.get('recheck_updating_shard_ranges',
+                         DEFAULT_RECHECK_UPDATING_SHARD_RANGES))
+        self.local_info_cache = LocalInfoCache(
+            maxsize=int(conf.get('local_info_cache_size',
+                                 DEFAULT_LOCAL_INFO_CACHE_SIZE)),
+            maxtime=float(conf.get('local_info_cache_time',
+                                   DEFAULT_LOCAL_INFO_CACHE_TIME)),
+            logger=self.logger)
+        set_local_info_cache(self.local_info_cache)
+        tpool_size = config_auto_int_value(
+            conf.get('eventlet_tpool_num_threads'), None)
+        if tpool_size:
+            tpool.set_num_threads(tpool_size)
         self.allow_account_management = \
             config_true_value(conf.get('allow_account_management', 'no'))
         self.container_ring = container_ring or Ring(swift_dir,
@@ -353,6 +353,9 @@ class FakeMemcache(object):
     def get(self, key):
         return self.store.get(key)
 
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
     def keys(self):
         return self.store.keys()
 
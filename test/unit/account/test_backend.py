@@ -668,6 +668,58 @@ class TestAccountBroker(unittest.TestCase):
         self.assertFalse(failures, "Found the following failures:\n%s" %
                          '\n'.join(failures))
 
+    def test_list_containers_iter_delimiter_skip(self):
+        broker = AccountBroker(':memory:', account='a')
+        broker.initialize(Timestamp('1').internal)
+        # pseudo-directories of assorted sizes, and containers named just
+        # past them
+        names = ['a', 'b-0', 'b.', 'c-', 'c.']
+        names += ['d-%02d' % i for i in range(3)]
+        names += ['e-%02d' % i for i in range(40)] + ['e-f-g', 'e.']
+        names += ['f-%02d-%d' % (i, j) for i in range(20) for j in range(i)]
+        names += ['g%02d-x' % i for i in range(30)] + ['h']
+        for name in names:
+            broker.put_container(name, Timestamp.now().internal, 0, 0, 0,
+                                 POLICIES.default.idx)
+        # a deleted container doesn't make a pseudo-directory
+        broker.put_container('b1-x', 0, Timestamp.now().internal, 0, 0,
+                             POLICIES.default.idx)
+
+        def expected_listing(prefix, reverse):
+            listing = []
+            for name in sorted(names, reverse=reverse):
+                if not name.startswith(prefix):
+                    continue
+                end = name.find('-', len(prefix))
+                if end > 0:
+                    name = name[:end + 1]
+                if not listing or listing[-1] != name:
+                    listing.append(name)
+            return listing
+
+        def page_through(limit, prefix, reverse):
+            listing = []
+            marker = ''
+            while True:
+                page = [row[0] for row in broker.list_containers_iter(
+                    limit, marker, None, prefix, '-', reverse=reverse)]
+                listing.extend(page)
+                if len(page) < limit:
+                    return listing
+                marker = page[-1]
+
+        for skip_rows in (1, 4, 16, 100):
+            with mock.patch('swift.account.backend.DELIMITER_SKIP_ROWS',
+                            skip_rows):
+                for prefix in ('', 'e-', 'f-'):
+                    for reverse in (False, True):
+                        expected = expected_listing(prefix, reverse)
+                        for limit in (1, 2, 7, 1000):
+                            self.assertEqual(
+                                expected, page_through(limit, prefix, reverse),
+                                'skip_rows=%s prefix=%r reverse=%s limit=%s' %
+                                (skip_rows, prefix, reverse, limit))
+
     def test_double_check_trailing_delimiter(self):
         # Test AccountBroker.list_containers_iter for an
         # account that has an odd container with a trailing delimiter
@@ -868,6 +920,55 @@ class TestAccountBroker(unittest.TestCase):
         self.assertIn('unable to open database file',
                       str(exc_context.exception))
 
+    @with_tempdir
+    def test_get_stats_snapshot(self, tempdir):
+        ts = make_timestamp_iter()
+        db_path = os.path.join(tempdir, 'test.db')
+        broker = AccountBroker(db_path, account='a')
+        self.assertEqual({'deleted': True, 'info': None,
+                          'policy_stats': None, 'metadata': None},
+                         broker.get_stats_snapshot())
+        broker.initialize(next(ts).internal)
+        broker.put_container('c', next(ts).internal, 0, 3, 4, 0)
+
+        snapshot = broker.get_stats_snapshot()
+        self.assertFalse(snapshot['deleted'])
+        self.assertEqual(1, snapshot['info']['container_count'])
+        self.assertEqual(3, snapshot['info']['object_count'])
+        self.assertEqual(4, snapshot['policy_stats'][0]['bytes_used'])
+        self.assertEqual({}, snapshot['metadata'])
+        # the pending update was committed while taking the snapshot, so it
+        # is taken again once...
+        snapshot = broker.get_stats_snapshot()
+        # ...then reused while the db is unchanged
+        with mock.patch.object(broker, 'get_info') as mock_get_info:
+            self.assertIs(snapshot, broker.get_stats_snapshot())
+            self.assertIs(snapshot, broker.get_stats_snapshot())
+        mock_get_info.assert_not_called()
+
+        # an update is pending
+        broker.put_container('d', next(ts).internal, 0, 1, 1, 0)
+        snapshot = broker.get_stats_snapshot()
+        self.assertEqual(2, snapshot['info']['container_count'])
+        snapshot = broker.get_stats_snapshot()
+        self.assertEqual(2, snapshot['info']['container_count'])
+        self.assertIs(snapshot, broker.get_stats_snapshot())
+
+        # another broker changes the db
+        other_broker = AccountBroker(db_path, account='a')
+        other_broker.update_metadata({'X-Foo': ['bar', next(ts).internal]})
+        snapshot = broker.get_stats_snapshot()
+        self.assertEqual({'X-Foo': ['bar', mock.ANY]}, snapshot['metadata'])
+        self.assertIs(snapshot, broker.get_stats_snapshot())
+
+        other_broker.delete_db(next(ts).internal)
+        other_broker.put_container('c', 0, next(ts).internal, 0, 0, 0)
+        other_broker.put_container('d', 0, next(ts).internal, 0, 0, 0)
+        other_broker.get_info()
+        snapshot = broker.get_stats_snapshot()
+        self.assertTrue(snapshot['deleted'])
+        self.assertIsNone(snapshot['info'])
+
     @patch_policies([StoragePolicy(0, 'zero', False),
                      StoragePolicy(1, 'one', True),
                      StoragePolicy(2, 'two', False),
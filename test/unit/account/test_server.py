@@ -341,6 +341,58 @@ class TestAccountController(unittest.TestCase):
         self.assertEqual(resp.headers['x-account-object-count'], '4')
         self.assertEqual(resp.headers['x-account-bytes-used'], '6')
 
+    def test_HEAD_with_broker_cache(self):
+        self.controller = AccountController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'broker_cache_size': '10'})
+
+        def put_container(name, object_count):
+            req = Request.blank(
+                '/sda1/p/a/%s' % name, method='PUT',
+                headers={'X-Put-Timestamp': '1', 'X-Delete-Timestamp': '0',
+                         'X-Object-Count': str(object_count),
+                         'X-Bytes-Used': '0',
+                         'X-Timestamp': normalize_timestamp(0)})
+            self.assertEqual(201, req.get_response(self.controller).status_int)
+
+        def head():
+            req = Request.blank('/sda1/p/a', method='HEAD')
+            resp = req.get_response(self.controller)
+            self.assertEqual(204, resp.status_int)
+            return (resp.headers['x-account-container-count'],
+                    resp.headers['x-account-object-count'],
+                    resp.headers.get('x-account-meta-test'))
+
+        req = Request.blank('/sda1/p/a', method='PUT',
+                            headers={'X-Timestamp': normalize_timestamp(0)})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+        put_container('c1', 1)
+        self.assertEqual(('1', '1', None), head())
+        self.assertEqual(('1', '1', None), head())
+        # the account's stats snapshot is reused while the db is unchanged
+        with mock.patch('swift.account.backend.AccountBroker.get_info') as \
+                mock_get_info:
+            self.assertEqual(('1', '1', None), head())
+            self.assertEqual(('1', '1', None), head())
+        mock_get_info.assert_not_called()
+        # and taken again once it changes
+        put_container('c2', 2)
+        self.assertEqual(('2', '3', None), head())
+        put_container('c1', 3)
+        self.assertEqual(('2', '5', None), head())
+        req = Request.blank('/sda1/p/a', method='POST',
+                            headers={'X-Timestamp': normalize_timestamp(1),
+                                     'X-Account-Meta-Test': 'Value'})
+        self.assertEqual(204, req.get_response(self.controller).status_int)
+        self.assertEqual(('2', '5', 'Value'), head())
+        req = Request.blank('/sda1/p/a', method='GET',
+                            headers={'Accept': 'application/json'})
+        resp = req.get_response(self.controller)
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual('5', resp.headers['x-account-object-count'])
+        self.assertEqual(['c1', 'c2'],
+                         [c['name'] for c in json.loads(resp.body)])
+
     def test_HEAD_invalid_partition(self):
         req = Request.blank('/sda1/./a', environ={'REQUEST_METHOD': 'HEAD',
                                                   'HTTP_X_TIMESTAMP': '1'})
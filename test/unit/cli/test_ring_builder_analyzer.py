@@ -21,7 +21,9 @@ from six import StringIO
 import unittest
 from test.unit import with_tempdir
 
-from swift.cli.ring_builder_analyzer import parse_scenario, run_scenario
+from swift.cli.ring_builder_analyzer import parse_scenario, run_scenario, \
+    compare_engines, main
+from swift.common.ring import builder
 
 
 class TestRunScenario(unittest.TestCase):
@@ -49,6 +51,40 @@ class TestRunScenario(unittest.TestCase):
         self.assertIn('Rebalance', fake_stdout.getvalue())
         self.assertTrue(os.path.exists(builder_path))
 
+    @unittest.skipIf(builder.numpy is None, 'NumPy is not installed')
+    def test_compare_engines(self):
+        scenario = {
+            'replicas': 3, 'part_power': 8, 'random_seed': 123, 'overload': 0,
+            'rounds': [[['add', 'r1z1-3.4.5.6:7/sda', 100],
+                        ['add', 'r1z2-3.4.5.7:7/sda', 100],
+                        ['add', 'r1z3-3.4.5.8:7/sda', 100],
+                        ['add', 'r1z3-3.4.5.8:7/sdb', 100]],
+                       [['set_weight', 0, 150]],
+                       [['remove', 1]]]}
+        parsed = parse_scenario(json.dumps(scenario))
+
+        fake_stdout = StringIO()
+        with mock.patch('sys.stdout', fake_stdout):
+            self.assertTrue(compare_engines(parsed))
+        output = fake_stdout.getvalue()
+        self.assertIn('Engine python', output)
+        self.assertIn('Engine numpy', output)
+        self.assertIn('python: ', output)
+        self.assertNotIn('different rings', output)
+
+    @with_tempdir
+    def test_numpy_not_installed(self, tempdir):
+        scenario_path = os.path.join(tempdir, 'scenario.json')
+        with open(scenario_path, 'w') as f:
+            json.dump({'replicas': 3, 'part_power': 8, 'random_seed': 123,
+                       'overload': 0, 'rounds': []}, f)
+        fake_stderr = StringIO()
+        with mock.patch('sys.stderr', fake_stderr), \
+                mock.patch('swift.common.ring.builder.numpy', None):
+            self.assertEqual(1, main(['--compare', scenario_path]))
+            self.assertEqual(1, main(['--engine', 'numpy', scenario_path]))
+        self.assertIn('NumPy is not installed', fake_stderr.getvalue())
+
 
 class TestParseScenario(unittest.TestCase):
     def test_good(self):
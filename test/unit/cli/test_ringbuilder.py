@@ -30,7 +30,7 @@ import time
 from swift.cli import ringbuilder
 from swift.cli.ringbuilder import EXIT_SUCCESS, EXIT_WARNING, EXIT_ERROR
 from swift.common import exceptions
-from swift.common.ring import RingBuilder
+from swift.common.ring import RingBuilder, RingData
 
 from test.unit import Timeout
 
@@ -2194,6 +2194,33 @@ class TestCommands(unittest.TestCase, RunSwiftRingBuilderMixin):
         argv = ["", self.tmpfile, "write_ring"]
         self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
 
+    def test_write_ring_v2(self):
+        self.create_sample_ring()
+        argv = ["", self.tmpfile, "rebalance"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+
+        argv = ["", self.tmpfile, "write_ring", "--format", "v2"]
+        self.assertSystemExit(EXIT_SUCCESS, ringbuilder.main, argv)
+        ring_file = self.tmpfile + '.ring.gz'
+        with open(ring_file, 'rb') as f:
+            self.assertEqual(b'R1NG\x00\x02', f.read(6))
+        ring = RingData.load(ring_file)
+        builder = RingBuilder.load(self.tmpfile)
+        self.assertEqual(builder.get_ring().devs, ring.devs)
+        self.assertEqual(builder._replica2part2dev,
+                         [part2dev_id.to_array() for part2dev_id
+                          in ring._replica2part2dev_id])
+
+        # the builder can still be recovered from a v2 ring
+        os.remove(self.tmpfile)
+        argv = ["", ring_file, "write_builder"]
+        self.assertIsNone(ringbuilder.main(argv))
+        rebuilt = RingBuilder.load(self.tmpfile + '.builder')
+        self.assertEqual(builder._replica2part2dev, rebuilt._replica2part2dev)
+
+        argv = ["", self.tmpfile, "write_ring", "--format", "v3"]
+        self.assertSystemExit(2, ringbuilder.main, argv)
+
     def test_write_empty_ring(self):
         ring = RingBuilder(6, 3, 1)
         ring.save(self.tmpfile)
@@ -305,6 +305,7 @@ class TestCacheMiddleware(unittest.TestCase):
         # tries is limited to server count
         self.assertEqual(memcache_ring._tries, 1)
         self.assertEqual(memcache_ring._io_timeout, 2.0)
+        self.assertFalse(memcache_ring._noreply_sets)
 
     @with_tempdir
     def test_real_config_with_options(self, tempdir):
@@ -323,6 +324,7 @@ class TestCacheMiddleware(unittest.TestCase):
         pool_timeout = 0.5
         tries = 4
         io_timeout = 1.0
+        noreply_sets = true
         """
         config_path = os.path.join(tempdir, 'test.conf')
         with open(config_path, 'w') as f:
@@ -336,6 +338,7 @@ class TestCacheMiddleware(unittest.TestCase):
         # tries is limited to server count
         self.assertEqual(memcache_ring._tries, 4)
         self.assertEqual(memcache_ring._io_timeout, 1.0)
+        self.assertTrue(memcache_ring._noreply_sets)
 
     @with_tempdir
     def test_real_memcache_config(self, tempdir):
@@ -40,6 +40,9 @@ class FakeMemcache(object):
     def get(self, key):
         return self.store.get(key)
 
+    def get_many(self, keys):
+        return [self.store.get(key) for key in keys]
+
     def set(self, key, value, serialize=False, time=0):
         self.store[key] = value
         return True
@@ -455,6 +458,38 @@ class TestRateLimit(unittest.TestCase):
             finally:
                 self.test_ratelimit.memcache_client = mc
 
+    def test_ratelimit_prefetches_info(self):
+        conf_dict = {'container_ratelimit_0': 100}
+        self.test_ratelimit = ratelimit.filter_factory(conf_dict)(FakeApp())
+        fake_memcache = FakeMemcache()
+        fake_memcache.set(get_cache_key('a'), {'sysmeta': {}})
+        fake_memcache.set(get_cache_key('a', 'c'), {'object_count': 1})
+
+        def do_request(path, method):
+            req = Request.blank(path, environ={'swift.cache': fake_memcache})
+            req.method = method
+            with mock.patch.object(
+                    fake_memcache, 'get_many',
+                    wraps=fake_memcache.get_many) as mock_many, \
+                    mock.patch.object(fake_memcache, 'get',
+                                      wraps=fake_memcache.get) as mock_get:
+                resp = self.test_ratelimit(req.environ, start_response)
+            self.assertEqual(resp[0], '204 No Content')
+            return mock_many.call_args_list, mock_get.call_args_list
+
+        # account and container info are fetched with one multi-get
+        for path, method in (('/v1/a/c/o', 'PUT'), ('/v1/a/c', 'GET')):
+            many_calls, get_calls = do_request(path, method)
+            self.assertEqual(
+                [mock.call([get_cache_key('a'), get_cache_key('a', 'c')])],
+                many_calls)
+            self.assertEqual([], get_calls)
+
+        # no container info is needed for an object GET
+        many_calls, get_calls = do_request('/v1/a/c/o', 'GET')
+        self.assertEqual([], many_calls)
+        self.assertEqual([mock.call(get_cache_key('a'))], get_calls)
+
     def test_ratelimit_max_rate_multiple_acc(self):
         num_calls = 4
         current_rate = 2
@@ -35,6 +35,7 @@ from six.moves import range
 from swift.common import exceptions
 from swift.common import ring
 from swift.common.ring import utils
+from swift.common.ring import builder as ring_builder
 from swift.common.ring.builder import MAX_BALANCE
 
 
@@ -2164,6 +2165,27 @@ class TestRingBuilder(unittest.TestCase):
             pickle.dump(rb, f, protocol=2)
         do_test()
 
+    def test_use_numpy_legacy_builder_file(self):
+        # builders pickled as class instances predate use_numpy
+        rb = ring.RingBuilder(8, 3, 1)
+        for i in range(4):
+            rb.add_dev({'id': i, 'region': 0, 'zone': i, 'weight': 1,
+                        'ip': '10.0.0.%d' % i, 'port': 6200,
+                        'device': 'sda'})
+        rb.rebalance()
+        del rb.use_numpy
+        with mock.patch('swift.common.ring.builder.pickle.load',
+                        return_value=rb):
+            loaded_rb = ring.RingBuilder.load('fake.builder',
+                                              open=mock.mock_open())
+        self.assertEqual(ring_builder.numpy is not None,
+                         loaded_rb.use_numpy)
+        loaded_rb.add_dev({'id': 4, 'region': 0, 'zone': 4, 'weight': 1,
+                           'ip': '10.0.0.4', 'port': 6200, 'device': 'sda'})
+        loaded_rb.pretend_min_part_hours_passed()
+        loaded_rb.rebalance()
+        loaded_rb.validate()
+
     def test_id_not_initialised_errors(self):
         rb = ring.RingBuilder(8, 3, 1)
         # id is not set until builder has been saved
@@ -4523,5 +4545,122 @@ class TestRingBuilderDispersion(unittest.TestCase):
         self.assertAlmostPartCount(counts, expected, delta=delta)
 
 
+@unittest.skipIf(ring_builder.numpy is None, 'NumPy is not installed')
+class TestRingBuilderNumpy(unittest.TestCase):
+
+    def _make_builders(self, part_power, replicas, min_part_hours):
+        builders = []
+        for use_numpy in (False, True):
+            rb = ring.RingBuilder(part_power, replicas, min_part_hours)
+            rb.use_numpy = use_numpy
+            builders.append(rb)
+        return builders
+
+    def _add_devs(self, builders, regions, zones, servers, disks,
+                  weight=100):
+        for rb in builders:
+            for r, z, s, d in itertools.product(
+                    range(regions), range(zones), range(servers),
+                    range(disks)):
+                rb.add_dev({'region': r, 'zone': z,
+                            'ip': '10.%d.%d.%d' % (r, z, s), 'port': 6200,
+                            'device': 'sd%s' % chr(ord('a') + d),
+                            'weight': weight})
+
+    def _rebalance_and_compare(self, builders, seed):
+        results = []
+        for rb in builders:
+            results.append(rb.rebalance(seed=seed))
+            rb.validate()
+        python_rb, numpy_rb = builders
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(python_rb._replica2part2dev,
+                         numpy_rb._replica2part2dev)
+        self.assertEqual(python_rb._last_part_moves,
+                         numpy_rb._last_part_moves)
+        self.assertEqual(python_rb._dispersion_graph,
+                         numpy_rb._dispersion_graph)
+        self.assertEqual(python_rb.dispersion, numpy_rb.dispersion)
+        self.assertEqual(python_rb.devs, numpy_rb.devs)
+        for rb in builders:
+            rb.pretend_min_part_hours_passed()
+        return results[1]
+
+    def test_default(self):
+        self.assertTrue(ring.RingBuilder(8, 3, 1).use_numpy)
+        with mock.patch('swift.common.ring.builder.numpy', None):
+            self.assertFalse(ring.RingBuilder(8, 3, 1).use_numpy)
+
+    def test_same_ring_as_python(self):
+        builders = self._make_builders(10, 3, 1)
+        self._add_devs(builders, 2, 3, 3, 2)
+        self._rebalance_and_compare(builders, 1)
+        # a new zone
+        for rb in builders:
+            for d in range(4):
+                rb.add_dev({'region': 1, 'zone': 7, 'ip': '10.1.7.1',
+                            'port': 6200, 'device': 'sd%d' % d,
+                            'weight': 100})
+        self._rebalance_and_compare(builders, 2)
+        # remove a device and reweight another
+        for rb in builders:
+            rb.remove_dev(3)
+            rb.set_dev_weight(8, 50)
+        changed_parts, _balance, removed_devs = \
+            self._rebalance_and_compare(builders, 3)
+        self.assertTrue(changed_parts)
+        self.assertEqual(1, removed_devs)
+        # and settle down
+        self._rebalance_and_compare(builders, 4)
+
+    def test_same_ring_as_python_undispersed(self):
+        # start out with every replica in one zone
+        builders = self._make_builders(8, 3, 0)
+        self._add_devs(builders, 1, 1, 2, 3)
+        self._rebalance_and_compare(builders, 1)
+        for rb in builders:
+            for z in range(1, 3):
+                for d in range(3):
+                    rb.add_dev({'region': 0, 'zone': z,
+                                'ip': '10.0.%d.0' % z, 'port': 6200,
+                                'device': 'sd%d' % d, 'weight': 100})
+        changed_parts, _balance, _removed = \
+            self._rebalance_and_compare(builders, 2)
+        self.assertTrue(changed_parts)
+        dispersion = builders[1].dispersion
+        self._rebalance_and_compare(builders, 3)
+        self.assertLess(builders[1].dispersion, dispersion)
+
+    def test_same_ring_as_python_fractional_replicas(self):
+        builders = self._make_builders(8, 2.5, 1)
+        self._add_devs(builders, 1, 3, 2, 2)
+        self._rebalance_and_compare(builders, 1)
+        for rb in builders:
+            rb.set_replicas(3.25)
+        self._rebalance_and_compare(builders, 2)
+        for rb in builders:
+            rb.set_replicas(2)
+        self._rebalance_and_compare(builders, 3)
+
+    def test_update_last_part_moves(self):
+        builders = self._make_builders(8, 3, 1)
+        self._add_devs(builders, 1, 3, 1, 2)
+        self._rebalance_and_compare(builders, 1)
+        for rb in builders:
+            rb._last_part_moves = array(
+                'B', (p % 256 for p in range(rb.parts)))
+        now = builders[0]._last_part_moves_epoch + 10 * 3600
+        with mock.patch('swift.common.ring.builder.time', return_value=now):
+            for rb in builders:
+                rb._update_last_part_moves()
+        python_rb, numpy_rb = builders
+        self.assertEqual(python_rb._last_part_moves,
+                         numpy_rb._last_part_moves)
+        self.assertEqual(array('B', (min(p + 10, 255)
+                                     for p in range(numpy_rb.parts))),
+                         numpy_rb._last_part_moves)
+        self.assertEqual(now, numpy_rb._last_part_moves_epoch)
+
+
 if __name__ == '__main__':
     unittest.main()
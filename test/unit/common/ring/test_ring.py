@@ -15,10 +15,12 @@
 
 import array
 import collections
+import json
 import six.moves.cPickle as pickle
 import os
 import unittest
 import stat
+import struct
 from contextlib import closing
 from gzip import GzipFile
 from tempfile import mkdtemp
@@ -32,6 +34,7 @@ from six.moves import range
 
 from swift.common import ring, utils
 from swift.common.ring import utils as ring_utils
+from swift.common.ring.ring import MappedPart2DevId, V2_ALIGNMENT
 
 
 class TestRingBase(unittest.TestCase):
@@ -135,6 +138,88 @@ class TestRingData(unittest.TestCase):
         rd2 = ring.RingData.load(ring_fname)
         self.assert_ring_data_equal(rd1, rd2)
 
+    def test_roundtrip_serialization_v2(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1]), array.array('H', [0, 1, 0, 1]),
+             array.array('H', [2, 3])],
+            [{'id': 0, 'zone': 0}, {'id': 1, 'zone': 1},
+             {'id': 2, 'zone': 2}, {'id': 3, 'zone': 3}, None], 30,
+            next_part_power=31)
+        rd.save(ring_fname, format_version=2)
+        with open(ring_fname, 'rb') as f:
+            self.assertEqual(b'R1NG\x00\x02', f.read(6))
+        meta_only = ring.RingData.load(ring_fname, metadata_only=True)
+        self.assertEqual([
+            {'id': 0, 'zone': 0, 'region': 1},
+            {'id': 1, 'zone': 1, 'region': 1},
+            {'id': 2, 'zone': 2, 'region': 1},
+            {'id': 3, 'zone': 3, 'region': 1},
+            None,
+        ], meta_only.devs)
+        self.assertEqual([], meta_only._replica2part2dev_id)
+        self.assertEqual(31, meta_only.next_part_power)
+
+        rd2 = ring.RingData.load(ring_fname)
+        self.assert_ring_data_equal(rd, rd2)
+        self.assertEqual(31, rd2.next_part_power)
+        self.assertEqual(2.5, rd2.replica_count)
+        self.assertEqual({0, 1, 2, 3}, rd2.dev_ids_with_parts)
+        for part2dev_id in rd2._replica2part2dev_id:
+            self.assertIsInstance(part2dev_id, MappedPart2DevId)
+        part2dev_id = rd2._replica2part2dev_id[2]
+        self.assertEqual(2, len(part2dev_id))
+        self.assertEqual(3, part2dev_id[-1])
+        self.assertEqual(array.array('H', [3]), part2dev_id[1:])
+        self.assertRaises(IndexError, part2dev_id.__getitem__, 2)
+
+        # the v2 ring round trips back to v1 too
+        rd2.save(ring_fname)
+        self.assert_ring_data_equal(rd, ring.RingData.load(ring_fname))
+
+    def test_serialization_v2_layout(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        replica2part2dev_id = [array.array('H', range(4096))
+                               for _ in range(3)]
+        devs = [{'id': i, 'zone': i % 3} for i in range(4096)]
+        ring.RingData(replica2part2dev_id, devs, 20).save(
+            ring_fname, format_version=2)
+        with open(ring_fname, 'rb') as f:
+            data = f.read()
+        json_len, = struct.unpack_from('!I', data, 6)
+        meta = json.loads(data[10:10 + json_len])
+        self.assertEqual(list(range(4096)), meta['dev_ids_with_parts'])
+        self.assertEqual(0, meta['data_offset'] % V2_ALIGNMENT)
+        # every partition table starts on a page boundary
+        for replica in range(3):
+            offset = meta['data_offset'] + V2_ALIGNMENT * 2 * replica
+            self.assertEqual(
+                replica2part2dev_id[replica].tolist(),
+                list(struct.unpack_from('<4096H', data, offset)))
+        rd = ring.RingData.load(ring_fname)
+        # the device list isn't parsed until it is needed
+        self.assertIsNone(rd._devs)
+        self.assertEqual(4096, len(rd.devs))
+        self.assertEqual(replica2part2dev_id, rd._replica2part2dev_id)
+
+    def test_mapped_part2dev_id_byteorder(self):
+        for byteorder, fmt in (('little', '<4H'), ('big', '>4H')):
+            buf = b'junk' + struct.pack(fmt, 0, 1, 258, 65535)
+            part2dev_id = MappedPart2DevId(buf, 4, 4, byteorder)
+            self.assertEqual([0, 1, 258, 65535], list(part2dev_id))
+            self.assertEqual(258, part2dev_id[2])
+            self.assertEqual(array.array('H', [0, 1, 258, 65535]),
+                             part2dev_id.to_array())
+            self.assertEqual(array.array('H', [0, 1, 258, 65535]).tostring(),
+                             part2dev_id.tostring())
+
+    def test_save_unknown_format(self):
+        ring_fname = os.path.join(self.testdir, 'foo.ring.gz')
+        rd = ring.RingData(
+            [array.array('H', [0, 1, 0, 1])], [{'id': 0, 'zone': 0}], 30)
+        self.assertRaises(ValueError, rd.save, ring_fname, format_version=3)
+        self.assertFalse(os.listdir(self.testdir))
+
     def test_deterministic_serialization(self):
         """
         Two identical rings should produce identical .gz files on disk.
@@ -24,6 +24,7 @@ from eventlet import spawn, Timeout
 from swift.common import bufferedhttp
 
 from test import listen_zero
+from test.unit import debug_logger
 
 
 class MockHTTPSConnection(object):
@@ -127,5 +128,167 @@ class TestBufferedHTTP(unittest.TestCase):
                                 % (e, dev, path, header))
 
 
+class TestBufferedHTTPConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = debug_logger()
+        self.pool = bufferedhttp.BufferedHTTPConnectionPool(
+            max_idle_per_host=2, idle_timeout=30, logger=self.logger)
+        bufferedhttp.set_connection_pool(self.pool)
+        self.bindsock = listen_zero()
+        self.port = self.bindsock.getsockname()[1]
+
+    def tearDown(self):
+        bufferedhttp.set_connection_pool(None)
+        self.bindsock.close()
+
+    def _serve(self, responses, close_after=False):
+        # serves each response in turn over a single accepted connection and
+        # returns the request lines and headers that were received
+        def serve():
+            received = []
+            with Timeout(3):
+                sock, addr = self.bindsock.accept()
+                fp = sock.makefile()
+                for response in responses:
+                    request_line = fp.readline()
+                    headers = {}
+                    line = fp.readline()
+                    while line and line != '\r\n':
+                        headers[line.split(':')[0].lower()] = \
+                            line.split(':', 1)[1].strip()
+                        line = fp.readline()
+                    received.append((request_line, headers))
+                    fp.write(response)
+                    fp.flush()
+                if close_after:
+                    fp.close()
+                    sock.close()
+                else:
+                    # hold the connection open until the client hangs up
+                    fp.read()
+            return received
+        return spawn(serve)
+
+    def _request(self, path, headers=None):
+        conn = bufferedhttp.http_connect(
+            '127.0.0.1', self.port, 'sda', 1, 'GET', path,
+            headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        return conn, resp, body
+
+    def test_connection_reused(self):
+        event = self._serve(
+            ['HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\none',
+             'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\ntwo'])
+        with Timeout(3):
+            conn, resp, body = self._request(
+                '/a', headers={'Connection': 'close'})
+            self.assertEqual('one', body)
+            sock = conn.sock
+            self.assertTrue(bufferedhttp.release_connection(conn, resp))
+            self.assertEqual(1, self.pool.idle_count())
+            conn2, resp, body = self._request('/b')
+            self.assertIs(sock, conn2.sock)
+            self.assertEqual('two', body)
+            self.assertEqual(0, self.pool.idle_count())
+            conn2.close()
+        received = event.wait()
+        self.assertEqual(['GET /sda/1/a HTTP/1.1\r\n',
+                          'GET /sda/1/b HTTP/1.1\r\n'],
+                         [line for line, headers in received])
+        # the caller's Connection: close is replaced
+        for line, headers in received:
+            self.assertEqual('keep-alive', headers['connection'])
+        self.assertEqual(
+            {'backend_pool.misses': 1, 'backend_pool.hits': 1},
+            self.logger.get_increment_counts())
+
+    def test_incomplete_response_not_reused(self):
+        event = self._serve(
+            ['HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\nRESPONSE'],
+            close_after=True)
+        with Timeout(3):
+            conn = bufferedhttp.http_connect(
+                '127.0.0.1', self.port, 'sda', 1, 'GET', '/a')
+            resp = conn.getresponse()
+            self.assertEqual('RESP', resp.read(4))
+            self.assertFalse(bufferedhttp.release_connection(conn, resp))
+            self.assertIsNone(conn.sock)
+        event.wait()
+        self.assertEqual(0, self.pool.idle_count())
+        self.assertEqual(
+            {'backend_pool.misses': 1, 'backend_pool.discards': 1},
+            self.logger.get_increment_counts())
+
+    def test_will_close_response_not_reused(self):
+        event = self._serve(
+            ['HTTP/1.1 200 OK\r\nConnection: close\r\n'
+             'Content-Length: 2\r\n\r\nok'], close_after=True)
+        with Timeout(3):
+            conn, resp, body = self._request('/a')
+            self.assertEqual('ok', body)
+            self.assertFalse(bufferedhttp.release_connection(conn, resp))
+        event.wait()
+        self.assertEqual(0, self.pool.idle_count())
+
+    def test_remotely_closed_connection_evicted(self):
+        event = self._serve(
+            ['HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n\r\n'],
+            close_after=True)
+        with Timeout(3):
+            conn, resp, body = self._request('/a')
+            self.assertTrue(bufferedhttp.release_connection(conn, resp))
+            event.wait()
+            self.assertIsNone(self.pool.get('127.0.0.1', self.port))
+        self.assertEqual(0, self.pool.idle_count())
+        self.assertEqual(
+            {'backend_pool.misses': 2, 'backend_pool.evictions': 1},
+            self.logger.get_increment_counts())
+
+    def test_idle_timeout_and_max_idle_per_host(self):
+        conns = []
+        for i in range(3):
+            conn = bufferedhttp.BufferedHTTPConnection('1.2.3.4', 6000)
+            conn.sock = mock.MagicMock()
+            conn.pool = self.pool
+            conn.pool_key = ('1.2.3.4', 6000)
+            conns.append(conn)
+        socks = [c.sock for c in conns]
+        with mock.patch('swift.common.bufferedhttp.time.time',
+                        return_value=100):
+            for conn in conns:
+                bufferedhttp.release_connection(conn)
+        self.assertEqual(2, self.pool.idle_count())
+        self.assertEqual([0, 0, 1], [s.close.call_count for s in socks])
+        # the pool took the sockets away from the released connections...
+        self.assertEqual([None, None, None], [c.sock for c in conns])
+        # ...so closing or releasing them again is harmless
+        conns[0].close()
+        self.assertFalse(bufferedhttp.release_connection(conns[0]))
+        self.assertEqual(2, self.pool.idle_count())
+        self.assertEqual([0, 0, 1], [s.close.call_count for s in socks])
+        with mock.patch('swift.common.bufferedhttp.time.time',
+                        return_value=131), \
+                mock.patch('swift.common.bufferedhttp._socket_is_idle',
+                           return_value=True):
+            self.assertIsNone(self.pool.get('1.2.3.4', 6000))
+        self.assertEqual(0, self.pool.idle_count())
+        self.assertEqual([1, 1, 1], [s.close.call_count for s in socks])
+        self.assertEqual(
+            {'backend_pool.overflows': 1, 'backend_pool.evictions': 2,
+             'backend_pool.misses': 1},
+            self.logger.get_increment_counts())
+
+    def test_ssl_connections_not_pooled(self):
+        with mock.patch('swift.common.bufferedhttp.HTTPSConnection',
+                        MockHTTPSConnection):
+            conn = bufferedhttp.http_connect_raw(
+                '127.0.0.1', 8080, 'GET', '/', ssl=True)
+        self.assertFalse(bufferedhttp.release_connection(conn))
+        self.assertEqual({}, self.logger.get_increment_counts())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -15,6 +15,8 @@
 
 """Tests for swift.common.db"""
 
+import fcntl
+import hashlib
 import os
 import sys
 import unittest
@@ -26,6 +28,7 @@ import six.moves.cPickle as pickle
 import json
 import sqlite3
 import itertools
+import struct
 import time
 import random
 from mock import patch, MagicMock
@@ -38,12 +41,13 @@ from swift.common.constraints import \
     MAX_META_VALUE_LENGTH, MAX_META_COUNT, MAX_META_OVERALL_SIZE
 from swift.common.db import chexor, dict_factory, get_db_connection, \
     DatabaseBroker, DatabaseConnectionError, DatabaseAlreadyExists, \
-    GreenDBConnection, PICKLE_PROTOCOL, zero_like
+    GreenDBConnection, PICKLE_PROTOCOL, zero_like, BrokerCache, \
+    parse_db_journal_mode
 from swift.common.utils import normalize_timestamp, mkdirs, Timestamp
 from swift.common.exceptions import LockTimeout
 from swift.common.swob import HTTPException
 
-from test.unit import with_tempdir
+from test.unit import with_tempdir, debug_logger
 
 
 class TestHelperFunctions(unittest.TestCase):
@@ -69,6 +73,15 @@ class TestHelperFunctions(unittest.TestCase):
         if errors:
             self.fail('Some unexpected return values:\n' + '\n'.join(errors))
 
+    def test_parse_db_journal_mode(self):
+        self.assertEqual('delete', parse_db_journal_mode(None))
+        self.assertEqual('delete', parse_db_journal_mode(''))
+        self.assertEqual('delete', parse_db_journal_mode('Delete'))
+        self.assertEqual('wal', parse_db_journal_mode(' WAL '))
+        with self.assertRaises(ValueError) as cm:
+            parse_db_journal_mode('truncate')
+        self.assertIn("'truncate'", str(cm.exception))
+
 
 class TestDatabaseConnectionError(unittest.TestCase):
 
@@ -205,6 +218,29 @@ class TestGetDBConnection(unittest.TestCase):
                              list((mock_db_cmd.call_args,) *
                                   mock_db_cmd.call_count))
 
+    @with_tempdir
+    def test_journal_mode(self, tempdir):
+        def journal_mode(conn):
+            return conn.execute('PRAGMA journal_mode').fetchone()[0]
+
+        db_file = os.path.join(tempdir, 'test.db')
+        conn = get_db_connection(db_file, okay_to_create=True)
+        self.assertEqual('delete', journal_mode(conn))
+        with patch.object(swift.common.db, 'DB_JOURNAL_MODE', 'wal'):
+            conn = get_db_connection(db_file)
+            self.assertEqual('wal', journal_mode(conn))
+            conn.execute('SELECT 1 FROM sqlite_master').fetchall()
+        # a db in WAL mode is left in WAL mode while it is in use...
+        self.assertTrue(os.path.exists(db_file + '-wal'))
+        other_conn = get_db_connection(db_file)
+        self.assertEqual('wal', journal_mode(other_conn))
+        # ...and switched back once it is not
+        conn.close()
+        other_conn.close()
+        self.assertFalse(os.path.exists(db_file + '-wal'))
+        conn = get_db_connection(db_file)
+        self.assertEqual('delete', journal_mode(conn))
+
 
 class ExampleBroker(DatabaseBroker):
     """
@@ -270,8 +306,8 @@ class ExampleBroker(DatabaseBroker):
                         rec['name'], rec['created_at'], rec['deleted']))
             conn.commit()
 
-    def _commit_puts_load(self, item_list, entry):
-        (name, timestamp, deleted) = pickle.loads(entry.decode('base64'))
+    def _commit_puts_load_tuple(self, item_list, data):
+        (name, timestamp, deleted) = data
         item_list.append({
             'name': name,
             'created_at': timestamp,
@@ -623,6 +659,77 @@ class TestExampleBroker(unittest.TestCase):
             self.assertEqual(broker.conn, None)
         self.assertEqual(broker.conn, conn)
 
+    @with_tempdir
+    def test_get_change_stamp(self, tempdir):
+        db_file = os.path.join(tempdir, 'test.db')
+        broker = self.broker_class(db_file, account='a', container='c')
+        broker.initialize(next(self.ts),
+                          storage_policy_index=int(self.policy))
+        stamp = broker.get_change_stamp()
+        self.assertIsNotNone(stamp)
+        self.assertEqual(stamp, broker.get_change_stamp())
+        broker.get_info()
+        self.assertEqual(stamp, broker.get_change_stamp())
+
+        # a record is added to the pending file...
+        self.put_item(broker, next(self.ts))
+        self.assertNotEqual(stamp, broker.get_change_stamp())
+        stamp = broker.get_change_stamp()
+        # ...and committed by this broker
+        broker.get_info()
+        self.assertNotEqual(stamp, broker.get_change_stamp())
+        stamp = broker.get_change_stamp()
+
+        # another broker commits a change
+        other_broker = self.broker_class(db_file, account='a', container='c')
+        other_broker.update_metadata({'X-Foo': ['bar', next(self.ts)]})
+        self.assertNotEqual(stamp, broker.get_change_stamp())
+        stamp = broker.get_change_stamp()
+
+        # this broker commits a change
+        broker.update_metadata({'X-Foo': ['baz', next(self.ts)]})
+        self.assertNotEqual(stamp, broker.get_change_stamp())
+        stamp = broker.get_change_stamp()
+
+        # stamps of a new connection differ
+        broker.close()
+        self.assertNotEqual(stamp, broker.get_change_stamp())
+
+    @with_tempdir
+    def test_checkpoint(self, tempdir):
+        db_file = os.path.join(tempdir, 'test.db')
+        broker = self.broker_class(db_file, account='a', container='c')
+        broker.initialize(next(self.ts),
+                          storage_policy_index=int(self.policy))
+        self.assertEqual('delete', broker.get_journal_mode())
+        self.assertTrue(broker.checkpoint())
+        broker.close()
+        self.assertIsNone(broker.conn)
+
+        with patch.object(swift.common.db, 'DB_JOURNAL_MODE', 'wal'):
+            broker = self.broker_class(db_file, account='a', container='c')
+            self.assertEqual('wal', broker.get_journal_mode())
+            self.put_item(broker, next(self.ts))
+            broker.get_info()
+            self.assertGreater(os.path.getsize(db_file + '-wal'), 0)
+            self.assertTrue(broker.checkpoint())
+            self.assertEqual(0, os.path.getsize(db_file + '-wal'))
+            self.assertEqual('wal', broker.get_journal_mode())
+
+        # while another connection is open the db stays in WAL mode...
+        other_broker = self.broker_class(db_file, account='a',
+                                         container='c')
+        self.assertEqual('wal', other_broker.get_journal_mode())
+        self.assertTrue(broker.checkpoint())
+        self.assertEqual('wal', broker.get_journal_mode())
+        # ...and is switched back to DELETE mode once it is the only one
+        other_broker.close()
+        self.assertTrue(broker.checkpoint())
+        self.assertEqual('delete', broker.get_journal_mode())
+        self.assertFalse(os.path.exists(db_file + '-wal'))
+        count_key = '%s_count' % broker.db_contains_type
+        self.assertEqual(1, broker.get_info()[count_key])
+
 
 class TestDatabaseBroker(unittest.TestCase):
 
@@ -953,6 +1060,70 @@ class TestDatabaseBroker(unittest.TestCase):
         self.assertEqual(broker.get_items_since(3, 2), [])
         self.assertEqual(broker.get_items_since(999, 2), [])
 
+    def test_merkle_ranges(self):
+        def make_broker(rows):
+            broker = DatabaseBroker(':memory:')
+            broker.db_type = 'test'
+            broker.db_contains_type = 'test'
+
+            def _initialize(conn, timestamp, **kwargs):
+                conn.execute('''
+                    CREATE TABLE test (
+                        ROWID INTEGER PRIMARY KEY AUTOINCREMENT,
+                        name TEXT, created_at TEXT,
+                        deleted INTEGER DEFAULT 0)''')
+                conn.executemany(
+                    'INSERT INTO test (name, created_at) VALUES (?, ?)', rows)
+                conn.commit()
+            broker._initialize = _initialize
+            broker.initialize(normalize_timestamp('1'))
+            return broker
+
+        rows = [(name, '1') for name in 'abcdefghij']
+        # the same rows in another order, but for a newer "e"
+        other_rows = [(name, '2' if name == 'e' else '1')
+                      for name in reversed('abcdefghij')]
+        broker = make_broker(rows)
+        other_broker = make_broker(other_rows)
+
+        ranges = broker.get_merkle_ranges('', '', 3)
+        self.assertEqual([['', 'd', 4], ['d', 'h', 4], ['h', '', 2]],
+                         [[r[0], r[1], r[3]] for r in ranges])
+        self.assertEqual([r[2:] for r in ranges],
+                         broker.get_merkle_hashes([r[:2] for r in ranges]))
+        other_hashes = other_broker.get_merkle_hashes(
+            [r[:2] for r in ranges])
+        self.assertNotEqual(ranges[1][2:], other_hashes[1])
+        self.assertEqual([ranges[0][2:], ranges[2][2:]],
+                         [other_hashes[0], other_hashes[2]])
+        # the ranges of a range cover just that range
+        self.assertEqual(
+            [['d', 'f', 2], ['f', 'h', 2]],
+            [[r[0], r[1], r[3]] for r in broker.get_merkle_ranges(
+                'd', 'h', 2)])
+        self.assertEqual([['d', 'h', '%032x' % 0, 0]],
+                         make_broker([]).get_merkle_ranges('d', 'h', 2))
+        # a row is hashed over its db_merkle_columns, each with its length
+        self.assertEqual([[hashlib.md5(b'1:a1:11:0').hexdigest(), 1]],
+                         broker.get_merkle_hashes([['', 'a']]))
+
+        # records with the same name stay in one range
+        broker = make_broker([('a', '1'), ('b', '1'), ('b', '2'), ('c', '1')])
+        self.assertEqual([['', 'b', 3], ['b', '', 1]],
+                         [[r[0], r[1], r[3]]
+                          for r in broker.get_merkle_ranges('', '', 2)])
+
+        self.assertEqual(
+            [{'ROWID': 2, 'name': 'b', 'created_at': '1', 'deleted': 0},
+             {'ROWID': 3, 'name': 'b', 'created_at': '2', 'deleted': 0},
+             {'ROWID': 4, 'name': 'c', 'created_at': '1', 'deleted': 0}],
+            broker.get_items_in_name_range('a', ''))
+        self.assertEqual(
+            [{'ROWID': 1, 'name': 'a', 'created_at': '1', 'deleted': 0}],
+            broker.get_items_in_name_range('', 'a'))
+        self.assertEqual(4, broker.get_item_count_since(-1))
+        self.assertEqual(1, broker.get_item_count_since(3))
+
     def test_get_sync(self):
         broker = DatabaseBroker(':memory:')
         broker.db_type = 'test'
@@ -1457,9 +1628,10 @@ class TestDatabaseBroker(unittest.TestCase):
         mock_commit_puts.assert_not_called()
         with open(broker.pending_file, 'rb') as fd:
             pending = fd.read()
-        items = pending.split(':')
-        self.assertEqual(['PINKY'],
-                         [pickle.loads(i.decode('base64')) for i in items[1:]])
+        self.assertEqual('\x00', pending[0])
+        self.assertEqual(len(pending) - 5,
+                         struct.unpack('!I', pending[1:5])[0])
+        self.assertEqual('PINKY', pickle.loads(pending[5:]))
 
         # record appended
         with patch.object(broker, '_commit_puts') as mock_commit_puts:
@@ -1467,9 +1639,10 @@ class TestDatabaseBroker(unittest.TestCase):
         mock_commit_puts.assert_not_called()
         with open(broker.pending_file, 'rb') as fd:
             pending = fd.read()
-        items = pending.split(':')
-        self.assertEqual(['PINKY', 'PERKY'],
-                         [pickle.loads(i.decode('base64')) for i in items[1:]])
+        items = []
+        broker._commit_puts_load_tuple = lambda l, d: l.append(d)
+        self.assertEqual([['PINKY', 'PERKY']],
+                         list(broker._load_pending(pending, items)))
 
         # pending file above cap
         cap = swift.common.db.PENDING_CAP
@@ -1495,6 +1668,264 @@ class TestDatabaseBroker(unittest.TestCase):
             pending = fd.read()
         self.assertFalse(pending)
 
+    def test_put_records(self):
+        db_file = os.path.join(self.testdir, '1.db')
+        broker = DatabaseBroker(db_file)
+        broker._initialize = MagicMock()
+        broker.initialize(Timestamp.now())
+
+        # records are committed along with anything in the pending file
+        broker.make_tuple_for_pickle = lambda x: x.upper()
+        broker.put_record('pinky')
+        broker._commit_puts_load_tuple = lambda l, d: l.append(d)
+        with patch.object(broker, 'merge_items') as mock_merge_items:
+            broker.put_records(['perky', 'direct'])
+        mock_merge_items.assert_called_once_with(['perky', 'direct', 'PINKY'])
+        with open(broker.pending_file, 'rb') as fd:
+            self.assertFalse(fd.read())
+
+        # ... or by themselves if there is no pending file
+        os.unlink(broker.pending_file)
+        with patch.object(broker, 'merge_items') as mock_merge_items:
+            broker.put_records(['perky'])
+        mock_merge_items.assert_called_once_with(['perky'])
+
+        broker.skip_commits = True
+        with patch.object(broker, 'merge_items') as mock_merge_items:
+            with self.assertRaises(DatabaseConnectionError) as cm:
+                broker.put_records(['unwelcome'])
+        self.assertIn('commits not accepted', str(cm.exception))
+        mock_merge_items.assert_not_called()
+
+    def test_load_pending(self):
+        broker = DatabaseBroker(os.path.join(self.testdir, '1.db'))
+        broker.logger = debug_logger()
+        broker._commit_puts_load_tuple = lambda l, d: l.append(d)
+
+        def binary(data):
+            data = pickle.dumps(data, protocol=PICKLE_PROTOCOL)
+            return '\x00' + struct.pack('!I', len(data)) + data
+
+        def base64(data):
+            return ':' + pickle.dumps(
+                data, protocol=PICKLE_PROTOCOL).encode('base64')
+
+        # both formats, in any order
+        pending = (base64('a') + binary('b') + binary(':') + base64('c') +
+                   base64('d') + binary('e'))
+        self.assertEqual([['x', 'a', 'b', ':', 'c', 'd', 'e']],
+                         list(broker._load_pending(pending, ['x'])))
+        self.assertEqual([], broker.logger.get_lines_for_level('error'))
+
+        # invalid entries are skipped
+        pending = ('junk' + base64('a') + ':junk' + binary('b') +
+                   binary('c')[:-1])
+        self.assertEqual([['a', 'b']],
+                         list(broker._load_pending(pending, [])))
+        self.assertEqual(3, len(broker.logger.get_lines_for_level('error')))
+        for line in broker.logger.get_lines_for_level('error'):
+            self.assertIn('Invalid pending entry', line)
+
+        # in batches
+        pending = ''.join(binary(i) if i % 2 else base64(i)
+                          for i in range(7))
+        with patch('swift.common.db.PENDING_COMMIT_BATCH', 3):
+            self.assertEqual([[0, 1, 2], [3, 4, 5], [6]],
+                             list(broker._load_pending(pending, [])))
+            self.assertEqual([['x', 0, 1], [2, 3, 4], [5, 6]],
+                             list(broker._load_pending(pending, ['x'])))
+        self.assertEqual([], list(broker._load_pending('', [])))
+
+    def test_commit_puts_waits_for_appends(self):
+        db_file = os.path.join(self.testdir, '1.db')
+        broker = DatabaseBroker(db_file, pending_timeout=0.1)
+        broker._initialize = MagicMock()
+        broker.initialize(Timestamp.now())
+        broker.make_tuple_for_pickle = lambda x: x
+        broker._commit_puts_load_tuple = lambda l, d: l.append(d)
+        broker.put_record('pinky')
+
+        # a record is being appended...
+        with open(broker.pending_file, 'ab') as fd:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            # ...which doesn't stop others being appended...
+            broker.put_record('perky')
+            # ...but stops a commit
+            with patch.object(broker, 'merge_items') as mock_merge_items:
+                with self.assertRaises(LockTimeout):
+                    broker._commit_puts()
+        mock_merge_items.assert_not_called()
+
+        with patch.object(broker, 'merge_items') as mock_merge_items:
+            broker._commit_puts()
+        mock_merge_items.assert_called_once_with(['pinky', 'perky'])
+        self.assertEqual(0, os.path.getsize(broker.pending_file))
+
+        # a commit stops records being appended
+        with open(broker.pending_file, 'ab') as fd:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with self.assertRaises(LockTimeout):
+                broker.put_record('brain')
+        self.assertEqual(0, os.path.getsize(broker.pending_file))
+
+
+class TestBrokerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.testdir = mkdtemp()
+        self.logger = debug_logger()
+        self.ts = (Timestamp(t).internal for t in
+                   itertools.count(int(time.time())))
+
+    def tearDown(self):
+        rmtree(self.testdir, ignore_errors=1)
+
+    def _make_db(self, name='a.db'):
+        db_file = os.path.join(self.testdir, name)
+        broker = ExampleBroker(db_file, account='a')
+        broker.initialize(next(self.ts))
+        return db_file
+
+    def test_disabled(self):
+        cache = BrokerCache(self.logger)
+        db_file = self._make_db()
+        broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        self.assertIsInstance(broker, ExampleBroker)
+        cache.release()
+        self.assertIsNot(broker, cache.get_broker(ExampleBroker, db_file,
+                                                  account='a'))
+        cache.release()
+        self.assertFalse(self.logger.get_increments())
+
+    def test_reuse(self):
+        cache = BrokerCache(self.logger, size=2)
+        db_file = self._make_db()
+        broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        broker.get_info()
+        conn = broker.conn
+        self.assertTrue(conn)
+        cache.release()
+        self.assertIs(broker, cache.get_broker(ExampleBroker, db_file,
+                                               account='a'))
+        self.assertIs(conn, broker.conn)
+        cache.release()
+        # brokers made with different args are cached separately
+        other = cache.get_broker(ExampleBroker, db_file, account='a',
+                                 stale_reads_ok=True)
+        self.assertIsNot(broker, other)
+        self.assertTrue(other.stale_reads_ok)
+        cache.release()
+        self.assertEqual(
+            ['broker_cache.miss', 'broker_cache.open',
+             'broker_cache.hit', 'broker_cache.open',
+             'broker_cache.miss'],
+            self.logger.get_increments())
+        self.assertEqual(
+            [(('broker_cache.open',), {})],
+            self.logger.log_dict['decrement'])
+
+    def test_not_kept_open_to_leave_wal_mode(self):
+        cache = BrokerCache(self.logger, size=2)
+        with patch.object(swift.common.db, 'DB_JOURNAL_MODE', 'wal'):
+            db_file = self._make_db()
+            broker = cache.get_broker(ExampleBroker, db_file, account='a')
+            broker.get_info()
+            cache.release()
+            self.assertIs(broker, cache.get_broker(ExampleBroker, db_file,
+                                                   account='a'))
+            self.assertEqual('wal', broker.get_journal_mode())
+            cache.release()
+            self.assertTrue(broker.conn)
+        # once WAL mode is no longer configured the broker is closed when it
+        # is released, so that the db can be switched back...
+        self.assertIs(broker, cache.get_broker(ExampleBroker, db_file,
+                                               account='a'))
+        cache.release()
+        self.assertIsNone(broker.conn)
+        self.assertFalse(os.path.exists(db_file + '-wal'))
+        # ...by the next connection
+        broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        self.assertEqual('delete', broker.get_journal_mode())
+        cache.release()
+        self.assertTrue(broker.conn)
+
+    def test_not_shared_while_checked_out(self):
+        cache = BrokerCache(self.logger, size=2)
+        db_file = self._make_db()
+        broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        other = cache.get_broker(ExampleBroker, db_file, account='a')
+        self.assertIsNot(broker, other)
+        broker.get_info()
+        other.get_info()
+        cache.release()
+        # only one of them is kept; the other's connection is closed
+        self.assertIs(other, cache.get_broker(ExampleBroker, db_file,
+                                              account='a'))
+        self.assertIsNone(broker.conn)
+        cache.release()
+
+    def test_missing_db_not_cached(self):
+        cache = BrokerCache(self.logger, size=2)
+        db_file = os.path.join(self.testdir, 'a.db')
+        broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        broker.initialize(next(self.ts))
+        cache.release()
+        self.assertIsNone(broker.conn)
+        self.assertIsNot(broker, cache.get_broker(ExampleBroker, db_file,
+                                                  account='a'))
+        cache.release()
+
+    def test_invalidated(self):
+        cache = BrokerCache(self.logger, size=2)
+        db_file = self._make_db()
+        broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        broker.get_info()
+        cache.release()
+
+        # the db is replaced, as by rsync_then_merge
+        tmp_file = os.path.join(self.testdir, 'tmp.db')
+        copy(db_file, tmp_file)
+        os.rename(tmp_file, db_file)
+        self.logger.clear()
+        new_broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        self.assertIsNot(broker, new_broker)
+        self.assertIsNone(broker.conn)
+        self.assertEqual(['broker_cache.stale', 'broker_cache.miss'],
+                         self.logger.get_increments())
+        new_broker.get_info()
+        cache.release()
+
+        # the db is removed, as by quarantine or reclaim
+        os.unlink(db_file)
+        self.logger.clear()
+        self.assertIsNot(new_broker, cache.get_broker(
+            ExampleBroker, db_file, account='a'))
+        self.assertEqual(['broker_cache.stale', 'broker_cache.miss'],
+                         self.logger.get_increments())
+        cache.release()
+
+    def test_evicted(self):
+        cache = BrokerCache(self.logger, size=1, idle_time=10)
+        db_file = self._make_db()
+        other_db_file = self._make_db('b.db')
+        broker = cache.get_broker(ExampleBroker, db_file, account='a')
+        broker.get_info()
+        cache.release()
+        cache.get_broker(ExampleBroker, other_db_file, account='a')
+        cache.release()
+        self.assertIsNone(broker.conn)
+        self.assertEqual(1, self.logger.get_increment_counts().get(
+            'broker_cache.evicted'))
+
+        # idle brokers are evicted, even if the cache is not full
+        now = time.time()
+        with patch('swift.common.db.time.time', return_value=now + 11):
+            cache.get_broker(ExampleBroker, db_file, account='a')
+            cache.release()
+        self.assertEqual(2, self.logger.get_increment_counts().get(
+            'broker_cache.evicted'))
+        self.assertEqual(1, len(cache._brokers))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -262,6 +262,15 @@ class FakeBroker(object):
     def reclaim(self, item_timestamp, sync_timestamp):
         pass
 
+    def checkpoint(self):
+        return True
+
+    def close(self):
+        pass
+
+    def get_journal_mode(self):
+        return 'delete'
+
     def newid(self, remote_d):
         pass
 
@@ -485,6 +494,53 @@ class TestDBReplicator(unittest.TestCase):
                 replicator._rsync_db(broker, fake_device, ReplHttp(), 'abcd')
                 self.assertEqual(2, replicator._rsync_file_call_count)
 
+    def test_rsync_db_change_in_wal(self):
+        fake_device = {'ip': '127.0.0.1', 'replication_ip': '127.0.0.1',
+                       'device': 'sda1'}
+        rsync_calls = []
+
+        def fake_rsync_file(db_file, remote_file, whole_file=True,
+                            different_region=False):
+            rsync_calls.append((whole_file, broker.locked))
+            return True
+
+        def do_test(stamps, checkpoints=None):
+            del rsync_calls[:]
+            replicator = TestReplicator({}, logger=unit.debug_logger())
+            replicator._rsync_file = fake_rsync_file
+            with patch('os.path.exists', return_value=False), \
+                    patch('os.path.getmtime', return_value=1), \
+                    patch.object(db_replicator, 'wal_stamp',
+                                 side_effect=stamps), \
+                    patch.object(broker, 'checkpoint',
+                                 side_effect=checkpoints or [True, True]):
+                success = replicator._rsync_db(broker, fake_device,
+                                               ReplHttp(), 'abcd')
+            return success, replicator.logger.get_lines_for_level('warning')
+
+        broker = FakeBroker()
+        # transactions committed to the log during the first sync are
+        # checkpointed and synced at block-level
+        success, warnings = do_test([(8, 1), (16, 2), (0, 3), (0, 3)])
+        self.assertTrue(success)
+        self.assertEqual([(True, False), (False, True)], rsync_calls)
+        self.assertEqual([], warnings)
+
+        # transactions committed to the log before the lock was taken
+        success, warnings = do_test([(8, 1), (16, 2), (0, 3), (8, 4)])
+        self.assertFalse(success)
+        self.assertEqual([(True, False)], rsync_calls)
+        self.assertEqual(['Unable to sync %s: committed transactions remain '
+                          'in its write-ahead log' % broker.db_file],
+                         warnings)
+
+        # checkpoint blocked by a reader
+        success, warnings = do_test([(8, 1), (8, 1), (8, 1), (8, 1)],
+                                    checkpoints=[False, False])
+        self.assertFalse(success)
+        self.assertEqual([(True, False)], rsync_calls)
+        self.assertEqual(1, len(warnings))
+
     def test_in_sync(self):
         replicator = TestReplicator({})
         self.assertEqual(replicator._in_sync(
@@ -2223,6 +2279,48 @@ class TestReplicatorSync(unittest.TestCase):
         # keep the metadata in existing db
         self.assertEqual(put_metadata, broker.metadata)
 
+    def test_rsync_then_merge_wal(self):
+        # setup current db (and broker) in WAL journal mode
+        broker = self._get_broker('a', 'c', node_index=0)
+        part, node = self._get_broker_part_node(broker)
+        part = str(part)
+        put_timestamp = normalize_timestamp(time.time())
+        with mock.patch('swift.common.db.DB_JOURNAL_MODE', 'wal'):
+            broker.initialize(put_timestamp)
+            self.assertEqual('wal', broker.get_journal_mode())
+        broker.update_metadata({'example-meta': ['bah', put_timestamp]})
+        db_ino = os.stat(broker.db_file).st_ino
+
+        # create rsynced db in tmp dir
+        obj_hash = hash_path('a', 'c')
+        rsynced_db_broker = self.backend(
+            os.path.join(self.root, node['device'], 'tmp', obj_hash + '.db'),
+            account='a', container='c')
+        rsynced_db_broker.initialize(put_timestamp)
+        other_metadata = {'other-meta': ['boo', put_timestamp]}
+        rsynced_db_broker.update_metadata(other_metadata)
+        rsynced_db_broker.merge_syncs(
+            [{'remote_id': 'other', 'sync_point': 3}])
+        rsynced_db_broker.close()
+
+        # do rysnc_then_merge
+        rpc = db_replicator.ReplicatorRpc(
+            self.root, self.datadir, self.backend, False)
+        response = rpc.dispatch((node['device'], part, obj_hash),
+                                ['rsync_then_merge', obj_hash + '.db', 'arg2'])
+        self.assertEqual(204, response.status_int)
+
+        # the rsynced db was merged into the existing db, in place
+        self.assertFalse(os.path.exists(rsynced_db_broker.db_file))
+        self.assertEqual(db_ino, os.stat(broker.db_file).st_ino)
+        self.assertEqual('wal', broker.get_journal_mode())
+        broker = self._get_broker('a', 'c', node_index=0)
+        expected = {'example-meta': ['bah', put_timestamp]}
+        expected.update(other_metadata)
+        self.assertEqual(expected, broker.metadata)
+        self.assertIn({'remote_id': 'other', 'sync_point': 3},
+                      broker.get_syncs())
+
     def test_replicator_sync(self):
         # setup current db (and broker)
         broker = self._get_broker('a', 'c', node_index=0)
@@ -554,6 +554,77 @@ class TestMemcached(unittest.TestCase):
                 None)
             self.assertFalse(not_expected in mock_stderr.getvalue())
 
+    def test_get_many(self):
+        memcache_client = memcached.MemcacheRing(
+            ['1.2.3.4:11211', '1.2.3.5:11211'])
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock1, mock1)] * 2)
+        memcache_client._client_cache['1.2.3.5:11211'] = MockedMemcachePool(
+            [(mock2, mock2)] * 2)
+        keys = ['some_key%d' % i for i in range(10)]
+        for i, key in enumerate(keys):
+            memcache_client.set(key, [i])
+        # the keys are spread over both servers
+        self.assertTrue(mock1.cache)
+        self.assertTrue(mock2.cache)
+        self.assertEqual(len(mock1.cache) + len(mock2.cache), len(keys))
+
+        with mock.patch.object(memcache_client, 'get_multi',
+                               wraps=memcache_client.get_multi) as mock_get:
+            self.assertEqual(
+                memcache_client.get_many(keys[::-1] + ['not_exists']),
+                [[i] for i in range(len(keys))][::-1] + [None])
+        # one request per server
+        self.assertEqual(2, mock_get.call_count)
+        self.assertEqual([], memcache_client.get_many([]))
+
+        # a server that fails to answer has its keys reported as misses
+        mock1.read_return_empty_str = True
+        self.assertEqual(
+            [[i] if memcached.md5hash(key) in mock2.cache else None
+             for i, key in enumerate(keys)],
+            memcache_client.get_many(keys))
+
+    def test_get_many_error_limited(self):
+        memcache_client = memcached.MemcacheRing(
+            ['1.2.3.4:11211', '1.2.3.5:11211'])
+        mock1 = MockMemcached()
+        mock2 = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock1, mock1)] * 2)
+        memcache_client._client_cache['1.2.3.5:11211'] = MockedMemcachePool(
+            [(mock2, mock2)] * 2)
+        memcache_client._error_limited['1.2.3.4:11211'] = time.time() + 60
+        keys = ['some_key%d' % i for i in range(10)]
+        for i, key in enumerate(keys):
+            memcache_client.set(key, [i])
+        self.assertFalse(mock1.cache)
+        self.assertEqual(len(keys), len(mock2.cache))
+        with mock.patch.object(memcache_client, 'get_multi',
+                               wraps=memcache_client.get_multi) as mock_get:
+            self.assertEqual([[i] for i in range(len(keys))],
+                             memcache_client.get_many(keys))
+        self.assertEqual(1, mock_get.call_count)
+
+    def test_noreply_sets(self):
+        memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
+                                                 noreply_sets=True)
+        mock = MockMemcached()
+        memcache_client._client_cache['1.2.3.4:11211'] = MockedMemcachePool(
+            [(mock, mock)] * 2)
+        with patch.object(mock, 'readline',
+                          wraps=mock.readline) as mock_readline:
+            memcache_client.set('some_key', [1, 2, 3])
+            memcache_client.set_multi(
+                {'some_key1': [4], 'some_key2': [5]}, 'multi_key')
+        self.assertFalse(mock_readline.called)
+        self.assertEqual(b'', mock.outbuf)
+        self.assertEqual(memcache_client.get('some_key'), [1, 2, 3])
+        self.assertEqual(memcache_client.get_many(
+            ['some_key1', 'some_key2']), [[4], [5]])
+
     def test_serialization(self):
         memcache_client = memcached.MemcacheRing(['1.2.3.4:11211'],
                                                  allow_pickle=True)
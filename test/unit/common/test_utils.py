@@ -3913,6 +3913,29 @@ cluster_dfw1 = http://dfw1.host/v1/
         found = utils.find_shard_range('l', overlapping_ranges)
         self.assertEqual(found, ktol)
 
+    def test_filter_shard_ranges(self):
+        ts = utils.Timestamp.now().internal
+        atof = utils.ShardRange('a/a-f', ts, '', 'f')
+        ftol = utils.ShardRange('a/f-l', ts, 'f', 'l')
+        ltoz = utils.ShardRange('a/l-', ts, 'l', '')
+        ranges = [atof, ftol, ltoz]
+
+        def do_test(includes, marker, end_marker):
+            return utils.filter_shard_ranges(
+                ranges, includes, marker, end_marker)
+
+        self.assertEqual(ranges, do_test(None, None, None))
+        self.assertEqual(ranges, do_test('', '', ''))
+        self.assertEqual([ftol], do_test('g', None, None))
+        # includes overrides markers
+        self.assertEqual([ftol], do_test('g', 'x', 'a'))
+        self.assertEqual([ltoz], do_test('x', None, None))
+        self.assertEqual([atof], do_test(None, ' ', 'f'))
+        self.assertEqual([ftol, ltoz], do_test(None, 'f', None))
+        self.assertEqual([atof, ftol], do_test(None, None, 'l'))
+        self.assertEqual([ftol], do_test(None, 'f', 'l'))
+        self.assertEqual([atof, ftol, ltoz], do_test(None, 'e', 'm'))
+
     def test_parse_db_filename(self):
         actual = utils.parse_db_filename('hash.db')
         self.assertEqual(('hash', None, '.db'), actual)
@@ -6169,6 +6192,40 @@ class TestLRUCache(unittest.TestCase):
             f(i)
         self.assertEqual(f.size(), 4)
 
+    def test_maxtime_repopulate_then_evict(self):
+        @utils.LRUCache(maxsize=2, maxtime=30)
+        def f(*args):
+            return math.sqrt(*args)
+        now = time.time()
+        with patch('time.time', lambda: now):
+            f(1)
+        with patch('time.time', lambda: now + 31):
+            # repopulating an expired key replaces its entry...
+            f(1)
+            self.assertEqual(f.size(), 1)
+            # ...so that evicting it later is safe
+            for i in range(2, 6):
+                f(i)
+        self.assertEqual(f.size(), 2)
+
+    def test_get_and_delete(self):
+        cache = utils.LRUCache(maxsize=2, maxtime=30)
+        the_future = time.time() + 31
+        self.assertRaises(KeyError, cache.get, 'a')
+        cache.set_cache(1, 'a')
+        cache.set_cache(2, 'b')
+        self.assertEqual(1, cache.get('a'))
+        # 'a' is now more recently used than 'b'
+        cache.set_cache(3, 'c')
+        self.assertEqual(1, cache.get('a'))
+        self.assertRaises(KeyError, cache.get, 'b')
+        cache.delete('a')
+        cache.delete('a')
+        self.assertRaises(KeyError, cache.get, 'a')
+        self.assertEqual(3, cache.get('c'))
+        with patch('time.time', lambda: the_future):
+            self.assertRaises(KeyError, cache.get, 'c')
+
 
 class TestSpliterator(unittest.TestCase):
     def test_string(self):
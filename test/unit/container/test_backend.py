@@ -2637,6 +2637,57 @@ class TestContainerBroker(unittest.TestCase):
         self.assertEqual([row[0] for row in listing],
                          ['/'])
 
+    def test_list_objects_iter_delimiter_skip(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        # pseudo-directories of assorted sizes, some of them nested, and
+        # objects named just past them
+        names = ['a', 'b/0', 'b0', 'c/', 'c0']
+        names += ['d/%02d' % i for i in range(3)]
+        names += ['e/%02d' % i for i in range(40)] + ['e/f/g', 'e0']
+        names += ['f/%02d/%d' % (i, j) for i in range(20) for j in range(i)]
+        names += ['g%02d/x' % i for i in range(30)] + ['h']
+        for name in names:
+            broker.put_object(name, Timestamp.now().internal, 0,
+                              'text/plain', 'etag')
+        # a deleted object doesn't make a pseudo-directory
+        broker.delete_object('b1/x', Timestamp.now().internal)
+
+        def expected_listing(prefix, reverse):
+            listing = []
+            for name in sorted(names, reverse=reverse):
+                if not name.startswith(prefix):
+                    continue
+                end = name.find('/', len(prefix))
+                if end >= 0:
+                    name = name[:end + 1]
+                if not listing or listing[-1] != name:
+                    listing.append(name)
+            return listing
+
+        def page_through(limit, prefix, reverse):
+            listing = []
+            marker = ''
+            while True:
+                page = [row[0] for row in broker.list_objects_iter(
+                    limit, marker, None, prefix, '/', reverse=reverse)]
+                listing.extend(page)
+                if len(page) < limit:
+                    return listing
+                marker = page[-1]
+
+        for skip_rows in (1, 4, 16, 100):
+            with mock.patch('swift.container.backend.DELIMITER_SKIP_ROWS',
+                            skip_rows):
+                for prefix in ('', 'e/', 'f/'):
+                    for reverse in (False, True):
+                        expected = expected_listing(prefix, reverse)
+                        for limit in (1, 2, 7, 1000):
+                            self.assertEqual(
+                                expected, page_through(limit, prefix, reverse),
+                                'skip_rows=%s prefix=%r reverse=%s limit=%s' %
+                                (skip_rows, prefix, reverse, limit))
+
     def test_list_objects_iter_order_and_reverse(self):
         # Test ContainerBroker.list_objects_iter
         broker = ContainerBroker(':memory:', account='a', container='c')
@@ -2878,6 +2929,17 @@ class TestContainerBroker(unittest.TestCase):
         self.assertEqual(len(items), 1)
         self.assertEqual(items[0]['name'], 'b')
 
+    def test_get_merkle_hashes(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        broker.put_object('a', Timestamp(1).internal, 12,
+                          'text/plain', 'd41d8cd98f00b204e9800998ecf8427e')
+        expected = hashlib.md5(
+            b'1:a16:0000000001.00000' b'2:12' b'10:text/plain'
+            b'32:d41d8cd98f00b204e9800998ecf8427e' b'1:0' b'1:0')
+        self.assertEqual([[expected.hexdigest(), 1]],
+                         broker.get_merkle_hashes([['', '']]))
+
     def test_sync_merging(self):
         # exercise the DatabaseBroker sync functions a bit
         broker1 = ContainerBroker(':memory:', account='a', container='c')
@@ -4178,6 +4240,28 @@ class TestContainerBroker(unittest.TestCase):
         self.assertFalse(broker.logger.get_lines_for_level('error'))
         self.assertTrue(os.path.exists(broker.db_file))
 
+    @with_tempdir
+    def test_get_db_identity(self, tempdir):
+        ts_iter = make_timestamp_iter()
+        retiring_db_path = os.path.join(
+            tempdir, 'part', 'suffix', 'hash', 'container.db')
+        broker = ContainerBroker(retiring_db_path, account='a', container='c',
+                                 logger=FakeLogger())
+        self.assertIsNone(broker.get_db_identity())
+        broker.initialize(next(ts_iter).internal, 0)
+        identity = broker.get_db_identity()
+        self.assertEqual(1, len(identity))
+
+        # the identity changes as the fresh db is created...
+        broker.enable_sharding(next(ts_iter))
+        self.assertTrue(broker.set_sharding_state())
+        sharding_identity = broker.get_db_identity()
+        self.assertEqual(2, len(sharding_identity))
+        self.assertEqual(identity[0], sharding_identity[0])
+        # ...and as the retiring db is removed
+        self.assertTrue(broker.set_sharded_state())
+        self.assertEqual(sharding_identity[1:], broker.get_db_identity())
+
     @with_tempdir
     def test_get_brokers(self, tempdir):
         ts_iter = make_timestamp_iter()
@@ -4760,6 +4844,25 @@ class TestContainerBrokerBeforeSPI(ContainerBrokerMigrationMixin,
         with broker.get() as conn:
             conn.execute('SELECT storage_policy_index FROM container_stat')
 
+    def test_get_merkle_hashes_before_spi(self):
+        broker = ContainerBroker(':memory:', account='a', container='c')
+        broker.initialize(Timestamp('1').internal, 0)
+        # manually insert a row to avoid automatic migration
+        with broker.get() as conn:
+            conn.execute('''
+                INSERT INTO object (name, created_at, size,
+                    content_type, etag, deleted)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ('a', Timestamp(1).internal, 12,
+                  'text/plain', 'd41d8cd98f00b204e9800998ecf8427e', 0))
+            conn.commit()
+        # the hash is the same as for a row in the default policy
+        expected = hashlib.md5(
+            b'1:a16:0000000001.00000' b'2:12' b'10:text/plain'
+            b'32:d41d8cd98f00b204e9800998ecf8427e' b'1:0' b'1:0')
+        self.assertEqual([[expected.hexdigest(), 1]],
+                         broker.get_merkle_hashes([['', '']]))
+
     @patch_policies
     @with_tempdir
     def test_object_table_migration(self, tempdir):
@@ -33,7 +33,7 @@ from swift.common.storage_policy import POLICIES
 
 from test.unit.common import test_db_replicator
 from test.unit import patch_policies, make_timestamp_iter, mock_check_drive, \
-    debug_logger, EMPTY_ETAG, FakeLogger
+    debug_logger, EMPTY_ETAG, FakeLogger, FakeHTTPResponse
 from contextlib import contextmanager
 
 from test.unit.common.test_db_replicator import attach_fake_replication_rpc
@@ -233,6 +233,44 @@ class TestReplicatorSync(test_db_replicator.TestReplicatorSync):
                              "mismatch remote %s %r != %r" % (
                                  k, remote_info[k], v))
 
+    def test_sync_remote_missing_most_rows_wal(self):
+        put_timestamp = time.time()
+        # create "local" broker
+        broker = self._get_broker('a', 'c', node_index=0)
+        broker.initialize(put_timestamp, POLICIES.default.idx)
+        # create "remote" broker in WAL journal mode, and keep it open
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        with mock.patch('swift.common.db.DB_JOURNAL_MODE', 'wal'):
+            remote_broker.initialize(put_timestamp, POLICIES.default.idx)
+        remote_broker.put_object(
+            '/a/c/o_remote', time.time(), 0, 'content-type', 'etag',
+            storage_policy_index=remote_broker.storage_policy_index)
+        self.assertEqual(1, remote_broker.get_info()['object_count'])
+        remote_ino = os.stat(remote_broker.db_file).st_ino
+        # add most rows to "local" db
+        for i in range(5):
+            broker.put_object('/a/c/o_%s' % i, time.time(), 0,
+                              'content-type', 'etag',
+                              storage_policy_index=broker.storage_policy_index)
+        # replicate
+        daemon = replicator.ContainerReplicator({'per_diff': 1})
+        self._install_fake_rsync_file(daemon)
+        part, node = self._get_broker_part_node(remote_broker)
+        info = broker.get_replication_info()
+        success = daemon._repl_to_node(node, broker, part, info)
+        self.assertTrue(success)
+        self.assertEqual(1, daemon.stats['remote_merge'])
+        # the rsynced rows were merged into the remote db in place, so the
+        # open remote broker sees them
+        self.assertEqual(remote_ino, os.stat(remote_broker.db_file).st_ino)
+        self.assertEqual('wal', remote_broker.get_journal_mode())
+        self.assertEqual(
+            ['/a/c/o_%s' % i for i in range(5)] + ['/a/c/o_remote'],
+            [row[0] for row in remote_broker.list_objects_iter(
+                10, '', None, None, None)])
+        sync_point = remote_broker.get_sync(broker.get_info()['id'])
+        self.assertEqual(broker.get_max_row(), sync_point)
+
     def test_sync_remote_missing_one_rows(self):
         put_timestamp = time.time()
         # create "local" broker
@@ -271,6 +309,110 @@ class TestReplicatorSync(test_db_replicator.TestReplicatorSync):
                              "mismatch remote %s %r != %r" % (
                                  k, remote_info[k], v))
 
+    def test_merkle_sync(self):
+        put_timestamp = time.time()
+        # create "local" broker
+        broker = self._get_broker('a', 'c', node_index=0)
+        broker.initialize(put_timestamp, POLICIES.default.idx)
+        # create "remote" broker
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        remote_broker.initialize(put_timestamp, POLICIES.default.idx)
+        # add the same rows to both db's, without syncing them
+        for i in range(200):
+            put_timestamp = time.time()
+            for db in (broker, remote_broker):
+                db.put_object('/a/c/o_%03d' % i, put_timestamp, 0,
+                              'content-type', 'etag',
+                              storage_policy_index=db.storage_policy_index)
+        # and a few changes to the "local" broker only
+        for name in ('/a/c/o_050', '/a/c/o_050a', '/a/c/o_150a'):
+            broker.put_object(name, time.time(), 0, 'content-type', 'etag',
+                              storage_policy_index=broker.storage_policy_index)
+        # more rows to send than a usync sends in one pass
+        daemon = replicator.ContainerReplicator({
+            'per_diff': 10, 'max_diffs': 5, 'merkle_sync': 'yes',
+            'merkle_leaf_rows': 4})
+        part, node = self._get_broker_part_node(remote_broker)
+        info = broker.get_replication_info()
+        success = daemon._repl_to_node(node, broker, part, info)
+        self.assertTrue(success)
+        self.assertEqual(1, daemon.stats['merkle'])
+        self.assertEqual(0, daemon.stats['diff'])
+        self.assertEqual(0, daemon.stats['remote_merge'])
+        # only rows near the changes were sent
+        self.assertLessEqual(3, daemon.stats['merkle_rows'])
+        self.assertGreater(15, daemon.stats['merkle_rows'])
+        self.assertEqual(202 - daemon.stats['merkle_rows'],
+                         daemon.stats['merkle_rows_saved'])
+        self.assertGreater(daemon.stats['merkle_bytes_saved'], 0)
+        self.assertEqual(
+            [row[:2] for row in broker.list_objects_iter(
+                1000, '', None, None, None)],
+            [row[:2] for row in remote_broker.list_objects_iter(
+                1000, '', None, None, None)])
+        self.assertEqual(info['max_row'],
+                         broker.get_sync(remote_broker.get_info()['id'],
+                                         incoming=False))
+        # so the next pass finds the replicas in sync
+        success = daemon._repl_to_node(node, broker, part, info)
+        self.assertTrue(success)
+        self.assertEqual(1, daemon.stats['no_change'])
+
+    def test_merkle_sync_not_needed(self):
+        put_timestamp = time.time()
+        broker = self._get_broker('a', 'c', node_index=0)
+        broker.initialize(put_timestamp, POLICIES.default.idx)
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        remote_broker.initialize(put_timestamp, POLICIES.default.idx)
+        for i in range(20):
+            put_timestamp = time.time()
+            for db in (broker, remote_broker):
+                db.put_object('/a/c/o_%03d' % i, put_timestamp, 0,
+                              'content-type', 'etag',
+                              storage_policy_index=db.storage_policy_index)
+        for i in range(15):
+            broker.put_object('/a/c/o_new_%03d' % i, time.time(), 0,
+                              'content-type', 'etag',
+                              storage_policy_index=broker.storage_policy_index)
+        # a usync sends all the rows in one pass, without rsyncing the db
+        daemon = replicator.ContainerReplicator({
+            'per_diff': 10, 'max_diffs': 5, 'merkle_sync': 'yes'})
+        part, node = self._get_broker_part_node(remote_broker)
+        info = broker.get_replication_info()
+        success = daemon._repl_to_node(node, broker, part, info)
+        self.assertTrue(success)
+        self.assertEqual(0, daemon.stats['merkle'])
+        self.assertEqual(1, daemon.stats['diff'])
+        self.assertEqual(35, remote_broker.get_info()['object_count'])
+
+    def test_merkle_sync_not_supported(self):
+        put_timestamp = time.time()
+        broker = self._get_broker('a', 'c', node_index=0)
+        broker.initialize(put_timestamp, POLICIES.default.idx)
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        remote_broker.initialize(put_timestamp, POLICIES.default.idx)
+        for i in range(20):
+            broker.put_object('/a/c/o_%s' % i, time.time(), 0,
+                              'content-type', 'etag',
+                              storage_policy_index=broker.storage_policy_index)
+        # the remote server fails to hash ranges...
+        db_replicator.ReplConnection = \
+            test_db_replicator.attach_fake_replication_rpc(
+                self.rpc, errors={'merkle_hashes': [
+                    FakeHTTPResponse(HTTPServerError())]})
+        daemon = replicator.ContainerReplicator({
+            'per_diff': 10, 'merkle_sync': 'yes'})
+        self._install_fake_rsync_file(daemon)
+        part, node = self._get_broker_part_node(remote_broker)
+        info = broker.get_replication_info()
+        success = daemon._repl_to_node(node, broker, part, info)
+        # ...so the db is sent as it would be without merkle syncs
+        self.assertTrue(success)
+        self.assertEqual(0, daemon.stats['merkle'])
+        self.assertEqual(1, daemon.stats['remote_merge'])
+        remote_broker = self._get_broker('a', 'c', node_index=1)
+        self.assertEqual(20, remote_broker.get_info()['object_count'])
+
     def test_sync_remote_can_not_keep_up(self):
         put_timestamp = time.time()
         # create "local" broker
@@ -20,7 +20,7 @@ import mock
 import unittest
 import itertools
 from contextlib import contextmanager
-from shutil import rmtree
+from shutil import copy, rmtree
 from tempfile import mkdtemp
 from test.unit import make_timestamp_iter, mock_timestamp_now
 from time import gmtime
@@ -260,6 +260,49 @@ class TestContainerController(unittest.TestCase):
         req.get_response(self.controller)
         self._test_head(Timestamp(start, offset=1), ts)
 
+    def test_broker_cache(self):
+        self.controller = container_server.ContainerController(
+            {'devices': self.testdir, 'mount_check': 'false',
+             'broker_cache_size': '10'},
+            logger=self.logger)
+        ts = make_timestamp_iter()
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'x-timestamp': next(ts).internal,
+            'X-Backend-Storage-Policy-Index': '0'})
+        self.assertEqual(201, req.get_response(self.controller).status_int)
+        for i in range(3):
+            req = Request.blank('/sda1/p/a/c', method='HEAD')
+            self.assertEqual(204,
+                             req.get_response(self.controller).status_int)
+        self.assertEqual({'broker_cache.miss': 2, 'broker_cache.hit': 2},
+                         dict((k, v) for k, v in
+                              self.logger.get_increment_counts().items()
+                              if k in ('broker_cache.miss',
+                                       'broker_cache.hit')))
+        self.assertFalse(self.controller.broker_cache._checked_out)
+
+        # a cached broker picks up a policy index changed by another process
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        self.controller.broker_cache.release()
+        self.assertEqual(0, broker.storage_policy_index)
+        container_server.ContainerBroker(broker.db_file).\
+            set_storage_policy_index(1, next(ts).internal)
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'x-timestamp': next(ts).internal})
+        resp = req.get_response(self.controller)
+        self.assertEqual(202, resp.status_int)
+        self.assertEqual('1', resp.headers['X-Backend-Storage-Policy-Index'])
+
+        # a replaced db is not served from the cache
+        self.logger.clear()
+        tmp_file = broker.db_file + '.tmp'
+        copy(broker.db_file, tmp_file)
+        os.rename(tmp_file, broker.db_file)
+        req = Request.blank('/sda1/p/a/c', method='HEAD')
+        self.assertEqual(204, req.get_response(self.controller).status_int)
+        self.assertIn('broker_cache.stale',
+                      self.logger.get_increments())
+
     def test_HEAD_not_found(self):
         req = Request.blank('/sda1/p/a/c', method='HEAD')
         resp = req.get_response(self.controller)
@@ -353,10 +396,11 @@ class TestContainerController(unittest.TestCase):
         req.content_length = 0
         resp = server_handler.OPTIONS(req)
         self.assertEqual(200, resp.status_int)
-        for verb in 'OPTIONS GET POST PUT DELETE HEAD REPLICATE'.split():
+        for verb in ('OPTIONS GET POST PUT DELETE HEAD REPLICATE '
+                     'UPDATE').split():
             self.assertTrue(
                 verb in resp.headers['Allow'].split(', '))
-        self.assertEqual(len(resp.headers['Allow'].split(', ')), 7)
+        self.assertEqual(len(resp.headers['Allow'].split(', ')), 8)
         self.assertEqual(resp.headers['Server'],
                          (self.controller.server_type + '/' + swift_version))
 
@@ -1704,6 +1748,143 @@ class TestContainerController(unittest.TestCase):
         resp = req.get_response(self.controller)
         self.assertEqual(resp.status_int, 404)
 
+    def test_UPDATE(self):
+        ts = (Timestamp(t) for t in itertools.count(int(time.time())))
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'X-Timestamp': next(ts).internal})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 201)
+        req = Request.blank(
+            '/sda1/p/a/c/o1', method='PUT', headers={
+                'X-Timestamp': next(ts).internal, 'X-Size': 1,
+                'X-Content-Type': 'text/plain', 'X-Etag': 'x'})
+        self._update_object_put_headers(req)
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 201)
+
+        ts_delete, ts_put = next(ts), next(ts)
+        policy_index = int(POLICIES.default)
+        updates = [
+            {'name': 'o1', 'created_at': ts_delete.normal, 'size': 0,
+             'content_type': 'application/deleted', 'etag': 'noetag',
+             'deleted': 1, 'storage_policy_index': policy_index},
+            {'name': u'o2\N{SNOWMAN}', 'created_at': ts_put.internal,
+             'size': 3, 'content_type': 'text/plain', 'etag': 'y',
+             'deleted': 0, 'storage_policy_index': policy_index,
+             'ctype_timestamp': None, 'meta_timestamp': None}]
+        req = Request.blank(
+            '/sda1/p/a/c', method='UPDATE', body=json.dumps(updates),
+            headers={'X-Timestamp': ts_delete.internal,
+                     'X-Backend-Storage-Policy-Index': str(policy_index)})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 202)
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        self.assertEqual(
+            [(u'o2\N{SNOWMAN}'.encode('utf8'), ts_put.internal, 3,
+              'text/plain', 'y')],
+            [tuple(obj) for obj in broker.list_objects_iter(
+                10, '', None, None, None,
+                storage_policy_index=policy_index)])
+        info = broker.get_info()
+        self.assertEqual(1, info['object_count'])
+        self.assertEqual(3, info['bytes_used'])
+
+    def test_UPDATE_bad_requests(self):
+        ts = (Timestamp(t).internal for t in itertools.count(1))
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'X-Timestamp': next(ts)})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 201)
+        update = {'name': 'o', 'created_at': next(ts), 'size': 0,
+                  'content_type': 'text/plain', 'etag': 'x', 'deleted': 0,
+                  'storage_policy_index': 0}
+        bodies = ['', 'not json', json.dumps({}), json.dumps([{}]),
+                  json.dumps([dict(update, name='')]),
+                  json.dumps([dict(update, name='o\x00')]),
+                  json.dumps([dict(update, created_at='nope')]),
+                  json.dumps([dict(update, size=None)])]
+        for body in bodies:
+            req = Request.blank('/sda1/p/a/c', method='UPDATE', body=body,
+                                headers={'X-Timestamp': next(ts)})
+            resp = req.get_response(self.controller)
+            self.assertEqual(resp.status_int, 400, body)
+        # the container must exist ...
+        req = Request.blank('/sda1/p/a/c2', method='UPDATE',
+                            body=json.dumps([update]),
+                            headers={'X-Timestamp': next(ts)})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 404)
+        # ... unless it is auto-created
+        req = Request.blank('/sda1/p/.a/c2', method='UPDATE',
+                            body=json.dumps([update]),
+                            headers={'X-Timestamp': next(ts),
+                                     'X-Backend-Storage-Policy-Index': '0'})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 202)
+        broker = self.controller._get_container_broker(
+            'sda1', 'p', '.a', 'c2')
+        self.assertEqual(1, broker.get_info()['object_count'])
+
+    def test_UPDATE_container_not_found(self):
+        ts = (Timestamp(t).internal for t in itertools.count(1))
+        update = {'name': 'o', 'created_at': next(ts), 'size': 0,
+                  'content_type': 'text/plain', 'etag': 'x', 'deleted': 0,
+                  'storage_policy_index': 0}
+        # like an object PUT or DELETE, an UPDATE of a missing container
+        # that isn't auto-created is a 404
+        req = Request.blank('/sda1/p/a/c', method='UPDATE',
+                            body=json.dumps([update]),
+                            headers={'X-Timestamp': next(ts)})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 404)
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        self.assertFalse(os.path.exists(broker.db_file))
+
+        # the container is removed while the updates are merged
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'X-Timestamp': next(ts)})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 201)
+        req = Request.blank('/sda1/p/a/c', method='UPDATE',
+                            body=json.dumps([update]),
+                            headers={'X-Timestamp': next(ts)})
+        with mock.patch.object(
+                container_server.ContainerBroker, 'put_records',
+                side_effect=container_server.DatabaseConnectionError(
+                    broker.db_file, "DB doesn't exist")):
+            resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 404)
+
+    def test_UPDATE_redirect_to_shards(self):
+        ts_iter = make_timestamp_iter()
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'X-Timestamp': next(ts_iter).internal})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 201)
+        self._put_shard_range(ShardRange(
+            '.shards_a/c_shard', next(ts_iter), '', '',
+            state=ShardRange.ACTIVE))
+        update = {'name': 'o', 'created_at': next(ts_iter).internal,
+                  'size': 0, 'content_type': 'text/plain', 'etag': 'x',
+                  'deleted': 0,
+                  'storage_policy_index': int(POLICIES.default)}
+        # a sender that can handle redirects is told to send individually
+        req = Request.blank('/sda1/p/a/c', method='UPDATE',
+                            body=json.dumps([update]),
+                            headers={'X-Timestamp': update['created_at'],
+                                     'X-Backend-Accept-Redirect': 'true'})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 412)
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        self.assertEqual(0, broker.get_info()['object_count'])
+        # other senders get the old behavior of updating the root
+        req = Request.blank('/sda1/p/a/c', method='UPDATE',
+                            body=json.dumps([update]),
+                            headers={'X-Timestamp': update['created_at']})
+        resp = req.get_response(self.controller)
+        self.assertEqual(resp.status_int, 202)
+        self.assertEqual(1, broker.get_info()['object_count'])
+
     def test_object_update_with_offset(self):
         ts = (Timestamp(t).internal for t in
               itertools.count(int(time.time())))
@@ -2800,6 +2981,55 @@ class TestContainerController(unittest.TestCase):
         do_test(False, [])
         do_test(True, shard_ranges)
 
+    def test_GET_shard_ranges_override_shard_name_filter(self):
+        ts_iter = make_timestamp_iter()
+        ts_now = Timestamp.now()  # used when mocking Timestamp.now()
+        shard_bounds = (('', 'ham'), ('ham', 'pie'), ('pie', ''))
+        shard_ranges = [
+            ShardRange('.shards_a/c_%s' % upper, next(ts_iter), lower, upper,
+                       state=ShardRange.ACTIVE)
+            for lower, upper in shard_bounds]
+        req = Request.blank('/sda1/p/a/c', method='PUT', headers={
+            'X-Timestamp': next(ts_iter).normal})
+        self.assertIn(req.get_response(self.controller).status_int,
+                      (201, 202))
+        for sr in shard_ranges:
+            self._put_shard_range(sr)
+        expected = [dict(sr, last_modified=sr.timestamp.isoformat)
+                    for sr in shard_ranges]
+
+        def do_test(params, override):
+            headers = {'X-Backend-Record-Type': 'auto'}
+            if override:
+                headers['X-Backend-Override-Shard-Name-Filter'] = override
+            req = Request.blank(
+                '/sda1/p/a/c?format=json&states=listing' + params,
+                method='GET', headers=headers)
+            with mock_timestamp_now(ts_now):
+                resp = req.get_response(self.controller)
+            self.assertEqual(resp.status_int, 200)
+            self.assertEqual('shard', resp.headers['X-Backend-Record-Type'])
+            return resp
+
+        # override is ignored unless the container is sharded
+        broker = self.controller._get_container_broker('sda1', 'p', 'a', 'c')
+        broker.enable_sharding(next(ts_iter))
+        self.assertTrue(broker.set_sharding_state())
+        resp = do_test('&marker=jam', 'sharded')
+        self.assertNotIn('X-Backend-Override-Shard-Name-Filter', resp.headers)
+        self.assertEqual(expected[1:], json.loads(resp.body))
+
+        self.assertTrue(broker.set_sharded_state())
+        resp = do_test('&marker=jam', None)
+        self.assertNotIn('X-Backend-Override-Shard-Name-Filter', resp.headers)
+        self.assertEqual(expected[1:], json.loads(resp.body))
+        for params in ('&marker=jam', '&end_marker=jam&reverse=true',
+                       '&includes=x'):
+            resp = do_test(params, 'sharded')
+            self.assertEqual(
+                'true', resp.headers['X-Backend-Override-Shard-Name-Filter'])
+            self.assertEqual(expected, json.loads(resp.body))
+
     def test_GET_shard_ranges_errors(self):
         # verify that x-backend-record-type is not included in error responses
         ts_iter = make_timestamp_iter()
@@ -670,6 +670,91 @@ class TestAuditor(unittest.TestCase):
         self.assertEqual(auditor_worker.stats_buckets[10240], 0)
         self.assertEqual(auditor_worker.stats_buckets['OVER'], 2)
 
+    def test_object_run_concurrent(self):
+        self.conf['object_concurrency'] = '4'
+        auditor_worker = auditor.AuditorWorker(self.conf, self.logger,
+                                               self.rcache, self.devices)
+        auditor_worker.log_time = 0
+        timestamp = Timestamp(time.time())
+        data = b'0' * 1024
+
+        def write_file(df, etag):
+            with df.create() as writer:
+                writer.write(data)
+                writer.put({
+                    'ETag': etag,
+                    'X-Timestamp': timestamp.internal,
+                    'Content-Length': str(len(data)),
+                })
+                writer.commit(timestamp)
+
+        write_file(self.disk_file, md5(data).hexdigest())
+        write_file(self.df_mgr.get_diskfile('sda', '1', 'a', 'c', 'o2',
+                                            policy=POLICIES[0]),
+                   md5(data).hexdigest())
+        # a corrupt object is quarantined after being read in a thread
+        write_file(self.disk_file_p1, md5(b'1' + data[1:]).hexdigest())
+
+        with mock.patch('swift.obj.auditor.tpool.execute',
+                        side_effect=auditor.tpool.execute) as mock_execute:
+            auditor_worker.audit_all_objects()
+        # each object is read in one chunk, then hits the end of the file
+        self.assertEqual(6, mock_execute.call_count)
+        error_lines = self.logger.get_lines_for_level('error')
+        self.assertEqual(1, len(error_lines))
+        self.assertIn('objects-1', error_lines[0])
+        self.assertIn('failed audit and was quarantined', error_lines[0])
+        self.assertEqual(3 * len(data), auditor_worker.total_bytes_processed)
+        self.assertEqual(3, auditor_worker.total_files_processed)
+        device_lines = [line for line in
+                        self.logger.get_lines_for_level('info')
+                        if 'Object audit (ALL) of ' in line]
+        self.assertTrue(device_lines)
+        self.assertTrue(all('of sda: ' in line for line in device_lines))
+
+    def test_object_run_recent_writes_first(self):
+        self.conf['audit_recent_writes'] = 'true'
+        df_mgr = DiskFileManager(self.conf, self.logger)
+        timestamp = Timestamp(time.time())
+        data = b'0' * 1024
+        disk_files = [df_mgr.get_diskfile('sda', '0', 'a', 'c', obj,
+                                          policy=POLICIES[0])
+                      for obj in ('o', 'o2')]
+        for df in disk_files:
+            with df.create() as writer:
+                writer.write(data)
+                writer.put({
+                    'ETag': md5(data).hexdigest(),
+                    'X-Timestamp': timestamp.internal,
+                    'Content-Length': str(len(data)),
+                })
+                writer.commit(timestamp)
+
+        auditor_worker = auditor.AuditorWorker(self.conf, self.logger,
+                                               self.rcache, self.devices)
+        self.assertTrue(auditor_worker.audit_recent_writes)
+        audited = []
+        with mock.patch.object(auditor_worker, 'object_audit',
+                               lambda location: audited.append(
+                                   location.path)):
+            auditor_worker.audit_all_objects(device_dirs=['sda'])
+        # the recent writes come first, in the order they were written,
+        # then the full sweep audits them again
+        self.assertEqual([df._datadir for df in disk_files], audited[:2])
+        self.assertEqual(sorted(audited[:2]), sorted(audited[2:]))
+        self.assertEqual(2, auditor_worker.recent_writes_audited)
+        self.assertIn('Object audit (ALL - parallel, sda): 2 recently '
+                      'written objects audited first',
+                      self.logger.get_lines_for_level('info'))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.devices, 'sda', 'recent_writes')))
+
+        # the zero byte auditor leaves the journal alone
+        auditor_worker = auditor.AuditorWorker(self.conf, self.logger,
+                                               self.rcache, self.devices,
+                                               zero_byte_only_at_fps=50)
+        self.assertFalse(auditor_worker.audit_recent_writes)
+
     def test_object_run_logging(self):
         auditor_worker = auditor.AuditorWorker(self.conf, self.logger,
                                                self.rcache, self.devices)
@@ -3843,6 +3843,56 @@ class DiskFileMixin(BaseDiskFileTestMixin):
         exp_name = '%s.meta' % timestamp
         self.assertIn(exp_name, set(dl))
 
+    def test_recent_writes(self):
+        self.conf['audit_recent_writes'] = 'true'
+        self.df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        df_mgr = self.df_router[POLICIES.default]
+        journal = os.path.join(
+            self.testdir, self.existing_device,
+            diskfile.get_recent_writes_file(POLICIES.default))
+        df, df_data = self._create_test_file('1234567890')
+        df2, df_data = self._create_test_file('1234567890', obj='o2')
+        df, df_data = self._create_test_file('1234567890')
+        entries = []
+        for datadir in (df._datadir, df2._datadir, df._datadir):
+            entries.append('/'.join(datadir.rsplit(os.sep, 3)[1:]))
+        with open(journal) as fp:
+            self.assertEqual(entries, fp.read().splitlines())
+
+        # only new data is journaled
+        df.write_metadata({'X-Timestamp': Timestamp.now().internal})
+        df.delete(Timestamp.now())
+        with open(journal) as fp:
+            self.assertEqual(entries, fp.read().splitlines())
+
+        locations = df_mgr.consume_recent_writes(
+            self.existing_device, POLICIES.default)
+        self.assertEqual(
+            [(df._datadir, self.existing_device, '0', POLICIES.default),
+             (df2._datadir, self.existing_device, '0', POLICIES.default)],
+            [(loc.path, loc.device, loc.partition, loc.policy)
+             for loc in locations])
+        self.assertFalse(os.path.exists(journal))
+        self.assertFalse(os.path.exists(journal + '.auditing'))
+        self.assertEqual([], df_mgr.consume_recent_writes(
+            self.existing_device, POLICIES.default))
+
+        # the journal stops growing at its max size
+        with mock.patch('swift.obj.diskfile.RECENT_WRITES_MAX_SIZE', 1):
+            self._create_test_file('1234567890')
+            self._create_test_file('1234567890', obj='o2')
+        with open(journal) as fp:
+            self.assertEqual(entries[:1], fp.read().splitlines())
+
+    def test_recent_writes_disabled(self):
+        journal = os.path.join(
+            self.testdir, self.existing_device,
+            diskfile.get_recent_writes_file(POLICIES.default))
+        self._create_test_file('1234567890')
+        self.assertFalse(os.path.exists(journal))
+        self.assertEqual([], self.df_mgr.consume_recent_writes(
+            self.existing_device, POLICIES.default))
+
     def test_write_metadata_with_content_type(self):
         # if metadata has content-type then its time should be in file name
         df, df_data = self._create_test_file('1234567890')
@@ -7722,6 +7772,180 @@ class TestSuffixHashes(unittest.TestCase):
             expected = {}
             self.assertEqual(expected, hashes)
 
+    def test_get_hashes_binary_hashes(self):
+        self.conf['binary_hashes'] = 'true'
+        df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        for policy in self.iter_policies():
+            df_mgr = df_router[policy]
+            part_path = os.path.join(
+                self.devices, self.existing_device,
+                diskfile.get_data_dir(policy), '0')
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=4)
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            df.delete(self.ts())
+            hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+            self.assertIn(suffix, hashes)
+            if policy.policy_type == EC_POLICY:
+                # EC suffix hashes are per fragment index, so don't fit
+                self.assertFalse(df_mgr.binary_hashes)
+                self.assertTrue(os.path.exists(
+                    os.path.join(part_path, diskfile.HASH_FILE)))
+                self.assertFalse(os.path.exists(
+                    os.path.join(part_path, diskfile.BINARY_HASH_FILE)))
+                continue
+            self.assertTrue(df_mgr.binary_hashes)
+            self.assertFalse(os.path.exists(
+                os.path.join(part_path, diskfile.HASH_FILE)))
+            found_hashes = diskfile.read_binary_hashes(part_path)
+            found_hashes.pop('updated')
+            self.assertTrue(found_hashes.pop('valid'))
+            self.assertEqual(hashes, found_hashes)
+
+            # invalidations are consolidated into hashes.bin
+            df.delete(self.ts())
+            with mock.patch.object(df_mgr, '_hash_suffix',
+                                   return_value='f' * 32) as mock_hash:
+                hashes = df_mgr.get_hashes(self.existing_device, '0', [],
+                                           policy)
+            mock_hash.assert_called_once_with(os.path.dirname(df._datadir))
+            self.assertEqual({suffix: 'f' * 32}, hashes)
+            found_hashes = diskfile.read_binary_hashes(part_path)
+            self.assertEqual('f' * 32, found_hashes[suffix])
+
+    def test_get_hashes_migrates_hashes_file(self):
+        binary_df_router = diskfile.DiskFileRouter(
+            dict(self.conf, binary_hashes='true'), self.logger)
+        policy = [p for p in POLICIES if p.policy_type == REPL_POLICY][0]
+        part_path = os.path.join(
+            self.devices, self.existing_device,
+            diskfile.get_data_dir(policy), '0')
+        pickle_file = os.path.join(part_path, diskfile.HASH_FILE)
+        binary_file = os.path.join(part_path, diskfile.BINARY_HASH_FILE)
+        df_mgr = self.df_router[policy]
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', 'o',
+                                 policy=policy)
+        df.delete(self.ts())
+        hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+        self.assertTrue(os.path.exists(pickle_file))
+
+        # the existing hashes move to hashes.bin without any rehashing
+        binary_df_mgr = binary_df_router[policy]
+        with mock.patch.object(binary_df_mgr, '_hash_suffix') as mock_hash:
+            self.assertEqual(hashes, binary_df_mgr.get_hashes(
+                self.existing_device, '0', [], policy))
+        self.assertFalse(mock_hash.called)
+        self.assertFalse(os.path.exists(pickle_file))
+        self.assertTrue(os.path.exists(binary_file))
+
+        # ... and back again
+        with mock.patch.object(df_mgr, '_hash_suffix') as mock_hash:
+            self.assertEqual(hashes, df_mgr.get_hashes(
+                self.existing_device, '0', [], policy))
+        self.assertFalse(mock_hash.called)
+        self.assertTrue(os.path.exists(pickle_file))
+        self.assertFalse(os.path.exists(binary_file))
+
+    def test_get_hashes_cache(self):
+        self.conf['hashes_cache_time'] = '60'
+        df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        for policy in self.iter_policies():
+            self.logger.clear()
+            df_mgr = df_router[policy]
+            df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c',
+                                     'o', policy=policy, frag_index=4)
+            suffix = os.path.basename(os.path.dirname(df._datadir))
+            df.delete(self.ts())
+            hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+            self.assertIn(suffix, hashes)
+
+            # the cached hashes are served without looking at the partition
+            with mock.patch.object(df_mgr, '_get_hashes') as mock_get:
+                self.assertEqual(hashes, df_mgr.get_hashes(
+                    self.existing_device, '0', [], policy))
+            self.assertFalse(mock_get.called)
+            self.assertEqual({'hashes_cache.hit': 1, 'hashes_cache.miss': 1},
+                             self.logger.get_increment_counts())
+
+            # ... until the partition is invalidated
+            df.delete(self.ts())
+            new_hashes = df_mgr.get_hashes(self.existing_device, '0', [],
+                                           policy)
+            self.assertNotEqual(hashes, new_hashes)
+            self.assertEqual({'hashes_cache.hit': 1, 'hashes_cache.miss': 2},
+                             self.logger.get_increment_counts())
+            # ... or rehashed by someone else
+            with mock.patch.object(df_mgr, '_hash_suffix',
+                                   return_value='f' * 32):
+                df_router[policy]._get_hashes(
+                    self.existing_device, '0', policy, recalculate=[suffix])
+                self.assertEqual({suffix: 'f' * 32}, df_mgr.get_hashes(
+                    self.existing_device, '0', [], policy))
+            self.assertEqual({'hashes_cache.hit': 1, 'hashes_cache.miss': 3},
+                             self.logger.get_increment_counts())
+
+            # suffixes to recalculate are always rehashed
+            with mock.patch.object(df_mgr, '_hash_suffix',
+                                   return_value='e' * 32):
+                self.assertEqual({suffix: 'e' * 32}, df_mgr.get_hashes(
+                    self.existing_device, '0', [suffix], policy))
+            # ... and the result is cached
+            with mock.patch.object(df_mgr, '_get_hashes') as mock_get:
+                self.assertEqual({suffix: 'e' * 32}, df_mgr.get_hashes(
+                    self.existing_device, '0', [], policy))
+            self.assertFalse(mock_get.called)
+
+    def test_get_hashes_cache_binary_hashes_updated_in_place(self):
+        self.conf['hashes_cache_time'] = '60'
+        self.conf['binary_hashes'] = 'true'
+        df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        # EC policies don't use hashes.bin
+        policy = [p for p in self.iter_policies()
+                  if p.policy_type == REPL_POLICY][0]
+        df_mgr = df_router[policy]
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', 'o',
+                                 policy=policy)
+        suffix = os.path.basename(os.path.dirname(df._datadir))
+        df.delete(self.ts())
+        df_mgr.get_hashes(self.existing_device, '0', [], policy)
+        part_path = os.path.join(self.devices, self.existing_device,
+                                 diskfile.get_data_dir(policy), '0')
+        hashes_file = os.path.join(part_path, diskfile.BINARY_HASH_FILE)
+        os.utime(hashes_file, (1000, 1000))
+        hashes = df_mgr.get_hashes(self.existing_device, '0', [], policy)
+        self.assertIn(suffix, hashes)
+        size = os.stat(hashes_file).st_size
+
+        # hashes.bin is rewritten in place, keeping its size and mtime
+        diskfile.write_binary_hashes(
+            part_path, {'valid': True, suffix: 'f' * 32})
+        os.utime(hashes_file, (1000, 1000))
+        self.assertEqual(size, os.stat(hashes_file).st_size)
+        self.assertEqual({suffix: 'f' * 32}, df_mgr.get_hashes(
+            self.existing_device, '0', [], policy))
+        self.assertEqual({'hashes_cache.hit': 1, 'hashes_cache.miss': 2},
+                         self.logger.get_increment_counts())
+
+    def test_get_hashes_cache_pending_invalidation(self):
+        self.conf['hashes_cache_time'] = '60'
+        df_router = diskfile.DiskFileRouter(self.conf, self.logger)
+        policy = POLICIES.default
+        df_mgr = df_router[policy]
+        df = df_mgr.get_diskfile(self.existing_device, '0', 'a', 'c', 'o',
+                                 policy=policy)
+        df.delete(self.ts())
+        real_get_hashes = df_mgr._get_hashes
+
+        def racing_get_hashes(*args, **kwargs):
+            result = real_get_hashes(*args, **kwargs)
+            # an invalidation lands after the hashes were computed
+            df_mgr.invalidate_hash(os.path.dirname(df._datadir))
+            return result
+
+        with mock.patch.object(df_mgr, '_get_hashes', racing_get_hashes):
+            df_mgr.get_hashes(self.existing_device, '0', [], policy)
+        self.assertFalse(df_mgr._hashes_cache.mapping)
+
     def test_get_hashes_multi_file_multi_suffix(self):
         paths, suffix = find_paths_with_matching_suffixes(needed_matches=2,
                                                           needed_suffixes=3)
@@ -8097,6 +8321,114 @@ class TestHashesHelpers(unittest.TestCase):
         # with the exactly the same value mutation from write_hashes
         self.assertEqual(hashes, result)
 
+    def test_read_write_binary_hashes(self):
+        hashes = {'valid': True, '000': 'a' * 32, 'abc': None,
+                  'fff': '0123456789abcdef' * 2, 'tmp': 'b' * 32,
+                  'ABC': 'c' * 32, '-01': 'd' * 32, '123': 'not an md5'}
+        diskfile.write_binary_hashes(self.testdir, hashes)
+        self.assertIn('updated', hashes)
+        hashes_file = os.path.join(self.testdir, diskfile.BINARY_HASH_FILE)
+        self.assertEqual(diskfile.BINARY_HASHES_SIZE,
+                         os.path.getsize(hashes_file))
+        # only suffixes are kept, anything without an md5 will be rehashed
+        expected = {'valid': True, 'updated': hashes['updated'],
+                    '000': 'a' * 32, 'abc': None,
+                    'fff': '0123456789abcdef' * 2, '123': None}
+        self.assertEqual(expected, diskfile.read_binary_hashes(self.testdir))
+
+    def test_write_binary_hashes_in_place(self):
+        hashes = {'valid': True}
+        hashes.update(('%03x' % i, '%032x' % i) for i in range(4096))
+        diskfile.write_binary_hashes(self.testdir, hashes)
+        hashes_file = os.path.join(self.testdir, diskfile.BINARY_HASH_FILE)
+        inode = os.stat(hashes_file).st_ino
+
+        hashes['abc'] = None
+        hashes['123'] = 'f' * 32
+        writes = []
+        orig_write = os.write
+
+        def capture_write(fd, data):
+            writes.append(len(data))
+            return orig_write(fd, data)
+
+        with mock.patch('swift.obj.diskfile.os.write', capture_write), \
+                mock.patch('swift.obj.diskfile.fdatasync') as mock_sync:
+            diskfile.write_binary_hashes(self.testdir, hashes)
+        self.assertEqual(inode, os.stat(hashes_file).st_ino)
+        # the md5s of 123 and abc, then the header (updated and checksum) and
+        # the valid bitmap
+        self.assertEqual([16, 16, 32, 16], writes)
+        self.assertEqual(2, mock_sync.call_count)
+        self.assertEqual(hashes, diskfile.read_binary_hashes(self.testdir))
+
+    def test_read_binary_hashes_missing_or_corrupt(self):
+        expected = {'valid': False, 'updated': -1}
+        self.assertEqual(expected, diskfile.read_binary_hashes(self.testdir))
+        hashes_file = os.path.join(self.testdir, diskfile.BINARY_HASH_FILE)
+        diskfile.write_binary_hashes(self.testdir, {'valid': True,
+                                                    'abc': 'a' * 32})
+        with open(hashes_file, 'rb') as f:
+            data = f.read()
+        for corrupt_data in (b'', data[:-1], b'HSAH' + data[4:], data * 2):
+            with open(hashes_file, 'wb') as f:
+                f.write(corrupt_data)
+            self.assertEqual(expected,
+                             diskfile.read_binary_hashes(self.testdir))
+        # and rewriting replaces the corrupt file
+        hashes = {'valid': True, 'abc': 'a' * 32}
+        diskfile.write_binary_hashes(self.testdir, hashes)
+        self.assertEqual(hashes, diskfile.read_binary_hashes(self.testdir))
+
+    def test_read_binary_hashes_md5_not_present(self):
+        hashes = {'valid': True, 'abc': 'a' * 32}
+        data = diskfile._encode_binary_hashes(hashes)
+        # the md5 of a suffix that isn't marked present must be rehashed
+        slot = int('abc', 16)
+        data[diskfile.BINARY_HASHES_HEADER.size + slot // 8] = 0
+        data[diskfile.BINARY_HASHES_CHECKSUM_OFFSET:
+             diskfile.BINARY_HASHES_HEADER.size] = \
+            diskfile._binary_hashes_checksum(data)
+        hashes_file = os.path.join(self.testdir, diskfile.BINARY_HASH_FILE)
+        with open(hashes_file, 'wb') as f:
+            f.write(data)
+        hashes['abc'] = None
+        hashes['updated'] = -1
+        self.assertEqual(hashes, diskfile.read_binary_hashes(self.testdir))
+
+    def test_read_binary_hashes_torn_write(self):
+        hashes = {'valid': True, 'abc': 'a' * 32}
+        diskfile.write_binary_hashes(self.testdir, hashes)
+        hashes_file = os.path.join(self.testdir, diskfile.BINARY_HASH_FILE)
+        with open(hashes_file, 'rb') as f:
+            data = f.read()
+        # e.g. the md5 of abc has been rewritten but not yet the header
+        torn_data = bytearray(data)
+        offset = diskfile.BINARY_HASHES_MD5_OFFSET + 16 * int('abc', 16)
+        torn_data[offset:offset + 16] = b'\xbb' * 16
+        reads = []
+        orig_open = open
+
+        def torn_open(path, mode='r'):
+            reads.append(path)
+            if len(reads) == 1:
+                return closing(six.BytesIO(bytes(torn_data)))
+            return orig_open(path, mode)
+
+        with mock.patch('swift.obj.diskfile.open', torn_open, create=True):
+            self.assertEqual(hashes,
+                             diskfile.read_binary_hashes(self.testdir))
+        # the torn read was retried
+        self.assertEqual([hashes_file] * 2, reads)
+
+        # a file that never matches its checksum is corrupt
+        with open(hashes_file, 'wb') as f:
+            f.write(torn_data)
+        with mock.patch('swift.obj.diskfile.open', torn_open, create=True):
+            self.assertEqual({'valid': False, 'updated': -1},
+                             diskfile.read_binary_hashes(self.testdir))
+        self.assertEqual(
+            2 + diskfile.BINARY_HASHES_READ_ATTEMPTS, len(reads))
 
 if __name__ == '__main__':
     unittest.main()
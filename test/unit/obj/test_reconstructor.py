@@ -3624,6 +3624,109 @@ class TestObjectReconstructor(BaseTestObjectReconstructor):
             c['suffixes'],
         ) for c in ssync_calls))
 
+    def test_process_job_sync_multi_fragment_rebuild(self):
+        self._configure_reconstructor(multi_fragment_rebuild='true',
+                                      multi_fragment_buffer_size=100)
+        self.assertTrue(self.reconstructor.multi_fragment_rebuild)
+        self.assertEqual(
+            100, self.reconstructor.multi_fragment_buffer_size)
+        replicas = self.policy.object_ring.replicas
+        frag_index = random.randint(
+            0, self.policy.ec_n_unique_fragments - 1)
+        sync_to = [n for n in self.policy.object_ring.devs
+                   if n != self.local_dev][:2]
+        stub_hashes = {
+            '123': {frag_index: 'hash', None: 'hash'},
+            'abc': {frag_index: 'hash', None: 'hash'},
+        }
+        # neither partner has the suffix abc
+        left_index = sync_to[0]['index'] = (frag_index - 1) % replicas
+        left_hashes = {
+            '123': {left_index: 'hash', None: 'hash'},
+        }
+        right_index = sync_to[1]['index'] = (frag_index + 1) % replicas
+        right_hashes = {
+            '123': {right_index: 'hash', None: 'hash'},
+        }
+
+        partition = 0
+        part_path = os.path.join(self.devices, self.local_dev['device'],
+                                 diskfile.get_data_dir(self.policy),
+                                 str(partition))
+        job = {
+            'job_type': object_reconstructor.SYNC,
+            'frag_index': frag_index,
+            'suffixes': stub_hashes.keys(),
+            'sync_to': sync_to,
+            'partition': partition,
+            'path': part_path,
+            'hashes': stub_hashes,
+            'policy': self.policy,
+            'local_dev': self.local_dev,
+        }
+
+        responses = [(200, pickle.dumps(hashes)) for hashes in (
+            left_hashes, right_hashes, left_hashes, right_hashes)]
+        codes, body_iter = zip(*responses)
+
+        ssync_calls = []
+        in_flight = []
+
+        def wait_for_partners(node, job, suffixes):
+            # ssync to both partners is in flight at the same time
+            in_flight.append(node['index'])
+            with Timeout(1):
+                while len(in_flight) < len(job['sync_to']):
+                    sleep(0.01)
+            return True, {}
+
+        with mock_ssync_sender(ssync_calls,
+                               response_callback=wait_for_partners), \
+                mock.patch('swift.obj.diskfile.ECDiskFileManager._get_hashes',
+                           return_value=(None, stub_hashes)), \
+                mocked_http_conn(*codes, body_iter=body_iter):
+            self.reconstructor.process_job(job)
+
+        self.assertEqual(sorted([
+            ('10.0.0.1', 0, ['abc']),
+            ('10.0.0.2', 0, ['abc']),
+        ]), sorted((
+            c['node']['ip'],
+            c['job']['partition'],
+            c['suffixes'],
+        ) for c in ssync_calls))
+        self.assertEqual(100, job['shared_rebuilds'].max_buffer)
+        self.assertEqual(set([left_index, right_index]),
+                         job['shared_rebuilds'].finished_nodes)
+
+    def test_shared_rebuilds(self):
+        shared_rebuilds = object_reconstructor.SharedRebuilds(100)
+        node = {'index': 1}
+        other = {'index': 2}
+        ts = self.ts()
+        queue = shared_rebuilds.reserve(node, '/a/c/o', ts.normal, 60)
+        self.assertIsNotNone(queue)
+        self.assertEqual(60, shared_rebuilds.buffered)
+        # no room left, and no second reservation for the same rebuild
+        self.assertIsNone(shared_rebuilds.reserve(other, '/a/c/o',
+                                                  ts.normal, 60))
+        self.assertIsNone(shared_rebuilds.reserve(node, '/a/c/o',
+                                                  ts.internal, 10))
+        self.assertIsNotNone(shared_rebuilds.reserve(other, '/a/c/o2',
+                                                     ts.normal, 40))
+        self.assertEqual(100, shared_rebuilds.buffered)
+        self.assertIs(queue, shared_rebuilds.claim(node, '/a/c/o',
+                                                   ts.internal))
+        self.assertIsNone(shared_rebuilds.claim(node, '/a/c/o',
+                                                ts.internal))
+        self.assertEqual(40, shared_rebuilds.buffered)
+        shared_rebuilds.finish_node(other)
+        self.assertEqual(0, shared_rebuilds.buffered)
+        self.assertIsNone(shared_rebuilds.claim(other, '/a/c/o2',
+                                                ts.normal))
+        self.assertIsNone(shared_rebuilds.reserve(other, '/a/c/o3',
+                                                  ts.normal, 1))
+
     def test_process_job_primary_some_in_sync(self):
         replicas = self.policy.object_ring.replicas
         frag_index = random.randint(
@@ -4834,6 +4937,164 @@ class TestReconstructFragmentArchive(BaseTestObjectReconstructor):
         for value in ('None', 'invalid'):
             test_invalid_ec_frag_index_header(value)
 
+    def test_reconstruct_fa_shares_rebuild_with_partner(self):
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        partner = part_nodes[2]
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+            'sync_to': [node, partner],
+            'shared_rebuilds': object_reconstructor.SharedRebuilds(
+                2 ** 20),
+        }
+
+        test_data = ('rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data).hexdigest()
+        ec_archive_bodies = encode_frag_archive_bodies(self.policy, test_data)
+        broken_body = ec_archive_bodies[1]
+        partner_body = ec_archive_bodies[2]
+        self.obj_metadata['Content-Length'] = str(len(broken_body))
+
+        responses = list()
+        for i, body in enumerate(ec_archive_bodies):
+            if i == 1:
+                continue
+            if i == 2:
+                # the partner is missing the object too
+                responses.append((404, '', {}))
+                continue
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+
+        codes, body_iter, headers = zip(*responses)
+        with mocked_http_conn(
+                *codes, body_iter=body_iter, headers=headers):
+            df = self.reconstructor.reconstruct_fa(
+                job, node, self.obj_metadata)
+            fixed_body = ''.join(df.reader())
+        self.assertEqual(md5(fixed_body).hexdigest(),
+                         md5(broken_body).hexdigest())
+        self.assertEqual(len(broken_body),
+                         job['shared_rebuilds'].buffered)
+
+        # the partner's fragment archive was rebuilt by the same decode
+        with mocked_http_conn() as mock_conn:
+            df = self.reconstructor.reconstruct_fa(
+                job, partner, self.obj_metadata)
+            partner_fixed_body = ''.join(df.reader())
+        self.assertFalse(mock_conn.requests)
+        self.assertEqual(md5(partner_fixed_body).hexdigest(),
+                         md5(partner_body).hexdigest())
+        self.assertEqual(0, job['shared_rebuilds'].buffered)
+
+        self.assertEqual(2 * len(broken_body),
+                         self.reconstructor.rebuild_rebuilt_bytes)
+        self.assertEqual(
+            self.policy.ec_ndata * len(broken_body),
+            self.reconstructor.rebuild_fetched_bytes)
+        self.assertEqual(
+            [((), {'rebuild.fetched_bytes':
+                   self.policy.ec_ndata * len(broken_body),
+                   'rebuild.rebuilt_bytes': 2 * len(broken_body)})],
+            [((), {args[0]: args[1]
+                   for args, _ in self.logger.log_dict['update_stats']})])
+        self.assertFalse(self.logger.get_lines_for_level('error'))
+
+    def test_reconstruct_fa_shared_rebuild_fails(self):
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        partner = part_nodes[2]
+        self.reconstructor.node_timeout = 0.01
+
+        test_data = ('rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data).hexdigest()
+        ec_archive_bodies = encode_frag_archive_bodies(self.policy, test_data)
+        partner_body = ec_archive_bodies[2]
+        self.obj_metadata['Content-Length'] = str(len(partner_body))
+        first_fragment = partner_body[:self.policy.fragment_size]
+
+        responses = list()
+        for i, body in enumerate(ec_archive_bodies):
+            if i == 2:
+                continue
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+        codes, body_iter, headers = zip(*responses)
+
+        # the shared rebuild either stalls or ends after its first fragment
+        for last in ([], [None]):
+            self.logger.clear()
+            job = {
+                'partition': 0,
+                'policy': self.policy,
+                'sync_to': [node, partner],
+                'shared_rebuilds': object_reconstructor.SharedRebuilds(
+                    2 ** 20),
+            }
+            queue = job['shared_rebuilds'].reserve(
+                partner, self.obj_path, self.obj_metadata['X-Timestamp'],
+                len(partner_body))
+            for fragment in [first_fragment] + last:
+                queue.put(fragment)
+            with mocked_http_conn(
+                    *codes, body_iter=body_iter, headers=headers) as \
+                    mock_conn:
+                df = self.reconstructor.reconstruct_fa(
+                    job, partner, dict(self.obj_metadata))
+                fixed_body = ''.join(df.reader())
+            # ...so the rest of the fragment archive is rebuilt locally
+            self.assertEqual(md5(fixed_body).hexdigest(),
+                             md5(partner_body).hexdigest())
+            self.assertEqual(len(part_nodes) - 1, len(mock_conn.requests))
+            error_lines = self.logger.get_lines_for_level('error')
+            self.assertEqual(1, len(error_lines))
+            self.assertIn('rebuilding it', error_lines[0])
+
+    def test_reconstruct_fa_does_not_share_rebuild_beyond_buffer(self):
+        part_nodes = self.policy.object_ring.get_part_nodes(0)
+        node = part_nodes[1]
+        partner = part_nodes[2]
+        job = {
+            'partition': 0,
+            'policy': self.policy,
+            'sync_to': [node, partner],
+            'shared_rebuilds': object_reconstructor.SharedRebuilds(10),
+        }
+
+        test_data = ('rebuild' * self.policy.ec_segment_size)[:-777]
+        etag = md5(test_data).hexdigest()
+        ec_archive_bodies = encode_frag_archive_bodies(self.policy, test_data)
+        broken_body = ec_archive_bodies[1]
+        self.obj_metadata['Content-Length'] = str(len(broken_body))
+
+        responses = list()
+        for i, body in enumerate(ec_archive_bodies):
+            if i == 1:
+                continue
+            if i == 2:
+                responses.append((404, '', {}))
+                continue
+            headers = get_header_frag_index(self, body)
+            headers.update({'X-Object-Sysmeta-Ec-Etag': etag})
+            responses.append((200, body, headers))
+
+        codes, body_iter, headers = zip(*responses)
+        with mocked_http_conn(
+                *codes, body_iter=body_iter, headers=headers):
+            df = self.reconstructor.reconstruct_fa(
+                job, node, self.obj_metadata)
+            fixed_body = ''.join(df.reader())
+        self.assertEqual(md5(fixed_body).hexdigest(),
+                         md5(broken_body).hexdigest())
+        self.assertEqual(0, job['shared_rebuilds'].buffered)
+        self.assertIsNone(job['shared_rebuilds'].claim(
+            partner, self.obj_path, self.obj_metadata['X-Timestamp']))
+        self.assertEqual(len(broken_body),
+                         self.reconstructor.rebuild_rebuilt_bytes)
+
 
 @patch_policies(with_ec_default=True)
 class TestReconstructFragmentArchiveUTF8(TestReconstructFragmentArchive):
@@ -27,7 +27,7 @@ from collections import defaultdict
 from errno import ENOENT, ENOTEMPTY, ENOTDIR
 
 from eventlet.green import subprocess
-from eventlet import Timeout, sleep
+from eventlet import GreenPool, Timeout, sleep
 
 from test.unit import (debug_logger, patch_policies, make_timestamp_iter,
                        mocked_http_conn, mock_check_drive, skip_if_no_xattrs)
@@ -503,6 +503,62 @@ class TestObjectReplicator(unittest.TestCase):
         self.assertEqual(mocks['isdir'].mock_calls, [])
         self.assertEqual(len(mocks['ismount'].mock_calls), 2)
 
+    def test_collect_jobs_priority(self):
+        self.conf['priority_replication'] = 'yes'
+        self._create_replicator()
+
+        def collect(recon):
+            with open(self.replicator.rcache, 'w') as fp:
+                json.dump(recon, fp)
+            self.logger.clear()
+            return [(job['priority'], job['partition'])
+                    for job in self.replicator.collect_jobs()]
+
+        # without failures only the handoffs are moved to the front
+        jobs = collect({})
+        self.assertEqual([('handoff', '1')] * 2, jobs[:2])
+        self.assertEqual(['normal'] * 6, [p for p, part in jobs[2:]])
+        self.assertEqual(
+            {'at_risk': 0, 'handoff': 2, 'normal': 6},
+            self.replicator.jobs_queued)
+        self.assertEqual(
+            ['Partitions queued by priority: at_risk 0, handoff 2, '
+             'normal 6'], self.logger.get_lines_for_level('info'))
+
+        # partitions with a primary that failed are replicated first
+        jobs = collect({'replication_stats': {
+            'failure_nodes': {'127.0.0.3': {'sda': 1}}}})
+        self.assertEqual(['at_risk'] * 6, [p for p, part in jobs[:6]])
+        self.assertEqual([('normal', '0')] * 2, jobs[6:])
+
+        # ... most failed primaries first, also for per-disk stats
+        jobs = collect({'object_replication_per_disk': {'sda': {
+            'replication_stats': {'failure_nodes': {
+                '127.0.0.2': {'sda': 1}, '127.0.0.3': {'sda': 1}}},
+            'object_replication_last': time.time()}}})
+        self.assertEqual(['at_risk'] * 8, [p for p, part in jobs])
+        self.assertEqual(['1', '1', '2', '2'],
+                         sorted(part for p, part in jobs[:4]))
+
+        # primaries being drained count as failed
+        ring = POLICIES[0].object_ring
+        ring.devs[3]['weight'] = 0
+        jobs = collect({})
+        self.assertEqual(
+            {'at_risk': 3, 'handoff': 1, 'normal': 4},
+            self.replicator.jobs_queued)
+
+    def test_replicate_priority_drains_queue(self):
+        self.conf['priority_replication'] = 'yes'
+        self._create_replicator()
+        with mock.patch.object(self.replicator, 'update') as update, \
+                mock.patch.object(self.replicator, 'update_deleted'):
+            self.replicator.replicate()
+        self.assertEqual(6, update.call_count)
+        self.assertEqual(
+            {'at_risk': 0, 'handoff': 0, 'normal': 0},
+            self.replicator.jobs_queued)
+
     def test_collect_jobs_failure_report_with_auditor_stats_json(self):
         devs = [
             {'id': 0, 'device': 'sda', 'zone': 0,
@@ -1972,6 +2028,8 @@ class TestObjectReplicator(unittest.TestCase):
         # as otherwise it may be different from earlier tests
         self.headers['X-Backend-Storage-Policy-Index'] = 0
         self.replicator.update(repl_job)
+        suffix_headers = dict(self.headers)
+        suffix_headers['X-Backend-Replicate-Suffixes'] = 'a83'
         reqs = []
         for node in repl_job['nodes']:
             reqs.append(mock.call(node['replication_ip'],
@@ -1981,7 +2039,7 @@ class TestObjectReplicator(unittest.TestCase):
             reqs.append(mock.call(node['replication_ip'],
                                   node['replication_port'], node['device'],
                                   repl_job['partition'], 'REPLICATE',
-                                  '/a83', headers=self.headers))
+                                  '/a83', headers=suffix_headers))
         mock_http.assert_has_calls(reqs, any_order=True)
 
     def test_rsync_compress_different_region(self):
@@ -2020,6 +2078,107 @@ class TestObjectReplicator(unittest.TestCase):
                             _m_os_path_exists.call_args_list[-2][0][0],
                             os.path.join(job['path']))
 
+    def _make_suffix_dirs(self, jobs, suffix):
+        for job in jobs:
+            mkdirs(os.path.join(job['path'], suffix))
+
+    def test_rsync_batched(self):
+        self.conf['rsync_batch_size'] = '2'
+        self._create_replicator()
+        jobs = [job for job in self.replicator.collect_jobs()
+                if int(job['policy']) == 0 and
+                job['partition'] in ('0', '1')]
+        self.assertEqual(2, len(jobs))
+        self._make_suffix_dirs(jobs, 'abc')
+        node = jobs[0]['nodes'][0]
+        calls = []
+
+        def fake_rsync(args, output=None, timeout=None):
+            with open(args[-3].split('=', 1)[1]) as fp:
+                calls.append((args, fp.read(), timeout))
+            output.append('<f+++++++++ 0/abc/d41/t.data')
+            return 0
+
+        pool = GreenPool()
+        with mock.patch.object(self.replicator, '_rsync', fake_rsync):
+            results = list(pool.imap(
+                lambda job: self.replicator.sync(node, job, ['abc', 'fff']),
+                jobs))
+        self.assertEqual([(True, {}), (True, {})], results)
+        self.assertEqual(1, len(calls))
+        args, files, timeout = calls[0]
+        # the batch gets rsync_timeout for each of its partitions
+        self.assertEqual(2 * self.replicator.rsync_timeout, timeout)
+        self.assertEqual('--files-from=', args[-3][:13])
+        self.assertEqual(self.objects, args[-2])
+        self.assertEqual('%s::object/%s/objects' % (
+            node['replication_ip'], node['device']), args[-1])
+        self.assertEqual(['0/abc', '1/abc'], sorted(files.splitlines()))
+        self.assertFalse(self.replicator._rsync_batches)
+        node_stats = self.replicator.rsync_node_stats[
+            '%s/%s' % (node['replication_ip'], node['device'])]
+        self.assertEqual(1, node_stats['processes'])
+
+    def test_rsync_batched_waits_for_partitions(self):
+        self.conf['rsync_batch_size'] = '10'
+        self.conf['rsync_batch_wait'] = '0.01'
+        self._create_replicator()
+        jobs = [job for job in self.replicator.collect_jobs()
+                if int(job['policy']) == 0 and job['partition'] == '0']
+        self._make_suffix_dirs(jobs, 'abc')
+        calls = []
+
+        def fake_rsync(args, output=None, timeout=None):
+            calls.append(args)
+            return 1
+
+        with mock.patch.object(self.replicator, '_rsync', fake_rsync):
+            # a failed batch fails each partition in it
+            self.assertEqual((False, {}), self.replicator.sync(
+                jobs[0]['nodes'][0], jobs[0], ['abc']))
+            # a different remote device gets a batch of its own
+            self.assertEqual((False, {}), self.replicator.sync(
+                jobs[0]['nodes'][1], jobs[0], ['abc']))
+        self.assertEqual(2, len(calls))
+        self.assertEqual([jobs[0]['nodes'][0]['device'],
+                          jobs[0]['nodes'][1]['device']],
+                         [args[-1].split('/')[-2] for args in calls])
+        self.assertFalse(self.replicator._rsync_batches)
+
+    def test_rsync_node_stats(self):
+        jobs = [job for job in self.replicator.collect_jobs()
+                if int(job['policy']) == 0 and job['partition'] == '0']
+        self._make_suffix_dirs(jobs, 'abc')
+        with open(os.path.join(jobs[0]['path'], 'abc', 't.data'), 'w') as fp:
+            fp.write('x' * 10)
+        node = jobs[0]['nodes'][0]
+
+        def fake_rsync(args, output=None, timeout=None):
+            output.extend(['cd+++++++++ abc/', '<f+++++++++ abc/t.data',
+                           '<f+++++++++ abc/gone.data'])
+            return 0
+
+        with mock.patch.object(self.replicator, '_rsync', fake_rsync):
+            for i in range(2):
+                self.assertEqual((True, {}), self.replicator.sync(
+                    node, jobs[0], ['abc']))
+        node_name = '%s/%s' % (node['replication_ip'], node['device'])
+        self.assertEqual([node_name], list(self.replicator.rsync_node_stats))
+        node_stats = self.replicator.rsync_node_stats[node_name]
+        self.assertEqual(2, node_stats['processes'])
+        self.assertEqual(20, node_stats['bytes'])
+        self.assertEqual({'rsync.processes': 2},
+                         self.logger.get_increment_counts())
+        self.assertEqual(
+            [(('rsync.bytes', 10), {})] * 2,
+            self.logger.log_dict['update_stats'])
+        self.replicator.rsync_stats_line()
+        info_lines = self.logger.get_lines_for_level('info')
+        self.assertIn('2 rsync processes to 1 devices sent 20 bytes',
+                      info_lines[-1])
+        self.assertIn('rsync to %s: 2 processes, 20 bytes' % node_name,
+                      self.logger.get_lines_for_level('debug')[-1])
+
     def test_do_listdir(self):
         # Test if do_listdir is enabled for every 10th partition to rehash
         # First number is the number of partitions in the job, list entries
@@ -5497,6 +5497,140 @@ class TestObjectController(unittest.TestCase):
             'container': 'c',
             'op': 'PUT'})
 
+    def test_container_update_batched(self):
+        conf = dict(self.conf, container_update_batch_interval='0.01')
+        controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+        self.assertEqual(0.01, controller.container_update_batch_interval)
+        self.assertEqual(100, controller.container_update_batch_size)
+        container_updates = []
+        sent = []
+
+        def capture_updates(ip, port, method, path, headers, *args, **kwargs):
+            container_updates.append((ip, port, method, path, headers))
+
+        def capture_send(conn, data):
+            sent.append(data)
+
+        ts = [next(self.ts) for _ in range(3)]
+        put_headers = {'x-size': '3', 'x-content-type': 'text/plain',
+                       'x-timestamp': ts[1].internal, 'x-etag': 'etag',
+                       'x-trans-id': '123', 'referer': 'PUT somewhere'}
+        delete_headers = {'x-timestamp': ts[0].internal}
+        with mocked_http_conn(202, give_connect=capture_updates,
+                              give_send=capture_send) as fake_conn:
+            events = [
+                controller.batch_async_update(
+                    'PUT', 'a', 'c', 'o1', 'chost:cport', 'cpartition',
+                    'cdevice', put_headers, 'sda1', POLICIES[0]),
+                controller.batch_async_update(
+                    'DELETE', 'a', 'c', 'o2', 'chost:cport', 'cpartition',
+                    'cdevice', delete_headers, 'sda1', POLICIES[0])]
+            for event in events:
+                event.wait()
+        self.assertRaises(StopIteration, fake_conn.code_iter.next)
+        self.assertEqual(1, len(container_updates))
+        ip, port, method, path, headers = container_updates[0]
+        self.assertEqual(
+            ('chost', 'cport', 'UPDATE', '/cdevice/cpartition/a/c'),
+            (ip, port, method, path))
+        self.assertEqual(ts[0].internal, headers['x-timestamp'])
+        self.assertEqual('123', headers['x-trans-id'])
+        self.assertEqual(0, headers['X-Backend-Storage-Policy-Index'])
+        self.assertEqual([
+            {'name': 'o1', 'created_at': ts[1].internal, 'size': 3,
+             'content_type': 'text/plain', 'etag': 'etag', 'deleted': 0,
+             'storage_policy_index': 0, 'ctype_timestamp': None,
+             'meta_timestamp': None},
+            {'name': 'o2', 'created_at': ts[0].internal, 'size': 0,
+             'content_type': 'application/deleted', 'etag': 'noetag',
+             'deleted': 1, 'storage_policy_index': 0}],
+            json.loads(''.join(sent)))
+        self.assertFalse(controller._container_update_batches)
+
+    def test_container_update_batch_size(self):
+        conf = dict(self.conf, container_update_batch_interval='10',
+                    container_update_batch_size='2')
+        controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+        headers = {'x-timestamp': next(self.ts).internal}
+        with mocked_http_conn(202, 202) as fake_conn:
+            events = [controller.batch_async_update(
+                'DELETE', 'a', 'c', 'o%d' % i, 'chost:cport', 'cpartition',
+                'cdevice', headers, 'sda1', POLICIES[0]) for i in range(4)]
+            # full batches are sent without waiting for the interval
+            with Timeout(1):
+                for event in events:
+                    event.wait()
+        self.assertEqual(['UPDATE', 'UPDATE'],
+                         [r['method'] for r in fake_conn.requests])
+
+    def test_container_update_batch_saves_async_updates(self):
+        conf = dict(self.conf, container_update_batch_interval='0.01')
+        controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+        policy = random.choice(list(POLICIES))
+        diskfile_mgr = controller._diskfile_router[policy]
+        ts = next(self.ts)
+        for status in (500, Timeout()):
+            with mock.patch.object(diskfile_mgr, 'pickle_async_update') as \
+                    mock_pickle, mocked_http_conn(status):
+                events = [controller.batch_async_update(
+                    'DELETE', 'a', 'c', 'o%d' % i, 'chost:cport',
+                    'cpartition', 'cdevice', {'x-timestamp': ts.internal},
+                    'sda1', policy, container_path='.shards_a/c_shard')
+                    for i in range(2)]
+                for event in events:
+                    event.wait()
+            self.assertEqual([
+                mock.call('sda1', 'a', 'c', 'o%d' % i, {
+                    'op': 'DELETE', 'account': 'a', 'container': 'c',
+                    'obj': 'o%d' % i,
+                    'headers': HeaderKeyDict({
+                        'x-timestamp': ts.internal,
+                        'user-agent': 'object-server %s' % os.getpid()}),
+                    'container_path': '.shards_a/c_shard'},
+                    ts.internal, policy) for i in range(2)],
+                mock_pickle.call_args_list)
+
+    def test_container_update_batch_not_supported(self):
+        conf = dict(self.conf, container_update_batch_interval='0.01')
+        controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+        headers = {'x-timestamp': next(self.ts).internal}
+        with mocked_http_conn(405, 204, 204) as fake_conn:
+            events = [controller.batch_async_update(
+                'DELETE', 'a', 'c', 'o%d' % i, 'chost:cport', 'cpartition',
+                'cdevice', headers, 'sda1', POLICIES[0]) for i in range(2)]
+            for event in events:
+                event.wait()
+        self.assertEqual(
+            [('UPDATE', '/cdevice/cpartition/a/c'),
+             ('DELETE', '/cdevice/cpartition/a/c/o0'),
+             ('DELETE', '/cdevice/cpartition/a/c/o1')],
+            [(r['method'], r['path']) for r in fake_conn.requests])
+
+    def test_container_update_uses_batches(self):
+        conf = dict(self.conf, container_update_batch_interval='0.01')
+        controller = object_server.ObjectController(
+            conf, logger=debug_logger())
+        req = Request.blank(
+            '/sda1/p/a/c/o', method='PUT',
+            headers={'X-Timestamp': next(self.ts).internal,
+                     'Content-Type': 'application/burrito',
+                     'X-Container-Partition': '20',
+                     'X-Container-Host': '1.2.3.4:5, 6.7.8.9:10',
+                     'X-Container-Device': 'sdb1, sdc1'}, body='')
+        with mock.patch.object(controller, 'batch_async_update') as \
+                mock_batch, mock.patch.object(
+                    controller, 'async_update') as mock_update:
+            resp = req.get_response(controller)
+        self.assertEqual(resp.status_int, 201)
+        self.assertFalse(mock_update.called)
+        self.assertEqual(
+            [('1.2.3.4:5', '20', 'sdb1'), ('6.7.8.9:10', '20', 'sdc1')],
+            [c[0][4:7] for c in mock_batch.call_args_list])
+
     def test_container_update_as_greenthread(self):
         greenthreads = []
         saved_spawn_calls = []
@@ -6793,6 +6927,18 @@ class TestObjectController(unittest.TestCase):
             tpool.execute = was_tpool_exe
             diskfile.DiskFileManager._get_hashes = was_get_hashes
 
+    def test_REPLICATE_only_wanted_suffixes(self):
+        with mock.patch.object(
+                diskfile.DiskFileManager, 'get_hashes',
+                return_value={'abc': 'x', 'def': 'y', 'fed': 'z'}) as mock_get:
+            req = Request.blank(
+                '/sda1/p/abc', environ={'REQUEST_METHOD': 'REPLICATE'},
+                headers={'X-Backend-Replicate-Suffixes': 'abc-fed-123'})
+            resp = req.get_response(self.object_controller)
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual({'abc': 'x', 'fed': 'z'}, pickle.loads(resp.body))
+        self.assertEqual(['abc'], mock_get.call_args[0][2])
+
     def test_REPLICATE_timeout(self):
 
         def fake_get_hashes(*args, **kwargs):
@@ -1168,6 +1168,96 @@ class TestSsyncReplication(TestBaseSsync):
         self._verify_ondisk_files(tx_objs, policy)
         self._verify_tombstones(tx_tombstones, policy)
 
+    def test_sync_batched_and_concurrent(self):
+        policy = POLICIES.default
+        self.daemon.ssync_batch_size = 4096
+        self.rx_controller.replication_update_concurrency = 4
+        tx_df_mgr = self.daemon._df_router[policy]
+        rx_df_mgr = self.rx_controller._diskfile_router[policy]
+        tx_objs = {}
+        tx_tombstones = {}
+        for i in range(10):
+            name = 'o%d' % i
+            tx_objs[name] = self._create_ondisk_files(
+                tx_df_mgr, name, policy, next(self.ts_iter))
+        # o0 has newer metadata, which is POSTed after its PUT
+        t_meta = next(self.ts_iter)
+        tx_objs['o0'][0].write_metadata({
+            'X-Timestamp': t_meta.internal,
+            'X-Object-Meta-Test': 'o0'})
+        # t0 is a tombstone on tx, older data on rx
+        self._create_ondisk_files(rx_df_mgr, 't0', policy, next(self.ts_iter))
+        t0 = next(self.ts_iter)
+        tx_tombstones['t0'] = self._create_ondisk_files(
+            tx_df_mgr, 't0', policy, t0)
+        tx_tombstones['t0'][0].delete(t0)
+
+        suffixes = set()
+        for diskfiles in list(tx_objs.values()) + list(tx_tombstones.values()):
+            for df in diskfiles:
+                suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        node = dict(self.rx_node)
+        node.update({'index': 0})
+        sender = ssync_sender.Sender(self.daemon, node, job, suffixes)
+        success, in_sync_objs = sender()
+
+        self.assertTrue(success)
+        self.assertEqual(11, len(in_sync_objs))
+        self._verify_ondisk_files(tx_objs, policy)
+        self._verify_tombstones(tx_tombstones, policy)
+        metadata = rx_df_mgr.get_diskfile(
+            self.device, self.partition, 'a', 'c', 'o0',
+            policy=policy).read_metadata()
+        self.assertEqual('o0', metadata['X-Object-Meta-Test'])
+
+    def test_sync_with_digests(self):
+        policy = POLICIES.default
+        self.daemon.ssync_digest_threshold = 4
+        tx_df_mgr = self.daemon._df_router[policy]
+        rx_df_mgr = self.rx_controller._diskfile_router[policy]
+        tx_objs = {}
+        for i in range(100):
+            name = 'o%d' % i
+            t = next(self.ts_iter)
+            tx_objs[name] = self._create_ondisk_files(
+                tx_df_mgr, name, policy, t)
+            if i >= 2:
+                # all but o0 and o1 are in sync
+                self._create_ondisk_files(rx_df_mgr, name, policy, t)
+
+        suffixes = set()
+        for diskfiles in tx_objs.values():
+            for df in diskfiles:
+                suffixes.add(os.path.basename(os.path.dirname(df._datadir)))
+
+        job = {'device': self.device,
+               'partition': self.partition,
+               'policy': policy}
+        node = dict(self.rx_node)
+        node.update({'index': 0})
+        sender = ssync_sender.Sender(self.daemon, node, job, suffixes)
+        missing_lines = []
+        orig_send_missing = sender.send_missing
+
+        def send_missing(line):
+            missing_lines.append(line)
+            orig_send_missing(line)
+
+        sender.send_missing = send_missing
+        success, in_sync_objs = sender()
+
+        self.assertTrue(success)
+        self.assertTrue(sender.use_digests)
+        self.assertEqual(100, len(in_sync_objs))
+        # only objects in ranges that differ were offered line by line
+        self.assertLess(len(missing_lines), 50)
+        self.assertEqual(2, len(sender.send_map))
+        self._verify_ondisk_files(tx_objs, policy)
+
     def test_nothing_to_sync(self):
         job = {'device': self.device,
                'partition': self.partition,
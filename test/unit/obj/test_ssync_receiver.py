@@ -664,6 +664,53 @@ class TestReceiver(unittest.TestCase):
         self.assertFalse(self.controller.logger.error.called)
         self.assertFalse(self.controller.logger.exception.called)
 
+    def test_MISSING_CHECK_digests(self):
+        object_dir = utils.storage_directory(
+            os.path.join(self.testdir, 'sda1',
+                         diskfile.get_data_dir(POLICIES[0])),
+            '1', self.hash1)
+        utils.mkdirs(object_dir)
+        fp = open(os.path.join(object_dir, self.ts1 + '.data'), 'w+')
+        fp.write('1')
+        fp.flush()
+        self.metadata1['Content-Length'] = '1'
+        diskfile.write_metadata(fp, self.metadata1)
+
+        line1 = self.hash1 + ' ' + self.ts1
+        line2 = self.hash2 + ' ' + self.ts2
+        prefix1 = self.hash1[:3]
+        prefix2 = self.hash2[:3]
+        self.assertNotEqual(prefix1, prefix2)  # sanity
+        self.controller.logger = mock.MagicMock()
+        req = swob.Request.blank(
+            '/sda1/1',
+            environ={'REQUEST_METHOD': 'SSYNC'},
+            body=':MISSING_CHECK: START\r\n'
+                 ':DIGESTS: START %s,%s\r\n' % (
+                     self.hash1[-3:], self.hash2[-3:]) +
+                 prefix1 + ' ' + ssync_sender.digest_missing([line1]) +
+                 '\r\n' +
+                 prefix2 + ' ' + ssync_sender.digest_missing([line2]) +
+                 '\r\n'
+                 ':DIGESTS: END\r\n' +
+                 line2 + '\r\n'
+                 ':MISSING_CHECK: END\r\n'
+                 ':UPDATES: START\r\n:UPDATES: END\r\n')
+        resp = req.get_response(self.controller)
+        self.assertEqual(
+            self.body_lines(resp.body),
+            [':DIGESTS: START',
+             prefix2,
+             ':DIGESTS: END',
+             ':MISSING_CHECK: START',
+             self.hash2 + ' dm',
+             ':MISSING_CHECK: END',
+             ':UPDATES: START', ':UPDATES: END'])
+        self.assertEqual(resp.status_int, 200)
+        self.assertEqual('true', resp.headers['X-Backend-Ssync-Digests'])
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertFalse(self.controller.logger.exception.called)
+
     def test_MISSING_CHECK_missing_meta_expired_data(self):
         # verify that even when rx disk file has expired x-delete-at, it will
         # still be opened and checked for missing meta
@@ -1874,6 +1921,114 @@ class TestReceiver(unittest.TestCase):
                     'x-object-meta-test-user x-timestamp')})
             self.assertEqual(_requests, [])
 
+    def test_UPDATES_concurrent(self):
+        events = []
+        bodies = {}
+        in_flight = []
+        max_in_flight = [0]
+
+        def handle(request, resp_class):
+            in_flight.append(request.path)
+            max_in_flight[0] = max(max_in_flight[0], len(in_flight))
+            events.append(('start', request.method, request.path))
+            if request.method == 'PUT':
+                bodies[request.path] = request.environ['wsgi.input'].read()
+            eventlet.sleep(0.01)
+            in_flight.remove(request.path)
+            events.append(('end', request.method, request.path))
+            return resp_class()
+
+        @server.public
+        def _PUT(request):
+            if request.path.endswith('fails'):
+                return handle(request, swob.HTTPInternalServerError)
+            return handle(request, swob.HTTPCreated)
+
+        @server.public
+        def _POST(request):
+            return handle(request, swob.HTTPAccepted)
+
+        @server.public
+        def _DELETE(request):
+            return handle(request, swob.HTTPNoContent)
+
+        self.controller.replication_update_concurrency = 3
+        self.controller.replication_update_buffer_size = 5
+        self.controller.logger = mock.MagicMock()
+        body = (':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                ':UPDATES: START\r\n'
+                'PUT /a/c/o1\r\n'
+                'Content-Length: 1\r\n'
+                'X-Timestamp: 1364456113.00001\r\n'
+                '\r\n'
+                '1'
+                'DELETE /a/c/o2\r\n'
+                'X-Timestamp: 1364456113.00002\r\n'
+                '\r\n'
+                'PUT /a/c/o3\r\n'
+                'Content-Length: 7\r\n'
+                'X-Timestamp: 1364456113.00003\r\n'
+                '\r\n'
+                '1234567'
+                'PUT /a/c/o4\r\n'
+                'Content-Length: 4\r\n'
+                'X-Timestamp: 1364456113.00004\r\n'
+                '\r\n'
+                '1234'
+                'POST /a/c/o4\r\n'
+                'X-Timestamp: 1364456113.00005\r\n'
+                '\r\n')
+        with mock.patch.object(self.controller, 'PUT', _PUT), \
+                mock.patch.object(self.controller, 'POST', _POST), \
+                mock.patch.object(self.controller, 'DELETE', _DELETE):
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                body=body)
+            resp = req.get_response(self.controller)
+            self.assertEqual(
+                self.body_lines(resp.body),
+                [':MISSING_CHECK: START', ':MISSING_CHECK: END',
+                 ':UPDATES: START', ':UPDATES: END'])
+        self.assertEqual(resp.status_int, 200)
+        self.assertFalse(self.controller.logger.exception.called)
+        self.assertFalse(self.controller.logger.error.called)
+        self.assertFalse(in_flight)
+        self.assertEqual(3, max_in_flight[0])
+        self.assertEqual(10, len(events))
+        self.assertEqual({'/device/partition/a/c/o1': '1',
+                          '/device/partition/a/c/o3': '1234567',
+                          '/device/partition/a/c/o4': '1234'}, bodies)
+        # subrequests for the same object are committed in order
+        self.assertLess(
+            events.index(('end', 'PUT', '/device/partition/a/c/o4')),
+            events.index(('start', 'POST', '/device/partition/a/c/o4')))
+
+        # failures are still counted
+        with mock.patch.object(self.controller, 'PUT', _PUT):
+            req = swob.Request.blank(
+                '/device/partition',
+                environ={'REQUEST_METHOD': 'SSYNC'},
+                body=':MISSING_CHECK: START\r\n:MISSING_CHECK: END\r\n'
+                     ':UPDATES: START\r\n'
+                     'PUT /a/c/fails\r\n'
+                     'Content-Length: 1\r\n'
+                     'X-Timestamp: 1364456113.00001\r\n'
+                     '\r\n'
+                     '1'
+                     'PUT /a/c/works\r\n'
+                     'Content-Length: 1\r\n'
+                     'X-Timestamp: 1364456113.00001\r\n'
+                     '\r\n'
+                     '1')
+            resp = req.get_response(self.controller)
+            self.assertEqual(
+                self.body_lines(resp.body),
+                [':MISSING_CHECK: START', ':MISSING_CHECK: END',
+                 ":ERROR: 500 'ERROR: With :UPDATES: 1 failures to 1 "
+                 "successes'"])
+        self.assertEqual(1, self.controller.logger.warning.call_count)
+
     def test_UPDATES_subreq_does_not_read_all(self):
         # This tests that if a SSYNC subrequest fails and doesn't read
         # all the subrequest body that it will read and throw away the rest of
@@ -224,6 +224,37 @@ class TestSender(BaseTest):
                                  method_name, mock_method.mock_calls,
                                  expected_calls))
 
+    def test_connect_digests(self):
+        node = dict(replication_ip='1.2.3.4', replication_port=5678,
+                    device='sda1', index=0)
+        job = dict(partition='9', policy=POLICIES[1])
+
+        def do_connect(threshold, header):
+            self.daemon.ssync_digest_threshold = threshold
+            self.sender = ssync_sender.Sender(self.daemon, node, job, None)
+            self.sender.suffixes = ['abc']
+            with mock.patch('swift.obj.ssync_sender.bufferedhttp.'
+                            'BufferedHTTPConnection') as mock_conn_class:
+                mock_conn = mock_conn_class.return_value
+                mock_resp = mock.MagicMock()
+                mock_resp.status = 200
+                mock_resp.getheader.return_value = header
+                mock_conn.getresponse.return_value = mock_resp
+                self.sender.connect()
+            return mock_resp
+
+        mock_resp = do_connect(10, 'true')
+        self.assertTrue(self.sender.use_digests)
+        mock_resp.getheader.assert_called_once_with(
+            'X-Backend-Ssync-Digests', '')
+        # old receiver
+        do_connect(10, '')
+        self.assertFalse(self.sender.use_digests)
+        # digests not enabled
+        mock_resp = do_connect(0, 'true')
+        self.assertFalse(self.sender.use_digests)
+        self.assertFalse(mock_resp.getheader.called)
+
     def test_connect_handoff(self):
         node = dict(replication_ip='1.2.3.4', replication_port=5678,
                     device='sda1')
@@ -803,6 +834,70 @@ class TestSender(BaseTest):
                             ts_ctype=Timestamp(1380144474.44448)))]
         self.assertEqual(self.sender.available_map, dict(candidates))
 
+    def test_send_digests(self):
+        self.daemon.ssync_digest_threshold = 2
+        self.sender.suffixes = ['def', 'abc']
+        entries = [
+            ('a0' + 'x' * 30, 'a0x 1'),
+            ('a0' + 'y' * 30, 'a0y 1'),
+            ('a1' + 'z' * 30, 'a1z 1'),
+            ('b0' + 'z' * 30, 'b0z 1'),
+        ]
+        self.sender.connection = FakeConnection()
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':DIGESTS: START\r\n'
+                'a\r\n'
+                ':DIGESTS: END\r\n'))
+        self.sender.send_digests(entries)
+        msg = (':DIGESTS: START abc,def\r\n'
+               'a %s\r\n'
+               ':DIGESTS: END\r\n' % ssync_sender.digest_missing(
+                   ['a0x 1', 'a0y 1', 'a1z 1']))
+        # the small range is offered line by line; the range that does not
+        # match is split into ranges small enough to be offered line by line
+        self.assertEqual(
+            ['7\r\nb0z 1\r\n\r\n',
+             '%x\r\n%s\r\n' % (len(msg), msg),
+             '7\r\na0x 1\r\n\r\n',
+             '7\r\na0y 1\r\n\r\n',
+             '7\r\na1z 1\r\n\r\n'],
+            self.sender.connection.sent)
+
+    def test_send_digests_in_sync(self):
+        self.daemon.ssync_digest_threshold = 2
+        self.sender.suffixes = ['abc']
+        entries = [
+            ('a0' + 'x' * 30, 'a0x 1'),
+            ('a0' + 'y' * 30, 'a0y 1'),
+            ('a1' + 'z' * 30, 'a1z 1'),
+        ]
+        self.sender.connection = FakeConnection()
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':DIGESTS: START\r\n'
+                ':DIGESTS: END\r\n'))
+        self.sender.send_digests(entries)
+        self.assertEqual(1, len(self.sender.connection.sent))
+        self.assertIn(':DIGESTS: END', self.sender.connection.sent[0])
+
+    def test_send_digests_unexpected_response(self):
+        self.daemon.ssync_digest_threshold = 2
+        self.sender.suffixes = ['abc']
+        entries = [
+            ('a0' + 'x' * 30, 'a0x 1'),
+            ('a0' + 'y' * 30, 'a0y 1'),
+            ('a1' + 'z' * 30, 'a1z 1'),
+        ]
+        self.sender.connection = FakeConnection()
+        self.sender.response = FakeResponse(
+            chunk_body=':MISSING_CHECK: START\r\n')
+        with self.assertRaises(exceptions.ReplicationException) as cm:
+            self.sender.send_digests(entries)
+        self.assertEqual(
+            "Unexpected response: ':MISSING_CHECK: START'",
+            str(cm.exception))
+
     def test_missing_check_far_end_disconnect(self):
         def yield_hashes(device, partition, policy, suffixes=None, **kwargs):
             if (device == 'dev' and partition == '9' and
@@ -1420,6 +1515,63 @@ class TestSender(BaseTest):
             'X-Timestamp: 1381679759.90941\r\n'
             '\r\n\r\n')
 
+    def test_send_delete_batched(self):
+        self.sender.connection = FakeConnection()
+        self.sender.daemon.ssync_batch_size = 100
+        delete = ('DELETE /a/c/o%d\r\n'
+                  'X-Timestamp: 1381679759.90941\r\n'
+                  '\r\n')
+        for i in range(2):
+            self.sender.send_delete('/a/c/o%d' % i,
+                                    utils.Timestamp('1381679759.90941'))
+        # the batch is not full yet
+        self.assertEqual([], self.sender.connection.sent)
+        self.sender.send_delete('/a/c/o2',
+                                utils.Timestamp('1381679759.90941'))
+        self.assertEqual(
+            ['93\r\n%s%s%s\r\n' % (delete % 0, delete % 1, delete % 2)],
+            self.sender.connection.sent)
+        self.assertEqual([], self.sender.batch)
+        self.assertEqual(0, self.sender.batch_len)
+        # nothing left to send
+        self.sender.send_batch()
+        self.assertEqual(1, len(self.sender.connection.sent))
+
+    def test_send_batch_timeout(self):
+        self.sender.connection = FakeConnection()
+        self.sender.connection.send = lambda d: eventlet.sleep(1)
+        self.sender.daemon.node_timeout = 0.01
+        self.sender.daemon.ssync_batch_size = 100
+        self.sender.send_delete('/a/c/o',
+                                utils.Timestamp('1381679759.90941'))
+        with self.assertRaises(exceptions.MessageTimeout) as cm:
+            self.sender.send_batch()
+        self.assertEqual(str(cm.exception), '0.01 seconds: send_batch')
+
+    def test_updates_sends_batch(self):
+        self.sender.connection = FakeConnection()
+        self.sender.daemon.ssync_batch_size = 100
+        self.sender.job = {
+            'device': 'dev',
+            'partition': '9',
+            'policy': POLICIES.legacy,
+        }
+        self.sender.send_delete('/a/c/o',
+                                utils.Timestamp('1381679759.90941'))
+        self.sender.response = FakeResponse(
+            chunk_body=(
+                ':UPDATES: START\r\n'
+                ':UPDATES: END\r\n'))
+        self.sender.updates()
+        self.assertEqual(
+            ''.join(self.sender.connection.sent),
+            '11\r\n:UPDATES: START\r\n\r\n'
+            '30\r\n'
+            'DELETE /a/c/o\r\n'
+            'X-Timestamp: 1381679759.90941\r\n'
+            '\r\n\r\n'
+            'f\r\n:UPDATES: END\r\n\r\n')
+
     def test_send_put_initial_timeout(self):
         df = self._make_open_diskfile()
         df._disk_chunk_size = 2
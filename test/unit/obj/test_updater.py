@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import six.moves.cPickle as pickle
+import json
 import mock
 import os
 import unittest
@@ -106,6 +107,10 @@ class TestObjectUpdater(unittest.TestCase):
         self.assertEqual(daemon.interval, 300)
         self.assertEqual(daemon.concurrency, 1)
         self.assertEqual(daemon.max_objects_per_second, 50.0)
+        self.assertEqual(daemon.concurrency_per_device, 1)
+        self.assertEqual(daemon.updates_per_batch, 1)
+        self.assertEqual(daemon.max_objects_per_container_per_second, 0)
+        self.assertEqual(daemon.max_deferred_updates, 10000)
 
         # non-defaults
         conf = {
@@ -115,6 +120,10 @@ class TestObjectUpdater(unittest.TestCase):
             'interval': '600',
             'concurrency': '2',
             'objects_per_second': '10.5',
+            'concurrency_per_device': '4',
+            'updates_per_batch': '50',
+            'max_objects_per_container_per_second': '2.5',
+            'max_deferred_updates': '100',
         }
         daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
         self.assertEqual(daemon.devices, '/some/where/else')
@@ -123,6 +132,10 @@ class TestObjectUpdater(unittest.TestCase):
         self.assertEqual(daemon.interval, 600)
         self.assertEqual(daemon.concurrency, 2)
         self.assertEqual(daemon.max_objects_per_second, 10.5)
+        self.assertEqual(daemon.concurrency_per_device, 4)
+        self.assertEqual(daemon.updates_per_batch, 50)
+        self.assertEqual(daemon.max_objects_per_container_per_second, 2.5)
+        self.assertEqual(daemon.max_deferred_updates, 100)
 
         # check deprecated option
         daemon = object_updater.ObjectUpdater({'slowdown': '0.04'},
@@ -139,6 +152,8 @@ class TestObjectUpdater(unittest.TestCase):
         check_bad({'concurrency': '1.0'})
         check_bad({'slowdown': 'baz'})
         check_bad({'objects_per_second': 'quux'})
+        check_bad({'concurrency_per_device': '1.5'})
+        check_bad({'updates_per_batch': 'many'})
 
     @mock.patch('os.listdir')
     def test_listdir_with_exception(self, mock_listdir):
@@ -1121,6 +1136,222 @@ class TestObjectUpdater(unittest.TestCase):
             daemon.logger.get_increment_counts())
         self.assertFalse(os.listdir(async_dir))  # no async file
 
+    def _write_async_updates(self, daemon, policy, objs, container='c'):
+        dfmanager = DiskFileManager(daemon.conf, daemon.logger)
+        timestamps = {}
+        for obj in objs:
+            ts = timestamps[obj] = next(self.ts_iter)
+            headers_out = {
+                'x-size': 0,
+                'x-content-type': 'text/plain',
+                'x-etag': 'd41d8cd98f00b204e9800998ecf8427e',
+                'x-timestamp': ts.internal,
+                'X-Backend-Storage-Policy-Index': int(policy),
+                'User-Agent': 'object-server %s' % os.getpid()}
+            data = {'op': 'PUT', 'account': 'a', 'container': container,
+                    'obj': obj, 'headers': headers_out}
+            dfmanager.pickle_async_update(self.sda1, 'a', container, obj,
+                                          data, ts, policy)
+        return timestamps
+
+    def _iter_async_files(self, policy):
+        async_dir = os.path.join(self.sda1, get_async_dir(policy))
+        for prefix in os.listdir(async_dir):
+            prefix_dir = os.path.join(async_dir, prefix)
+            for name in os.listdir(prefix_dir):
+                yield os.path.join(prefix_dir, name)
+
+    def test_obj_put_async_updates_batched(self):
+        policy = random.choice(list(POLICIES))
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'updates_per_batch': '10',
+            'concurrency_per_device': '2',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        timestamps = self._write_async_updates(
+            daemon, policy, ['o1', 'o2', 'o3'])
+        sent = []
+
+        def capture_send(conn, data):
+            sent.append(json.loads(data))
+
+        with mocked_http_conn(202, 202, 202,
+                              give_send=capture_send) as conn:
+            with mock.patch('swift.obj.updater.dump_recon_cache'):
+                daemon.run_once()
+        self.assertEqual([('UPDATE', '/sda1/0/a/c')] * 3,
+                         [(req['method'], req['path'])
+                          for req in conn.requests])
+        for req in conn.requests:
+            self.assertEqual('true',
+                             req['headers']['X-Backend-Accept-Redirect'])
+            self.assertEqual(str(int(policy)),
+                             req['headers']['X-Backend-Storage-Policy-Index'])
+            self.assertEqual(timestamps['o1'].internal,
+                             req['headers']['X-Timestamp'])
+        expected = [{'name': obj, 'created_at': timestamps[obj].internal,
+                     'size': 0, 'content_type': 'text/plain',
+                     'etag': 'd41d8cd98f00b204e9800998ecf8427e',
+                     'deleted': 0, 'storage_policy_index': int(policy),
+                     'ctype_timestamp': None, 'meta_timestamp': None}
+                    for obj in ('o1', 'o2', 'o3')]
+        for body in sent:
+            self.assertEqual(expected,
+                             sorted(body, key=lambda r: r['name']))
+        self.assertEqual(
+            {'successes': 3, 'unlinks': 3, 'async_pendings': 3},
+            daemon.logger.get_increment_counts())
+        self.assertFalse(list(self._iter_async_files(policy)))
+
+    def test_obj_put_async_updates_batch_partial_failure(self):
+        policy = random.choice(list(POLICIES))
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'updates_per_batch': '10',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self._write_async_updates(daemon, policy, ['o1', 'o2'])
+        with mocked_http_conn(500, 202, Timeout()) as conn:
+            with mock.patch('swift.obj.updater.dump_recon_cache'):
+                daemon.run_once()
+        self.assertEqual(['UPDATE'] * 3,
+                         [req['method'] for req in conn.requests])
+        self.assertEqual(
+            {'failures': 2, 'async_pendings': 2},
+            daemon.logger.get_increment_counts())
+        # the successes are remembered...
+        async_files = list(self._iter_async_files(policy))
+        self.assertEqual(2, len(async_files))
+        for async_file in async_files:
+            with open(async_file, 'rb') as fd:
+                self.assertEqual([1], pickle.load(fd)['successes'])
+
+        # ... so next time the batch only goes to the nodes that failed
+        daemon.logger.clear()
+        with mocked_http_conn(202, 202) as conn:
+            with mock.patch('swift.obj.updater.dump_recon_cache'):
+                daemon.run_once()
+        self.assertEqual(['127.0.0.1:1/sda1/0/a/c'] * 2,
+                         ['%(ip)s:%(port)s%(path)s' % req
+                          for req in conn.requests])
+        self.assertEqual(
+            {'successes': 2, 'unlinks': 2},
+            daemon.logger.get_increment_counts())
+        self.assertFalse(list(self._iter_async_files(policy)))
+
+    def test_obj_put_async_updates_batch_refused(self):
+        policy = random.choice(list(POLICIES))
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'updates_per_batch': '10',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self._write_async_updates(daemon, policy, ['o1', 'o2'])
+        # e.g. the container has shard ranges or doesn't support UPDATE, so
+        # the updates are sent individually to the nodes that refused them
+        with mocked_http_conn(412, 202, 405, 201, 201, 201, 201) as conn:
+            with mock.patch('swift.obj.updater.dump_recon_cache'):
+                daemon.run_once()
+        self.assertEqual(['UPDATE'] * 3 + ['PUT'] * 4,
+                         [req['method'] for req in conn.requests])
+        self.assertEqual(
+            ['/sda1/0/a/c/o1', '/sda1/0/a/c/o1', '/sda1/0/a/c/o2',
+             '/sda1/0/a/c/o2'],
+            sorted(req['path'] for req in conn.requests[3:]))
+        self.assertEqual(
+            {'successes': 2, 'unlinks': 2, 'async_pendings': 2},
+            daemon.logger.get_increment_counts())
+        self.assertFalse(list(self._iter_async_files(policy)))
+
+    def _run_rate_limited(self, daemon, num_requests):
+        now = [time()]
+        sleeps = []
+
+        def fake_sleep(delay):
+            sleeps.append(delay)
+            now[0] += delay
+
+        with mocked_http_conn(*[201] * num_requests) as conn, \
+                mock.patch('swift.obj.updater.dump_recon_cache'), \
+                mock.patch('swift.obj.updater.time.time',
+                           side_effect=lambda: now[0]), \
+                mock.patch('swift.obj.updater.sleep', fake_sleep):
+            daemon.run_once()
+        return conn.requests, sleeps
+
+    def test_obj_put_async_updates_per_container_rate_limit(self):
+        policy = random.choice(list(POLICIES))
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'max_objects_per_container_per_second': '1',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self._write_async_updates(daemon, policy, ['o1', 'o2', 'o3'])
+        self._write_async_updates(daemon, policy, ['o4'], container='c2')
+        requests, sleeps = self._run_rate_limited(daemon, 12)
+        # one update for each container straight away, the rest of the
+        # updates for the busy container are paced at the end of the sweep
+        paths = [req['path'].split('/', 3)[3] for req in requests]
+        self.assertEqual(['a/c2/o4'] * 3, [p for p in paths if 'c2' in p])
+        container_paths = [p for p in paths if 'c2' not in p]
+        self.assertEqual(9, len(container_paths))
+        self.assertEqual(['a/c/o1', 'a/c/o2', 'a/c/o3'],
+                         sorted(set(container_paths)))
+        self.assertEqual([1, 1], sleeps)
+        self.assertEqual(
+            {'successes': 4, 'unlinks': 4, 'deferrals': 2,
+             'async_pendings': 4},
+            daemon.logger.get_increment_counts())
+        self.assertFalse(list(self._iter_async_files(policy)))
+
+    def test_obj_put_async_updates_max_deferred_updates(self):
+        policy = random.choice(list(POLICIES))
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'max_objects_per_container_per_second': '1',
+            'max_deferred_updates': '1',
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self._write_async_updates(daemon, policy, ['o1', 'o2', 'o3'])
+        requests, sleeps = self._run_rate_limited(daemon, 6)
+        # only one deferred update is held, the other is left for later
+        self.assertEqual([1], sleeps)
+        self.assertEqual(
+            {'successes': 2, 'unlinks': 2, 'deferrals': 2, 'skips': 1,
+             'async_pendings': 3},
+            daemon.logger.get_increment_counts())
+        self.assertEqual(1, len(list(self._iter_async_files(policy))))
+
+    def test_object_sweep_dumps_recon(self):
+        policy = random.choice(list(POLICIES))
+        conf = {
+            'devices': self.devices_dir,
+            'mount_check': 'false',
+            'swift_dir': self.testdir,
+            'recon_cache_path': self.testdir,
+        }
+        daemon = object_updater.ObjectUpdater(conf, logger=self.logger)
+        self._write_async_updates(daemon, policy, ['o1', 'o2', 'o3'])
+        with mocked_http_conn(*([201] * 3 + [500] * 6)), \
+                mock.patch('swift.obj.updater.dump_recon_cache') as mock_dump:
+            daemon.object_sweep(self.sda1)
+        self.assertEqual(1, mock_dump.call_count)
+        stats = mock_dump.call_args[0][0]['object_updater_stats']['sda1']
+        self.assertEqual(2, stats['backlog'])
+        self.assertGreater(stats['drain_rate'], 0)
+        self.assertIn('sweep_time', stats)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import itertools
+import time
 import json
 from collections import defaultdict
 import unittest
@@ -21,7 +22,8 @@ import mock
 from swift.proxy.controllers.base import headers_to_container_info, \
     headers_to_account_info, headers_to_object_info, get_container_info, \
     get_cache_key, get_account_info, get_info, get_object_info, \
-    Controller, GetOrHeadHandler, bytes_to_skip
+    Controller, GetOrHeadHandler, bytes_to_skip, clear_info_cache, \
+    headers_from_container_info, prefetch_info, LocalInfoCache
 from swift.common.swob import Request, HTTPException, RESPONSE_REASONS
 from swift.common import exceptions
 from swift.common.utils import split_path, ShardRange, Timestamp
@@ -377,6 +379,30 @@ class TestFuncs(unittest.TestCase):
         self.assertEqual(resp['status'], 404)
         self.assertEqual(resp['versions'], "\xe1\xbd\x8a\x39")
 
+    def test_get_cache_key(self):
+        self.assertEqual('account/a', get_cache_key('a'))
+        self.assertEqual('container/a/c', get_cache_key('a', 'c'))
+        self.assertEqual('object/a/c/o', get_cache_key('a', 'c', 'o'))
+        self.assertEqual('shard-listing/a/c',
+                         get_cache_key('a', 'c', shard='listing'))
+        self.assertEqual('shard-updating/a/c',
+                         get_cache_key('a', 'c', shard='updating'))
+        self.assertRaises(ValueError, get_cache_key, None, 'c')
+        self.assertRaises(ValueError, get_cache_key, 'a', None, 'o')
+
+    def test_clear_info_cache_clears_shard_ranges(self):
+        memcache = FakeMemcache()
+        keys = [get_cache_key('a', 'c'),
+                get_cache_key('a', 'c', shard='listing'),
+                get_cache_key('a', 'c', shard='updating')]
+        for key in keys:
+            memcache.set(key, 'cached')
+        env = {'swift.cache': memcache,
+               'swift.infocache': dict((key, 'cached') for key in keys)}
+        clear_info_cache(None, env, 'a', 'c')
+        self.assertEqual({}, env['swift.infocache'])
+        self.assertEqual({}, memcache.store)
+
     def test_get_container_info_env(self):
         cache_key = get_cache_key("account", "cont")
         req = Request.blank(
@@ -386,6 +412,133 @@ class TestFuncs(unittest.TestCase):
         resp = get_container_info(req.environ, 'xxx')
         self.assertEqual(resp['bytes'], 3867)
 
+    def test_prefetch_info(self):
+        account_key = get_cache_key('account')
+        container_key = get_cache_key('account', 'cont')
+        cache = FakeCache(**{
+            account_key: {'status': 200, 'bytes': 3333,
+                          'meta': {'color': u'\u1F4A9'}},
+            container_key: {'status': 200, 'object_count': 10}})
+        req = Request.blank('/v1/account/cont/obj',
+                            environ={'swift.cache': cache})
+        with mock.patch.object(cache, 'get_many',
+                               wraps=cache.get_many) as mock_get_many, \
+                mock.patch.object(cache, 'get',
+                                  wraps=cache.get) as mock_get:
+            prefetch_info(req.environ, FakeApp())
+            self.assertEqual([mock.call([account_key, container_key])],
+                             mock_get_many.call_args_list)
+            # everything needed is now in the request's infocache
+            mock_get.reset_mock()
+            app = FakeApp()
+            account_info = get_account_info(req.environ, app)
+            container_info = get_container_info(req.environ, app)
+            self.assertFalse(mock_get.called)
+        self.assertEqual([], app.captured_envs)
+        self.assertEqual(3333, account_info['bytes'])
+        self.assertEqual({'color': '\xe1\xbd\x8a\x39'},
+                         account_info['meta'])
+        self.assertEqual(10, container_info['object_count'])
+
+        # nothing more is fetched once it's all in infocache
+        with mock.patch.object(cache, 'get_many') as mock_get_many:
+            prefetch_info(req.environ, FakeApp())
+        self.assertFalse(mock_get_many.called)
+
+    def test_prefetch_info_miss(self):
+        req = Request.blank('/v1/account', environ={
+            'swift.cache': FakeCache()})
+        prefetch_info(req.environ, FakeApp())
+        self.assertEqual({}, req.environ['swift.infocache'])
+        # the info is fetched as usual on a memcache miss
+        resp = get_account_info(req.environ, FakeApp())
+        self.assertEqual(resp['bytes'], 6666)
+
+    def test_local_info_cache(self):
+        logger = FakeLogger()
+        cache = LocalInfoCache(maxsize=2, maxtime=10, logger=logger)
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            self.assertIsNone(cache.get('account/a'))
+            cache.set('account/a', {'status': 200, 'meta': {'k': 'v'}})
+            cache.set('container/a/c', {'status': 404})
+            info = cache.get('account/a')
+            self.assertEqual({'status': 200, 'meta': {'k': 'v'}}, info)
+            # callers get their own copy
+            info['meta']['k'] = 'x'
+            self.assertEqual({'k': 'v'}, cache.get('account/a')['meta'])
+            self.assertEqual({'status': 404}, cache.get('container/a/c'))
+        self.assertEqual({'account_info.local_cache.hit': 2,
+                          'account_info.local_cache.miss': 1,
+                          'container_info.local_cache.hit': 1},
+                         logger.get_increment_counts())
+
+        # not found is cached for a tenth of the time
+        with mock.patch('time.time', return_value=now + 1.5):
+            self.assertIsNone(cache.get('container/a/c'))
+            self.assertIsNotNone(cache.get('account/a'))
+        with mock.patch('time.time', return_value=now + 10.5):
+            self.assertIsNone(cache.get('account/a'))
+
+        # it is bounded
+        with mock.patch('time.time', return_value=now):
+            for i in range(3):
+                cache.set('account/a%d' % i, {'status': 200})
+            self.assertIsNone(cache.get('account/a0'))
+            self.assertIsNotNone(cache.get('account/a2'))
+            cache.delete('account/a2')
+            self.assertIsNone(cache.get('account/a2'))
+
+        # a zero time disables it
+        cache = LocalInfoCache(maxtime=0, logger=logger)
+        cache.set('account/a', {'status': 200})
+        logger.clear()
+        self.assertIsNone(cache.get('account/a'))
+        self.assertEqual({}, logger.get_increment_counts())
+
+    def test_get_info_uses_local_info_cache(self):
+        local_cache = LocalInfoCache(maxtime=10)
+        memcache = FakeMemcache()
+        with mock.patch('swift.proxy.controllers.base._local_info_cache',
+                        local_cache):
+            # the first request fills memcache and the local cache
+            req = Request.blank('/v1/a/c', environ={'swift.cache': memcache})
+            resp = get_container_info(req.environ, FakeApp())
+            self.assertEqual(resp['bytes'], 6666)
+            self.assertIsNotNone(local_cache.get(get_cache_key('a')))
+            self.assertIsNotNone(local_cache.get(get_cache_key('a', 'c')))
+
+            # later requests are served without going to memcache
+            app = FakeApp()
+            with mock.patch.object(memcache, 'get') as mock_get:
+                req = Request.blank('/v1/a/c',
+                                    environ={'swift.cache': memcache})
+                resp = get_container_info(req.environ, app)
+                self.assertEqual(resp['bytes'], 6666)
+                resp = get_account_info(req.environ, app)
+                self.assertEqual(resp['bytes'], 6666)
+                req = Request.blank('/v1/a/c',
+                                    environ={'swift.cache': memcache})
+                prefetch_info(req.environ, app)
+                self.assertIn(get_cache_key('a', 'c'),
+                              req.environ['swift.infocache'])
+            self.assertFalse(mock_get.called)
+            self.assertEqual([], app.captured_envs)
+
+            # clearing the info cache also clears the local cache
+            clear_info_cache(None, {'swift.cache': memcache}, 'a', 'c')
+            self.assertIsNone(local_cache.get(get_cache_key('a', 'c')))
+            self.assertIsNotNone(local_cache.get(get_cache_key('a')))
+
+            # and a memcache hit fills it again
+            memcache.set(get_cache_key('a', 'c'),
+                         {'status': 200, 'bytes': 1234})
+            req = Request.blank('/v1/a/c', environ={'swift.cache': memcache})
+            resp = get_container_info(req.environ, FakeApp())
+            self.assertEqual(resp['bytes'], 1234)
+            self.assertEqual(
+                1234, local_cache.get(get_cache_key('a', 'c'))['bytes'])
+
     def test_get_account_info_swift_source(self):
         app = FakeApp()
         req = Request.blank("/v1/a", environ={'swift.cache': FakeCache()})
@@ -556,6 +709,30 @@ class TestFuncs(unittest.TestCase):
         self.assertEqual(resp['sysmeta']['whatevs'], 14)
         self.assertEqual(resp['sysmeta']['somethingelse'], 0)
 
+    def test_headers_from_container_info(self):
+        self.assertIsNone(headers_from_container_info(None))
+        self.assertIsNone(headers_from_container_info(
+            headers_to_container_info({}, 404)))
+        headers = {
+            'X-Backend-Timestamp': Timestamp(1).internal,
+            'X-Backend-PUT-Timestamp': Timestamp(2).internal,
+            'X-Backend-Storage-Policy-Index': '1',
+            'X-Backend-Sharding-State': 'sharded',
+            'X-Container-Object-Count': '10',
+            'X-Container-Bytes-Used': '100',
+            'X-Container-Read': 'readvalue',
+            'X-Container-Meta-Flavour': 'peach',
+            get_sys_meta_prefix('container') + 'Whatevs': '14',
+        }
+        info = headers_to_container_info(headers.items(), 200)
+        # info cached by an older proxy can't be used
+        self.assertIsNone(headers_from_container_info(
+            dict(info, created_at=None)))
+        actual = headers_from_container_info(info)
+        self.assertEqual(Timestamp(1).normal, actual['X-Timestamp'])
+        self.assertEqual(Timestamp(2).normal, actual['X-PUT-Timestamp'])
+        self.assertEqual(info, headers_to_container_info(actual.items(), 200))
+
     def test_headers_to_container_info_values(self):
         headers = {
             'x-container-read': 'readvalue',
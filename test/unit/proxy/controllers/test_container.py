@@ -500,6 +500,9 @@ class TestContainerController(TestRingBase):
             if k.lower().startswith('x-container-meta'):
                 self.assertEqual(v, resp.headers[k])
         # check that info cache is correct for root container
+        for k in ('X-Backend-Timestamp', 'X-Backend-PUT-Timestamp'):
+            if k in resp.headers:
+                info_hdrs[k] = resp.headers[k]
         info = get_container_info(resp.request.environ, self.app)
         self.assertEqual(headers_to_container_info(info_hdrs), info)
 
@@ -1245,6 +1248,118 @@ class TestContainerController(TestRingBase):
         # root object count will overridden by actual length of listing
         self.check_response(resp, root_resp_hdrs)
 
+    def test_GET_sharded_container_shard_ranges_cached(self):
+        shard_bounds = (('', 'ham'), ('ham', 'pie'), ('pie', ''))
+        shard_ranges = [
+            ShardRange('.shards_a/c_%s' % upper, Timestamp.now(), lower, upper)
+            for lower, upper in shard_bounds]
+        sr_dicts = [dict(sr) for sr in shard_ranges]
+        sr_objs = [self._make_shard_objects(sr) for sr in shard_ranges]
+        shard_resp_hdrs = [
+            {'X-Backend-Sharding-State': 'unsharded',
+             'X-Container-Object-Count': len(sr_objs[i]),
+             'X-Container-Bytes-Used':
+                 sum([obj['bytes'] for obj in sr_objs[i]]),
+             'X-Container-Meta-Flavour': 'flavour%d' % i,
+             'X-Backend-Storage-Policy-Index': 0}
+            for i in range(3)]
+        all_objects = sr_objs[0] + sr_objs[1] + sr_objs[2]
+        root_resp_hdrs = {'X-Backend-Sharding-State': 'sharded',
+                          'X-Backend-Timestamp': Timestamp(1).internal,
+                          'X-Backend-PUT-Timestamp': Timestamp(2).internal,
+                          'X-Container-Object-Count': len(all_objects),
+                          'X-Container-Bytes-Used':
+                              sum([obj['bytes'] for obj in all_objects]),
+                          'X-Container-Meta-Flavour': 'peach',
+                          'X-Backend-Storage-Policy-Index': 0}
+        root_shard_resp_hdrs = dict(root_resp_hdrs)
+        root_shard_resp_hdrs['X-Backend-Record-Type'] = 'shard'
+        root_shard_resp_hdrs['X-Backend-Override-Shard-Name-Filter'] = 'true'
+        limit = CONTAINER_LISTING_LIMIT
+        cache_key = 'shard-listing/a/c'
+
+        # the root returns all its shard ranges, which are cached, but the
+        # listing only uses those that match the marker
+        mock_responses = [
+            # status, body, headers
+            (200, sr_dicts, root_shard_resp_hdrs),
+            (200, sr_objs[1][1:], shard_resp_hdrs[1]),
+            (200, sr_objs[2], shard_resp_hdrs[2])
+        ]
+        expected_requests = [
+            # path, headers, params
+            ('a/c', {'X-Backend-Record-Type': 'auto',
+                     'X-Backend-Override-Shard-Name-Filter': 'sharded'},
+             dict(states='listing', marker='i')),  # 200
+            (shard_ranges[1].name, {'X-Backend-Record-Type': 'auto'},
+             dict(marker='i', end_marker='pie\x00', states='listing',
+                  limit=str(limit))),  # 200
+            (shard_ranges[2].name, {'X-Backend-Record-Type': 'auto'},
+             dict(marker='p', end_marker='', states='listing',
+                  limit=str(limit - len(sr_objs[1][1:])))),  # 200
+        ]
+        resp = self._check_GET_shard_listing(
+            mock_responses, sr_objs[1][1:] + sr_objs[2], expected_requests,
+            query_string='?marker=i')
+        self.check_response(resp, root_resp_hdrs)
+        self.assertEqual(sr_dicts, self.app.memcache.get(cache_key))
+        self.assertNotIn('X-Backend-Override-Shard-Name-Filter', resp.headers)
+
+        # now the root isn't asked for the shard ranges
+        mock_responses = [
+            # status, body, headers
+            (200, sr_objs[0], shard_resp_hdrs[0]),
+            (200, sr_objs[1], shard_resp_hdrs[1]),
+            (200, sr_objs[2], shard_resp_hdrs[2])
+        ]
+        expected_requests = [
+            # path, headers, params
+            (shard_ranges[0].name, {'X-Backend-Record-Type': 'auto'},
+             dict(marker='', end_marker='ham\x00', states='listing',
+                  limit=str(limit))),  # 200
+            (shard_ranges[1].name, {'X-Backend-Record-Type': 'auto'},
+             dict(marker='h', end_marker='pie\x00', states='listing',
+                  limit=str(limit - len(sr_objs[0])))),  # 200
+            (shard_ranges[2].name, {'X-Backend-Record-Type': 'auto'},
+             dict(marker='p', end_marker='', states='listing',
+                  limit=str(limit - len(sr_objs[0] + sr_objs[1])))),  # 200
+        ]
+        resp = self._check_GET_shard_listing(
+            mock_responses, all_objects, expected_requests)
+        self.check_response(resp, root_resp_hdrs)
+        self.assertEqual(
+            1, self.logger.get_increment_counts()['shard_listing.cache.hit'])
+
+        # reverse listings filter the cached shard ranges too
+        mock_responses = [
+            # status, body, headers
+            (200, list(reversed(sr_objs[1])), shard_resp_hdrs[1]),
+            (200, list(reversed(sr_objs[0])), shard_resp_hdrs[0]),
+        ]
+        expected_requests = [
+            # path, headers, params
+            (shard_ranges[1].name, {'X-Backend-Record-Type': 'auto'},
+             dict(marker='j', end_marker='ham', states='listing',
+                  reverse='true', limit=str(limit))),  # 200
+            (shard_ranges[0].name, {'X-Backend-Record-Type': 'auto'},
+             dict(marker='i', end_marker='', states='listing',
+                  reverse='true',
+                  limit=str(limit - len(sr_objs[1])))),  # 200
+        ]
+        expected_objects = list(reversed(sr_objs[0] + sr_objs[1]))
+        self._check_GET_shard_listing(
+            mock_responses, expected_objects, expected_requests,
+            query_string='?marker=j&reverse=true', reverse=True)
+
+        # the cache is cleared when the container changes
+        req = Request.blank('/v1/a/c', method='POST')
+        with mocked_http_conn(*[204] * self.CONTAINER_REPLICAS) as fake_conn:
+            resp = req.get_response(self.app)
+        self.assertEqual(204, resp.status_int)
+        self.assertEqual(['POST'] * self.CONTAINER_REPLICAS,
+                         [r['method'] for r in fake_conn.requests])
+        self.assertIsNone(self.app.memcache.get(cache_key))
+
     def test_GET_sharded_container_shard_errors(self):
         self._check_GET_sharded_container_shard_error(404)
         self._check_GET_sharded_container_shard_error(500)
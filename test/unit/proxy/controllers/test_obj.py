@@ -2251,6 +2251,73 @@ class TestECObjController(ECObjectControllerMixin, unittest.TestCase):
         self.assertEqual(len(real_body), len(resp.body))
         self.assertEqual(real_body, resp.body)
 
+    def test_GET_with_body_coding_in_threads(self):
+        policy_options = self.app.get_policy_options(self.policy)
+        policy_options.ec_coding_in_threads = True
+        policy_options.ec_segments_in_flight = 3
+        segment_size = self.policy.ec_segment_size
+        real_body = ('asdf' * segment_size)[:-10]
+        ec_archive_bodies = self._make_ec_archive_bodies(real_body)
+        responses = [(200, body, self._add_frag_index(i, {
+            'X-Object-Sysmeta-Ec-Content-Length': str(len(real_body))}))
+            for i, body in enumerate(ec_archive_bodies)]
+        responses = responses[:self.policy.ec_ndata]
+        status_codes, body_iter, headers = zip(*responses)
+        req = swift.common.swob.Request.blank('/v1/a/c/o')
+        with mock.patch('swift.proxy.controllers.obj.tpool.execute',
+                        wraps=obj.tpool.execute) as mock_execute, \
+                set_http_connect(*status_codes, body_iter=body_iter,
+                                 headers=headers):
+            resp = req.get_response(self.app)
+            self.assertEqual(resp.status_int, 200)
+            self.assertEqual(real_body, resp.body)
+        # four segments were decoded in at least two batches
+        self.assertTrue(2 <= mock_execute.call_count <= 4)
+        decoded = [fragment_sets for _func, _apply, fragment_sets
+                   in (c[0] for c in mock_execute.call_args_list)]
+        self.assertEqual(4, sum(len(batch) for batch in decoded))
+        self.assertTrue(all(len(batch) <= 3 for batch in decoded))
+        self.assertEqual(
+            mock_execute.call_count,
+            len(self.logger.log_dict['timing_since']))
+        self.assertEqual(
+            'policy.%d.ec_decode.timing' % int(self.policy),
+            self.logger.log_dict['timing_since'][0][0][0])
+
+    def test_PUT_with_body_coding_in_threads(self):
+        self.app.get_policy_options(self.policy).ec_coding_in_threads = True
+        segment_size = self.policy.ec_segment_size
+        test_body = ('asdf' * segment_size)[:-10]
+        req = swift.common.swob.Request.blank(
+            '/v1/a/c/o', method='PUT', body=test_body)
+        codes = [201] * self.replicas()
+        expect_headers = {
+            'X-Obj-Metadata-Footer': 'yes',
+            'X-Obj-Multiphase-Commit': 'yes'
+        }
+        put_bodies = defaultdict(str)
+
+        def capture_body(conn, chunk):
+            put_bodies[conn.connection_id] += chunk
+
+        with mock.patch('swift.proxy.controllers.obj.tpool.execute',
+                        wraps=obj.tpool.execute) as mock_execute, \
+                set_http_connect(*codes, expect_headers=expect_headers,
+                                 give_send=capture_body):
+            resp = req.get_response(self.app)
+        self.assertEqual(resp.status_int, 201)
+        # each full segment and the last partial one were encoded in threads
+        self.assertEqual(4, sum(len(c[0][2])
+                                for c in mock_execute.call_args_list))
+        self.assertEqual(
+            mock_execute.call_count,
+            len(self.logger.log_dict['timing_since']))
+        self.assertEqual(
+            'policy.%d.ec_encode.timing' % int(self.policy),
+            self.logger.log_dict['timing_since'][0][0][0])
+        # fragments were sent to every backend
+        self.assertEqual(self.replicas(), len(put_bodies))
+
     def test_PUT_simple(self):
         req = swift.common.swob.Request.blank('/v1/a/c/o', method='PUT',
                                               body='')
@@ -4240,6 +4307,39 @@ class TestECFunctions(unittest.TestCase):
         do_test(1)
         do_test(2)
 
+    def test_chunk_transformer_coding_in_threads(self):
+        segment_size = 1024
+        policy = ECStoragePolicy(0, 'ec8-2', ec_type=DEFAULT_TEST_EC_TYPE,
+                                 ec_ndata=8, ec_nparity=2,
+                                 object_ring=FakeRing(replicas=10),
+                                 ec_segment_size=segment_size)
+        orig_chunks = [chr(i + 97) * segment_size for i in range(3)]
+        expected = [''.join(frags) for frags in zip(*[
+            policy.pyeclib_driver.encode(chunk) for chunk in orig_chunks])]
+        logger = debug_logger()
+        coder = obj.ECCoder(policy, in_threads=True, logger=logger)
+
+        transform = obj.chunk_transformer(policy, coder=coder)
+        transform.send(None)
+        with mock.patch('swift.proxy.controllers.obj.tpool.execute',
+                        wraps=obj.tpool.execute) as mock_execute:
+            backend_chunks = transform.send(''.join(orig_chunks) + 'x')
+            self.assertEqual(expected, backend_chunks)
+            # all three segments were encoded with one hand off to a thread
+            self.assertEqual(1, mock_execute.call_count)
+            backend_chunks = transform.send('')
+            self.assertEqual(policy.pyeclib_driver.encode('x'),
+                             backend_chunks)
+            self.assertEqual(2, mock_execute.call_count)
+        self.assertEqual(['policy.0.ec_encode.timing'] * 2,
+                         [c[0][0] for c in logger.log_dict['timing_since']])
+
+        # errors are raised on the calling greenthread
+        with mock.patch.object(policy.pyeclib_driver, 'decode',
+                               side_effect=ECDriverError('kaboom')):
+            with self.assertRaises(ECDriverError):
+                coder.decode([['frag'] * 8])
+
 
 @patch_policies([ECStoragePolicy(0, name='ec', is_default=True,
                                  ec_type=DEFAULT_TEST_EC_TYPE, ec_ndata=10,
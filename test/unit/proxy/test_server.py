@@ -59,7 +59,8 @@ from test.unit.helpers import setup_servers, teardown_servers
 from swift.proxy import server as proxy_server
 from swift.proxy.controllers.obj import ReplicatedObjectController
 from swift.obj import server as object_server
-from swift.common.bufferedhttp import BufferedHTTPResponse
+from swift.common.bufferedhttp import BufferedHTTPResponse, \
+    BufferedHTTPConnectionPool, set_connection_pool, get_connection_pool
 from swift.common.middleware import proxy_logging, versioned_writes, \
     copy, listing_formats
 from swift.common.middleware.acl import parse_acl, format_acl
@@ -574,6 +575,23 @@ class TestProxyServer(unittest.TestCase):
         self.assertEqual(app.node_timeout, 3.5)
         self.assertEqual(app.recoverable_node_timeout, 1.5)
 
+    def test_creation_backend_keepalive(self):
+        try:
+            app = proxy_server.Application({'backend_keepalive': 'true'},
+                                           FakeMemcache(),
+                                           container_ring=FakeRing(),
+                                           account_ring=FakeRing())
+            pool = get_connection_pool()
+            self.assertIsInstance(pool, BufferedHTTPConnectionPool)
+            self.assertIs(app.logger, pool.logger)
+            # a later app without keepalive doesn't use the earlier pool
+            proxy_server.Application({}, FakeMemcache(),
+                                     container_ring=FakeRing(),
+                                     account_ring=FakeRing())
+            self.assertIsNone(get_connection_pool())
+        finally:
+            set_connection_pool(None)
+
     def test_get_object_ring(self):
         baseapp = proxy_server.Application({},
                                            FakeMemcache(),
@@ -732,6 +750,29 @@ class TestProxyServer(unittest.TestCase):
         finally:
             rmtree(swift_dir, ignore_errors=True)
 
+    def test_local_info_cache_conf(self):
+        logger = FakeLogger()
+        app = proxy_server.Application({}, FakeMemcache(), logger,
+                                       container_ring=FakeRing(),
+                                       account_ring=FakeRing())
+        self.assertEqual(0, app.local_info_cache.maxtime)
+        self.assertEqual(1000, app.local_info_cache.maxsize)
+        self.assertIs(logger, app.local_info_cache.logger)
+        self.assertIs(app.local_info_cache,
+                      proxy_base._local_info_cache)
+
+        app = proxy_server.Application({'local_info_cache_time': '2.5',
+                                        'local_info_cache_size': '10'},
+                                       FakeMemcache(),
+                                       container_ring=FakeRing(),
+                                       account_ring=FakeRing())
+        self.addCleanup(proxy_base.set_local_info_cache,
+                        proxy_base.LocalInfoCache())
+        self.assertEqual(2.5, app.local_info_cache.maxtime)
+        self.assertEqual(10, app.local_info_cache.maxsize)
+        self.assertIs(app.local_info_cache,
+                      proxy_base._local_info_cache)
+
     def test_node_timing(self):
         baseapp = proxy_server.Application({'sorting_method': 'timing'},
                                            FakeMemcache(),
@@ -1379,18 +1420,24 @@ class TestProxyServerConfigLoading(unittest.TestCase):
         write_affinity = r1
         write_affinity_node_count = 1 * replicas
         write_affinity_handoff_delete_count = 4
+        ec_coding_in_threads = true
+        ec_segments_in_flight = 4
         """
         expected_default = {"read_affinity": "",
                             "sorting_method": "shuffle",
                             "write_affinity": "",
                             "write_affinity_node_count_fn": 6,
-                            "write_affinity_handoff_delete_count": None}
+                            "write_affinity_handoff_delete_count": None,
+                            "ec_coding_in_threads": False,
+                            "ec_segments_in_flight": 1}
         exp_options = {None: expected_default,
                        POLICIES[0]: {"read_affinity": "r1=100",
                                      "sorting_method": "affinity",
                                      "write_affinity": "r1",
                                      "write_affinity_node_count_fn": 3,
-                                     "write_affinity_handoff_delete_count": 4},
+                                     "write_affinity_handoff_delete_count": 4,
+                                     "ec_coding_in_threads": True,
+                                     "ec_segments_in_flight": 4},
                        POLICIES[1]: expected_default}
         exp_is_local = {POLICIES[0]: [({'region': 1, 'zone': 2}, True),
                                       ({'region': 2, 'zone': 1}, False)],
@@ -1403,7 +1450,8 @@ class TestProxyServerConfigLoading(unittest.TestCase):
             "ProxyOverrideOptions({}, {'sorting_method': 'shuffle', "
             "'read_affinity': '', 'write_affinity': '', "
             "'write_affinity_node_count': '2 * replicas', "
-            "'write_affinity_handoff_delete_count': None})",
+            "'write_affinity_handoff_delete_count': None, "
+            "'ec_coding_in_threads': False, 'ec_segments_in_flight': 1})",
             repr(default_options))
         self.assertEqual(default_options, eval(repr(default_options), {
             'ProxyOverrideOptions': default_options.__class__}))
@@ -1413,7 +1461,8 @@ class TestProxyServerConfigLoading(unittest.TestCase):
             "ProxyOverrideOptions({}, {'sorting_method': 'affinity', "
             "'read_affinity': 'r1=100', 'write_affinity': 'r1', "
             "'write_affinity_node_count': '1 * replicas', "
-            "'write_affinity_handoff_delete_count': 4})",
+            "'write_affinity_handoff_delete_count': 4, "
+            "'ec_coding_in_threads': True, 'ec_segments_in_flight': 4})",
             repr(policy_0_options))
         self.assertEqual(policy_0_options, eval(repr(policy_0_options), {
             'ProxyOverrideOptions': policy_0_options.__class__}))
@@ -1802,6 +1851,20 @@ class TestProxyServerConfigLoading(unittest.TestCase):
         """
         do_test(conf_sections, '(default)')
 
+    def test_per_policy_conf_invalid_ec_segments_in_flight_value(self):
+        conf_sections = """
+        [app:proxy-server]
+        use = egg:swift#proxy
+
+        [proxy-server:policy:0]
+        ec_segments_in_flight = 0
+        """
+        with self.assertRaises(ValueError) as cm:
+            self._write_conf_and_load_app(conf_sections)
+        self.assertIn('Invalid ec_segments_in_flight value: 0',
+                      cm.exception.message)
+        self.assertIn('policy 0 (nulo)', cm.exception.message)
+
     def test_per_policy_conf_bad_section_name(self):
         def do_test(policy):
             conf_sections = """
@@ -2201,6 +2264,38 @@ class TestReplicatedObjectController(
         self.assertEqual(res.status_int, 200)
         self.assertEqual(res.body, obj)
 
+    @unpatch_policies
+    def test_PUT_GET_HEAD_with_backend_keepalive(self):
+        prosrv = _test_servers[0]
+        logger = debug_logger()
+        pool = BufferedHTTPConnectionPool(logger=logger)
+        set_connection_pool(pool)
+        try:
+            obj = 'keepalive' * 100
+            path = '/v1/a/c/o.keepalive'
+            for i in range(2):
+                req = Request.blank(path, environ={'REQUEST_METHOD': 'PUT'},
+                                    headers={'Content-Type': 'text/plain'},
+                                    body=obj)
+                res = req.get_response(prosrv)
+                self.assertEqual(res.status_int, 201)
+                req = Request.blank(path)
+                res = req.get_response(prosrv)
+                self.assertEqual(res.status_int, 200)
+                self.assertEqual(res.body, obj)
+                req = Request.blank(path, environ={'REQUEST_METHOD': 'HEAD'})
+                res = req.get_response(prosrv)
+                self.assertEqual(res.status_int, 200)
+                self.assertEqual(res.content_length, len(obj))
+                req = Request.blank(path + '.missing')
+                res = req.get_response(prosrv)
+                self.assertEqual(res.status_int, 404)
+        finally:
+            set_connection_pool(None)
+        counts = logger.get_increment_counts()
+        self.assertGreater(counts.get('backend_pool.hits'), 0)
+        self.assertFalse(counts.get('backend_pool.evictions'))
+
     @unpatch_policies
     def test_GET_ranges(self):
         prolis = _test_sockets[0]
@@ -3334,6 +3429,8 @@ class TestReplicatedObjectController(
         # reset the router post patch_policies
         self.app.obj_controller_router = proxy_server.ObjectControllerRouter()
         self.app.sort_nodes = lambda nodes, *args, **kwargs: nodes
+        # without caching only the one shard range is fetched from the root
+        self.app.recheck_updating_shard_ranges = 0
 
         def do_test(method, sharding_state):
             self.app.memcache.store = {}
@@ -3417,6 +3514,98 @@ class TestReplicatedObjectController(
         do_test('PUT', 'sharding')
         do_test('PUT', 'sharded')
 
+    @patch_policies([
+        StoragePolicy(0, 'zero', is_default=True, object_ring=FakeRing()),
+        StoragePolicy(1, 'one', object_ring=FakeRing()),
+    ])
+    def test_backend_headers_update_shard_container_with_cache(self):
+        # verify that when container is sharded the root's updating shard
+        # ranges are cached and used to direct the backend container update
+        # to the shard container
+        self.app.obj_controller_router = proxy_server.ObjectControllerRouter()
+        self.app.sort_nodes = lambda nodes, *args, **kwargs: nodes
+        self.app.logger = debug_logger()
+        self.app.memcache.store = {}
+        shard_ranges = [
+            utils.ShardRange('.shards_a/c_l', utils.Timestamp.now(), '', 'l'),
+            utils.ShardRange('.shards_a/c_u', utils.Timestamp.now(), 'l', 'u'),
+            utils.ShardRange('.shards_a/c_', utils.Timestamp.now(), 'u', '')]
+        cache_key = 'shard-updating/a/c'
+
+        def do_test(method, obj, status_codes, expected_shard):
+            req = Request.blank('/v1/a/c/%s' % obj, {}, method=method,
+                                body='',
+                                headers={'Content-Type': 'text/plain'})
+            resp_headers = {'X-Backend-Storage-Policy-Index': 1,
+                            'x-backend-sharding-state': 'sharded',
+                            'X-Backend-Record-Type': 'shard'}
+            body = json.dumps([dict(sr) for sr in shard_ranges])
+            with mocked_http_conn(*status_codes, headers=resp_headers,
+                                  body=body) as fake_conn:
+                resp = req.get_response(self.app)
+            self.assertEqual(resp.status_int, 202)
+            obj_requests = [r for r in fake_conn.requests
+                            if r['path'].endswith('/a/c/%s' % obj)]
+            self.assertEqual(3, len(obj_requests))
+            for request in obj_requests:
+                if expected_shard is None:
+                    # the update goes to the root container
+                    self.assertNotIn('X-Backend-Container-Path',
+                                     request['headers'])
+                    continue
+                self.assertEqual(
+                    expected_shard.name,
+                    request['headers']['X-Backend-Container-Path'])
+                self.assertEqual(
+                    str(self.app.container_ring.get_part(
+                        expected_shard.account, expected_shard.container)),
+                    request['headers']['X-Container-Partition'])
+            return [r for r in fake_conn.requests if r not in obj_requests]
+
+        # acc HEAD, cont HEAD, cont shard GET, obj POSTs
+        other_requests = do_test(
+            'POST', 'o', (200, 200, 200, 202, 202, 202), shard_ranges[1])
+        self.assertEqual(['HEAD', 'HEAD', 'GET'],
+                         [r['method'] for r in other_requests])
+        # all the updating shard ranges were fetched from the root...
+        params = dict(parse_qsl(other_requests[2]['qs']))
+        self.assertNotIn('includes', params)
+        self.assertEqual('updating', params['states'])
+        self.assertEqual('shard',
+                         other_requests[2]['headers']['X-Backend-Record-Type'])
+        # ...and cached
+        self.assertEqual([dict(sr) for sr in shard_ranges],
+                         self.app.memcache.get(cache_key))
+        self.assertEqual({'shard_updating.cache.miss': 1,
+                          'shard_updating.shard': 1},
+                         self.app.logger.get_increment_counts())
+
+        # subsequent updates to the container use the cache
+        self.assertEqual([], do_test(
+            'PUT', 'a', (202, 202, 202), shard_ranges[0]))
+        self.assertEqual([], do_test(
+            'DELETE', 'x', (202, 202, 202), shard_ranges[2]))
+        self.assertEqual({'shard_updating.cache.miss': 1,
+                          'shard_updating.cache.hit': 2,
+                          'shard_updating.shard': 3},
+                         self.app.logger.get_increment_counts())
+
+        # an object that no cached shard range includes falls back to the root
+        self.app.memcache.set(cache_key, [dict(shard_ranges[0])])
+        self.assertEqual([], do_test('PUT', 'x', (202, 202, 202), None))
+        self.assertEqual({'shard_updating.cache.miss': 1,
+                          'shard_updating.cache.hit': 3,
+                          'shard_updating.shard': 3,
+                          'shard_updating.root': 1},
+                         self.app.logger.get_increment_counts())
+
+        # the cache is cleared when the container changes
+        req = Request.blank('/v1/a/c', method='POST')
+        with mocked_http_conn(204, 204, 204):
+            resp = req.get_response(self.app)
+        self.assertEqual(204, resp.status_int)
+        self.assertIsNone(self.app.memcache.get(cache_key))
+
     def test_DELETE(self):
         with save_globals():
             def test_status_map(statuses, expected):